@@ -0,0 +1,25 @@
+"""Utilità asyncio condivise da crawler, scoperta entrypoint e client CSE."""
+from __future__ import annotations
+import asyncio, threading
+
+
+def run_sync(coro):
+    """Esegue una coroutine dal codice sincrono (anche se il thread ha già un event loop attivo)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    box = {}
+
+    def target():
+        try:
+            box["v"] = asyncio.run(coro)
+        except BaseException as e:
+            box["e"] = e
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join()
+    if "e" in box:
+        raise box["e"]
+    return box["v"]
@@ -10,59 +10,29 @@ import os
 # Impostiamo il mode del watchdog a "poll" prima di importare streamlit
 os.environ.setdefault("STREAMLIT_WATCHDOG_MODE", "poll")
 
-import io
 import time
 import re
-import json
-from collections import deque
-from typing import Optional, List, Dict, Any, Set, Tuple
-from urllib.parse import urljoin, urlparse
-from urllib import robotparser
+from typing import Optional, List, Dict, Any
 
-# Import Streamlit e pandas dopo aver impostato la variabile d'ambiente
+# Import Streamlit dopo aver impostato la variabile d'ambiente.
+# pandas, httpx, bs4, librerie PDF/OCR e crawler semantico si caricano al primo uso (cold start rapido).
 import streamlit as st
-import pandas as pd
 
-# Tentativo di import del crawler esterno (se lo hai come modulo)
-_CRAWLER_IMPORTED = False
-try:
-    from semantic_crawler.crawler_semantic import crawl_and_classify as _external_crawl_and_classify
-    _CRAWLER_IMPORTED = True
-except Exception:
-    _CRAWLER_IMPORTED = False
+import metrics
+import st_cache
+from profiling import RunProfiler
+from st_cache import results_store, job_queue
+from job_queue import enqueue_sheet
+from results_store import EXPORT_FORMATS
 
-# Import "soft" per dipendenze usate nel fallback
-try:
-    import httpx
-except Exception:
-    httpx = None
+# PDF: librerie opzionali (lazy, gestite nel modulo), qui solo per lo stato delle dipendenze
+from pdf_extract import is_installed, pdf_text_available, ocr_available
 
-try:
-    from bs4 import BeautifulSoup
-except Exception:
-    BeautifulSoup = None
-
-# PDF text extraction libs (optional)
-try:
-    import pdfplumber
-except Exception:
-    pdfplumber = None
-
-try:
-    from PyPDF2 import PdfReader
-except Exception:
-    PdfReader = None
-
-# OCR libs (optional)
-try:
-    import pytesseract
-except Exception:
-    pytesseract = None
-
-try:
-    from pdf2image import convert_from_bytes
-except Exception:
-    convert_from_bytes = None
+# Pipeline per azienda (ricerca, crawl, estrazione): modulo senza UI, condiviso con i worker della coda
+from pipeline import (
+    _CRAWLER_AVAILABLE, process_company, serp_query,
+    cached_search_google_cse_many, cached_discover_many, cached_crawl_and_classify,
+)
 
 # toml config read: try built-in/more common libs
 try:
@@ -78,8 +48,6 @@ except Exception:
 # --------------------------------------------
 APP_TITLE = "Bilanci & DNF – Crawler semantico (Estra)"
 APP_VERSION = "1.0.2"
-# User-Agent chiaro e con riferimento di contatto (aiuta a non essere bloccati)
-DEFAULT_UA = "BilanciCrawler/1.0 (+https://github.com/lineapulita-creator) Mozilla/5.0 (compatible;)"
 
 st.set_page_config(page_title=APP_TITLE, page_icon="🔎", layout="wide")
 
@@ -117,402 +85,76 @@ def load_search_config() -> Dict[str, str]:
     return cfg
 
 
-# --------------------------------------------
-# Google CSE wrapper (usa httpx)
-# --------------------------------------------
-def search_google_cse(query: str, api_key: str, cx: str, num: int = 5, timeout: float = 15.0) -> List[Dict[str, Any]]:
-    """
-    Esegue una query su Google Custom Search API e ritorna la lista di result items.
-    Richiede: api_key e cx.
-    """
-    if httpx is None:
-        raise RuntimeError("httpx non disponibile")
-    url = "https://www.googleapis.com/customsearch/v1"
-    params = {"q": query, "key": api_key, "cx": cx, "num": num}
-    try:
-        with httpx.Client(timeout=timeout) as client:
-            r = client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
-            return data.get("items", [])
-    except Exception:
-        return []
-
-
-# --------------------------------------------
-# Helpers per pdf: download, estrazione testo (include OCR)
-# --------------------------------------------
-def download_binary(url: str, timeout: float = 30.0) -> Optional[bytes]:
-    if httpx is None:
-        return None
-    try:
-        with httpx.Client(follow_redirects=True, timeout=timeout) as client:
-            r = client.get(url)
-            if r.status_code == 200:
-                return r.content
-    except Exception:
-        return None
-    return None
-
-
-def ocr_pdf_bytes(data: bytes, dpi: int = 200, lang: str = "ita") -> str:
-    """
-    Converte le pagine PDF in immagini (pdf2image) e esegue pytesseract OCR.
-    Restituisce il testo concatenato. Richiede poppler e tesseract installati a livello di sistema.
-    """
-    if convert_from_bytes is None or pytesseract is None:
-        return ""
-    texts = []
-    try:
-        images = convert_from_bytes(data, dpi=dpi)
-    except Exception:
-        return ""
-    for img in images:
-        try:
-            text = pytesseract.image_to_string(img, lang=lang)
-            texts.append(text or "")
-        except Exception:
-            texts.append("")
-    return "\n".join(texts)
-
-
-def extract_text_from_pdf_bytes(data: bytes) -> Tuple[str, bool]:
-    """
-    Ritorna (text, needs_ocr_bool).
-    Usa pdfplumber se disponibile, altrimenti PyPDF2 come fallback.
-    Se non riesce a estrarre testo restituisce ('', True).
-    """
-    if not data:
-        return "", False
-    # Try pdfplumber
-    if pdfplumber is not None:
-        try:
-            with pdfplumber.open(io.BytesIO(data)) as pdf:
-                pages = []
-                for p in pdf.pages:
-                    try:
-                        pages.append(p.extract_text() or "")
-                    except Exception:
-                        pages.append("")
-                text = "\n".join(pages)
-                if text and text.strip():
-                    return text, False
-        except Exception:
-            pass
-    # Try PyPDF2
-    if PdfReader is not None:
-        try:
-            reader = PdfReader(io.BytesIO(data))
-            pages = []
-            for p in reader.pages:
-                try:
-                    pages.append(p.extract_text() or "")
-                except Exception:
-                    pages.append("")
-            text = "\n".join(pages)
-            if text and text.strip():
-                return text, False
-        except Exception:
-            pass
-    # Fall back: no text extracted -> needs OCR
-    return "", True
-
-
-# --------------------------------------------
-# Utilità per trovare valori vicino alla keyword
-# --------------------------------------------
-NUMBER_RE = re.compile(r"[-+]?\d[\d\.\,\s]*\d(?:\s*(?:€|EUR|eur)?)?")
-
-def normalize_number_str(s: str) -> str:
-    s = s.strip()
-    s = s.replace("\u00a0", " ")
-    s = s.replace(" ", "")
-    if "," in s and "." in s:
-        if s.rfind(",") > s.rfind("."):
-            s = s.replace(".", "")
-            s = s.replace(",", ".")
-        else:
-            s = s.replace(",", "")
-    else:
-        s = s.replace(",", ".")
-    s = re.sub(r"[^\d\.\-+]", "", s)
-    return s
-
-def find_value_near_keywords(text: str, keywords: List[str]) -> (Optional[str], Optional[str]):
-    txt_low = text.lower()
-    for kw in keywords:
-        kw_l = kw.lower()
-        idx = txt_low.find(kw_l)
-        if idx >= 0:
-            start = max(0, idx - 300)
-            end = min(len(text), idx + len(kw_l) + 300)
-            window = text[start:end]
-            m = NUMBER_RE.search(window)
-            if m:
-                raw = m.group(0)
-                norm = normalize_number_str(raw)
-                return kw, norm
-            else:
-                start = max(0, idx - 800)
-                end = min(len(text), idx + len(kw_l) + 800)
-                window = text[start:end]
-                m = NUMBER_RE.search(window)
-                if m:
-                    raw = m.group(0)
-                    norm = normalize_number_str(raw)
-                    return kw, norm
-    return None, None
 
 
 # --------------------------------------------
-# Politeness + robots helpers
+# UI
 # --------------------------------------------
-_robot_parsers: Dict[str, Optional[robotparser.RobotFileParser]] = {}
-_last_request_time: Dict[str, float] = {}
-
-def _get_host(url: str) -> str:
-    try:
-        return urlparse(url).netloc or ""
-    except Exception:
-        return ""
-
-def allowed_by_robots(url: str, user_agent: str = "*") -> bool:
-    host = _get_host(url)
-    if not host:
-        return False
-    rp = _robot_parsers.get(host)
-    if rp is None:
-        robots_url = f"{urlparse(url).scheme}://{host}/robots.txt"
-        rp = robotparser.RobotFileParser()
-        try:
-            rp.set_url(robots_url)
-            rp.read()
-        except Exception:
-            _robot_parsers[host] = None
-            return True
-        _robot_parsers[host] = rp
-    if _robot_parsers.get(host) is None:
-        return True
-    try:
-        return _robot_parsers[host].can_fetch(user_agent, url)
-    except Exception:
-        return True
-
-def polite_get(client: "httpx.Client", url: str, min_delay: float = 0.8) -> "httpx.Response":
-    host = _get_host(url)
-    now = time.time()
-    last = _last_request_time.get(host, 0.0)
-    wait = max(0.0, min_delay - (now - last))
-    if wait > 0:
-        time.sleep(wait)
-    resp = client.get(url)
-    _last_request_time[host] = time.time()
-    return resp
-
+def render_profile(prof: Optional[RunProfiler], stem: str) -> None:
+    """Mostra top-N funzioni e download del profilo (pstats + speedscope) accanto ai risultati."""
+    if prof is None:
+        return
+    import pandas as pd
+    # niente expander: questi blocchi sono già dentro un expander
+    st.markdown(f"#### ⏱️ Profilo del run ({prof.wall_seconds:.1f}s) – funzioni più costose")
+    st.dataframe(pd.DataFrame(prof.top_functions()), use_container_width=True, hide_index=True)
+    c1, c2 = st.columns(2)
+    with c1:
+        st.download_button("⬇️ Profilo (.pstats)", data=prof.pstats_bytes(), file_name=f"{stem}.pstats", mime="application/octet-stream")
+    with c2:
+        st.download_button("⬇️ Profilo (speedscope JSON)", data=prof.speedscope_json().encode("utf-8"), file_name=f"{stem}.speedscope.json", mime="application/json")
+    st.caption("Apri il JSON su https://www.speedscope.app oppure il .pstats con snakeviz / pstats.")
 
-# --------------------------------------------
-# Adapter / Fallback crawler
-# --------------------------------------------
-def _is_pdf_url(url: str) -> bool:
-    u = url.lower()
-    return u.endswith(".pdf") or "application/pdf" in u
 
-def _year_from_text(text: str, candidates=(2022, 2023, 2024, 2025)) -> Optional[int]:
+def read_batch_sheet(uploaded, column: str):
+    """Foglio Excel caricato nel batch, con la colonna del nome azienda (altrimenti errore e stop)."""
+    if uploaded is None:
+        st.error("Carica prima il file Excel.")
+        st.stop()
+    import pandas as pd
     try:
-        s = str(text)
-    except Exception:
-        return None
-    for y in candidates:
-        if str(y) in s:
-            return y
-    return None
-
-def _score_candidate(url: str, title: Optional[str], keywords: List[str], year: Optional[int]) -> float:
-    score = 0.0
-    u = (url or "").lower()
-    t = (title or "").lower()
-    if year and str(year) in u:
-        score += 1.2
-    if year and str(year) in t:
-        score += 0.8
-    for kw in keywords:
-        kw_l = kw.lower()
-        if kw_l and kw_l in u:
-            score += 0.6
-        if kw_l and kw_l in t:
-            score += 0.4
-    boost_terms = ("bilanci", "relazioni", "investor", "financial", "sostenibilit")
-    if any(bt in u for bt in boost_terms):
-        score += 0.5
-    if _is_pdf_url(u):
-        score += 0.4
-    return round(score, 3)
-
-def _is_allowed(url: str, allowlist: List[str]) -> bool:
-    host = _get_host(url).lower()
-    if not host:
-        return False
-    for item in allowlist:
-        item = item.lower()
-        if host == item or host.endswith("." + item):
-            return True
-    return False
-
-def crawl_and_classify(
-    seed_url: str,
-    keywords: List[str],
-    year: int,
-    depth: int = 1,
-    max_pages: int = 20,
-    allowlist: Optional[List[str]] = None,
-    polite_mode: bool = True,
-    min_delay: float = 1.0,
-) -> List[Dict[str, Any]]:
-    if _CRAWLER_IMPORTED:
-        try:
-            return _external_crawl_and_classify(
-                seed_url=seed_url,
-                keywords=keywords,
-                year=year,
-                depth=depth,
-                max_pages=max_pages,
-                allowlist=allowlist,
-                polite_mode=polite_mode,
-                min_delay=min_delay,
-            )
-        except TypeError:
-            return _external_crawl_and_classify(
-                seed_url=seed_url,
-                keywords=keywords,
-                year=year,
-                depth=depth,
-                max_pages=max_pages,
-                allowlist=allowlist,
-            )
-    results: List[Dict[str, Any]] = []
-    if httpx is None or BeautifulSoup is None:
-        return results
-
-    headers = {"User-Agent": DEFAULT_UA, "Accept": "*/*"}
-    visited: Set[str] = set()
-    q = deque([(seed_url, 0, None)])  # (url, depth, source)
-    pages_processed = 0
-    allow = allowlist or [_get_host(seed_url).lower()] if seed_url else []
-    with httpx.Client(follow_redirects=True, headers=headers, timeout=15.0) as client:
-        global _last_request_time
-        _last_request_time = {}
-        while q and pages_processed < max_pages:
-            url, d, source = q.popleft()
-            if url in visited:
-                continue
-            visited.add(url)
-            if not _is_allowed(url, [h.lower() for h in allow]):
-                continue
-            if polite_mode and not allowed_by_robots(url, DEFAULT_UA):
-                continue
-            try:
-                if polite_mode:
-                    r = polite_get(client, url, min_delay=min_delay)
-                else:
-                    r = client.get(url)
-            except Exception:
-                continue
-            ctype = r.headers.get("content-type", "").lower()
-            if _is_pdf_url(url) or "application/pdf" in ctype:
-                title = url.split("/")[-1]
-                ydet = _year_from_text(url) or _year_from_text(title)
-                matched = [kw for kw in keywords if kw.lower() in url.lower()]
-                score = _score_candidate(url, title, keywords, year)
-                results.append({
-                    "url": url,
-                    "title": title,
-                    "is_pdf": True,
-                    "host": _get_host(url),
-                    "score": score,
-                    "year_detected": ydet,
-                    "matched_keywords": matched,
-                    "source_page": source,
-                })
-                continue
-            if "text/html" not in ctype:
-                continue
-            pages_processed += 1
-            try:
-                soup = BeautifulSoup(r.text, "html.parser")
-            except Exception:
-                continue
-            page_title = None
-            t_tag = soup.find("title")
-            if t_tag and t_tag.text:
-                page_title = t_tag.text.strip()
-            ydet = _year_from_text(url) or _year_from_text(page_title)
-            s = _score_candidate(url, page_title, keywords, year)
-            if s >= 1.0:
-                matched = [kw for kw in keywords if (kw.lower() in (url.lower() + " " + (page_title or "").lower()))]
-                results.append({
-                    "url": url,
-                    "title": page_title,
-                    "is_pdf": False,
-                    "host": _get_host(url),
-                    "score": s,
-                    "year_detected": ydet,
-                    "matched_keywords": matched,
-                    "source_page": source,
-                })
-            for a in soup.find_all("a", href=True):
-                href = a.get("href")
-                try:
-                    nxt = urljoin(url, href)
-                except Exception:
-                    continue
-                if not nxt:
-                    continue
-                if nxt.startswith("mailto:") or nxt.startswith("tel:"):
-                    continue
-                if not nxt.startswith("http"):
-                    continue
-                if nxt in visited:
-                    continue
-                if not _is_allowed(nxt, [h.lower() for h in allow]):
-                    continue
-                if d < depth:
-                    q.append((nxt, d + 1, url))
-    best_by_url: Dict[str, Dict[str, Any]] = {}
-    for rec in results:
-        u = rec["url"]
-        prev = best_by_url.get(u)
-        if prev is None or rec.get("score", 0) > prev.get("score", 0):
-            best_by_url[u] = rec
-    final = list(best_by_url.values())
-    final.sort(key=lambda r: (r.get("score", 0.0), 1 if not r.get("is_pdf") else 2), reverse=True)
-    return final
+        df_in = pd.read_excel(uploaded)
+    except Exception as e:
+        st.error(f"Impossibile leggere il file Excel: {e}")
+        st.stop()
+    if column not in df_in.columns:
+        st.error(f"Colonna '{column}' non trovata nel file Excel. Colonne disponibili: {', '.join(df_in.columns.astype(str))}")
+        st.stop()
+    return df_in
 
 
-# --------------------------------------------
-# UI
-# --------------------------------------------
 st.title(APP_TITLE)
 st.caption(f"Versione {APP_VERSION}")
 
 with st.sidebar:
     st.markdown("### Stato dipendenze")
-    if _CRAWLER_IMPORTED:
+    if _CRAWLER_AVAILABLE:
         st.success("Modulo esterno `semantic_crawler` rilevato ✅")
     else:
         st.info("Uso **fallback crawler** interno")
 
     missing = []
-    if httpx is None:
+    # find_spec: controlla la presenza senza importare le librerie
+    if not is_installed("httpx"):
         missing.append("httpx")
-    if BeautifulSoup is None:
+    if not is_installed("bs4"):
         missing.append("beautifulsoup4")
-    if pdfplumber is None and PdfReader is None:
+    if not pdf_text_available():
         missing.append("pdfplumber or PyPDF2 for PDF text extraction")
-    if pytesseract is None or convert_from_bytes is None:
+    if not ocr_available():
         missing.append("pytesseract and pdf2image (for OCR) - requires system packages (tesseract, poppler)")
     if missing:
         st.error("Mancano dipendenze: **" + ", ".join(missing) + "**")
 
+    st.divider()
+    # ricerche, crawl ed estrazioni PDF sono memoizzate (TTL); qui si forza un nuovo run da zero
+    if st.button("🗑️ Svuota cache ricerche/crawl/PDF"):
+        # tutte le cache memoized, comprese scoperta entrypoint e crawl delle pagine
+        st_cache.clear_all()
+        for k in ("single_scan", "batch_run"):
+            st.session_state.pop(k, None)
+        st.rerun()
+
     st.divider()
     st.markdown("**Suggerimento**: usa la modalità gentile, e metti le chiavi Google nelle Secrets di Streamlit (GOOGLE_API_KEY, GOOGLE_CX).")
 
@@ -565,7 +207,9 @@ with st.expander("🔎 Crawler semantico – Estra (scan singolo)", expanded=Fal
         )
     allowlist = [h.strip() for h in allowlist_raw.split(",") if h.strip()]
 
-    fmt = st.radio("Formato esportazione", ["CSV", "JSON"], horizontal=True, index=0)
+    fmt = st.radio("Formato esportazione", ["CSV", "JSON", "Parquet"], horizontal=True, index=0)
+    profile_single = st.checkbox("Profila questo run", value=False, key="profile_single",
+                                 help="Allega ai risultati il profilo (pstats, speedscope) e le funzioni più costose.")
 
     run = st.button("▶️ Avvia crawler semantico (singolo)", type="primary")
     status = st.empty()
@@ -578,34 +222,55 @@ with st.expander("🔎 Crawler semantico – Estra (scan singolo)", expanded=Fal
             st.error("Inserisci almeno una parola chiave.")
             st.stop()
         status.info("In esecuzione… può richiedere alcuni minuti su siti complessi.")
+        prof = RunProfiler(name=f"crawler_estra_{anno_target}") if profile_single else None
+        scan: Dict[str, Any] = {"anno": anno_target, "results": [], "error": None, "prof": prof}
         try:
-            results = crawl_and_classify(
-                seed_url=seed_url,
-                keywords=keywords,
-                year=int(anno_target),
-                depth=int(depth_max),
-                max_pages=int(pages_max),
-                allowlist=allowlist if allowlist else None,
-                polite_mode=True,
-                min_delay=1.0,
-            )
-            if not results:
-                status.warning("Nessun risultato utile trovato. Prova ad aumentare Profondità/Pagine o variare le keywords.")
-            else:
-                df = pd.DataFrame(results)
-                if "score" in df.columns:
-                    df = df.sort_values(by="score", ascending=False)
-                st.subheader("Risultati")
-                st.dataframe(df, use_container_width=True, hide_index=True)
-                if fmt == "CSV":
-                    csv_bytes = df.to_csv(index=False).encode("utf-8")
-                    st.download_button("⬇️ Scarica risultati (CSV)", data=csv_bytes, file_name=f"crawler_estra_{anno_target}.csv", mime="text/csv")
-                else:
-                    json_bytes = df.to_json(orient="records", force_ascii=False, indent=2).encode("utf-8")
-                    st.download_button("⬇️ Scarica risultati (JSON)", data=json_bytes, file_name=f"crawler_estra_{anno_target}.json", mime="application/json")
-                status.success("Crawler completato ✅")
+            if prof is not None:
+                prof.start()
+            try:
+                scan["results"] = cached_crawl_and_classify(
+                    seed_url=seed_url,
+                    keywords=keywords,
+                    year=int(anno_target),
+                    depth=int(depth_max),
+                    max_pages=int(pages_max),
+                    allowlist=allowlist if allowlist else None,
+                    polite_mode=True,
+                    min_delay=1.0,
+                )
+            finally:
+                if prof is not None:
+                    prof.stop()
         except Exception as e:
-            status.error(f"Errore durante l’esecuzione del crawler: {e}")
+            scan["error"] = e
+        # risultati in session_state: i rerun (es. cambio formato export) li ridisegnano senza ricrawlare
+        st.session_state["single_scan"] = scan
+
+    scan = st.session_state.get("single_scan")
+    if scan:
+        anno_scan = scan["anno"]
+        if scan["error"] is not None:
+            status.error(f"Errore durante l’esecuzione del crawler: {scan['error']}")
+        elif not scan["results"]:
+            status.warning("Nessun risultato utile trovato. Prova ad aumentare Profondità/Pagine o variare le keywords.")
+        else:
+            import pandas as pd
+            df = pd.DataFrame(scan["results"])
+            if "score" in df.columns:
+                df = df.sort_values(by="score", ascending=False)
+            st.subheader("Risultati")
+            st.dataframe(df, use_container_width=True, hide_index=True)
+            if fmt == "CSV":
+                csv_bytes = df.to_csv(index=False).encode("utf-8")
+                st.download_button("⬇️ Scarica risultati (CSV)", data=csv_bytes, file_name=f"crawler_estra_{anno_scan}.csv", mime="text/csv")
+            elif fmt == "JSON":
+                json_bytes = df.to_json(orient="records", force_ascii=False, indent=2).encode("utf-8")
+                st.download_button("⬇️ Scarica risultati (JSON)", data=json_bytes, file_name=f"crawler_estra_{anno_scan}.json", mime="application/json")
+            else:
+                parquet_bytes = df.astype({c: "string" for c in df.columns if df[c].dtype == object}).to_parquet(index=False)
+                st.download_button("⬇️ Scarica risultati (Parquet)", data=parquet_bytes, file_name=f"crawler_estra_{anno_scan}.parquet", mime=EXPORT_FORMATS["parquet"])
+            status.success("Crawler completato ✅")
+        render_profile(scan["prof"], f"crawler_estra_{anno_scan}")
 
 
 # ==============================
@@ -615,7 +280,7 @@ with st.expander("📁 Batch: carica Excel e processa elenco aziende", expanded=
     st.markdown(
         """
 Carica un file Excel (.xlsx) con una colonna che contiene il NOME azienda (colonna chiamata idealmente 'name' o 'azienda').
-Per ogni riga: il sistema esegue una query Google Custom Search del tipo `Nome Azienda bilancio <anno>` e cerca il PDF rilevante, quindi estrae il valore vicino alla keyword indicata.
+Per ogni riga: il sistema trova il sito ufficiale (domini candidati dal nome e percorsi noti; in mancanza, una query Google Custom Search del tipo `Nome Azienda bilancio <anno>`) e cerca il PDF rilevante, quindi estrae il valore vicino alla keyword indicata.
 """
     )
 
@@ -625,6 +290,9 @@ Per ogni riga: il sistema esegue una query Google Custom Search del tipo `Nome A
     st.markdown("### 2) Configura ricerca")
     ex_col_name = st.text_input("Nome colonna con il nome azienda", value="name", help="Inserisci esatto nome della colonna nel tuo Excel che contiene il nome dell'azienda")
     year_for_search = st.number_input("Anno documento (es. 2024)", min_value=2000, max_value=2100, value=2024)
+    extra_years_raw = st.text_input("Altri anni (opzionale, separati da virgola: es. 2023, 2022)", value="",
+                                    help="Multi-anno: una sola ricerca e una sola crawl per azienda, miglior documento per ciascun anno (colonne con suffisso _<anno>).")
+    years_batch = sorted({int(year_for_search)} | {int(y) for y in re.findall(r"\d{4}", extra_years_raw)}, reverse=True)
     serp_results = st.number_input("Risultati SERP da interrogare per azienda", min_value=1, max_value=10, value=3)
     doc_keywords_raw = st.text_area("Parole chiave per identificare il documento (una per riga)", value="\n".join(["bilancio", "relazione finanziaria", "bilanci", "nota integrativa"]), height=120)
     doc_keywords = [k.strip() for k in doc_keywords_raw.splitlines() if k.strip()]
@@ -635,6 +303,15 @@ Per ogni riga: il sistema esegue una query Google Custom Search del tipo `Nome A
     polite_mode_batch = st.checkbox("Modalità gentile (rispetta robots.txt e delay)", value=True)
     min_delay_batch = st.slider("Delay minimo (s) tra richieste allo stesso host", min_value=0.2, max_value=5.0, value=1.0, step=0.1)
     max_companies = st.number_input("Numero massimo di aziende da processare in questo run", min_value=1, max_value=1000, value=20, step=1)
+    discover_batch = st.checkbox("Trova i siti ufficiali senza CSE (la CSE solo per le aziende non trovate)", value=True,
+                                 help="Domini candidati dal nome (.it/.com, prefissi di gruppo), verifica DNS/HTTP e "
+                                      "percorsi noti (investor relations, bilanci, trasparenza) in parallelo.")
+    queue_batch = st.checkbox("Accoda per i worker (tutte le righe, senza limite di aziende)", value=False,
+                              help="Un job per azienda nella coda su disco: li eseguono i worker avviati con "
+                                   "`python job_queue.py worker`, anche su più macchine con la cartella condivisa. "
+                                   "Quando hanno finito, «Unisci risultati» prepara l'Excel.")
+    profile_batch = st.checkbox("Profila questo run", value=False, key="profile_batch",
+                                help="Allega all'Excel il profilo del run (pstats, speedscope) e le funzioni più costose.")
     run_batch = st.button("▶️ Processa elenco e genera Excel aggiornato")
 
     # carica config google: preferiamo Secrets/ENV, fallback a streamlit/config.toml se presente
@@ -646,152 +323,139 @@ Per ogni riga: il sistema esegue una query Google Custom Search del tipo `Nome A
     else:
         st.info("Google Custom Search configurato (valore preso da Secrets/ENV o streamlit/config.toml). Controlla la quota giornaliera (es. 100 query/giorno).")
 
-    if run_batch:
-        if uploaded is None:
-            st.error("Carica prima il file Excel.")
-            st.stop()
-        try:
-            df_in = pd.read_excel(uploaded)
-        except Exception as e:
-            st.error(f"Impossibile leggere il file Excel: {e}")
-            st.stop()
-        if ex_col_name not in df_in.columns:
-            st.error(f"Colonna '{ex_col_name}' non trovata nel file Excel. Colonne disponibili: {', '.join(df_in.columns.astype(str))}")
-            st.stop()
-
-        df_proc = df_in.copy()
-        n_rows = min(int(max_companies), len(df_proc))
+    if run_batch and queue_batch:
+        # niente lavoro in processo: i worker della coda eseguono le aziende, il merge produce l'Excel
+        df_in = read_batch_sheet(uploaded, ex_col_name)
+        params = {"doc_keywords": doc_keywords, "extract_keywords": extract_keywords,
+                  "serp_results": int(serp_results), "polite_mode": polite_mode_batch,
+                  "min_delay": min_delay_batch, "discover": discover_batch}
+        batch_id, run_id = enqueue_sheet(job_queue(), results_store(), df_in, ex_col_name, years_batch, params)
+        st.session_state["queued_batch"] = {"batch_id": batch_id, "run_id": run_id, "years": years_batch,
+                                            "year": year_for_search}
+        st.session_state.pop("batch_run", None)
+
+    if run_batch and not queue_batch:
+        df_in = read_batch_sheet(uploaded, ex_col_name)
+
+        n_rows = min(int(max_companies), len(df_in))
         st.info(f"Avvio processamento su {n_rows} aziende (limite impostato).")
         progress = st.progress(0)
         status_text = st.empty()
 
-        # Prepara colonne di output
-        out_cols = {
-            "found_document_url": [],
-            "matched_doc_keyword": [],
-            "matched_value": [],
-            "needs_ocr": [],
-            "notes": []
-        }
-        for c in out_cols.keys():
-            if c not in df_proc.columns:
-                df_proc[c] = ""
+        # risultati su disco (SQLite) a blocchi: il foglio originale non viene copiato né riempito in RAM
+        store = results_store()
+        run_id = store.new_run(list(df_in.columns), years_batch, meta={"year": year_for_search})
+        store.add_inputs(run_id, df_in.itertuples(index=False, name=None))
+        companies = [str(v) for v in df_in[ex_col_name].iloc[:n_rows]]
+        del df_in
 
         queries_used = 0
+        prof = RunProfiler(name=f"batch_{year_for_search}").start() if profile_batch else None
 
-        for i in range(n_rows):
-            row_name = str(df_proc.iloc[i][ex_col_name])
-            status_text.info(f"({i+1}/{n_rows}) Processing: {row_name}")
-            best_doc_url = None
-            best_doc_score = -1.0
-            matched_keyword = None
-            matched_value = None
-            needs_ocr_flag = False
-            notes = ""
-
-            # 1) Search via Google CSE
-            query = f"{row_name} bilancio {int(year_for_search)}"
-            serp_items = []
+        try:
+            # ricerche SERP di tutte le aziende in parallelo (QPS limitato, retry/backoff su 429/5xx)
+            discovered: Dict[str, List[str]] = {}
+            if discover_batch:
+                status_text.info(f"Scoperta dei siti ufficiali per {len(set(companies))} aziende…")
+                discovered = cached_discover_many(tuple(dict.fromkeys(companies)))
+            prefetched: Dict[str, List[Dict[str, Any]]] = {}
             if api_key and cx:
-                serp_items = search_google_cse(query, api_key, cx, num=int(serp_results))
-                queries_used += 1
-            else:
-                notes = "No Google API key; nessuna ricerca SERP automatica eseguita."
-
-            candidate_urls = []
-            for it in serp_items:
-                link = it.get("link")
-                if link:
-                    candidate_urls.append(link)
-
-            # 2) Per ogni candidate url, usa crawl_and_classify per trovare PDF rilevanti
-            found = False
-            for link in candidate_urls:
-                status_text.info(f"  -> scanning candidate {link}")
-                try:
-                    results = crawl_and_classify(
-                        seed_url=link,
-                        keywords=doc_keywords,
-                        year=int(year_for_search),
-                        depth=1,
-                        max_pages=20,
-                        allowlist=None,
+                queries = tuple(dict.fromkeys(serp_query(name, years_batch) for name in companies
+                                              if not discovered.get(name)))
+                status_text.info(f"Ricerca SERP in parallelo per {len(queries)} aziende…")
+                prefetched = cached_search_google_cse_many(queries, api_key, cx, num=int(serp_results))
+                queries_used += len(prefetched)
+
+            # aziende ripetute nel foglio: elaborate una volta, risultato riusato per le righe successive
+            done_companies: Dict[str, Dict[int, Dict[str, Any]]] = {}
+            for i, row_name in enumerate(companies):
+                company_key = " ".join(row_name.casefold().split())
+                if company_key in done_companies:
+                    status_text.info(f"({i+1}/{n_rows}) {row_name}: già elaborata in questo run, risultato riusato")
+                    metrics.inc("singleflight_total", group="company", result="reused")
+                    by_year = done_companies[company_key]
+                else:
+                    status_text.info(f"({i+1}/{n_rows}) Processing: {row_name}")
+                    by_year, used = process_company(
+                        row_name,
+                        years_batch,
+                        doc_keywords,
+                        extract_keywords,
+                        api_key,
+                        cx,
+                        serp_results=int(serp_results),
                         polite_mode=polite_mode_batch,
                         min_delay=min_delay_batch,
+                        log=status_text.info,
+                        serp_items=prefetched.get(serp_query(row_name, years_batch)),
+                        entrypoints=discovered.get(row_name),
                     )
-                except Exception:
-                    results = []
-                for r in results:
-                    if r.get("is_pdf"):
-                        score = r.get("score", 0.0)
-                        if score > best_doc_score:
-                            best_doc_score = score
-                            best_doc_url = r.get("url")
-                if best_doc_url:
-                    found = True
-
-            # 3) Se non trovato tramite crawl, verifica direttamente i candidate_urls se contengono pdf
-            if not best_doc_url:
-                for link in candidate_urls:
-                    if _is_pdf_url(link):
-                        best_doc_url = link
-                        found = True
-                        break
-
-            # 4) Se trovato documento PDF, scarica ed estrai testo (con fallback OCR)
-            if best_doc_url:
-                status_text.info(f"  -> scarico documento {best_doc_url}")
-                data = download_binary(best_doc_url)
-                if data:
-                    text, needs_ocr_flag = extract_text_from_pdf_bytes(data)
-                    # se non estrae testo, prova OCR se possibile
-                    if needs_ocr_flag and pytesseract is not None and convert_from_bytes is not None:
-                        status_text.info("  -> OCR in corso (pytesseract)...")
-                        try:
-                            ocr_text = ocr_pdf_bytes(data, dpi=200, lang="ita")
-                            if ocr_text and ocr_text.strip():
-                                text = ocr_text
-                                needs_ocr_flag = False
-                        except Exception:
-                            pass
-                    if not needs_ocr_flag and text:
-                        kw, val = find_value_near_keywords(text, extract_keywords)
-                        matched_keyword = kw
-                        matched_value = val
-                        if not kw:
-                            notes = "Nessuna keyword trovata nel testo"
-                    else:
-                        needs_ocr_flag = True
-                        if not notes:
-                            notes = "Documento probabilmente scannerizzato o testo non estraibile (needs OCR)"
-                else:
-                    notes = "Download documento fallito"
-            else:
-                notes = "Nessun documento PDF trovato dai risultati SERP"
+                    queries_used += used
+                    done_companies[company_key] = by_year
 
-            # scrivi risultati nella riga
-            df_proc.at[df_proc.index[i], "found_document_url"] = best_doc_url or ""
-            df_proc.at[df_proc.index[i], "matched_doc_keyword"] = matched_keyword or ""
-            df_proc.at[df_proc.index[i], "matched_value"] = matched_value or ""
-            df_proc.at[df_proc.index[i], "needs_ocr"] = bool(needs_ocr_flag)
-            df_proc.at[df_proc.index[i], "notes"] = notes or ""
+                # risultati della riga nell'archivio (scritti su disco a blocchi)
+                store.append(run_id, i, row_name, by_year)
 
-            progress.progress(int(((i+1)/n_rows)*100))
-            time.sleep(0.25)
+                progress.progress(int(((i+1)/n_rows)*100))
+                time.sleep(0.25)
+        finally:
+            store.flush()
+            if prof is not None:
+                prof.stop()
 
         status_text.success("Elaborazione completata.")
-        st.dataframe(df_proc.head(200), use_container_width=True)
-
-        # Download Excel aggiornato
-        out_buffer = io.BytesIO()
+        st.session_state.pop("queued_batch", None)
+        st.session_state["batch_run"] = {"run_id": run_id, "years": years_batch, "year": year_for_search,
+                                         "queries_used": queries_used, "prof": prof}
+
+    # batch accodato: stato dei job (aggiornato a ogni rerun) e merge dei risultati nell'archivio
+    queued = st.session_state.get("queued_batch")
+    if queued:
+        queue = job_queue()
+        qs = queue.status(queued["batch_id"])
+        finished = qs["done"] + qs["failed"]
+        st.markdown(f"#### 🧵 Batch in coda `{queued['batch_id']}`")
+        st.progress(int(100 * finished / max(1, qs["total"])))
+        st.caption(f"Job: {qs['total']} · in coda {qs['queued']} · in corso {qs['running']} · "
+                   f"finiti {qs['done']} · falliti {qs['failed']}. Avvia i worker con "
+                   f"`python job_queue.py worker --processes N` (coda: `{queue.path}`).")
+        failures = queue.failures(queued["batch_id"])
+        if failures:
+            import pandas as pd
+            st.dataframe(pd.DataFrame(failures), use_container_width=True, hide_index=True)
+        c1, c2 = st.columns(2)
+        with c1:
+            st.button("🔄 Aggiorna stato", key="queue_refresh")
+        with c2:
+            merge = st.button("🧩 Unisci risultati", key="queue_merge", disabled=finished == 0)
+        if merge:
+            qs = queue.merge(queued["batch_id"], results_store())
+            if qs["queued"] or qs["running"]:
+                st.warning(f"Merge parziale: {qs['queued'] + qs['running']} job non ancora conclusi.")
+            st.session_state["batch_run"] = {"run_id": queued["run_id"], "years": queued["years"],
+                                             "year": queued["year"], "queries_used": qs["queries_used"], "prof": None}
+
+    # ultimo batch in session_state: download e rerun non rilanciano ricerche, crawl o OCR
+    batch = st.session_state.get("batch_run")
+    if batch:
+        store = results_store()
+        st.dataframe(store.preview(batch["run_id"], 200), use_container_width=True)
+
+        # esportazione in streaming su file (XLSX write-only, CSV, JSON, Parquet), generata una volta per formato
+        fmt_batch = st.radio("Formato risultati", ["XLSX", "CSV", "JSON", "Parquet"], horizontal=True, key="batch_fmt")
+        ext = fmt_batch.lower()
         try:
-            df_proc.to_excel(out_buffer, index=False)
-            out_buffer.seek(0)
-            st.download_button("⬇️ Scarica Excel aggiornato", data=out_buffer, file_name=f"risultati_crawl_{year_for_search}.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            path = store.export_path(batch["run_id"], ext)
+            with open(path, "rb") as fh:
+                st.download_button(f"⬇️ Scarica risultati ({fmt_batch})", data=fh,
+                                   file_name=f"risultati_crawl_{'-'.join(str(y) for y in batch['years'])}.{ext}",
+                                   mime=EXPORT_FORMATS[ext])
         except Exception as e:
-            st.error(f"Errore generazione Excel: {e}")
+            st.error(f"Errore generazione {fmt_batch}: {e}")
+        st.caption(f"Run `{batch['run_id']}` salvato in `{store.path}` (esportabile anche con `python results_store.py export`).")
 
-        st.info(f"Query SERP effettuate in questo run: {queries_used} (quota giornaliera da monitorare!)")
+        render_profile(batch["prof"], f"risultati_crawl_{batch['year']}_profile")
+        st.info(f"Query SERP effettuate in questo run: {batch['queries_used']} (quota giornaliera da monitorare!)")
 
 
 # --------------------------------------------
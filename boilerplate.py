@@ -0,0 +1,103 @@
+"""
+Link di template del sito (header, footer, mega-menu) da valutare una volta sola per crawl.
+
+Un blocco di template è una sequenza di link che si ripete uguale su più pagine dello stesso sito.
+Per ogni pagina si calcolano le shingle di `SHINGLE` link consecutivi (URL assoluti, testo ignorato):
+un link coperto da una shingle già vista su un'altra pagina dello stesso sito è boilerplate e viene
+scartato prima dello scoring; la prima pagina che lo mostra lo valuta normalmente.
+
+Le shingle si registrano mentre la pagina arriva, quindi anche pagine dello stesso sito scaricate in
+parallelo si riconoscono a vicenda. Un link resta in attesa finché le shingle che possono coprirlo non
+sono complete (al massimo SHINGLE - 1 link): `PageLinks.close()` consegna gli ultimi a fine pagina.
+Se il fetch fallisce a metà, `PageLinks.discard()` ritira le shingle registrate dalla pagina: i link
+rimasti in attesa non sono mai stati valutati e la prossima pagina con lo stesso template li valuta.
+Link isolati (pagine con meno di SHINGLE link, voci ripetute fuori da un blocco) passano sempre.
+"""
+from __future__ import annotations
+import os
+from typing import Dict, List, Tuple
+
+import metrics
+
+# link consecutivi per shingle (0 = rilevamento disattivato)
+SHINGLE = int(os.environ.get("BILANCI_BOILERPLATE_SHINGLE", "3"))
+
+Link = Tuple[str, str]
+
+
+class SiteTemplates:
+    """Shingle di link viste nella crawl, per sito: {sito: {hash shingle: pagina che l'ha mostrata}}."""
+
+    def __init__(self, shingle: int = SHINGLE):
+        self.shingle = shingle
+        self.sites: Dict[str, Dict[int, str]] = {}
+
+    def page(self, site: str, url: str, on_skip=None) -> "PageLinks":
+        return PageLinks(self, site, url, on_skip)
+
+
+class PageLinks:
+    """Filtro dei link di una pagina: feed(blocco) → link di contenuto pronti, close() → i rimanenti."""
+
+    def __init__(self, templates: SiteTemplates, site: str, url: str, on_skip=None):
+        self.k = templates.shingle
+        self.known = templates.sites.setdefault(site, {})
+        self.url = url
+        self.on_skip = on_skip            # on_skip(link) per ogni link scartato (es. trace)
+        self.window: List[str] = []       # ultimi k URL della pagina
+        self.pending: List[list] = []     # [link, boilerplate?] non ancora consegnati
+        self.owned: List[int] = []        # shingle registrate per prime da questa pagina
+        self.skipped = 0
+
+    def feed(self, links) -> List[Link]:
+        if self.k <= 0:
+            return list(links)
+        k = self.k
+        for link in links:
+            self.pending.append([link, False])
+            self.window.append(link[0])
+            if len(self.window) > k:
+                del self.window[0]
+            if len(self.window) == k:
+                key = hash(tuple(self.window))
+                owner = self.known.setdefault(key, self.url)
+                if owner == self.url:
+                    self.owned.append(key)
+                else:
+                    for item in self.pending[-k:]:
+                        item[1] = True
+        # i link fuori dalle ultime k-1 posizioni non possono più essere coperti
+        ready = len(self.pending) - (k - 1)
+        if ready <= 0:
+            return []
+        out, self.pending = self.pending[:ready], self.pending[ready:]
+        return self._keep(out)
+
+    def close(self) -> List[Link]:
+        out, self.pending = self.pending, []
+        kept = self._keep(out)
+        if self.skipped:
+            metrics.inc("boilerplate_links_total", self.skipped, host=metrics.host_label(self.url))
+            self.skipped = 0
+        return kept
+
+    def discard(self) -> None:
+        """Fetch fallito: shingle della pagina ritirate, link in attesa scartati senza contarli."""
+        for key in self.owned:
+            if self.known.get(key) == self.url:
+                del self.known[key]
+        self.owned, self.pending = [], []
+        if self.skipped:
+            metrics.inc("boilerplate_links_total", self.skipped, host=metrics.host_label(self.url))
+            self.skipped = 0
+
+    def _keep(self, items: List[list]) -> List[Link]:
+        kept = []
+        for link, boiler in items:
+            if not boiler:
+                kept.append(link)
+            else:
+                self.skipped += 1
+                if self.on_skip is not None:
+                    self.on_skip(link)
+        return kept
@@ -0,0 +1,211 @@
+"""
+CLI: pipeline Entrypoint → Crawl → PDF → estrazione valore, senza Streamlit.
+
+Esempi:
+  # registra una crawl reale (risposte CSE e PDF inclusi)
+  python cli.py --company "Estra" --year 2023 --record estra_2023.jsonl.gz
+  # riesegue offline e deterministica (zero quota CSE), con tempi per stage
+  python cli.py --company "Estra" --year 2023 --replay estra_2023.jsonl.gz --repeat 5
+  # profila il run: .pstats, .speedscope.json e top-N accanto ai risultati
+  python cli.py --company "Estra" --year 2023 --profile out/
+  # multi-anno: una crawl, miglior PDF per anno
+  python cli.py --company "Estra" --year 2024 2023
+
+Gli entrypoint vengono dalla scoperta dei domini (discovery.py); la CSE è il ripiego, con le chiavi
+da GOOGLE_API_KEY / GOOGLE_CX (in replay bastano valori fittizi).
+"""
+from __future__ import annotations
+import argparse, json, os, sys, time
+
+import replay
+
+
+def _extract(pdf_url: str, keywords: list[str] | None, ocr: bool, timings: dict, ocr_mode: str = "adaptive",
+             pool=None, company: str | None = None, years: list[int] | tuple = ()) -> dict:
+    """
+    Download + estrazione testo (OCR se serve) + ricerca valore; accumula i tempi in `timings`.
+    Il testo per pagina finisce nel corpus FTS (corpus_index) con le etichette azienda/anni.
+    """
+    from corpus_index import index_document
+    from pdf_extract import (download_binary, extract_pages_from_pdf_bytes, ocr_pdf_pages, ocr_pdf_pages_adaptive,
+                             DocumentIndex)
+
+    out: dict = {}
+    t0 = time.perf_counter()
+    data = download_binary(pdf_url)
+    timings["download"] = timings.get("download", 0.0) + time.perf_counter() - t0
+    if not data:
+        out["notes"] = "Download documento fallito"
+        return out
+    out["pdf_bytes"] = len(data)
+
+    t0 = time.perf_counter()
+    if pool is not None:
+        # worker separato: timeout e limite di memoria per documento
+        res = pool.extract(data)
+        pages, needs_ocr = res["pages"], res["needs_ocr"]
+        if res["error"]:
+            timings["extract"] = timings.get("extract", 0.0) + time.perf_counter() - t0
+            out["notes"] = f"Estrazione testo interrotta ({res['error']})"
+            return out
+    else:
+        pages, needs_ocr = extract_pages_from_pdf_bytes(data)
+    timings["extract"] = timings.get("extract", 0.0) + time.perf_counter() - t0
+    if needs_ocr and ocr:
+        t0 = time.perf_counter()
+        if ocr_mode == "adaptive" and keywords:
+            ocr_pages = ocr_pdf_pages_adaptive(data, keywords, lang="ita")
+        else:
+            ocr_pages = ocr_pdf_pages(data, dpi=200, lang="ita")
+        timings["ocr"] = timings.get("ocr", 0.0) + time.perf_counter() - t0
+        if any(p.strip() for p in ocr_pages):
+            pages, needs_ocr = ocr_pages, False
+            out["ocr"] = True
+    out["needs_ocr"] = needs_ocr
+    if pages:
+        index_document(pdf_url, pages, company, years, ocr=bool(out.get("ocr")))
+
+    if keywords and pages:
+        # un valore (con pagina e posizione) per ogni keyword
+        out["values"] = DocumentIndex(pages).find_values(keywords)
+    return out
+
+
+def run_pipeline(company: str, year: int | list[int], seed: str | None = None, keywords: list[str] | None = None,
+                 max_pages: int = 50, max_depth: int = 4, ocr: bool = True, ocr_mode: str = "adaptive",
+                 pool=None) -> dict:
+    """
+    Esegue search → crawl → extract e ritorna esito + tempi per stage (secondi).
+    Con più anni: una sola ricerca e una sola crawl, esito per anno in `by_year`.
+    """
+    from discovery import find_entrypoints
+    from crawler import crawl_for_pdf, crawl_for_pdfs
+
+    years = sorted({int(y) for y in year}, reverse=True) if isinstance(year, (list, tuple)) else [int(year)]
+    timings: dict[str, float] = {}
+    out: dict = {"company": company, "year": years[0] if len(years) == 1 else years, "timings": timings}
+
+    t0 = time.perf_counter()
+    source = "seed"
+    if seed:
+        entrypoints = [seed]
+    else:
+        # scoperta dei domini prima; la CSE (se configurata) solo se non trova nulla
+        api_key = os.environ.get("GOOGLE_API_KEY", "")
+        cx = os.environ.get("GOOGLE_CX", "")
+        if (not api_key or not cx) and replay.current_mode() == "replay":
+            api_key, cx = api_key or "replay", cx or "replay"
+        entrypoints, source = find_entrypoints(company, years[0], api_key, cx, max_sites=5)
+        if source == "none" and (not api_key or not cx):
+            raise SystemExit("Sito ufficiale non trovato e GOOGLE_API_KEY/GOOGLE_CX mancanti: usa --seed "
+                             "oppure imposta le variabili.")
+    timings["search"] = time.perf_counter() - t0
+    out["entrypoints"] = entrypoints
+    out["entry_source"] = source
+    if not entrypoints:
+        out["notes"] = "Nessun entrypoint"
+        return out
+
+    if len(years) > 1:
+        t0 = time.perf_counter()
+        res = crawl_for_pdfs(entrypoints, years, max_pages=max_pages, max_depth=max_depth)
+        timings["crawl"] = time.perf_counter() - t0
+        out["crawl"] = {"visited": res["visited"], "candidates": res["candidates"]}
+        by_year, done = {}, {}
+        for y, hit in res["by_year"].items():
+            if not hit:
+                by_year[y] = {"pdf": None, "notes": "Nessun PDF trovato entro i limiti"}
+                continue
+            # stesso PDF per più anni → scaricato ed estratto una volta sola
+            if hit["pdf"] not in done:
+                same = [yy for yy, h in res["by_year"].items() if h and h["pdf"] == hit["pdf"]]
+                done[hit["pdf"]] = _extract(hit["pdf"], keywords, ocr, timings, ocr_mode, pool, company, same)
+            by_year[y] = {**hit, **done[hit["pdf"]]}
+        out["by_year"] = by_year
+        return out
+
+    t0 = time.perf_counter()
+    res = crawl_for_pdf(entrypoints, years[0], max_pages=max_pages, max_depth=max_depth)
+    timings["crawl"] = time.perf_counter() - t0
+    out["crawl"] = res
+    if not res.get("pdf"):
+        out["notes"] = "Nessun PDF trovato entro i limiti"
+        return out
+    out.update(_extract(res["pdf"], keywords, ocr, timings, ocr_mode, pool, company, years))
+    return out
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Bilanci: Entrypoint → Crawl → PDF → valore")
+    ap.add_argument("--company", required=True, help="Ragione sociale")
+    ap.add_argument("--year", type=int, nargs="+", required=True,
+                    help="Anno del bilancio (più anni = una sola crawl, esito per anno)")
+    ap.add_argument("--seed", help="URL seed manuale (salta la CSE)")
+    ap.add_argument("--keyword", action="append", dest="keywords", default=None,
+                    help="Keyword da cercare nel documento (ripetibile)")
+    ap.add_argument("--max-pages", type=int, default=50)
+    ap.add_argument("--max-depth", type=int, default=4)
+    ap.add_argument("--no-ocr", action="store_true", help="Non eseguire OCR sui PDF scannerizzati")
+    ap.add_argument("--ocr-mode", choices=["adaptive", "full"], default="adaptive",
+                    help="adaptive: passata veloce + alta risoluzione solo attorno alle keyword; full: tutte le pagine a 200 dpi")
+    ap.add_argument("--pdf-timeout", type=float, default=0.0,
+                    help="Estrae il testo in un worker separato con questo timeout per documento (0 = in processo)")
+    ap.add_argument("--pdf-backend", choices=["auto", "pdfplumber", "pypdf2", "bench"], default="auto",
+                    help="Backend di estrazione nel worker (bench: il più veloce per classe di documento)")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="ARCHIVE", help="Registra tutti gli scambi HTTP nell'archivio")
+    mode.add_argument("--replay", metavar="ARCHIVE", help="Riproduce offline dall'archivio (nessuna rete)")
+    ap.add_argument("--repeat", type=int, default=1, help="Ripete la pipeline N volte (benchmark)")
+    ap.add_argument("--profile", metavar="DIR", help="Profila il run e salva pstats/speedscope/top-N in DIR")
+    return ap
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.record:
+        replay.activate("record", args.record)
+    elif args.replay:
+        replay.activate("replay", args.replay)
+
+    prof = None
+    if args.profile:
+        from profiling import RunProfiler
+        prof = RunProfiler(name="cli_" + "-".join(str(y) for y in args.year)).start()
+
+    pool = None
+    if args.pdf_timeout > 0:
+        from pdf_pool import ExtractionPool
+        pool = ExtractionPool(workers=1, timeout=args.pdf_timeout, backend=args.pdf_backend)
+
+    runs = []
+    try:
+        for _ in range(max(1, args.repeat)):
+            t0 = time.perf_counter()
+            res = run_pipeline(args.company, args.year, seed=args.seed, keywords=args.keywords,
+                               max_pages=args.max_pages, max_depth=args.max_depth, ocr=not args.no_ocr,
+                               ocr_mode=args.ocr_mode, pool=pool)
+            res["timings"]["total"] = time.perf_counter() - t0
+            runs.append(res)
+    finally:
+        if prof is not None:
+            prof.stop()
+        if pool is not None:
+            pool.close()
+
+    out = runs[-1]
+    if pool is not None:
+        out["pdf_pool"] = pool.stats
+    if prof is not None:
+        from profiling import format_top
+        out["profile"] = prof.write(args.profile)
+        sys.stderr.write(format_top(prof.top_functions(15)))
+    if len(runs) > 1:
+        totals = sorted(r["timings"]["total"] for r in runs)
+        out["benchmark"] = {"runs": len(runs), "min": totals[0], "median": totals[len(totals) // 2], "max": totals[-1]}
+    json.dump(out, sys.stdout, ensure_ascii=False, indent=2, default=str)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""
+Indice full-text (SQLite FTS5) del testo estratto dai PDF, pagina per pagina (OCR incluso).
+
+Ogni documento estratto dal batch, dai worker della coda o dalla CLI viene salvato qui, con le
+etichette azienda/anno a cui è stato attribuito: cambiare le keyword di estrazione non richiede
+più di riscaricare e rileggere i PDF.
+
+- `search(query)`: ricerca full-text (bm25) con estratto della pagina, filtrabile per azienda/anno;
+- `find_values(keywords)`: valori vicino alle keyword (stessa DocumentIndex del batch) su tutti i
+  documenti che le citano;
+- `requery(store, run_id, keywords)`: nuovo run dell'archivio risultati con le nuove keyword sui
+  documenti già trovati da un run precedente, senza rete né PDF.
+
+Il testo sta in `page_text` (una riga per pagina), l'indice FTS5 è a contenuto esterno.
+Database da BILANCI_CORPUS_DB (vuoto = indicizzazione disattivata); journal classico come la coda
+di job, perché più worker su macchine diverse possono scriverci.
+
+Uso da riga di comando:
+  python corpus_index.py stats
+  python corpus_index.py search "costo del personale" [--company Estra] [--year 2023]
+  python corpus_index.py values --keyword "costo del personale" [--company Estra] [--year 2023]
+  python corpus_index.py requery <run_id> --keyword "costo del personale"
+"""
+from __future__ import annotations
+import json, os, re, sqlite3, sys, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import metrics
+
+DEFAULT_DB = os.environ.get("BILANCI_CORPUS_DB", os.path.join("results", "bilanci_corpus.sqlite"))
+INDEX_CACHE_DOCS = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT,
+    n_pages INTEGER NOT NULL,
+    ocr INTEGER NOT NULL DEFAULT 0,
+    indexed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    url TEXT NOT NULL,
+    company_key TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    company TEXT NOT NULL,
+    PRIMARY KEY (url, company_key, year)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_company ON tags (company_key, year);
+CREATE TABLE IF NOT EXISTS page_text (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS page_text_url ON page_text (url, page);
+CREATE VIRTUAL TABLE IF NOT EXISTS page_fts USING fts5(
+    text, content='page_text', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def company_key(name: str) -> str:
+    return " ".join(str(name).casefold().split())
+
+
+def keyword_query(keywords: Iterable[str]) -> str:
+    """Query FTS5 "almeno una keyword": ogni keyword è una frase, l'ultima parola anche come prefisso."""
+    phrases = []
+    for kw in keywords:
+        tokens = _TOKEN_RE.findall(kw or "")
+        if tokens:
+            phrases.append(" + ".join(f'"{t}"' for t in tokens) + "*")
+    return " OR ".join(phrases)
+
+
+class CorpusIndex:
+    """Indice condivisibile tra thread (scritture serializzate, transazioni BEGIN IMMEDIATE)."""
+
+    def __init__(self, path: str = DEFAULT_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA busy_timeout=60000")
+        self._conn.executescript(_SCHEMA)
+        # DocumentIndex per URL (e data di indicizzazione): le ricerche ripetute non rileggono il testo
+        self._indexes: "OrderedDict[tuple, Any]" = OrderedDict()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------- scrittura ----------------
+    def add_document(self, url: str, pages: Sequence[str], company: Optional[str] = None,
+                     years: Iterable[int] = (), ocr: bool = False, sha256: Optional[str] = None) -> bool:
+        """
+        Salva il testo per pagina del documento e le etichette azienda/anno. Il testo già presente viene
+        sostituito solo se cambia (es. versione OCR dopo una senza testo). Ritorna True se il testo è stato scritto.
+        """
+        pages = [p or "" for p in pages]
+        if not any(p.strip() for p in pages):
+            return False   # niente testo (scansione senza OCR): nulla da cercare
+        with metrics.timer("corpus_index_seconds"), self._lock:
+            c = self._conn
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                prev = c.execute("SELECT n_pages, ocr, sha256 FROM documents WHERE url = ?", (url,)).fetchone()
+                write = prev is None or prev[0] != len(pages) or bool(prev[1]) != bool(ocr) or \
+                    (sha256 is not None and prev[2] != sha256)
+                if write:
+                    if prev is not None:
+                        # FTS5 a contenuto esterno: le righe vecchie si tolgono dall'indice con il comando 'delete'
+                        c.execute("INSERT INTO page_fts (page_fts, rowid, text) "
+                                  "SELECT 'delete', id, text FROM page_text WHERE url = ?", (url,))
+                        c.execute("DELETE FROM page_text WHERE url = ?", (url,))
+                    for i, text in enumerate(pages, 1):
+                        rowid = c.execute("INSERT INTO page_text (url, page, text) VALUES (?, ?, ?)",
+                                          (url, i, text)).lastrowid
+                        c.execute("INSERT INTO page_fts (rowid, text) VALUES (?, ?)", (rowid, text))
+                    c.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                              (url, sha256, len(pages), int(bool(ocr)), time.time()))
+                if company:
+                    c.executemany("INSERT OR IGNORE INTO tags VALUES (?, ?, ?, ?)",
+                                  [(url, company_key(company), int(y), str(company)) for y in years])
+            except BaseException:
+                c.execute("ROLLBACK")
+                raise
+            c.execute("COMMIT")
+        if write:
+            metrics.inc("corpus_documents_total")
+            metrics.inc("corpus_pages_total", value=len(pages))
+        return write
+
+    # ---------------- lettura ----------------
+    def stats(self) -> dict:
+        with self._lock:
+            docs, pages, ocr = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(n_pages), 0), COALESCE(SUM(ocr), 0) FROM documents").fetchone()
+            companies = self._conn.execute("SELECT COUNT(DISTINCT company_key) FROM tags").fetchone()[0]
+        return {"documents": docs, "pages": pages, "ocr_documents": ocr, "companies": companies}
+
+    def tags(self, url: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT company, year FROM tags WHERE url = ? ORDER BY year DESC, company",
+                                      (url,)).fetchall()
+        return [{"company": r[0], "year": r[1]} for r in rows]
+
+    def document_pages(self, url: str) -> Optional[List[str]]:
+        """Testo per pagina del documento (None se non indicizzato)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT page, text FROM page_text WHERE url = ? ORDER BY page", (url,)).fetchall()
+        if not rows:
+            return None
+        pages = [""] * rows[-1][0]
+        for page, text in rows:
+            pages[page - 1] = text
+        return pages
+
+    def document_index(self, url: str):
+        """DocumentIndex del documento (memorizzato per URL e data di indicizzazione), None se assente."""
+        from pdf_extract import DocumentIndex
+        with self._lock:
+            row = self._conn.execute("SELECT indexed FROM documents WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        key = (url, row[0])
+        index = self._indexes.get(key)
+        if index is None:
+            pages = self.document_pages(url)
+            if pages is None:
+                return None
+            index = DocumentIndex(pages)
+            self._indexes[key] = index
+            while len(self._indexes) > INDEX_CACHE_DOCS:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(key)
+        return index
+
+    def _filter(self, company: Optional[str], year: Optional[int]):
+        where, args = [], []
+        if company:
+            where.append("company_key = ?")
+            args.append(company_key(company))
+        if year:
+            where.append("year = ?")
+            args.append(int(year))
+        if not where:
+            return "", []
+        return f" AND p.url IN (SELECT url FROM tags WHERE {' AND '.join(where)})", args
+
+    def search(self, query: str, company: Optional[str] = None, year: Optional[int] = None,
+               limit: int = 50) -> List[dict]:
+        """
+        Pagine che rispondono alla query FTS5 (parole, "frasi", prefisso*, OR/NOT), dalla più pertinente,
+        con estratto ed etichette azienda/anno del documento.
+        """
+        extra, args = self._filter(company, year)
+        with metrics.timer("corpus_query_seconds", kind="search"), self._lock:
+            rows = self._conn.execute(
+                "SELECT p.url, p.page, snippet(page_fts, 0, '«', '»', '…', 16), bm25(page_fts) "
+                "FROM page_fts JOIN page_text p ON p.id = page_fts.rowid "
+                f"WHERE page_fts MATCH ?{extra} ORDER BY bm25(page_fts) LIMIT ?",
+                [query] + args + [int(limit)]).fetchall()
+        tags: Dict[str, List[dict]] = {}
+        for url, *_ in rows:
+            if url not in tags:
+                tags[url] = self.tags(url)
+        return [{"url": url, "page": page, "snippet": snippet, "score": round(-rank, 3),
+                 "companies": sorted({t["company"] for t in tags[url]}),
+                 "years": sorted({t["year"] for t in tags[url]}, reverse=True)}
+                for url, page, snippet, rank in rows]
+
+    def matching_pages(self, keywords: Sequence[str], company: Optional[str] = None,
+                       year: Optional[int] = None) -> Dict[str, List[int]]:
+        """{url: pagine} in cui compare almeno una keyword."""
+        query = keyword_query(keywords)
+        if not query:
+            return {}
+        extra, args = self._filter(company, year)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.url, p.page FROM page_fts JOIN page_text p ON p.id = page_fts.rowid "
+                f"WHERE page_fts MATCH ?{extra}", [query] + args).fetchall()
+        out: Dict[str, List[int]] = {}
+        for url, page in rows:
+            out.setdefault(url, []).append(page)
+        return out
+
+    def _sparse_index(self, url: str, pages: Sequence[int], margin: int):
+        """
+        DocumentIndex con le sole pagine che citano le keyword: delle pagine vicine bastano i `margin`
+        caratteri adiacenti (un numero può stare a cavallo di pagina). Pagine e distanze restano quelle
+        del documento intero; gli offset no.
+        """
+        from pdf_extract import DocumentIndex
+        hit = set(pages)
+        need = hit | {p - 1 for p in hit if p > 1} | {p + 1 for p in hit}
+        marks = ",".join("?" for _ in need)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT page, text FROM page_text WHERE url = ? AND page IN ({marks})",
+                                      [url] + sorted(need)).fetchall()
+        texts = [""] * max(p for p, _ in rows) if rows else []
+        for page, text in rows:
+            if page in hit:
+                texts[page - 1] = text
+            elif page + 1 in hit and page - 1 not in hit:
+                texts[page - 1] = text[-margin:]          # coda della pagina precedente
+            elif page - 1 in hit and page + 1 not in hit:
+                texts[page - 1] = text[:margin]           # inizio della pagina successiva
+            else:
+                texts[page - 1] = text if len(text) <= 2 * margin else text[:margin] + "\n" + text[-margin:]
+        return DocumentIndex(texts)
+
+    def find_values(self, keywords: Sequence[str], company: Optional[str] = None, year: Optional[int] = None,
+                    within: int = 300, fallback_within: int = 800) -> List[dict]:
+        """
+        Valore più vicino a ogni keyword (come nel batch) in ogni documento che ne cita almeno una:
+        [{url, companies, years, values: {keyword: {value, raw, page, ...} | None}}].
+        Si leggono solo le pagine con le keyword (FTS), non i documenti interi.
+        """
+        out = []
+        with metrics.timer("corpus_query_seconds", kind="values"):
+            for url, pages in self.matching_pages(keywords, company, year).items():
+                values = self._sparse_index(url, pages, fallback_within).find_values(list(keywords), within,
+                                                                                    fallback_within)
+                if not any(values.values()):
+                    continue
+                tags = self.tags(url)
+                out.append({"url": url, "companies": sorted({t["company"] for t in tags}),
+                            "years": sorted({t["year"] for t in tags}, reverse=True), "values": values})
+        return out
+
+
+# --------------------------------------------
+# Indice del processo e indicizzazione dalla pipeline
+# --------------------------------------------
+_default: Optional[CorpusIndex] = None
+_default_lock = threading.Lock()
+
+
+def default_index() -> Optional[CorpusIndex]:
+    """Indice del processo (BILANCI_CORPUS_DB), None se l'indicizzazione è disattivata."""
+    global _default
+    if not DEFAULT_DB:
+        return None
+    with _default_lock:
+        if _default is None:
+            _default = CorpusIndex(DEFAULT_DB)
+        return _default
+
+
+def index_document(url: str, pages: Sequence[str], company: Optional[str] = None, years: Iterable[int] = (),
+                   ocr: bool = False, sha256: Optional[str] = None) -> None:
+    """add_document sull'indice del processo; un errore dell'indice non ferma mai il batch."""
+    try:
+        index = default_index()
+        if index is not None:
+            index.add_document(url, pages, company, list(years), ocr=ocr, sha256=sha256)
+    except Exception:
+        metrics.inc("corpus_index_errors_total")
+
+
+def requery(index: CorpusIndex, store, run_id: str, keywords: Sequence[str]) -> str:
+    """
+    Nuovo run dell'archivio risultati: stesse righe e stessi documenti del run `run_id`, valori cercati
+    con le nuove `keywords` nel testo indicizzato (nessun download, nessuna estrazione). Ritorna il run_id.
+    """
+    from pipeline import match_fields
+    info = store.run_info(run_id)
+    if info is None:
+        raise KeyError(f"run sconosciuto: {run_id}")
+    new_id = store.new_run(info["input_columns"], info["years"],
+                           meta={**info["meta"], "requery_of": run_id, "extract_keywords": list(keywords)})
+    store.copy_inputs(run_id, new_id)
+    with metrics.timer("corpus_query_seconds", kind="requery"):
+        for row_idx, company, year, fields in store.results(run_id):
+            url = fields.get("found_document_url")
+            new = {"found_document_url": url or "", "needs_ocr": bool(fields.get("needs_ocr")),
+                   "notes": fields.get("notes") or ""}
+            doc = index.document_index(url) if url else None
+            if doc is not None:
+                new.update(match_fields(doc, list(keywords)))
+                new["needs_ocr"] = False
+            elif url:
+                new["notes"] = "Documento non presente nel corpus (rilanciare il batch per estrarlo)"
+            store.append(new_id, row_idx, company, {year: new})
+    store.flush()
+    return new_id
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Indice full-text dei report estratti (SQLite FTS5)")
+    ap.add_argument("--db", default=DEFAULT_DB or os.path.join("results", "bilanci_corpus.sqlite"))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="documenti, pagine e aziende indicizzati")
+    se = sub.add_parser("search", help="ricerca full-text (sintassi FTS5)")
+    se.add_argument("query")
+    va = sub.add_parser("values", help="valori vicino alle keyword in tutti i documenti")
+    va.add_argument("--keyword", action="append", dest="keywords", required=True)
+    for p in (se, va):
+        p.add_argument("--company")
+        p.add_argument("--year", type=int)
+        p.add_argument("--limit", type=int, default=50)
+    rq = sub.add_parser("requery", help="nuovo run con altre keyword sui documenti di un run del batch")
+    rq.add_argument("run_id")
+    rq.add_argument("--keyword", action="append", dest="keywords", required=True)
+    rq.add_argument("--results-db", default=None)
+    args = ap.parse_args(argv)
+
+    with CorpusIndex(args.db) as index:
+        if args.cmd == "stats":
+            print(json.dumps(index.stats(), ensure_ascii=False))
+        elif args.cmd == "search":
+            for r in index.search(args.query, args.company, args.year, args.limit):
+                print(f"{r['score']:>7}  {', '.join(r['companies'])} {r['years']}  p.{r['page']}  {r['url']}")
+                print(f"         {r['snippet']}")
+        elif args.cmd == "values":
+            for r in index.find_values(args.keywords, args.company, args.year)[:args.limit]:
+                print(json.dumps(r, ensure_ascii=False, default=str))
+        else:
+            from results_store import DEFAULT_DB as RESULTS_DB, ResultsStore
+            with ResultsStore(args.results_db or RESULTS_DB) as store:
+                print(requery(index, store, args.run_id, args.keywords))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Trace delle decisioni di crawl (opzionale) per tarare pesi di `_score_link`, `max_depth` e `max_pages`.
+
+Un evento per riga (JSONL):
+- push    : URL messo in frontiera (score, depth, parent, anchor)
+- pop     : URL estratto dalla frontiera (con t_enqueue)
+- fetch   : esito HTTP (status, content-type, bytes, durata; truncated se oltre il tetto di byte)
+- skip    : URL scartato, con `reason` (visited, depth, domain, scheme, http_status,
+            content_type, error, robots, circuit_open, boilerplate)
+- found   : PDF scelto
+- unvisited: URL rimasti in frontiera a budget esaurito (reason=max_pages)
+
+Se il crawler riceve trace=None non si paga nulla oltre a un confronto per evento.
+"""
+from __future__ import annotations
+import json, time
+from collections import Counter
+
+
+class CrawlTrace:
+    def __init__(self):
+        self.events: list[dict] = []
+        self._enqueued: dict[tuple, float] = {}
+        self.t_start = time.time()
+
+    def _add(self, event: str, url: str, **fields) -> None:
+        rec = {"event": event, "ts": time.time(), "url": url}
+        rec.update(fields)
+        self.events.append(rec)
+
+    def push(self, url: str, score: float, depth: int, parent: str | None, anchor: str = "") -> None:
+        self._enqueued.setdefault((url, parent), time.time())
+        self._add("push", url, score=round(score, 3), depth=depth, parent=parent, anchor=(anchor or "")[:200])
+
+    def pop(self, url: str, score: float, depth: int, parent: str | None) -> None:
+        self._add("pop", url, score=round(score, 3), depth=depth, parent=parent,
+                  t_enqueue=self._enqueued.get((url, parent)))
+
+    def fetch(self, url: str, status: int, content_type: str = "", nbytes: int = 0, seconds: float = 0.0,
+              truncated: bool = False) -> None:
+        extra = {"truncated": True} if truncated else {}
+        self._add("fetch", url, status=status, content_type=content_type, bytes=nbytes, seconds=round(seconds, 4),
+                  **extra)
+
+    def skip(self, url: str, reason: str, **fields) -> None:
+        self._add("skip", url, reason=reason, **fields)
+
+    def found(self, url: str, score: float, parent: str | None) -> None:
+        self._add("found", url, score=round(score, 3), parent=parent)
+
+    def unvisited(self, url: str, score: float, depth: int, parent: str | None, reason: str = "max_pages") -> None:
+        self._add("unvisited", url, score=round(score, 3), depth=depth, parent=parent, reason=reason)
+
+    def summary(self) -> dict:
+        """Conteggi per evento e per motivo di scarto, più byte scaricati e tempo di fetch."""
+        events = Counter(e["event"] for e in self.events)
+        reasons = Counter(e["reason"] for e in self.events if e["event"] in ("skip", "unvisited"))
+        fetched = [e for e in self.events if e["event"] == "fetch"]
+        return {
+            "events": dict(events),
+            "skip_reasons": dict(reasons),
+            "bytes": sum(e.get("bytes", 0) for e in fetched),
+            "fetch_seconds": round(sum(e.get("seconds", 0.0) for e in fetched), 3),
+        }
+
+    def to_jsonl(self) -> str:
+        return "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self.events)
@@ -1,8 +1,15 @@
 from __future__ import annotations
-import re, heapq, unicodedata
+import asyncio, os, re, heapq, time, unicodedata
 from urllib.parse import urljoin, urlparse
 import httpx
-from bs4 import BeautifulSoup
+
+import boilerplate
+import host_health
+import html_stream
+import metrics
+import replay
+from aio_util import run_sync
+from crawl_trace import CrawlTrace
 
 # Alcuni PDF sono ospitati su CDN o storage esterni leciti per documenti societari
 ALLOWED_EXTERNAL_PDF_HOSTS = [
@@ -29,6 +36,9 @@ KEY_TERMS = [
     "amministrazione trasparente", "trasparenza", "bilanci-relazioni"
 ]
 
+# pagine scaricate in parallelo per giro di crawl (le prime della heap best-first)
+CRAWL_CONCURRENCY = int(os.environ.get("BILANCI_CRAWL_CONCURRENCY", "4"))
+
 URL_HINTS = [
     "investor", "investor-relations", "investitori", "relazioni", "bilanci",
     "financial", "report", "documenti", "amministrazione-trasparente",
@@ -81,74 +91,428 @@ def _score_link(url: str, anchor_text: str, year: int) -> float:
             score += 0.5
     return score
 
-def _extract_links(base_url: str, html: str):
-    soup = BeautifulSoup(html, "html.parser")
-    out, seen = [], set()
-    for a in soup.find_all("a", href=True):
-        href = a.get("href")
+def _resolve_links(base_url: str, links, seen: set) -> list:
+    """(href, testo) del parser → (URL assoluto, testo o href), senza duplicati nella pagina."""
+    out = []
+    for href, txt in links:
+        if not href:
+            continue
         url = urljoin(base_url, href)
-        txt = a.get_text(" ", strip=True) or href
         if url not in seen:
-            seen.add(url); out.append((url, txt))
+            seen.add(url); out.append((url, txt or href))
     return out
 
-def crawl_for_pdf(entry_urls: list[str], year: int, max_pages=50, max_depth=4, timeout=15) -> dict:
+def _extract_links(base_url: str, html: str):
+    parser = html_stream.LinkParser()
+    with metrics.timer("html_parse_seconds"):
+        parser.feed(html)
+        parser.close()
+    return _resolve_links(base_url, parser.drain(), set())
+
+async def _crawl(entry_urls: list[str], score, on_pdf, done, max_pages: int, max_depth: int, timeout,
+                 trace: CrawlTrace | None, pages_by_domain: dict | None = None, pages=None,
+                 concurrency: int = CRAWL_CONCURRENCY, host_stats: dict | None = None) -> int:
     """
-    Visita il dominio a partire dagli entrypoint HTML e ritorna il primo PDF 'buono' per l'anno.
-    Ritorna dict con chiavi: pdf|None, score, via, visited, reason (se non trovato).
+    Nucleo best-first (async) comune alle modalità singolo/multi-anno.
+    score(url, anchor) → priorità in frontiera; on_pdf(url, anchor, via) → score se il PDF è accettato
+    (None altrimenti: il PDF resta in frontiera); done() → True quando si può smettere.
+
+    Più entrypoint (anche su domini diversi) = una sola crawl: frontiera per dominio registrabile,
+    visited e budget condivisi. Ogni dominio ha una quota minima riservata (metà budget diviso per
+    i domini); il resto va al dominio con il link più promettente in testa alla frontiera, e la quota
+    di un dominio senza più frontiera torna disponibile. Con un solo dominio è il best-first di sempre.
+    Ritorna il numero di URL visitati (per dominio in `pages_by_domain`, se passato).
+
+    Ad ogni giro si estraggono dalla heap le prime `concurrency` pagine e si scaricano in parallelo,
+    in streaming (html_stream, con tetto di byte): i link di ogni pagina si valutano a blocchi mentre
+    arriva, e quando done() è soddisfatto i download ancora in corso vengono chiusi.
+    Con concurrency=1 è la crawl sequenziale.
+
+    `pages` (es. monitor.PageCache) rende la crawl incrementale: richieste condizionali
+    (headers(url)) e, su 304 o contenuto invariato, i link salvati invece del parsing (links(...)).
+
+    Ogni richiesta passa da host_health: host con circuito aperto saltati (senza consumare budget),
+    timeout adattato alla latenza dell'host, esiti per host sommati in `host_stats` se passato.
+
+    I blocchi di link ripetuti dal template del sito (header, footer, menu) si valutano solo sulla
+    prima pagina che li mostra (boilerplate.py): sulle altre non si calcola lo score né si ripete il push.
     """
     visited = set()
-    # priority queue: (-score, depth, url, anchor, parent)
-    pq = []
+    blocked = set()
+    templates = boilerplate.SiteTemplates()
+    stats = host_stats if host_stats is not None else {}
+    # priority queue per dominio registrabile: (-score, depth, url, anchor, parent)
+    frontiers: dict[str, list] = {}
+    roots: dict[str, str] = {}
     for u in entry_urls:
-        heapq.heappush(pq, (-5.0, 0, u, "entry", None))
+        dom = _registrable(urlparse(u).netloc)
+        roots.setdefault(dom, u)
+        heapq.heappush(frontiers.setdefault(dom, []), (-5.0, 0, u, "entry", None))
+        if trace is not None:
+            trace.push(u, 5.0, 0, None, "entry")
+    spent = pages_by_domain if pages_by_domain is not None else {}
+    for dom in frontiers:
+        spent.setdefault(dom, 0)
+    reserve = max(1, max_pages // (2 * len(frontiers))) if frontiers else 0
 
-    with httpx.Client(follow_redirects=True, timeout=timeout, headers={
-        "User-Agent": "Mozilla/5.0 (compatible; BilanciCrawler/1.0)"
-    }) as client:
-        while pq and len(visited) < max_pages:
-            neg_s, depth, url, text, parent = heapq.heappop(pq)
-            if url in visited:
+    def next_domain():
+        live = [d for d, pq in frontiers.items() if pq]
+        if not live:
+            return None
+        floating = max_pages - len(visited) - sum(max(0, reserve - spent[d]) for d in live)
+        eligible = [d for d in live if spent[d] < reserve or floating > 0]
+        # testa di frontiera migliore (stesso ordinamento della heap)
+        return min(eligible or live, key=lambda d: frontiers[d][0])
+
+    def next_batch() -> tuple[list, bool]:
+        """Fino a `concurrency` pagine HTML da scaricare; True se un PDF accettato ha chiuso la crawl."""
+        batch = []
+        while len(batch) < max(1, concurrency) and len(visited) < max_pages:
+            dom = next_domain()
+            if dom is None:
+                break
+            neg_s, depth, url, text, parent = heapq.heappop(frontiers[dom])
+            if trace is not None:
+                trace.pop(url, -neg_s, depth, parent)
+            if url in visited or url in blocked:
+                if trace is not None:
+                    trace.skip(url, "visited")
                 continue
             visited.add(url)
+            spent[dom] += 1
             if depth > max_depth:
+                if trace is not None:
+                    trace.skip(url, "depth", depth=depth)
                 continue
 
             # Caso: già PDF plausibile
-            if url.lower().endswith(".pdf") and _score_link(url, text, year) >= 2.0:
-                return {"pdf": url, "score": _score_link(url, text, year), "via": parent or "seed", "visited": len(visited)}
-
-            # Fetch HTML
-            try:
-                r = client.get(url)
-                if r.status_code >= 400 or "text/html" not in r.headers.get("content-type", ""):
+            if url.lower().endswith(".pdf"):
+                sc = on_pdf(url, text, parent or "seed")
+                if sc is not None:
+                    if trace is not None:
+                        trace.found(url, sc, parent)
+                    if done():
+                        return batch, True
                     continue
-                html = r.text
-            except Exception:
+            if not host_health.allow(url):
+                # host in cooldown: nessuna richiesta e pagina restituita al budget
+                visited.discard(url)
+                spent[dom] -= 1
+                blocked.add(url)
+                host_health.tally(stats, url, "circuit_open")
+                if trace is not None:
+                    trace.skip(url, "circuit_open")
                 continue
+            batch.append((dom, depth, url))
+        return batch, False
 
-            # Estrai link e valuta
-            links = _extract_links(url, html)
-            origin = entry_urls[0]
-            for u2, txt in links:
-                same_dom = _same_domain(origin, u2)
-                allowed_ext_pdf = _is_allowed_external_pdf(origin, u2)
-                if not same_dom and not allowed_ext_pdf:
-                    continue
+    finished = False
 
-                # scarta protocolli non http(s), mailto, anchor
-                if not u2.lower().startswith(("http://", "https://")):
-                    continue
-                if u2.lower().startswith(("mailto:", "tel:")) or u2.endswith("#"):
+    def visit_links(dom: str, depth: int, url: str, links) -> bool:
+        """Valuta un blocco di link della pagina `url` (anche a pagina non finita); True se done()."""
+        nonlocal finished
+        if finished:
+            return True
+        origin = roots[dom]
+        t_score = time.perf_counter()
+        for u2, txt in links:
+            same_dom = _same_domain(origin, u2)
+            # link verso il dominio di un altro entrypoint: va nella frontiera di quel dominio
+            target = dom if same_dom else _registrable(urlparse(u2).netloc)
+            if target not in frontiers:
+                target = dom
+            allowed_ext_pdf = _is_allowed_external_pdf(origin, u2)
+            if not same_dom and target == dom and not allowed_ext_pdf:
+                if trace is not None:
+                    trace.skip(u2, "domain", parent=url)
+                continue
+
+            # scarta protocolli non http(s), mailto, anchor
+            if not u2.lower().startswith(("http://", "https://")):
+                if trace is not None:
+                    trace.skip(u2, "scheme", parent=url)
+                continue
+            if u2.lower().startswith(("mailto:", "tel:")) or u2.endswith("#"):
+                if trace is not None:
+                    trace.skip(u2, "scheme", parent=url)
+                continue
+
+            # se è PDF accettato → candidato (non si naviga)
+            if u2.lower().endswith(".pdf"):
+                sc = on_pdf(u2, txt, url)
+                if sc is not None:
+                    if trace is not None:
+                        trace.found(u2, sc, url)
+                    if done():
+                        finished = True
+                        break
                     continue
 
-                sc = _score_link(u2, txt, year)
+            # enqueue per navigare
+            sc = score(u2, txt)
+            heapq.heappush(frontiers[target], (-sc, depth + 1, u2, txt, url))
+            if trace is not None:
+                trace.push(u2, sc, depth + 1, url, txt)
+        metrics.observe("link_scoring_seconds", time.perf_counter() - t_score)
+        return finished
+
+    async def fetch(client: httpx.AsyncClient, dom: str, depth: int, url: str) -> None:
+        t0 = time.perf_counter()
+        kw = {"timeout": host_health.timeout_for(url, timeout)}
+        on_links = None
+        on_skip = (lambda link: trace.skip(link[0], "boilerplate", parent=url)) if trace is not None else None
+        template = templates.page(dom, url, on_skip)
+        if pages is not None:
+            kw["headers"] = pages.headers(url)
+        else:
+            # link valutati a blocchi mentre la pagina arriva (parser incrementale)
+            seen: set = set()
+            on_links = lambda links: visit_links(dom, depth, url, template.feed(_resolve_links(url, links, seen)))
+        try:
+            page = await html_stream.stream_html(client, url, on_links, keep_html=pages is not None, **kw)
+        except Exception as e:
+            template.discard()
+            elapsed = time.perf_counter() - t0
+            host_health.record_error(url, elapsed, e, stats)
+            metrics.record_fetch(url, elapsed, error=True)
+            if trace is not None:
+                trace.skip(url, "error", error=type(e).__name__)
+            return
+        elapsed = time.perf_counter() - t0
+        status, ctype = page["status"], page["content_type"]
+        host_health.record_response(url, elapsed, status, stats)
+        metrics.record_fetch(url, elapsed, page["nbytes"])
+        if trace is not None:
+            trace.fetch(url, status, ctype, page["nbytes"], elapsed, truncated=page["truncated"])
+        if on_links is not None:
+            # ultimi link della pagina, trattenuti finché le shingle non erano complete
+            rest = template.close()
+            if rest:
+                visit_links(dom, depth, url, rest)
+        if pages is not None and status == 304:
+            # pagina non modificata: link dell'ultimo controllo, niente download né parsing
+            links = pages.links(url, page["response"], None)
+            visit_links(dom, depth, url, template.feed(links) + template.close())
+        elif status >= 400 or not html_stream.is_html(ctype):
+            # corpo non letto (PDF, binari, pagine di errore)
+            if trace is not None:
+                trace.skip(url, "http_status" if status >= 400 else "content_type",
+                           status=status, content_type=ctype)
+        elif pages is not None:
+            links = pages.links(url, page["response"], page["html"], page["nbytes"])
+            visit_links(dom, depth, url, template.feed(links) + template.close())
+
+    async with httpx.AsyncClient(follow_redirects=True, timeout=timeout, headers={
+        "User-Agent": "Mozilla/5.0 (compatible; BilanciCrawler/1.0)"
+    }, **replay.client_kwargs(async_client=True)) as client:
+        while len(visited) < max_pages:
+            batch, stop = next_batch()
+            if stop:
+                return len(visited)
+            if not batch:
+                break
+            pending = {asyncio.ensure_future(fetch(client, dom, depth, url)) for dom, depth, url in batch}
+            while pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if finished:
+                    # done() raggiunto: si chiudono i download ancora in corso
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    return len(visited)
+
+    if trace is not None:
+        # quello che resta in frontiera è il budget mancato: utile per tarare max_pages
+        for neg_s, depth, u, _, parent in sorted(e for pq in frontiers.values() for e in pq):
+            if u not in visited:
+                trace.unvisited(u, -neg_s, depth, parent)
+    return len(visited)
+
+
+def crawl_for_pdf(entry_urls: list[str], year: int, max_pages=50, max_depth=4, timeout=15,
+                  trace: CrawlTrace | None = None, pages=None, mode: str = "first", top_k: int = 5,
+                  max_candidates: int = 20, concurrency: int = CRAWL_CONCURRENCY) -> dict:
+    """Wrapper sincrono di crawl_for_pdf_async (stessi parametri, stesso dict)."""
+    return run_sync(crawl_for_pdf_async(entry_urls, year, max_pages, max_depth, timeout, trace, pages, mode,
+                                        top_k, max_candidates, concurrency))
+
+
+async def crawl_for_pdf_async(entry_urls: list[str], year: int, max_pages=50, max_depth=4, timeout=15,
+                              trace: CrawlTrace | None = None, pages=None, mode: str = "first", top_k: int = 5,
+                              max_candidates: int = 20, concurrency: int = CRAWL_CONCURRENCY) -> dict:
+    """
+    Visita il dominio a partire dagli entrypoint HTML e ritorna il primo PDF 'buono' per l'anno.
+    Tutti gli entrypoint dell'azienda vanno in una sola crawl (frontiera e budget condivisi per dominio).
+    Ritorna dict con chiavi: pdf|None, score, via, visited, pages_by_domain, host_stats (esiti delle
+    richieste per host e stato del circuito), reason (se non trovato).
+    Con `trace` (CrawlTrace) registra ogni push/pop/fetch/scarto della frontiera;
+    con `pages` (monitor.PageCache) rivalida le pagine già viste con richieste condizionali.
+
+    mode="rank": non si ferma al primo PDF ma raccoglie fino a `max_candidates` candidati (entro
+    max_pages), verifica in parallelo i migliori `top_k` (HEAD + sonda Range del contenuto) e ritorna
+    il migliore verificato; in più `candidates`, la classifica con le evidenze di ogni verifica.
+    `concurrency`: pagine scaricate in parallelo (le migliori della frontiera); 1 = sequenziale.
+    """
+    hit: dict = {}
+    cands: list[dict] = []
+    by_domain: dict = {}
+    by_host: dict = {}
+    rank = mode == "rank"
+
+    def on_pdf(url, anchor, via):
+        sc = _score_link(url, anchor, year)
+        if sc < 2.0:
+            return None
+        if rank:
+            if all(c["pdf"] != url for c in cands):
+                cands.append({"pdf": url, "anchor": anchor, "via": via, "score_link": sc})
+            return sc
+        if not hit:
+            hit.update({"pdf": url, "score": sc, "via": via})
+            return sc
+        return None
+
+    done = (lambda: len(cands) >= max_candidates) if rank else (lambda: bool(hit))
+    visited = await _crawl(entry_urls, lambda u, t: _score_link(u, t, year), on_pdf, done,
+                           max_pages, max_depth, timeout, trace, by_domain, pages, concurrency, by_host)
+    extra = {"visited": visited, "pages_by_domain": by_domain, "host_stats": host_health.summary(by_host)}
+    if rank:
+        # run_in_executor e non asyncio.to_thread (3.9+): la CI gira anche su Python 3.8
+        ranked = await asyncio.get_running_loop().run_in_executor(None, _verify_candidates, cands, year, top_k, timeout)
+        best = next((c for c in ranked if c["verified"]), None)
+        if best:
+            return {"pdf": best["pdf"], "score": best["score"], "via": best["via"], "candidates": ranked, **extra}
+        return {"pdf": None, "reason": "no_verified_candidate" if ranked else "not_found_within_limits",
+                "candidates": ranked, **extra}
+    if hit:
+        return {**hit, **extra}
+    return {"pdf": None, "reason": "not_found_within_limits", **extra}
+
+
+def _verify_pdf(client: httpx.Client, cand: dict, year: int) -> dict:
+    """HEAD (stato, content-type, dimensione) + sonda Range (titolo, anno, tipo, pagine) di un candidato."""
+    from pdf_probe import NOT_PDF, doc_type, probe_pdf, probe_score
+    url = cand["pdf"]
+    ev: dict = {"status": None, "content_type": None, "size": None}
+    t0 = time.perf_counter()
+    if not host_health.allow(url):
+        ev["error"] = "circuit_open"
+    else:
+        try:
+            r = client.head(url, timeout=host_health.timeout_for(url, client.timeout.read or 15.0))
+            # alcuni server non implementano HEAD: decide la sonda (e l'host resta sano)
+            if r.status_code in (405, 501):
+                host_health.record(url, time.perf_counter() - t0, ok=True)
+            else:
+                host_health.record_response(url, time.perf_counter() - t0, r.status_code)
+                ev["status"] = r.status_code
+                ev["content_type"] = r.headers.get("content-type", "").split(";")[0].strip() or None
+                length = r.headers.get("content-length", "")
+                ev["size"] = int(length) if length.isdigit() else None
+        except Exception as e:
+            host_health.record_error(url, time.perf_counter() - t0, e)
+            ev["error"] = type(e).__name__
+    probe = probe_pdf(url)
+    ev.update({"title": probe.get("title"), "pages": probe.get("pages"), "created_year": probe.get("created_year"),
+               "doc_type": doc_type(probe) if probe.get("ok") else None, "range": probe.get("range"),
+               "probe_error": probe.get("error")})
+    if ev["size"] is None:
+        ev["size"] = probe.get("size")
+
+    bonus = probe_score(probe, year)
+    reachable = ev["status"] is not None and ev["status"] < 400
+    # sonda riuscita, oppure HEAD valido e sonda fallita per rete/timeout (non per contenuto)
+    ok = (probe.get("ok") or (reachable and probe.get("error") != NOT_PDF)) and \
+        (ev["status"] is None or ev["status"] < 400)
+    if ev["content_type"] and "html" in ev["content_type"]:
+        ok = False   # pagina di login/errore servita al posto del PDF
+    if ev["size"] is not None and ev["size"] < 20_000:
+        bonus -= 1.0   # troppo piccolo per un bilancio
+    return {**cand, "score": cand["score_link"] + bonus, "score_probe": bonus, "verified": bool(ok), "evidence": ev}
+
+
+def _verify_candidates(cands: list[dict], year: int, top_k: int, timeout) -> list[dict]:
+    """Verifica in parallelo i migliori top_k candidati; classifica: verificati prima, poi per score."""
+    from concurrent.futures import ThreadPoolExecutor
+    ordered = sorted(cands, key=lambda c: c["score_link"], reverse=True)
+    head, rest = ordered[:top_k], ordered[top_k:]
+    checked: list[dict] = []
+    if head:
+        with httpx.Client(follow_redirects=True, timeout=timeout, headers={
+            "User-Agent": "Mozilla/5.0 (compatible; BilanciCrawler/1.0)"
+        }, **replay.client_kwargs()) as client, ThreadPoolExecutor(max_workers=min(8, len(head))) as ex:
+            checked = list(ex.map(lambda c: _verify_pdf(client, c, year), head))
+    checked.sort(key=lambda c: (c["verified"], c["score"]), reverse=True)
+    # i candidati oltre top_k restano in coda, non verificati
+    return checked + [{**c, "score": c["score_link"], "score_probe": None, "verified": False, "evidence": None}
+                      for c in rest]
+
+
+YEAR_TOKEN_RE = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+
+def _years_cited(url: str, anchor_text: str) -> set[int]:
+    return {int(y) for y in YEAR_TOKEN_RE.findall(_norm(anchor_text) + " " + _norm(url))}
+
+
+def crawl_for_pdfs(entry_urls: list[str], years: list[int], max_pages=50, max_depth=4, timeout=15,
+                   trace: CrawlTrace | None = None, pages=None, exhaustive: bool = False,
+                   concurrency: int = CRAWL_CONCURRENCY) -> dict:
+    """Wrapper sincrono di crawl_for_pdfs_async (stessi parametri, stesso dict)."""
+    return run_sync(crawl_for_pdfs_async(entry_urls, years, max_pages, max_depth, timeout, trace, pages,
+                                         exhaustive, concurrency))
+
+
+async def crawl_for_pdfs_async(entry_urls: list[str], years: list[int], max_pages=50, max_depth=4, timeout=15,
+                               trace: CrawlTrace | None = None, pages=None, exhaustive: bool = False,
+                               concurrency: int = CRAWL_CONCURRENCY) -> dict:
+    """
+    Modalità multi-anno: una sola crawl del sito per tutti gli anni richiesti.
+    Ogni PDF candidato viene attribuito agli anni che cita (URL o testo ancora); i PDF senza anno
+    restano come ripiego. La crawl si ferma quando ogni anno ha un PDF con l'anno esplicito.
+    Con exhaustive=True (monitoraggio) visita tutto il budget per raccogliere ogni candidato.
+    Ritorna dict: by_year {anno: {pdf, score, via, exact} | None}, candidates, visited, host_stats,
+    missing_years.
+    """
+    years = sorted({int(y) for y in years}, reverse=True)
+    best: dict[int, dict] = {}
+    candidates: list[dict] = []
+    seen: set[str] = set()
+
+    def on_pdf(url, anchor, via):
+        accepted = None
+        cited = _years_cited(url, anchor)
+        for y in years:
+            sc = _score_link(url, anchor, y)
+            # stesse etichette di _score_link (anno o anno-1); un PDF che cita solo altri anni non vale
+            if sc < 2.0 or (cited and y not in cited and (y - 1) not in cited):
+                continue
+            exact = y in cited
+            prev = best.get(y)
+            # un match con anno esplicito batte sempre un ripiego senza anno
+            if prev is None or (exact, sc) > (prev["exact"], prev["score"]):
+                best[y] = {"pdf": url, "score": sc, "via": via, "exact": exact}
+            accepted = sc if accepted is None else max(accepted, sc)
+        if accepted is not None and url not in seen:
+            seen.add(url)
+            candidates.append({"pdf": url, "anchor": anchor, "via": via,
+                               "years": [y for y in years if y in cited]})
+        return accepted
 
-                # se è PDF e score alto → return
-                if u2.lower().endswith(".pdf") and sc >= 2.0:
-                    return {"pdf": u2, "score": sc, "via": url, "visited": len(visited)}
+    def done():
+        return not exhaustive and all(y in best and best[y]["exact"] for y in years)
 
-                # enqueue per navigare
-                heapq.heappush(pq, (-sc, depth + 1, u2, txt, url))
+    def score(u, t):
+        return max(_score_link(u, t, y) for y in years)
 
-    return {"pdf": None, "reason": "not_found_within_limits", "visited": len(visited)}
+    by_domain: dict = {}
+    by_host: dict = {}
+    visited = await _crawl(entry_urls, score, on_pdf, done, max_pages, max_depth, timeout, trace, by_domain, pages,
+                           concurrency, by_host)
+    return {
+        "by_year": {y: best.get(y) for y in years},
+        "candidates": candidates,
+        "visited": visited,
+        "pages_by_domain": by_domain,
+        "host_stats": host_health.summary(by_host),
+        "missing_years": [y for y in years if y not in best],
+    }
@@ -0,0 +1,212 @@
+"""
+Scoperta degli entrypoint senza Google CSE.
+
+1. domini candidati dalla ragione sociale (`normalize_company`): nome unito/con trattini/prima
+   parola, con prefissi di gruppo (gruppo…, …group), su .it e .com;
+2. verifica concorrente: DNS (con e senza www) e GET della home, che deve citare il nome
+   dell'azienda (scarta omonimi e domini parcheggiati);
+3. sonda in parallelo dei percorsi noti (investor relations, bilanci, trasparenza) sui siti verificati,
+   più i link della home che somigliano a pagine indice.
+
+La CSE (3 query per azienda) si usa solo quando la scoperta non trova nulla: `find_entrypoints`.
+"""
+from __future__ import annotations
+import asyncio, os, re, secrets, socket, time, unicodedata
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import html_stream
+import metrics
+import replay
+from aio_util import run_sync
+
+TLDS = ("it", "com")
+GROUP_WORDS = ("gruppo", "group")
+STOP_WORDS = {"di", "del", "della", "dei", "e", "ed", "the", "and", "of", "spa", "srl"}
+WELL_KNOWN_PATHS = [
+    "/investor-relations", "/investitori", "/investors",
+    "/bilanci-relazioni", "/bilanci-e-relazioni", "/bilanci",
+    "/amministrazione-trasparente", "/societa-trasparente",
+    "/en/investors", "/en/investor-relations", "/it/investor-relations",
+]
+# link della home che somigliano a pagine indice (come i risultati CSE accettati)
+ENTRY_HINTS = ("investor", "investitori", "relazioni", "bilanci", "financial", "report", "amministrazione-trasparente")
+_PARKED_RE = re.compile(r"domain (name )?(is |may be )?for sale|buy this domain|dominio (è )?in vendita|parked (free|domain)",
+                        re.IGNORECASE)
+
+SCHEME = "https"
+MAX_DOMAINS = 16
+HOME_BYTES = 256 * 1024
+DISCOVERY_TIMEOUT = float(os.environ.get("BILANCI_DISCOVERY_TIMEOUT", "6"))
+DISCOVERY_CONCURRENCY = int(os.environ.get("BILANCI_DISCOVERY_CONCURRENCY", "16"))
+
+
+def _ascii(s: str) -> str:
+    return unicodedata.normalize("NFKD", s or "").encode("ascii", "ignore").decode("ascii").lower()
+
+
+def _name_tokens(company: str) -> List[str]:
+    from search_cse import normalize_company
+    core = _ascii(normalize_company(company)).replace("&", " e ")
+    return [t for t in re.findall(r"[a-z0-9]+", core) if t not in STOP_WORDS]
+
+
+def candidate_domains(company: str) -> List[str]:
+    """Domini plausibili per l'azienda, dal più probabile (al massimo MAX_DOMAINS)."""
+    raw = _name_tokens(company)
+    tokens = [t for t in raw if t not in GROUP_WORDS] or raw
+    if not tokens:
+        return []
+    bases = ["".join(tokens)]
+    if len(tokens) > 1:
+        if len(tokens[0]) >= 3:
+            bases.append(tokens[0])
+        bases.append("-".join(tokens))
+    labels = ["".join(raw)] if raw != tokens else []   # "Gruppo Hera" → gruppohera
+    labels += bases
+    # prefissi di gruppo dopo i nomi semplici (e non sulle varianti con trattini)
+    labels += ["gruppo" + b for b in bases if "-" not in b] + [b + "group" for b in bases if "-" not in b]
+    out = []
+    for label in dict.fromkeys(labels):
+        out += [f"{label}.{tld}" for tld in TLDS]
+    return out[:MAX_DOMAINS]
+
+
+async def _resolves(host: str) -> bool:
+    if replay.current_mode() == "replay":
+        return True   # niente rete: decide l'archivio HTTP
+    try:
+        await asyncio.wait_for(asyncio.get_running_loop().getaddrinfo(host, 443, type=socket.SOCK_STREAM),
+                               timeout=DISCOVERY_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+
+def _mentions(html: str, tokens: List[str]) -> bool:
+    """La pagina cita il nome (anche solo la prima parola, se distintiva: snam.it per "Snam Rete Gas")."""
+    flat = re.sub(r"[^a-z0-9]", "", _ascii(html))
+    return "".join(tokens) in flat or (len(tokens) > 1 and len(tokens[0]) >= 4 and tokens[0] in flat)
+
+
+async def _home(client, domain: str, tokens: List[str]) -> Optional[dict]:
+    """Home verificata del dominio (con o senza www): {base, links} o None."""
+    hosts = [h for h, ok in zip((f"www.{domain}", domain),
+                                await asyncio.gather(_resolves(f"www.{domain}"), _resolves(domain))) if ok]
+    for host in hosts:
+        try:
+            page = await html_stream.stream_html(client, f"{SCHEME}://{host}/", max_bytes=HOME_BYTES, keep_html=True)
+        except Exception:
+            continue
+        html = page["html"] or ""
+        if page["status"] >= 400 or not html:
+            continue
+        if not _mentions(html, tokens) or _PARKED_RE.search(html):
+            continue
+        final = page["response"].url
+        base = f"{final.scheme}://{final.host}" + (f":{final.port}" if final.port else "")
+        return {"base": base, "links": [(urljoin(str(final), h), t) for h, t in page["links"] if h]}
+    return None
+
+
+async def _status(client, url: str) -> Tuple[int, str, str]:
+    """(status, URL finale, content-type) senza leggere il corpo."""
+    try:
+        async with client.stream("GET", url) as r:
+            return r.status_code, str(r.url), r.headers.get("content-type", "")
+    except Exception:
+        return 0, url, ""
+
+
+async def _probe_paths(client, base: str) -> List[str]:
+    """Percorsi noti che rispondono con una pagina HTML vera (non redirect alla home, non soft-404)."""
+    sentinel = f"{base}/bilanci-{secrets.token_hex(4)}"
+    results = await asyncio.gather(_status(client, sentinel), *(_status(client, base + p) for p in WELL_KNOWN_PATHS))
+    (s_status, s_final, _), probes = results[0], results[1:]
+    if s_status == 200 and s_final == sentinel:
+        return []   # il sito risponde 200 a tutto: i percorsi non dicono nulla
+    # percorso inesistente rediretto (home, pagina "non trovata"): i percorsi che finiscono lì sono soft-404
+    soft_404 = s_final if s_final != sentinel else None
+    found = []
+    for (status, final, ctype) in probes:
+        path = urlparse(final).path.rstrip("/")
+        if status == 200 and html_stream.is_html(ctype) and path and final != soft_404 and final not in found:
+            found.append(final)
+    return found
+
+
+async def discover_async(company: str, max_sites: int = 5, client=None) -> List[str]:
+    """Entrypoint trovati senza CSE (lista vuota se nessun dominio candidato è verificato)."""
+    if client is None:
+        async with _client() as own:
+            return await discover_async(company, max_sites, own)
+    t0 = time.perf_counter()
+    tokens = [t for t in _name_tokens(company) if t not in GROUP_WORDS] or _name_tokens(company)
+    homes, seen = [], set()
+    for home in await asyncio.gather(*(_home(client, d, tokens) for d in candidate_domains(company))):
+        if home and home["base"] not in seen:
+            seen.add(home["base"])
+            homes.append(home)
+    entry: List[str] = []
+    probed = await asyncio.gather(*(_probe_paths(client, h["base"]) for h in homes))
+    for home, paths in zip(homes, probed):
+        host = urlparse(home["base"]).netloc
+        hinted = [u for u, t in home["links"] if urlparse(u).netloc == host and not u.lower().endswith(".pdf")
+                  and any(k in (u + " " + t).lower() for k in ENTRY_HINTS)]
+        # percorsi noti, poi link indice della home, poi la home stessa
+        for u in paths + hinted[:max_sites] + [home["base"] + "/"]:
+            if u not in entry:
+                entry.append(u)
+    metrics.observe("discovery_seconds", time.perf_counter() - t0)
+    metrics.inc("discovery_total", result="found" if entry else "not_found")
+    return entry[:max_sites]
+
+
+def _client():
+    import httpx
+    return httpx.AsyncClient(follow_redirects=True, timeout=DISCOVERY_TIMEOUT,
+                             limits=httpx.Limits(max_connections=DISCOVERY_CONCURRENCY),
+                             headers={"User-Agent": "Mozilla/5.0 (compatible; BilanciCrawler/1.0)"},
+                             **replay.client_kwargs(async_client=True))
+
+
+async def discover_many_async(companies: List[str], max_sites: int = 5,
+                              concurrency: int = 4) -> List[List[str]]:
+    """Scoperta per molte aziende con un solo client (un'azienda in errore dà lista vuota)."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(name):
+        async with sem:
+            try:
+                return await discover_async(name, max_sites, client)
+            except Exception:
+                return []
+
+    async with _client() as client:
+        return await asyncio.gather(*(one(c) for c in companies))
+
+
+def discover(company: str, max_sites: int = 5) -> List[str]:
+    return run_sync(discover_async(company, max_sites))
+
+
+def discover_many(companies: List[str], max_sites: int = 5) -> Dict[str, List[str]]:
+    """{azienda: entrypoint} per aziende distinte."""
+    uniq = list(dict.fromkeys(companies))
+    return dict(zip(uniq, run_sync(discover_many_async(uniq, max_sites))))
+
+
+def find_entrypoints(company: str, year: int, api_key: Optional[str] = None, cx: Optional[str] = None,
+                     max_sites: int = 5) -> Tuple[List[str], str]:
+    """
+    Entrypoint dalla scoperta domini; la CSE solo se non trova nulla (e se ci sono le chiavi).
+    Ritorna (entrypoint, origine) con origine "discovery" | "cse" | "none".
+    """
+    entry = discover(company, max_sites)
+    if entry:
+        return entry, "discovery"
+    if api_key and cx:
+        from search_cse import pick_entrypoints
+        entry = pick_entrypoints(company, year, api_key, cx, max_sites=max_sites)
+        return entry, "cse" if entry else "none"
+    return [], "none"
@@ -0,0 +1,154 @@
+"""
+Salute per host: circuit breaker e timeout adattivi, condivisi da tutte le crawl del processo.
+
+- Circuit breaker: dopo `FAILURES_TO_OPEN` errori o timeout consecutivi l'host viene saltato per
+  `COOLDOWN` secondi; poi passa una sola richiesta di prova (half-open): se riesce il circuito si
+  richiude, altrimenti resta aperto per un altro cooldown.
+- Timeout adattivo: con almeno `MIN_SAMPLES` latenze osservate, timeout = `TIMEOUT_FACTOR` × p95
+  delle ultime risposte, limitato a [MIN_TIMEOUT, timeout richiesto]. Un host lento ma vivo resta
+  al timeout pieno; un tarpit su un host di solito veloce viene chiuso molto prima.
+
+Contano come errori le eccezioni di rete e le risposte 429/5xx; un 404 è un host sano.
+Le crawl sommano i propri esiti per host con `tally(...)` e li restituiscono come `host_stats`.
+"""
+from __future__ import annotations
+import os, threading, time
+from collections import deque
+from typing import Dict, Optional
+
+import metrics
+
+FAILURES_TO_OPEN = int(os.environ.get("BILANCI_CIRCUIT_FAILURES", "3"))
+COOLDOWN = float(os.environ.get("BILANCI_CIRCUIT_COOLDOWN", "120"))
+MIN_TIMEOUT = float(os.environ.get("BILANCI_MIN_TIMEOUT", "3"))
+TIMEOUT_FACTOR = 4.0
+MIN_SAMPLES = 5
+LATENCY_WINDOW = 50
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class _Host:
+    __slots__ = ("latencies", "failures", "state", "opened_at", "probe_at", "ok", "errors", "timeouts", "skipped")
+
+    def __init__(self):
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.failures = 0          # consecutivi
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_at = 0.0        # richiesta di prova in corso (half-open)
+        self.ok = self.errors = self.timeouts = self.skipped = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        xs = sorted(self.latencies)
+        return xs[min(len(xs) - 1, int(0.95 * len(xs)))]
+
+
+_hosts: Dict[str, _Host] = {}
+_lock = threading.Lock()
+
+
+def _host(url: str) -> _Host:
+    key = metrics.host_label(url)
+    h = _hosts.get(key)
+    if h is None:
+        h = _hosts[key] = _Host()
+    return h
+
+
+def allow(url: str) -> bool:
+    """False se l'host ha il circuito aperto (la richiesta va saltata)."""
+    now = time.monotonic()
+    with _lock:
+        h = _host(url)
+        if h.state == CLOSED:
+            return True
+        if h.state == OPEN and now - h.opened_at >= COOLDOWN:
+            h.state = HALF_OPEN
+        # half-open: una prova alla volta (una prova rimasta appesa scade dopo un cooldown)
+        if h.state == HALF_OPEN and (not h.probe_at or now - h.probe_at >= COOLDOWN):
+            h.probe_at = now
+            return True
+        h.skipped += 1
+    metrics.inc("circuit_skips_total", host=metrics.host_label(url))
+    return False
+
+
+def timeout_for(url: str, default: float) -> float:
+    """Timeout per la prossima richiesta all'host: adattato al p95 osservato, mai oltre `default`."""
+    with _lock:
+        p95 = _host(url).p95()
+    if p95 is None:
+        return float(default)
+    return min(float(default), max(MIN_TIMEOUT, TIMEOUT_FACTOR * p95))
+
+
+def record(url: str, seconds: float, ok: bool, timeout: bool = False) -> None:
+    """Esito di una richiesta: latenza (se riuscita) e stato del circuito."""
+    opened = False
+    with _lock:
+        h = _host(url)
+        h.probe_at = 0.0
+        if ok:
+            h.ok += 1
+            h.latencies.append(seconds)
+            h.failures = 0
+            h.state = CLOSED
+            return
+        h.errors += 1
+        h.timeouts += int(timeout)
+        h.failures += 1
+        if h.state == HALF_OPEN or (h.state == CLOSED and h.failures >= FAILURES_TO_OPEN):
+            opened = h.state == CLOSED
+            h.state, h.opened_at = OPEN, time.monotonic()
+    if opened:
+        metrics.inc("circuit_open_total", host=metrics.host_label(url))
+
+
+def record_response(url: str, seconds: float, status: int, stats: Optional[dict] = None) -> None:
+    """record(...) da uno status HTTP (429 e 5xx sono errori dell'host); somma l'esito in `stats`."""
+    record(url, seconds, ok=status != 429 and status < 500)
+    if stats is not None:
+        tally(stats, url, "ok" if status < 400 else "http_error")
+
+
+def record_error(url: str, seconds: float, exc: BaseException, stats: Optional[dict] = None) -> None:
+    """record(...) da un'eccezione di rete (i timeout httpx contano come timeout); somma l'esito in `stats`."""
+    timeout = "Timeout" in type(exc).__name__
+    record(url, seconds, ok=False, timeout=timeout)
+    if stats is not None:
+        tally(stats, url, "timeout" if timeout else "error")
+
+
+def state(url: str) -> str:
+    with _lock:
+        return _host(url).state
+
+
+def tally(stats: dict, url: str, outcome: str) -> None:
+    """Somma un esito (ok|http_error|error|timeout|circuit_open) nelle statistiche per host di una crawl."""
+    d = stats.setdefault(metrics.host_label(url), {})
+    d[outcome] = d.get(outcome, 0) + 1
+
+
+def summary(stats: dict) -> dict:
+    """Statistiche per host di una crawl con lo stato attuale del circuito."""
+    with _lock:
+        return {host: {**d, "circuit": _hosts[host].state if host in _hosts else CLOSED}
+                for host, d in stats.items()}
+
+
+def snapshot() -> list[dict]:
+    """Tutti gli host visti dal processo (per Diagnostics)."""
+    with _lock:
+        items = list(_hosts.items())
+        return [{"host": k, "state": h.state, "ok": h.ok, "errors": h.errors, "timeouts": h.timeouts,
+                 "skipped": h.skipped, "consecutive_failures": h.failures, "p95": h.p95()}
+                for k, h in sorted(items)]
+
+
+def reset() -> None:
+    with _lock:
+        _hosts.clear()
@@ -0,0 +1,209 @@
+"""
+Fetch HTML in streaming con tetto di byte e parser incrementale dei link.
+
+I chunk vengono decodificati e passati a un HTMLParser man mano che arrivano: i link completati
+escono subito (il crawler li valuta e li mette in frontiera prima della fine del download).
+Oltre `MAX_HTML_BYTES` la pagina viene troncata e la connessione chiusa; il corpo delle risposte
+non HTML (PDF, binari con content-type sbagliato) e degli errori HTTP non viene letto affatto.
+"""
+from __future__ import annotations
+import codecs, os, time
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+MAX_HTML_BYTES = int(os.environ.get("BILANCI_MAX_HTML_BYTES", str(2 * 1024 * 1024)))
+
+Link = Tuple[str, str]
+# riceve i link appena completati; True per interrompere la lettura
+OnLinks = Callable[[List[Link]], bool]
+
+# header che non valgono più per un corpo già decodificato e troncato
+_BODY_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def is_html(content_type: str) -> bool:
+    return "text/html" in (content_type or "").lower()
+
+
+class LinkParser(HTMLParser):
+    """
+    Parser incrementale: feed(testo) a pezzi, drain() → [(href, testo dell'ancora)] completati
+    dall'ultima chiamata. Il testo è come get_text(" ", strip=True) di BeautifulSoup.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._ready: List[Link] = []
+        self._href: Optional[str] = None
+        self._text: List[str] = []
+        self._open_node = False  # l'ultimo handle_data continua lo stesso nodo di testo (chunk spezzati)
+        self._in_title = False
+        self._title: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        self._open_node = False
+        if tag == "a":
+            self._flush()  # <a> non chiuso: vale fino al successivo
+            href = dict(attrs).get("href")
+            if href is not None:
+                self._href, self._text = href.strip(), []
+        elif tag == "title":
+            self._in_title = True
+
+    def handle_endtag(self, tag):
+        self._open_node = False
+        if tag == "a":
+            self._flush()
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._href is not None:
+            if self._open_node and self._text:
+                self._text[-1] += data
+            else:
+                self._text.append(data)
+            self._open_node = True
+        if self._in_title:
+            self._title.append(data)
+
+    def handle_comment(self, data):
+        self._open_node = False
+
+    def _flush(self):
+        if self._href is not None:
+            self._ready.append((self._href, " ".join(s.strip() for s in self._text if s.strip())))
+            self._href, self._text = None, []
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def drain(self) -> List[Link]:
+        out, self._ready = self._ready, []
+        return out
+
+    @property
+    def title(self) -> str:
+        return " ".join("".join(self._title).split())
+
+
+def _encoding(response) -> str:
+    enc = response.charset_encoding or "utf-8"
+    try:
+        codecs.lookup(enc)
+    except LookupError:
+        enc = "utf-8"
+    return enc
+
+
+class _Reader:
+    """Stato di una lettura: decoder incrementale, parser, byte letti, testo (se richiesto)."""
+
+    def __init__(self, response, url: str, on_links: Optional[OnLinks], max_bytes: int, keep_html: bool):
+        self.url = url
+        self.on_links = on_links
+        self.max_bytes = max_bytes
+        self.decoder = codecs.getincrementaldecoder(_encoding(response))(errors="replace")
+        self.parser = LinkParser()
+        self.parts: Optional[List[str]] = [] if keep_html else None
+        self.links: List[Link] = []
+        self.nbytes = 0
+        self.parse_seconds = 0.0
+        self.truncated = self.stopped = False
+
+    def _emit(self) -> bool:
+        links = self.parser.drain()
+        if not links:
+            return False
+        self.links.extend(links)
+        return bool(self.on_links and self.on_links(links))
+
+    def _text(self, text: str) -> None:
+        if text:
+            t0 = time.perf_counter()
+            self.parser.feed(text)
+            self.parse_seconds += time.perf_counter() - t0
+            if self.parts is not None:
+                self.parts.append(text)
+
+    def chunk(self, data: bytes) -> bool:
+        """Elabora un chunk; True quando la lettura va interrotta (tetto raggiunto o on_links)."""
+        take = data[:self.max_bytes - self.nbytes]
+        self.nbytes += len(take)
+        self._text(self.decoder.decode(take))
+        if self._emit():
+            self.stopped = True
+            return True
+        if self.nbytes >= self.max_bytes:
+            self.truncated = True
+            metrics.inc("html_truncated_total", host=metrics.host_label(self.url))
+            return True
+        return False
+
+    def finish(self, response) -> Dict[str, Any]:
+        if not self.stopped:
+            self._text(self.decoder.decode(b"", final=True))
+            self.parser.close()
+            self._emit()
+        metrics.observe("html_parse_seconds", self.parse_seconds)
+        out = _result(response, self.nbytes)
+        out.update(truncated=self.truncated, stopped=self.stopped, links=self.links, title=self.parser.title)
+        if self.parts is not None:
+            out["html"] = "".join(self.parts)
+        return out
+
+
+def _result(response, nbytes: int = 0) -> Dict[str, Any]:
+    return {"response": response, "status": response.status_code,
+            "content_type": response.headers.get("content-type", ""), "nbytes": nbytes,
+            "truncated": False, "stopped": False, "links": [], "title": "", "html": None}
+
+
+async def stream_html(client, url: str, on_links: Optional[OnLinks] = None, max_bytes: int = MAX_HTML_BYTES,
+                      keep_html: bool = False, **kwargs) -> Dict[str, Any]:
+    """
+    GET in streaming (httpx.AsyncClient). Solo le risposte HTML con status < 400 vengono lette,
+    a chunk, fino a `max_bytes`; `on_links(links)` riceve i link man mano che il parser li completa.
+    Ritorna {response, status, content_type, nbytes, truncated, stopped, links, title, html}
+    (`html` solo con keep_html=True; `response` ha il corpo non letto).
+    """
+    async with client.stream("GET", url, **kwargs) as r:
+        if r.status_code >= 400 or not is_html(r.headers.get("content-type", "")):
+            return _result(r)
+        reader = _Reader(r, url, on_links, max_bytes, keep_html)
+        async for data in r.aiter_bytes():
+            if reader.chunk(data):
+                break
+        return reader.finish(r)
+
+
+def stream_html_sync(client, url: str, on_links: Optional[OnLinks] = None, max_bytes: int = MAX_HTML_BYTES,
+                     keep_html: bool = False, **kwargs) -> Dict[str, Any]:
+    """Come stream_html, con httpx.Client."""
+    with client.stream("GET", url, **kwargs) as r:
+        if r.status_code >= 400 or not is_html(r.headers.get("content-type", "")):
+            return _result(r)
+        reader = _Reader(r, url, on_links, max_bytes, keep_html)
+        for data in r.iter_bytes():
+            if reader.chunk(data):
+                break
+        return reader.finish(r)
+
+
+def capped_response(page: Dict[str, Any]):
+    """
+    httpx.Response con il solo corpo HTML letto (troncato al tetto; vuoto per non-HTML ed errori),
+    per chi usa ancora r.text/r.content e per le cache di risposte.
+    """
+    import httpx
+    r = page["response"]
+    html = page.get("html") or ""
+    headers = [(k, v) for k, v in r.headers.items() if k.lower() not in _BODY_HEADERS]
+    enc = _encoding(r)
+    resp = httpx.Response(r.status_code, headers=headers, content=html.encode(enc, errors="replace"),
+                          request=r.request)
+    resp.encoding = enc
+    return resp
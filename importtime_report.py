@@ -0,0 +1,79 @@
+"""
+Report dei tempi di import (stile `python -X importtime`) per app.py, pagine e moduli pipeline.
+
+Ogni target gira in un processo pulito con -X importtime; si riportano il tempo totale di import,
+gli import top-level più costosi (tempo cumulativo e proprio) e quali librerie pesanti sono state
+caricate (quelle lazy non devono comparire al semplice avvio dell'app).
+
+Uso:
+  python importtime_report.py                 # app.py + pages/*.py
+  python importtime_report.py crawler cli     # moduli (import) o script .py (eseguiti in bare mode)
+  python importtime_report.py --json
+"""
+from __future__ import annotations
+import argparse, glob, json, os, re, subprocess, sys, time
+
+HEAVY = ["pandas", "numpy", "pyarrow", "pdfplumber", "PyPDF2", "pytesseract", "pdf2image",
+         "httpx", "bs4", "lxml", "semantic_crawler"]
+
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def measure(target: str) -> dict:
+    if target.endswith(".py"):
+        code = f"import runpy; runpy.run_path({target!r}, run_name='__main__')"
+    else:
+        code = f"import {target}"
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True,
+                          text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - t0
+    top, loaded = [], {}
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if not m:
+            continue
+        self_us, cum_us, indent, name = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        depth = (len(indent) - 1) // 2
+        if depth == 0:
+            top.append((name, self_us, cum_us))
+        root = name.split(".")[0]
+        if root in HEAVY and (root not in loaded or name == root):
+            loaded[root] = max(loaded.get(root, 0), cum_us)
+    top.sort(key=lambda t: t[2], reverse=True)
+    return {
+        "target": target,
+        "wall_s": round(wall, 3),
+        "import_total_ms": round(sum(c for _, _, c in top) / 1000, 1),
+        "top": [{"module": n, "self_ms": round(s / 1000, 1), "cumulative_ms": round(c / 1000, 1)}
+                for n, s, c in top[:10]],
+        "heavy_loaded_ms": {k: round(v / 1000, 1) for k, v in sorted(loaded.items())},
+        "heavy_lazy": [h for h in HEAVY if h not in loaded],
+        "returncode": proc.returncode,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Tempi di import stile -X importtime")
+    ap.add_argument("targets", nargs="*", help="moduli o script .py (default: app.py e pages/*.py)")
+    ap.add_argument("--json", action="store_true", help="output JSON")
+    args = ap.parse_args(argv)
+    targets = args.targets or ["app.py"] + sorted(glob.glob("pages/*.py"))
+    reports = [measure(t) for t in targets]
+    if args.json:
+        json.dump(reports, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+    for r in reports:
+        print(f"== {r['target']}: import {r['import_total_ms']} ms (processo {r['wall_s']} s)")
+        for t in r["top"]:
+            print(f"   {t['cumulative_ms']:>9.1f} ms  (self {t['self_ms']:>7.1f} ms)  {t['module']}")
+        loaded = ", ".join(f"{k} {v} ms" for k, v in r["heavy_loaded_ms"].items()) or "nessuna"
+        print(f"   pesanti caricate: {loaded}")
+        print(f"   pesanti lazy:     {', '.join(r['heavy_lazy']) or 'nessuna'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+"""
+Coda di job su disco (SQLite) per distribuire il batch su più processi e più macchine.
+
+Il batch (expander dell'app o `python job_queue.py enqueue`) registra il foglio nell'archivio
+risultati (results_store) e accoda un job per azienda distinta; un numero qualsiasi di worker
+(`python job_queue.py worker`, anche su macchine diverse con la cartella condivisa) li consuma:
+
+- lease: il worker che prende un job lo tiene per `LEASE_SECONDS` e lo rinnova mentre lavora;
+  se muore, alla scadenza il job torna disponibile per un altro worker;
+- retry: un job fallito torna in coda con backoff esponenziale, fino a `MAX_ATTEMPTS` tentativi;
+- idempotenza: un job per (batch, azienda) e risultato scritto una volta sola (il primo vince),
+  anche se un lease scaduto ha fatto eseguire la stessa azienda due volte;
+- merge: i risultati dei job finiti vanno nell'archivio risultati, da cui si esporta l'Excel.
+
+Il database usa il journal classico (non WAL), che funziona anche su filesystem di rete.
+
+Uso da riga di comando:
+  python job_queue.py enqueue elenco.xlsx --column name --year 2024 2023
+  python job_queue.py worker --processes 4          # su ogni macchina, quante volte serve
+  python job_queue.py status [<batch_id>]
+  python job_queue.py merge <batch_id> risultati.xlsx
+"""
+from __future__ import annotations
+import json, os, socket, sqlite3, sys, threading, time, uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import metrics
+
+DEFAULT_DB = os.environ.get("BILANCI_QUEUE_DB", os.path.join("results", "bilanci_queue.sqlite"))
+LEASE_SECONDS = float(os.environ.get("BILANCI_QUEUE_LEASE", "900"))
+MAX_ATTEMPTS = int(os.environ.get("BILANCI_QUEUE_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF = 30.0
+POLL_SECONDS = 5.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+DEFAULT_DOC_KEYWORDS = ["bilancio", "relazione finanziaria", "bilanci", "nota integrativa"]
+DEFAULT_EXTRACT_KEYWORDS = ["somministrati", "interinali", "lavoratori non dipendenti"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    run_id TEXT NOT NULL,
+    params TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    batch_id TEXT NOT NULL,
+    company_key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    company TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    not_before REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    queries_used INTEGER NOT NULL DEFAULT 0,
+    seconds REAL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (batch_id, company_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before);
+"""
+
+
+def company_key(name: str) -> str:
+    """Chiave dell'azienda (come nel batch in processo: maiuscole e spazi non contano)."""
+    return " ".join(str(name).casefold().split())
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:4]}"
+
+
+class JobQueue:
+    """Coda SQLite condivisibile tra thread, processi e macchine (transazioni BEGIN IMMEDIATE)."""
+
+    def __init__(self, path: str = DEFAULT_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # autocommit: le transazioni sono esplicite, così la presa di un job è atomica tra processi
+        self._conn = sqlite3.connect(path, timeout=60.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA busy_timeout=60000")
+        self._conn.executescript(_SCHEMA)
+
+    def _tx(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return out
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------- produttore ----------------
+    def enqueue(self, run_id: str, companies: Sequence[str], params: Dict[str, Any],
+                batch_id: Optional[str] = None) -> str:
+        """
+        Un job per azienda distinta (le righe ripetute condividono il job); `companies[i]` è la riga i
+        del run. Riaccodare lo stesso batch_id non duplica i job.
+        """
+        batch_id = batch_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        jobs: Dict[str, Tuple[str, List[int]]] = {}
+        for i, name in enumerate(companies):
+            jobs.setdefault(company_key(name), (str(name), []))[1].append(i)
+        now = time.time()
+
+        def tx(c):
+            c.execute("INSERT OR IGNORE INTO batches VALUES (?, ?, ?, ?)",
+                      (batch_id, now, run_id, json.dumps(params, ensure_ascii=False, default=str)))
+            c.executemany("INSERT OR IGNORE INTO jobs (batch_id, company_key, seq, company, rows, status, updated) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          [(batch_id, k, seq, name, json.dumps(rows), QUEUED, now)
+                           for seq, (k, (name, rows)) in enumerate(jobs.items())])
+        self._tx(tx)
+        metrics.inc("queue_enqueued_total", value=len(jobs))
+        return batch_id
+
+    # ---------------- worker ----------------
+    def claim(self, worker: str, lease: float = LEASE_SECONDS) -> Optional[dict]:
+        """Prende il prossimo job (in coda o con lease scaduto) e lo assegna a `worker`; None se non ce ne sono."""
+        def tx(c):
+            now = time.time()
+            # lease scaduti all'ultimo tentativo: il job non viene più ripreso
+            c.execute("UPDATE jobs SET status = ?, worker = NULL, error = 'lease scaduto (worker interrotto)', "
+                      "updated = ? WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                      (FAILED, now, RUNNING, now, MAX_ATTEMPTS))
+            row = c.execute(
+                "SELECT j.batch_id, j.company_key, j.company, j.rows, j.attempts, b.run_id, b.params "
+                "FROM jobs j JOIN batches b USING (batch_id) "
+                "WHERE (j.status = ? AND j.not_before <= ?) OR (j.status = ? AND j.lease_until < ?) "
+                "ORDER BY b.created, j.seq LIMIT 1", (QUEUED, now, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            c.execute("UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                      "WHERE batch_id = ? AND company_key = ?", (RUNNING, worker, now + lease, now, row[0], row[1]))
+            return {"batch_id": row[0], "company_key": row[1], "company": row[2], "rows": json.loads(row[3]),
+                    "attempt": row[4] + 1, "run_id": row[5], "params": json.loads(row[6])}
+        return self._tx(tx)
+
+    def heartbeat(self, job: dict, worker: str, lease: float = LEASE_SECONDS) -> bool:
+        """Rinnova il lease; False se il job non è più di questo worker."""
+        def tx(c):
+            return c.execute("UPDATE jobs SET lease_until = ?, updated = ? WHERE batch_id = ? AND company_key = ? "
+                             "AND status = ? AND worker = ?",
+                             (time.time() + lease, time.time(), job["batch_id"], job["company_key"], RUNNING,
+                              worker)).rowcount == 1
+        return self._tx(tx)
+
+    def complete(self, job: dict, result: Dict[int, Dict[str, Any]], queries_used: int = 0,
+                 seconds: Optional[float] = None) -> bool:
+        """Salva il risultato ({anno: campi}); un job già concluso non viene sovrascritto."""
+        def tx(c):
+            return c.execute("UPDATE jobs SET status = ?, result = ?, queries_used = ?, seconds = ?, error = NULL, "
+                             "lease_until = NULL, updated = ? WHERE batch_id = ? AND company_key = ? AND status != ?",
+                             (DONE, json.dumps({str(y): f for y, f in result.items()}, ensure_ascii=False, default=str),
+                              int(queries_used), seconds, time.time(), job["batch_id"], job["company_key"],
+                              DONE)).rowcount == 1
+        return self._tx(tx)
+
+    def fail(self, job: dict, worker: str, error: str) -> str:
+        """Errore del job: di nuovo in coda con backoff, o `failed` all'ultimo tentativo. Ritorna lo stato."""
+        def tx(c):
+            row = c.execute("SELECT attempts FROM jobs WHERE batch_id = ? AND company_key = ? AND status = ? "
+                            "AND worker = ?", (job["batch_id"], job["company_key"], RUNNING, worker)).fetchone()
+            if row is None:
+                return None   # lease perso: il job è già di un altro worker
+            status = FAILED if row[0] >= MAX_ATTEMPTS else QUEUED
+            c.execute("UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL, not_before = ?, error = ?, "
+                      "updated = ? WHERE batch_id = ? AND company_key = ?",
+                      (status, time.time() + RETRY_BACKOFF * 2 ** (row[0] - 1), error[:2000], time.time(),
+                       job["batch_id"], job["company_key"]))
+            return status
+        return self._tx(tx)
+
+    # ---------------- stato e merge ----------------
+    def batches(self, limit: int = 20) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT batch_id, created, run_id FROM batches ORDER BY created DESC LIMIT ?",
+                                      (limit,)).fetchall()
+        return [{"batch_id": r[0], "created": r[1], "run_id": r[2], **self.status(r[0])} for r in rows]
+
+    def batch(self, batch_id: str) -> Optional[dict]:
+        with self._lock:
+            r = self._conn.execute("SELECT batch_id, created, run_id, params FROM batches WHERE batch_id = ?",
+                                   (batch_id,)).fetchone()
+        if r is None:
+            return None
+        return {"batch_id": r[0], "created": r[1], "run_id": r[2], "params": json.loads(r[3])}
+
+    def status(self, batch_id: str) -> dict:
+        """Job per stato, totale e query CSE usate dai job conclusi."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*), SUM(queries_used) FROM jobs WHERE batch_id = ? "
+                                      "GROUP BY status", (batch_id,)).fetchall()
+        out = {s: 0 for s in (QUEUED, RUNNING, DONE, FAILED)}
+        out.update({r[0]: r[1] for r in rows})
+        out["total"] = sum(r[1] for r in rows)
+        out["queries_used"] = sum(r[2] or 0 for r in rows)
+        return out
+
+    def failures(self, batch_id: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT company, attempts, error FROM jobs WHERE batch_id = ? AND status = ? "
+                                      "ORDER BY seq", (batch_id, FAILED)).fetchall()
+        return [{"company": r[0], "attempts": r[1], "error": r[2]} for r in rows]
+
+    def merge(self, batch_id: str, store) -> dict:
+        """
+        Scrive nell'archivio risultati (results_store) le righe dei job conclusi; i job falliti danno righe
+        vuote con l'errore nelle note. Ripetibile: le righe già scritte vengono sostituite.
+        """
+        info = self.batch(batch_id)
+        if info is None:
+            raise KeyError(f"batch sconosciuto: {batch_id}")
+        years = [int(y) for y in info["params"]["years"]]
+        with self._lock:
+            rows = self._conn.execute("SELECT company, rows, status, result, attempts, error FROM jobs "
+                                      "WHERE batch_id = ? AND status IN (?, ?) ORDER BY seq",
+                                      (batch_id, DONE, FAILED)).fetchall()
+        for company, idx, status, result, attempts, error in rows:
+            if status == DONE:
+                by_year = {int(y): f for y, f in json.loads(result).items()}
+            else:
+                note = f"Job fallito dopo {attempts} tentativi: {error or ''}".strip()
+                by_year = {y: {"notes": note} for y in years}
+            for i in json.loads(idx):
+                store.append(info["run_id"], i, company, by_year)
+        store.flush()
+        store.drop_exports(info["run_id"])
+        return self.status(batch_id)
+
+
+def enqueue_sheet(queue: JobQueue, store, df, column: str, years: Sequence[int], params: Dict[str, Any],
+                  limit: Optional[int] = None) -> Tuple[str, str]:
+    """Registra il foglio nell'archivio risultati e accoda le sue aziende; ritorna (batch_id, run_id)."""
+    years = sorted({int(y) for y in years}, reverse=True)
+    run_id = store.new_run(list(df.columns), years, meta={"year": years[0], "queued": True})
+    store.add_inputs(run_id, df.itertuples(index=False, name=None))
+    names = df[column].iloc[:limit] if limit else df[column]
+    batch_id = queue.enqueue(run_id, [str(v) for v in names], {**params, "years": years})
+    return batch_id, run_id
+
+
+# --------------------------------------------
+# Worker
+# --------------------------------------------
+def execute(job: dict) -> Tuple[Dict[int, Dict[str, Any]], int]:
+    """Esegue un job con la stessa pipeline del batch in processo: (risultati per anno, query CSE)."""
+    from pipeline import process_company
+    p = job["params"]
+    entrypoints = None
+    if p.get("discover", True):
+        from discovery import discover
+        entrypoints = discover(job["company"]) or None
+    return process_company(
+        job["company"], p["years"], p.get("doc_keywords") or DEFAULT_DOC_KEYWORDS,
+        p.get("extract_keywords") or DEFAULT_EXTRACT_KEYWORDS,
+        os.environ.get("GOOGLE_API_KEY"), os.environ.get("GOOGLE_CX"),
+        serp_results=int(p.get("serp_results", 3)), polite_mode=bool(p.get("polite_mode", True)),
+        min_delay=float(p.get("min_delay", 1.0)), entrypoints=entrypoints)
+
+
+class _Heartbeat(threading.Thread):
+    """Rinnova il lease ogni terzo di lease mentre il job è in esecuzione."""
+
+    def __init__(self, queue: JobQueue, job: dict, worker: str, lease: float):
+        super().__init__(daemon=True)
+        self.queue, self.job, self.worker, self.lease = queue, job, worker, lease
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.lease / 3):
+            try:
+                if not self.queue.heartbeat(self.job, self.worker, self.lease):
+                    return
+            except sqlite3.Error:
+                pass   # filesystem condiviso occupato: si riprova al prossimo giro
+
+    def stop(self):
+        self.stopped.set()
+
+
+def run_worker(path: str = DEFAULT_DB, worker: Optional[str] = None, lease: float = LEASE_SECONDS,
+               until_empty: bool = False, poll: float = POLL_SECONDS, max_jobs: Optional[int] = None) -> int:
+    """Consuma job finché ce ne sono (until_empty) o per sempre; ritorna i job eseguiti."""
+    worker = worker or worker_name()
+    n = 0
+    with JobQueue(path) as queue:
+        while max_jobs is None or n < max_jobs:
+            job = queue.claim(worker, lease)
+            if job is None:
+                if until_empty:
+                    break
+                time.sleep(poll)
+                continue
+            hb = _Heartbeat(queue, job, worker, lease)
+            hb.start()
+            t0 = time.perf_counter()
+            try:
+                by_year, used = execute(job)
+            except Exception as e:
+                status = queue.fail(job, worker, f"{type(e).__name__}: {e}")
+                metrics.inc("queue_jobs_total", result={QUEUED: "retry", FAILED: "failed"}.get(status, "lost"))
+            else:
+                seconds = time.perf_counter() - t0
+                saved = queue.complete(job, by_year, used, seconds)
+                metrics.inc("queue_jobs_total", result="done" if saved else "duplicate")
+                metrics.observe("queue_job_seconds", seconds)
+            finally:
+                hb.stop()
+            n += 1
+    return n
+
+
+def _worker_process(path: str, lease: float, until_empty: bool) -> None:
+    _quiet_streamlit()
+    run_worker(path, lease=lease, until_empty=until_empty)
+
+
+def _quiet_streamlit() -> None:
+    # st.cache_data senza runtime (worker senza UI) avvisa a ogni cache: funziona comunque, in memoria
+    import logging
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Coda di job del batch (SQLite, multi-processo e multi-macchina)")
+    ap.add_argument("--db", default=DEFAULT_DB, help="database della coda (su disco condiviso per più macchine)")
+    ap.add_argument("--results-db", default=None, help="archivio risultati (default BILANCI_RESULTS_DB)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    en = sub.add_parser("enqueue", help="accoda le aziende di un foglio Excel")
+    en.add_argument("xlsx")
+    en.add_argument("--column", default="name", help="colonna con il nome azienda")
+    en.add_argument("--year", type=int, nargs="+", required=True)
+    en.add_argument("--doc-keyword", action="append", dest="doc_keywords", default=None)
+    en.add_argument("--keyword", action="append", dest="extract_keywords", default=None,
+                    help="keyword da cercare nel documento (ripetibile)")
+    en.add_argument("--serp-results", type=int, default=3)
+    en.add_argument("--min-delay", type=float, default=1.0)
+    en.add_argument("--no-polite", action="store_true", help="ignora robots.txt e delay")
+    en.add_argument("--no-discover", action="store_true", help="solo CSE, senza scoperta dei domini")
+    en.add_argument("--limit", type=int, default=None, help="solo le prime N righe")
+    wk = sub.add_parser("worker", help="consuma i job")
+    wk.add_argument("--processes", type=int, default=1)
+    wk.add_argument("--lease", type=float, default=LEASE_SECONDS)
+    wk.add_argument("--until-empty", action="store_true", help="termina quando la coda è vuota")
+    sp = sub.add_parser("status", help="stato dei batch")
+    sp.add_argument("batch_id", nargs="?")
+    mg = sub.add_parser("merge", help="unisce i risultati nell'archivio ed esporta (formato dall'estensione)")
+    mg.add_argument("batch_id")
+    mg.add_argument("path")
+    args = ap.parse_args(argv)
+
+    def store():
+        from results_store import DEFAULT_DB as RESULTS_DB, ResultsStore
+        return ResultsStore(args.results_db or RESULTS_DB)
+
+    if args.cmd == "worker":
+        _quiet_streamlit()
+        if args.processes <= 1:
+            n = run_worker(args.db, lease=args.lease, until_empty=args.until_empty)
+            print(f"Job eseguiti: {n}", file=sys.stderr)
+            return 0
+        import multiprocessing as mp
+        ctx = mp.get_context("spawn")
+        procs = [ctx.Process(target=_worker_process, args=(args.db, args.lease, args.until_empty))
+                 for _ in range(args.processes)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        return 0
+
+    with JobQueue(args.db) as queue:
+        if args.cmd == "enqueue":
+            import pandas as pd
+            df = pd.read_excel(args.xlsx)
+            if args.column not in df.columns:
+                print(f"Colonna '{args.column}' non trovata: {', '.join(map(str, df.columns))}", file=sys.stderr)
+                return 1
+            params = {"doc_keywords": args.doc_keywords or DEFAULT_DOC_KEYWORDS,
+                      "extract_keywords": args.extract_keywords or DEFAULT_EXTRACT_KEYWORDS,
+                      "serp_results": args.serp_results, "polite_mode": not args.no_polite,
+                      "min_delay": args.min_delay, "discover": not args.no_discover}
+            with store() as s:
+                batch_id, run_id = enqueue_sheet(queue, s, df, args.column, args.year, params, limit=args.limit)
+            print(batch_id)
+            print(f"Job accodati: {queue.status(batch_id)['total']} (run {run_id})", file=sys.stderr)
+        elif args.cmd == "status":
+            batches = [{"batch_id": args.batch_id, **queue.status(args.batch_id)}] if args.batch_id else queue.batches()
+            for b in batches:
+                print(f"{b['batch_id']}  totale={b['total']}  in_coda={b[QUEUED]}  in_corso={b[RUNNING]}  "
+                      f"finiti={b[DONE]}  falliti={b[FAILED]}")
+            if args.batch_id:
+                for f in queue.failures(args.batch_id):
+                    print(f"  ✗ {f['company']} ({f['attempts']} tentativi): {f['error']}")
+        else:
+            with store() as s:
+                status = queue.merge(args.batch_id, s)
+                print(s.export(queue.batch(args.batch_id)["run_id"], args.path))
+            if status[QUEUED] or status[RUNNING]:
+                print(f"Attenzione: {status[QUEUED] + status[RUNNING]} job non ancora conclusi (merge parziale)",
+                      file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Metriche in-process (contatori e istogrammi) per capire dove si spende il tempo:
+rete (CSE, fetch per host), parsing HTML, scoring link, estrazione PDF, OCR, cache.
+
+Tutto è aggregato nel processo corrente (condiviso tra le pagine Streamlit) ed esportabile
+in JSON o in formato testo Prometheus. Costo per osservazione: un lock e qualche somma.
+"""
+from __future__ import annotations
+import json, threading, time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Bucket (secondi) per gli istogrammi di latenza
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+# Metriche note (nome → descrizione), usate per HELP Prometheus e in Diagnostics
+DESCRIPTIONS = {
+    "cse_request_seconds": "Latenza richieste Google CSE",
+    "cse_retries_total": "Retry verso Google CSE (429/5xx/errori di rete) per status",
+    "fetch_seconds": "Latenza fetch HTTP per host",
+    "fetch_bytes_total": "Byte scaricati per host",
+    "fetch_errors_total": "Errori di fetch per host",
+    "html_parse_seconds": "Tempo di parsing HTML per pagina (parser incrementale o BeautifulSoup)",
+    "html_truncated_total": "Pagine HTML troncate al tetto di byte (BILANCI_MAX_HTML_BYTES) per host",
+    "link_scoring_seconds": "Tempo di scoring/classificazione dei link di una pagina",
+    "boilerplate_links_total": "Link di template del sito (header, footer, menu) già visti su un'altra pagina e scartati",
+    "pdf_extract_page_seconds": "Tempo di estrazione testo per pagina PDF",
+    "ocr_rasterize_seconds": "Tempo di rasterizzazione PDF per OCR (documento)",
+    "ocr_page_seconds": "Tempo OCR per pagina (stage=low|high nell'OCR adattivo: pagina o fascia)",
+    "ocr_regions_total": "Fasce con keyword trovate (stage=low) e ri-OCR ad alta risoluzione (stage=high)",
+    "pdf_extract_doc_seconds": "Tempo di estrazione testo per documento nel pool di worker",
+    "pdf_pool_events_total": "Eventi del pool PDF (timeouts, crashes, memory, replaced)",
+    "singleflight_total": "Richieste single-flight per gruppo (result=leader|shared|reused)",
+    "results_store_rows_total": "Righe di risultato scritte nell'archivio SQLite del batch",
+    "corpus_index_seconds": "Scrittura di un documento (testo per pagina) nell'indice FTS del corpus",
+    "corpus_query_seconds": "Interrogazioni del corpus senza rete né PDF (kind=search|values|requery)",
+    "corpus_documents_total": "Documenti scritti o aggiornati nell'indice FTS del corpus",
+    "corpus_pages_total": "Pagine di testo scritte nell'indice FTS del corpus",
+    "corpus_index_errors_total": "Errori di indicizzazione nel corpus (il batch prosegue comunque)",
+    "queue_enqueued_total": "Job accodati nella coda su disco del batch (uno per azienda distinta)",
+    "queue_jobs_total": "Job eseguiti dai worker della coda (result=done|duplicate|retry|failed|lost)",
+    "queue_job_seconds": "Durata di un job della coda (ricerca, crawl ed estrazione di un'azienda)",
+    "results_store_flush_seconds": "Durata delle scritture a blocchi nell'archivio risultati",
+    "results_export_seconds": "Durata delle esportazioni in streaming per formato",
+    "scheduler_targets_total": "Target eseguiti dallo scheduler per esito (ok|timeout|error)",
+    "scheduler_target_seconds": "Durata dei target dello scheduler per esito",
+    "monitor_pages_total": "Pagine ricontrollate dal monitoraggio (not_modified|unchanged|changed|new)",
+    "monitor_docs_total": "Documenti nuovi o cambiati emessi dal monitoraggio",
+    "pdf_probe_seconds": "Durata delle sonde Range sui PDF candidati (range=yes|no)",
+    "pdf_probe_bytes_total": "Byte letti dalle sonde Range sui PDF candidati",
+    "circuit_open_total": "Aperture del circuit breaker per host (errori o timeout consecutivi)",
+    "circuit_skips_total": "Richieste saltate perché l'host ha il circuito aperto",
+    "discovery_seconds": "Durata della scoperta degli entrypoint senza CSE (domini, DNS/HTTP, percorsi noti)",
+    "discovery_total": "Aziende passate dalla scoperta degli entrypoint (result=found|not_found)",
+    "cache_requests_total": "Accessi alle cache (result=hit|miss)",
+}
+
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_histograms: dict[tuple, dict] = {}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0.0) + value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    k = _key(name, labels)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = {"count": 0, "sum": 0.0, "min": value, "max": value, "buckets": [0] * len(BUCKETS)}
+        h["count"] += 1
+        h["sum"] += value
+        h["min"] = min(h["min"], value)
+        h["max"] = max(h["max"], value)
+        for i, b in enumerate(BUCKETS):
+            if value <= b:
+                h["buckets"][i] += 1
+                break
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Misura il blocco e lo registra nell'istogramma `name` (anche se solleva eccezioni)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+
+def cache_access(cache: str, hit: bool) -> None:
+    inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def host_label(url: str) -> str:
+    try:
+        return urlparse(str(url)).netloc.lower() or "?"
+    except Exception:
+        return "?"
+
+
+def record_fetch(url: str, seconds: float, nbytes: int = 0, error: bool = False) -> None:
+    host = host_label(url)
+    observe("fetch_seconds", seconds, host=host)
+    if nbytes:
+        inc("fetch_bytes_total", nbytes, host=host)
+    if error:
+        inc("fetch_errors_total", host=host)
+
+
+def quantile(h: dict, q: float) -> float:
+    """Quantile stimato dai bucket (limite superiore del bucket, max per l'ultimo)."""
+    if not h["count"]:
+        return 0.0
+    target = q * h["count"]
+    acc = 0
+    for i, b in enumerate(BUCKETS):
+        acc += h["buckets"][i]
+        if acc >= target:
+            return min(b, h["max"])
+    return h["max"]
+
+
+def snapshot() -> dict:
+    """Copia consistente di tutte le metriche, serializzabile in JSON."""
+    with _lock:
+        counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(_counters.items())]
+        hists = []
+        for (n, l), h in sorted(_histograms.items()):
+            hists.append({
+                "name": n, "labels": dict(l), "count": h["count"], "sum": h["sum"],
+                "min": h["min"], "max": h["max"],
+                "mean": h["sum"] / h["count"] if h["count"] else 0.0,
+                "p50": quantile(h, 0.5), "p95": quantile(h, 0.95),
+                "buckets": [{"le": b, "count": c} for b, c in zip(BUCKETS, h["buckets"])],
+            })
+    return {"generated_at": time.time(), "counters": counters, "histograms": hists}
+
+
+def cache_hit_rates() -> list[dict]:
+    by_cache: dict[str, dict] = {}
+    for c in snapshot()["counters"]:
+        if c["name"] != "cache_requests_total":
+            continue
+        d = by_cache.setdefault(c["labels"].get("cache", "?"), {"hit": 0.0, "miss": 0.0})
+        d[c["labels"].get("result", "miss")] = d.get(c["labels"].get("result", "miss"), 0.0) + c["value"]
+    out = []
+    for cache, d in sorted(by_cache.items()):
+        tot = d["hit"] + d["miss"]
+        out.append({"cache": cache, "hit": int(d["hit"]), "miss": int(d["miss"]), "hit_rate": (d["hit"] / tot) if tot else 0.0})
+    return out
+
+
+def to_json() -> str:
+    return json.dumps(snapshot(), ensure_ascii=False, indent=2, default=str)
+
+
+def _prom_labels(labels: dict, extra: dict | None = None) -> str:
+    items = dict(labels)
+    if extra:
+        items.update(extra)
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items.items()) + "}"
+
+
+def to_prometheus(prefix: str = "bilanci_") -> str:
+    """Esporta nel formato testo di Prometheus (text exposition 0.0.4)."""
+    snap = snapshot()
+    lines: list[str] = []
+    seen: set[str] = set()
+    for c in snap["counters"]:
+        n = prefix + c["name"]
+        if n not in seen:
+            seen.add(n)
+            lines.append(f"# HELP {n} {DESCRIPTIONS.get(c['name'], c['name'])}")
+            lines.append(f"# TYPE {n} counter")
+        lines.append(f"{n}{_prom_labels(c['labels'])} {c['value']:g}")
+    for h in snap["histograms"]:
+        n = prefix + h["name"]
+        if n not in seen:
+            seen.add(n)
+            lines.append(f"# HELP {n} {DESCRIPTIONS.get(h['name'], h['name'])}")
+            lines.append(f"# TYPE {n} histogram")
+        acc = 0
+        for b in h["buckets"]:
+            acc += b["count"]
+            le = "+Inf" if b["le"] == float("inf") else f"{b['le']:g}"
+            lines.append(f"{n}_bucket{_prom_labels(h['labels'], {'le': le})} {acc}")
+        lines.append(f"{n}_sum{_prom_labels(h['labels'])} {h['sum']:.6f}")
+        lines.append(f"{n}_count{_prom_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,288 @@
+"""
+Monitoraggio incrementale: ricontrolli periodici (es. settimanali) delle pagine IR che riportano
+solo i documenti nuovi o cambiati, invece di una crawl completa ogni volta.
+
+Per ogni pagina visitata si salvano (SQLite) ETag/Last-Modified, un'impronta del contenuto
+(HTML senza script/stili/commenti/token) e i link estratti. Al controllo successivo:
+- richiesta condizionale (If-None-Match / If-Modified-Since): su 304 si riusano i link salvati
+- 200 con impronta invariata: link salvati, nessun parsing
+- impronta diversa: parsing e aggiornamento
+I PDF candidati sono confrontati con quelli già noti per lo stesso ambito (azienda/target):
+nuovi → "new"; noti → HEAD condizionale, "changed" se ETag/Last-Modified/lunghezza sono cambiati.
+
+Anche con lo scheduler (--targets) la crawl passa da crawler.crawl_for_pdfs con PageCache, non da
+semantic_crawler, che gestisce da sé i fetch e riscaricherebbe ogni pagina.
+
+Uso:
+  python monitor.py --seed https://www.example.it/investor --year 2024
+  python monitor.py --targets config/targets --out results/monitor_diff.jsonl   # tutti i target
+"""
+from __future__ import annotations
+import argparse, asyncio, hashlib, json, os, re, sqlite3, sys, threading, time
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urljoin
+
+import metrics
+
+DEFAULT_DB = os.environ.get("BILANCI_MONITOR_DB", os.path.join("results", "monitor.sqlite"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    fingerprint TEXT NOT NULL,
+    links TEXT NOT NULL,
+    checked REAL NOT NULL,
+    changed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS docs (
+    scope TEXT NOT NULL,
+    url TEXT NOT NULL,
+    anchor TEXT,
+    via TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    length INTEGER,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (scope, url)
+);
+"""
+
+# parti dell'HTML che cambiano a ogni richiesta senza cambiare la pagina
+_VOLATILE_RE = re.compile(
+    r"<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->|<input[^>]+type=[\"']?hidden[^>]*>|<meta[^>]+csrf[^>]*>",
+    re.I | re.S)
+_WS_RE = re.compile(r"\s+")
+
+
+def fingerprint(html: str) -> str:
+    """Impronta del contenuto significativo della pagina."""
+    return hashlib.sha256(_WS_RE.sub(" ", _VOLATILE_RE.sub("", html)).strip().encode("utf-8", "replace")).hexdigest()
+
+
+def _validators(headers) -> Dict[str, Optional[str]]:
+    return {"etag": headers.get("etag"), "last_modified": headers.get("last-modified")}
+
+
+class MonitorStore:
+    """Stato del monitoraggio su SQLite (WAL), condivisibile tra thread."""
+
+    def __init__(self, path: str = DEFAULT_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def page(self, url: str) -> Optional[dict]:
+        with self._lock:
+            r = self._conn.execute("SELECT etag, last_modified, fingerprint, links FROM pages WHERE url = ?",
+                                   (url,)).fetchone()
+        if r is None:
+            return None
+        return {"etag": r[0], "last_modified": r[1], "fingerprint": r[2], "links": [tuple(x) for x in json.loads(r[3])]}
+
+    def save_page(self, url: str, etag: Optional[str], last_modified: Optional[str], fp: str,
+                  links: Optional[list], changed: bool) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            if links is None:
+                self._conn.execute("UPDATE pages SET checked = ? WHERE url = ?", (now, url))
+                return
+            self._conn.execute(
+                "INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET "
+                "etag = excluded.etag, last_modified = excluded.last_modified, fingerprint = excluded.fingerprint, "
+                "links = excluded.links, checked = excluded.checked, "
+                "changed = CASE WHEN ? THEN excluded.changed ELSE pages.changed END",
+                (url, etag, last_modified, fp, json.dumps(links, ensure_ascii=False), now, now, int(changed)))
+
+    def docs(self, scope: str) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT url, etag, last_modified, length FROM docs WHERE scope = ?",
+                                      (scope,)).fetchall()
+        return {r[0]: {"etag": r[1], "last_modified": r[2], "length": r[3]} for r in rows}
+
+    def save_doc(self, scope: str, url: str, anchor: str, via: str, v: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(scope, url) DO UPDATE SET "
+                "anchor = excluded.anchor, via = excluded.via, etag = COALESCE(excluded.etag, docs.etag), "
+                "last_modified = COALESCE(excluded.last_modified, docs.last_modified), "
+                "length = COALESCE(excluded.length, docs.length), last_seen = excluded.last_seen",
+                (scope, url, anchor, via, v.get("etag"), v.get("last_modified"), v.get("length"), now, now))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class PageCache:
+    """Aggancio per crawler._crawl (`pages=`): richieste condizionali e link salvati se nulla è cambiato."""
+
+    def __init__(self, store: MonitorStore):
+        self.store = store
+        self._known: Dict[str, dict] = {}
+        self.stats = {"not_modified": 0, "unchanged": 0, "changed": 0, "new": 0, "bytes": 0}
+
+    def headers(self, url: str) -> Dict[str, str]:
+        prev = self.store.page(url)
+        if prev is None:
+            return {}
+        self._known[url] = prev
+        h = {}
+        if prev["etag"]:
+            h["If-None-Match"] = prev["etag"]
+        if prev["last_modified"]:
+            h["If-Modified-Since"] = prev["last_modified"]
+        return h
+
+    def links(self, url: str, response, html: Optional[str], nbytes: int = 0) -> list:
+        from crawler import _extract_links
+        prev = self._known.pop(url, None)
+        self.stats["bytes"] += nbytes
+        if html is None:
+            # 304: lo stato salvato resta valido
+            self.stats["not_modified"] += 1
+            metrics.inc("monitor_pages_total", result="not_modified")
+            self.store.save_page(url, None, None, "", None, False)
+            return prev["links"] if prev else []
+        v = _validators(response.headers)
+        fp = fingerprint(html)
+        if prev is not None and prev["fingerprint"] == fp:
+            self.stats["unchanged"] += 1
+            metrics.inc("monitor_pages_total", result="unchanged")
+            self.store.save_page(url, v["etag"], v["last_modified"], fp, prev["links"], False)
+            return prev["links"]
+        result = "changed" if prev is not None else "new"
+        self.stats[result] += 1
+        metrics.inc("monitor_pages_total", result=result)
+        links = _extract_links(url, html)
+        self.store.save_page(url, v["etag"], v["last_modified"], fp, [list(l) for l in links], True)
+        return links
+
+
+def diff_docs(store: MonitorStore, scope: str, candidates: Iterable[dict], check: bool = True,
+              timeout: float = 15.0) -> List[dict]:
+    """
+    Candidati {url, anchor, via, ...} → solo quelli nuovi o cambiati, con "change": new|changed.
+    I PDF già noti vengono verificati con HEAD condizionale (pochi byte per documento).
+    """
+    import httpx
+    import replay
+    known = store.docs(scope)
+    baseline = not known
+    out: List[dict] = []
+    with httpx.Client(follow_redirects=True, timeout=timeout, headers={
+        "User-Agent": "Mozilla/5.0 (compatible; BilanciCrawler/1.0)"
+    }, **replay.client_kwargs()) as client:
+        seen = set()
+        for c in candidates:
+            url = c["url"]
+            if url in seen:  # stesso PDF linkato da più pagine
+                continue
+            seen.add(url)
+            prev = known.get(url)
+            v: Dict[str, Any] = {}
+            change = "new" if prev is None else None
+            if check:
+                h = {}
+                if prev and prev["etag"]:
+                    h["If-None-Match"] = prev["etag"]
+                if prev and prev["last_modified"]:
+                    h["If-Modified-Since"] = prev["last_modified"]
+                try:
+                    r = client.head(url, headers=h)
+                    if r.status_code < 400 and r.status_code != 304:
+                        length = r.headers.get("content-length")
+                        v = {**_validators(r.headers), "length": int(length) if length and length.isdigit() else None}
+                        if prev is not None and any(v[k] and prev[k] and v[k] != prev[k]
+                                                    for k in ("etag", "last_modified", "length")):
+                            change = "changed"
+                except Exception:
+                    pass
+            store.save_doc(scope, url, c.get("anchor", ""), c.get("via", ""), v)
+            if change:
+                metrics.inc("monitor_docs_total", change=change)
+                out.append({**c, **{k: x for k, x in v.items() if x is not None}, "change": change, "baseline": baseline})
+    return out
+
+
+def monitor_company(entry_urls: List[str], years: List[int], store: MonitorStore, scope: Optional[str] = None,
+                    max_pages: int = 50, max_depth: int = 4, check_docs: bool = True) -> dict:
+    """
+    Ricontrollo incrementale con crawler.crawl_for_pdfs: ritorna {"diff": [documenti nuovi/cambiati],
+    "pages": statistiche pagine (not_modified/unchanged/changed/new, bytes), "visited": n}.
+    """
+    from crawler import crawl_for_pdfs
+    scope = scope or " ".join(sorted(entry_urls))
+    cache = PageCache(store)
+    out = crawl_for_pdfs(entry_urls, years, max_pages=max_pages, max_depth=max_depth, pages=cache, exhaustive=True)
+    cands = [{"url": c["pdf"], "anchor": c["anchor"], "via": c["via"], "years": c["years"]} for c in out["candidates"]]
+    return {"diff": diff_docs(store, scope, cands, check=check_docs), "pages": cache.stats, "visited": out["visited"],
+            "host_stats": out["host_stats"]}
+
+
+def monitor_crawl_fn(store: MonitorStore, check_docs: bool = True):
+    """
+    crawl_fn per scheduler.Scheduler: gli item restituiti sono solo i documenti nuovi o cambiati.
+    Sempre monitor_company (PageCache: richieste condizionali, impronte, link salvati), anche se
+    semantic_crawler è installato: quello riscarica ogni pagina a ogni giro.
+    """
+    async def run(config: dict) -> dict:
+        scope = config.get("name") or config["base_url"]
+        base = config["base_url"]
+        seeds = [urljoin(base + "/", s) for s in (config.get("seeds") or ["/"])]
+        years = config.get("years_target") or [time.localtime().tm_year - 1]
+        # run_in_executor e non asyncio.to_thread (3.9+): la CI gira anche su Python 3.8
+        res = await asyncio.get_running_loop().run_in_executor(
+            None, monitor_company, seeds, list(years), store, scope,
+            int(config.get("max_pages", 50)), int(config.get("max_depth", 4)), check_docs)
+        return {"items": res["diff"], "stats": {**res["pages"], "visited": res["visited"]}, "host_stats": res["host_stats"]}
+    return run
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Monitoraggio incrementale: solo documenti nuovi o cambiati")
+    ap.add_argument("--db", default=DEFAULT_DB)
+    ap.add_argument("--seed", action="append", default=[], help="entrypoint (ripetibile)")
+    ap.add_argument("--year", type=int, action="append", default=[], help="anno (ripetibile)")
+    ap.add_argument("--max-pages", type=int, default=50)
+    ap.add_argument("--max-depth", type=int, default=4)
+    ap.add_argument("--targets", help="cartella di target JSON (esegue tutti i target con lo scheduler)")
+    ap.add_argument("--out", default="-", help="JSONL del diff (default stdout)")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--per-host", type=int, default=2)
+    ap.add_argument("--no-head", action="store_true", help="non verificare i PDF già noti con HEAD")
+    args = ap.parse_args(argv)
+
+    store = MonitorStore(args.db)
+    out = sys.stdout if args.out == "-" else open(args.out, "a", encoding="utf-8")
+    try:
+        if args.targets:
+            from scheduler import JsonlSink, Scheduler, load_targets
+            sched = Scheduler(monitor_crawl_fn(store, check_docs=not args.no_head), concurrency=args.concurrency,
+                              per_host=args.per_host, on_result=JsonlSink(out))
+            asyncio.run(sched.run(load_targets(args.targets)))
+        elif args.seed:
+            years = args.year or [time.localtime().tm_year - 1]
+            res = monitor_company(args.seed, years, store, max_pages=args.max_pages, max_depth=args.max_depth,
+                                  check_docs=not args.no_head)
+            for d in res["diff"]:
+                out.write(json.dumps(d, ensure_ascii=False) + "\n")
+            print(f"Pagine: {res['pages']}  visitate: {res['visited']}  documenti nuovi/cambiati: {len(res['diff'])}",
+                  file=sys.stderr)
+        else:
+            ap.error("indicare --seed oppure --targets")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
+import re
 import streamlit as st
-from search_cse import pick_entrypoints
-from crawler import crawl_for_pdf
+from crawl_trace import CrawlTrace
 
 st.set_page_config(page_title="Entrypoint → Crawl → PDF", page_icon="📄", layout="centered")
 st.title("📄 Bilanci – Entrypoint → Crawl → PDF")
@@ -9,43 +9,129 @@ st.caption("Trova la pagina indice (IR/Bilanci/Trasparenza) e naviga nel dominio
 with st.form("param"):
     company = st.text_input("Ragione sociale", value="Estra")
     year = st.number_input("Anno", min_value=2005, max_value=2028, value=2023, step=1)
-    manual_seed = st.text_input("URL seed (opzionale: pagina 'Bilanci e Relazioni' / 'Investor Relations')")
+    extra_years_raw = st.text_input("Altri anni (opzionale, es. 2022, 2021)",
+                                    help="Multi-anno: una sola crawl del sito, miglior PDF per ciascun anno.")
+    manual_seed = st.text_input("URL seed (opzionale: pagina 'Bilanci e Relazioni' / 'Investor Relations')",
+                                help="Più seed separate da spazio o virgola: una sola crawl con budget condiviso.")
     max_depth = st.slider("Profondità massima crawl", 1, 6, 4)
     max_pages = st.slider("Pagine massime da visitare", 10, 120, 50, step=10)
+    rank_mode = st.checkbox("Classifica e verifica i candidati (non fermarti al primo PDF)", value=False,
+                            help="Raccoglie i PDF candidati entro il budget, verifica i migliori in parallelo "
+                                 "(HEAD + metadati/prima pagina via Range) e mostra la classifica con le evidenze.")
+    top_k = st.slider("Candidati da verificare", 2, 10, 5)
+    trace_on = st.checkbox("Registra trace delle decisioni di crawl (JSONL)", value=False)
     submitted = st.form_submit_button("Cerca PDF")
 
 if submitted:
-    st.info(f"Cerco PDF per **{company} – {int(year)}**…")
+    # httpx/bs4 si caricano solo quando serve davvero (cold start della pagina più rapido)
+    import st_cache
 
-    # 1) Entrypoint
+    years = sorted({int(year)} | {int(y) for y in re.findall(r"\d{4}", extra_years_raw)}, reverse=True)
+    st.info(f"Cerco PDF per **{company} – {', '.join(str(y) for y in years)}**…")
+
+    # 1) Entrypoint: scoperta del sito (DNS/HTTP, nessuna quota); la CSE solo se non trova nulla
     if manual_seed.strip():
-        entrypoints = [manual_seed.strip()]
-        st.write("🔗 Entrypoint (manuale): ", entrypoints[0])
+        entrypoints = [u for u in re.split(r"[\s,]+", manual_seed.strip()) if u]
+        entry_source = "manual"
     else:
-        try:
-            api_key = st.secrets["google"]["api_key"]
-            cx      = st.secrets["google"]["cx"]
-        except Exception:
-            st.error("Configura le secrets in Streamlit Cloud: [google.api_key] e [google.cx] — oppure usa un seed manuale.")
-            st.stop()
-
-        entrypoints = pick_entrypoints(company, int(year), api_key, cx, max_sites=5)
+        with st.spinner("Cerco il sito ufficiale (domini e percorsi noti)…"):
+            entrypoints = st_cache.discover_entrypoints(company, max_sites=5)
+        entry_source = "discovery"
         if not entrypoints:
-            st.error("La CSE non ha restituito entrypoint utili. Prova un seed manuale.")
-            st.stop()
-        with st.expander("🔎 Entrypoint trovati via CSE"):
-            for u in entrypoints:
-                st.write(u)
+            try:
+                api_key = st.secrets["google"]["api_key"]
+                cx      = st.secrets["google"]["cx"]
+            except Exception:
+                st.error("Sito ufficiale non trovato automaticamente. Configura le secrets [google.api_key] e "
+                         "[google.cx] per la ricerca CSE, oppure usa un seed manuale.")
+                st.stop()
+
+            # memoizzata per (azienda, anno, max_sites): ripetere la ricerca non consuma quota CSE
+            entrypoints = st_cache.pick_entrypoints(company, years[0], api_key, cx, max_sites=5)
+            entry_source = "cse"
+            if not entrypoints:
+                st.error("Né la scoperta dei domini né la CSE hanno restituito entrypoint utili. Prova un seed manuale.")
+                st.stop()
 
-    # 2) Crawl interno al dominio
-    with st.spinner("Navigo nel dominio alla ricerca del PDF…"):
-        res = crawl_for_pdf(entrypoints, int(year), max_pages=max_pages, max_depth=max_depth)
+    # 2) Crawl interno al dominio (memoizzata; con trace attivo si crawla davvero per registrare le decisioni)
+    trace = CrawlTrace() if trace_on else None
+    if len(years) > 1:
+        with st.spinner("Navigo nel dominio (una sola crawl per tutti gli anni)…"):
+            if trace is None:
+                res = st_cache.crawl_for_pdfs(tuple(entrypoints), tuple(years), max_pages=max_pages, max_depth=max_depth)
+            else:
+                from crawler import crawl_for_pdfs
+                res = crawl_for_pdfs(entrypoints, years, max_pages=max_pages, max_depth=max_depth, trace=trace)
+    else:
+        with st.spinner("Navigo nel dominio alla ricerca del PDF…"):
+            mode = "rank" if rank_mode else "first"
+            if trace is None:
+                res = st_cache.crawl_for_pdf(tuple(entrypoints), int(year), max_pages=max_pages, max_depth=max_depth,
+                                             mode=mode, top_k=int(top_k))
+            else:
+                from crawler import crawl_for_pdf
+                res = crawl_for_pdf(entrypoints, int(year), max_pages=max_pages, max_depth=max_depth, trace=trace,
+                                    mode=mode, top_k=int(top_k))
+
+    # esito in session_state: i rerun della pagina lo ridisegnano senza rifare ricerca e crawl
+    st.session_state["entry_to_pdf"] = {"company": company, "year": int(year), "years": years,
+                                        "entrypoints": entrypoints, "entry_source": entry_source,
+                                        "res": res, "trace": trace}
+
+run = st.session_state.get("entry_to_pdf")
+if run:
+    res, trace = run["res"], run["trace"]
+    if run.get("entry_source", "manual") != "manual":
+        label = "scoperta dei domini" if run["entry_source"] == "discovery" else "CSE"
+        with st.expander(f"🔎 Entrypoint trovati via {label}"):
+            for u in run["entrypoints"]:
+                st.write(u)
+    else:
+        st.write("🔗 Entrypoint (manuale): ", ", ".join(run["entrypoints"]))
 
     # 3) Esito
-    if res.get("pdf"):
+    if len(run["years"]) > 1:
+        st.write(f"Pagine visitate: {res['visited']}")
+        for y, hit in res["by_year"].items():
+            if hit:
+                label = "" if hit["exact"] else " (senza anno esplicito: verificare)"
+                st.success(f"✅ {y}: PDF trovato ({hit['score']:.2f}) via {hit['via']}{label}")
+                st.code(hit["pdf"], language="text")
+            else:
+                st.warning(f"⚠️ {y}: nessun PDF trovato entro i limiti.")
+        if res["missing_years"]:
+            st.caption("Suggerimenti: incolla la pagina 'Bilanci e Relazioni' come seed oppure aumenta profondità/pagine.")
+    elif res.get("pdf"):
+        if len(res.get("pages_by_domain") or {}) > 1:
+            st.caption("Pagine per dominio: " + ", ".join(f"{d} {n}" for d, n in res["pages_by_domain"].items()))
         st.success(f"✅ PDF trovato ({res['score']:.2f}) via {res['via']} — pagine visitate: {res['visited']}")
         st.code(res["pdf"], language="text")
         st.caption("Copia l'URL: puoi usarlo nel tuo flusso OCR/Excel.")
     else:
         st.warning(f"⚠️ Nessun PDF trovato entro i limiti (visitato: {res.get('visited')}).")
         st.caption("Suggerimenti: incolla la pagina 'Bilanci e Relazioni' come seed oppure aumenta profondità/pagine.")
+
+    if res.get("candidates") and len(run["years"]) == 1:
+        with st.expander(f"🏅 Classifica candidati ({len(res['candidates'])})", expanded=not res.get("pdf")):
+            rows = []
+            for c in res["candidates"]:
+                ev = c.get("evidence") or {}
+                rows.append({"pdf": c["pdf"], "score": round(c["score"], 2), "verificato": c["verified"],
+                             "link": round(c["score_link"], 2), "sonda": c["score_probe"],
+                             "tipo": ev.get("doc_type"), "titolo": ev.get("title"), "pagine": ev.get("pages"),
+                             "HTTP": ev.get("status"), "content-type": ev.get("content_type"),
+                             "byte": ev.get("size"), "errore": ev.get("probe_error") or ev.get("error"),
+                             "ancora": c["anchor"], "via": c["via"]})
+            st.dataframe(rows, use_container_width=True)
+
+    failing = {h: d for h, d in (res.get("host_stats") or {}).items()
+               if d.get("error") or d.get("timeout") or d.get("circuit_open") or d.get("circuit") != "closed"}
+    if failing:
+        with st.expander(f"🩹 Host con errori ({len(failing)})"):
+            st.dataframe([{"host": h, **d} for h, d in failing.items()], use_container_width=True)
+
+    if trace is not None:
+        with st.expander("🧾 Trace decisioni di crawl"):
+            st.json(trace.summary())
+            st.download_button("⬇️ Scarica trace (JSONL)", data=trace.to_jsonl().encode("utf-8"),
+                               file_name=f"trace_{run['company']}_{run['year']}.jsonl", mime="application/x-ndjson")
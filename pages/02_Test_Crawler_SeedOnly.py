@@ -1,7 +1,5 @@
 import streamlit as st
-from crawler import crawl_for_pdf
-import httpx
-from bs4 import BeautifulSoup
+from crawl_trace import CrawlTrace
 
 st.set_page_config(page_title="Test Crawler (Seed only)", page_icon="🧭", layout="centered")
 st.title("🧭 Test Crawler (solo seed, senza CSE)")
@@ -12,19 +10,29 @@ with st.form("params"):
     year = st.number_input("Anno", min_value=2005, max_value=2028, value=2023, step=1)
     max_depth = st.slider("Profondità massima", 1, 6, 4)
     max_pages = st.slider("Pagine max da visitare", 10, 120, 50, step=10)
+    concurrency = st.slider("Pagine scaricate in parallelo", 1, 8, 4,
+                            help="Le migliori pagine della frontiera vengono scaricate insieme; 1 = crawl sequenziale.")
     debug = st.toggle("Mostra primo HTML e primi 20 link estratti", value=False)
+    trace_on = st.toggle("Registra trace delle decisioni di crawl (JSONL)", value=False)
     go = st.form_submit_button("Cerca PDF")
 
 if go:
+    # httpx/bs4 si caricano solo quando serve davvero (cold start della pagina più rapido)
+    import httpx
+    from bs4 import BeautifulSoup
+    import replay
+    import st_cache
+
     if not seed.strip():
         st.error("Inserisci un URL seed."); st.stop()
 
     # Debug: controlla che la pagina seed sia raggiungibile e contenga link
     if debug:
         try:
-            r = httpx.get(seed.strip(), timeout=30, follow_redirects=True, headers={
+            with httpx.Client(timeout=30, follow_redirects=True, headers={
                 "User-Agent": "Mozilla/5.0 (compatible; BilanciCrawler/1.0)"
-            })
+            }, **replay.client_kwargs()) as client:
+                r = client.get(seed.strip())
             st.write("GET seed:", r.status_code, r.headers.get("content-type"))
             if "text/html" in r.headers.get("content-type", "") and r.text:
                 soup = BeautifulSoup(r.text, "html.parser")
@@ -36,9 +44,21 @@ if go:
         except Exception as e:
             st.error(f"Errore fetch seed: {e}")
 
+    trace = CrawlTrace() if trace_on else None
     with st.spinner("Navigo nel dominio alla ricerca del PDF…"):
-        res = crawl_for_pdf([seed.strip()], int(year), max_pages=max_pages, max_depth=max_depth)
+        if trace is None:
+            # memoizzata per (seed, anno, limiti); con trace attivo si crawla davvero
+            res = st_cache.crawl_for_pdf((seed.strip(),), int(year), max_pages=max_pages, max_depth=max_depth,
+                                         concurrency=int(concurrency))
+        else:
+            from crawler import crawl_for_pdf
+            res = crawl_for_pdf([seed.strip()], int(year), max_pages=max_pages, max_depth=max_depth, trace=trace,
+                                concurrency=int(concurrency))
+    st.session_state["seed_only"] = {"year": int(year), "res": res, "trace": trace}
 
+run = st.session_state.get("seed_only")
+if run:
+    res, trace = run["res"], run["trace"]
     if res.get("pdf"):
         st.success(f"✅ PDF trovato ({res['score']:.2f}) via {res['via']} — pagine visitate: {res['visited']}")
         st.code(res["pdf"], language="text")
@@ -46,3 +66,9 @@ if go:
     else:
         st.warning(f"⚠️ Nessun PDF trovato entro i limiti (visitato: {res.get('visited')}).")
         st.caption("Suggerimenti: usa un seed più specifico (pagina 'Bilanci e relazioni' dell'anno) o aumenta profondità/pagine.")
+
+    if trace is not None:
+        with st.expander("🧾 Trace decisioni di crawl"):
+            st.json(trace.summary())
+            st.download_button("⬇️ Scarica trace (JSONL)", data=trace.to_jsonl().encode("utf-8"),
+                               file_name=f"trace_seed_{run['year']}.jsonl", mime="application/x-ndjson")
@@ -0,0 +1,94 @@
+import time
+
+import streamlit as st
+
+import corpus_index
+from results_store import EXPORT_FORMATS
+from st_cache import results_store
+
+st.set_page_config(page_title="Corpus report", page_icon="📚", layout="wide")
+st.title("📚 Interroga il corpus dei report già estratti")
+st.caption("Testo per pagina (OCR incluso) di tutti i PDF estratti dal batch, dai worker e dalla CLI: "
+           "nessuna rete, nessun download, nessuna estrazione.")
+
+index = corpus_index.default_index()
+if index is None:
+    st.warning("Indicizzazione disattivata (BILANCI_CORPUS_DB vuoto).")
+    st.stop()
+stats = index.stats()
+st.caption(f"Documenti: {stats['documents']} · pagine: {stats['pages']} · con OCR: {stats['ocr_documents']} · "
+           f"aziende: {stats['companies']} · `{index.path}`")
+
+mode = st.radio("Modalità", ["Valori per keyword", "Ricerca nel testo", "Rianalizza un batch"], horizontal=True)
+
+if mode in ("Valori per keyword", "Ricerca nel testo"):
+    c1, c2 = st.columns([2, 1])
+    with c1:
+        company = st.text_input("Azienda (opzionale)", value="")
+    with c2:
+        year = st.number_input("Anno (0 = tutti)", min_value=0, max_value=2100, value=0, step=1)
+
+if mode == "Valori per keyword":
+    kw_raw = st.text_area("Keyword (una per riga)", value="costo del personale", height=100)
+    keywords = [k.strip() for k in kw_raw.splitlines() if k.strip()]
+    if st.button("🔎 Cerca valori", type="primary") and keywords:
+        import pandas as pd
+        t0 = time.perf_counter()
+        found = index.find_values(keywords, company or None, int(year) or None)
+        rows = [{"aziende": ", ".join(r["companies"]), "anni": ", ".join(map(str, r["years"])), "keyword": kw,
+                 "valore": h["value"], "testo": h["raw"], "pagina": h["page"], "documento": r["url"]}
+                for r in found for kw, h in r["values"].items() if h]
+        st.caption(f"{len(found)} documenti in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        if rows:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+        else:
+            st.info("Nessun valore trovato vicino alle keyword.")
+
+elif mode == "Ricerca nel testo":
+    query = st.text_input("Query (parole, \"frase esatta\", prefisso*, OR, NOT)", value='"costo del personale"')
+    if st.button("🔎 Cerca", type="primary") and query.strip():
+        import pandas as pd
+        t0 = time.perf_counter()
+        try:
+            hits = index.search(query, company or None, int(year) or None, limit=200)
+        except Exception as e:
+            st.error(f"Query non valida: {e}")
+            st.stop()
+        st.caption(f"{len(hits)} pagine in {(time.perf_counter() - t0) * 1000:.0f} ms")
+        if hits:
+            st.dataframe(pd.DataFrame([{"aziende": ", ".join(h["companies"]), "anni": ", ".join(map(str, h["years"])),
+                                        "pagina": h["page"], "estratto": h["snippet"], "documento": h["url"],
+                                        "score": h["score"]} for h in hits]),
+                         use_container_width=True, hide_index=True)
+        else:
+            st.info("Nessuna pagina trovata.")
+
+else:
+    # stesso foglio e stessi documenti di un batch precedente, valori con le nuove keyword
+    store = results_store()
+    runs = store.runs(50)
+    if not runs:
+        st.info("Nessun batch nell'archivio risultati.")
+        st.stop()
+    labels = {r["run_id"]: f"{r['run_id']} · anni {', '.join(map(str, r['years']))} · {r['processed']}/{r['rows']} righe"
+              for r in runs}
+    run_id = st.selectbox("Batch", list(labels), format_func=labels.get)
+    kw_raw = st.text_area("Nuove keyword di estrazione (una per riga)", value="costo del personale", height=100)
+    keywords = [k.strip() for k in kw_raw.splitlines() if k.strip()]
+    if st.button("♻️ Ricalcola dal corpus", type="primary") and keywords:
+        t0 = time.perf_counter()
+        new_id = corpus_index.requery(index, store, run_id, keywords)
+        st.session_state["corpus_requery"] = {"run_id": new_id, "seconds": time.perf_counter() - t0}
+
+    done = st.session_state.get("corpus_requery")
+    if done:
+        st.caption(f"Nuovo run `{done['run_id']}` in {done['seconds']:.2f}s")
+        st.dataframe(store.preview(done["run_id"], 200), use_container_width=True)
+        fmt = st.radio("Formato risultati", ["XLSX", "CSV", "JSON", "Parquet"], horizontal=True, key="corpus_fmt")
+        ext = fmt.lower()
+        try:
+            with open(store.export_path(done["run_id"], ext), "rb") as fh:
+                st.download_button(f"⬇️ Scarica risultati ({fmt})", data=fh,
+                                   file_name=f"risultati_corpus_{done['run_id']}.{ext}", mime=EXPORT_FORMATS[ext])
+        except Exception as e:
+            st.error(f"Errore generazione {fmt}: {e}")
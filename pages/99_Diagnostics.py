@@ -1,4 +1,6 @@
-import streamlit as st, sys, importlib, httpx
+import streamlit as st, sys, importlib
+import host_health
+import metrics
 
 st.set_page_config(page_title="Diagnostics", page_icon="🩺", layout="centered")
 st.title("🩺 Diagnostics")
@@ -25,9 +27,82 @@ st.write("`google.cx` presente? →", "✅" if "cx" in g else "❌")
 
 st.subheader("Test rete (GET semplice)")
 try:
+    import httpx
     r = httpx.get("https://www.google.com/robots.txt", timeout=10, follow_redirects=True)
     st.write("GET google.com:", "✅", r.status_code)
 except Exception as e:
     st.write("GET google.com:", "❌", e)
 
 st.caption("Se 'httpx' o 'bs4' sono ❌, aggiungili in requirements.txt e riavvia l'app.")
+
+st.subheader("Metriche pipeline (processo corrente)")
+st.caption("Aggregate da tutte le esecuzioni in questo processo: rete, parsing, scoring link, estrazione PDF, OCR, cache.")
+snap = metrics.snapshot()
+if not snap["histograms"] and not snap["counters"]:
+    st.info("Nessuna metrica ancora: esegui una crawl o un batch e torna qui.")
+else:
+    import pandas as pd
+    hist_rows = [{
+        "metrica": h["name"],
+        "etichette": ", ".join(f"{k}={v}" for k, v in h["labels"].items()),
+        "n": h["count"],
+        "totale (s)": round(h["sum"], 3),
+        "media (s)": round(h["mean"], 4),
+        "p50 (s)": round(h["p50"], 4),
+        "p95 (s)": round(h["p95"], 4),
+        "max (s)": round(h["max"], 4),
+    } for h in snap["histograms"]]
+    if hist_rows:
+        st.markdown("**Tempi per stage**")
+        st.dataframe(pd.DataFrame(hist_rows), use_container_width=True, hide_index=True)
+
+    # Tempo totale per stage: dice subito se il batch è legato a rete, parsing o OCR
+    totals = {}
+    for h in snap["histograms"]:
+        totals[h["name"]] = totals.get(h["name"], 0.0) + h["sum"]
+    if totals:
+        st.markdown("**Tempo totale per stage (s)**")
+        st.bar_chart(pd.Series(totals, name="secondi"))
+
+    counter_rows = [{
+        "metrica": c["name"],
+        "etichette": ", ".join(f"{k}={v}" for k, v in c["labels"].items()),
+        "valore": c["value"],
+    } for c in snap["counters"] if c["name"] != "cache_requests_total"]
+    if counter_rows:
+        st.markdown("**Contatori (byte scaricati, errori)**")
+        st.dataframe(pd.DataFrame(counter_rows), use_container_width=True, hide_index=True)
+
+    rates = metrics.cache_hit_rates()
+    if rates:
+        st.markdown("**Cache hit rate**")
+        st.dataframe(pd.DataFrame(rates), use_container_width=True, hide_index=True)
+
+    st.markdown("**Istogrammi**")
+    names = sorted({h["name"] for h in snap["histograms"]})
+    if names:
+        pick = st.selectbox("Metrica", names)
+        buckets = {}
+        for h in snap["histograms"]:
+            if h["name"] != pick:
+                continue
+            for i, b in enumerate(h["buckets"]):
+                # prefisso numerico: il grafico ordina le etichette alfabeticamente
+                le = f"{i:02d} " + ("+Inf" if b["le"] == float("inf") else f"≤{b['le']:g}s")
+                buckets[le] = buckets.get(le, 0) + b["count"]
+        st.bar_chart(pd.DataFrame({"bucket": list(buckets), "conteggio": list(buckets.values())}).set_index("bucket"))
+
+    hosts = [h for h in host_health.snapshot() if h["errors"] or h["state"] != host_health.CLOSED]
+    if hosts:
+        st.markdown("**Host con errori (circuit breaker)**")
+        st.dataframe(pd.DataFrame(hosts), use_container_width=True, hide_index=True)
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        st.download_button("⬇️ Metriche (JSON)", data=metrics.to_json().encode("utf-8"), file_name="metrics.json", mime="application/json")
+    with c2:
+        st.download_button("⬇️ Metriche (Prometheus)", data=metrics.to_prometheus().encode("utf-8"), file_name="metrics.prom", mime="text/plain")
+    with c3:
+        if st.button("♻️ Azzera metriche"):
+            metrics.reset()
+            st.rerun()
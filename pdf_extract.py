@@ -0,0 +1,459 @@
+"""
+Helpers per PDF: download, estrazione testo (con fallback OCR) e ricerca valori vicino alle keyword.
+Modulo senza dipendenze da Streamlit: usato da app.py e dalla CLI.
+
+Le librerie PDF/OCR/HTTP sono opzionali e pesanti: si importano al primo uso (cold start più
+rapido); `pdf_text_available()` / `ocr_available()` verificano la presenza senza importarle.
+"""
+from __future__ import annotations
+import io
+import re
+import time
+import importlib.util
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Optional, List, Tuple, Dict, Any
+
+import metrics
+
+
+def is_installed(name: str) -> bool:
+    """True se il modulo è installato (find_spec: non lo importa)."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except Exception:
+        return False
+
+def pdf_text_available() -> bool:
+    return is_installed("pdfplumber") or is_installed("PyPDF2")
+
+def ocr_available() -> bool:
+    return is_installed("pytesseract") and is_installed("pdf2image")
+
+# Import "soft" e lazy: None se la libreria non è disponibile
+@lru_cache(maxsize=None)
+def _httpx():
+    try:
+        import httpx
+        return httpx
+    except Exception:
+        return None
+
+@lru_cache(maxsize=None)
+def _pdfplumber():
+    try:
+        import pdfplumber
+        return pdfplumber
+    except Exception:
+        return None
+
+@lru_cache(maxsize=None)
+def _pdf_reader():
+    try:
+        from PyPDF2 import PdfReader
+        return PdfReader
+    except Exception:
+        return None
+
+@lru_cache(maxsize=None)
+def _pytesseract():
+    try:
+        import pytesseract
+        return pytesseract
+    except Exception:
+        return None
+
+@lru_cache(maxsize=None)
+def _convert_from_bytes():
+    try:
+        from pdf2image import convert_from_bytes
+        return convert_from_bytes
+    except Exception:
+        return None
+
+
+def download_binary(url: str, timeout: float = 30.0) -> Optional[bytes]:
+    """Download del documento; download concorrenti dello stesso URL (canonico) ne condividono uno."""
+    import singleflight
+    return singleflight.group("pdf_download").do(singleflight.canonical_url(url), lambda: _download(url, timeout))
+
+
+def _download(url: str, timeout: float) -> Optional[bytes]:
+    httpx = _httpx()
+    if httpx is None:
+        return None
+    import host_health
+    import replay
+    if not host_health.allow(url):
+        return None
+    t0 = time.perf_counter()
+    try:
+        with httpx.Client(follow_redirects=True, timeout=host_health.timeout_for(url, timeout),
+                          **replay.client_kwargs()) as client:
+            r = client.get(url)
+            metrics.record_fetch(url, time.perf_counter() - t0, len(r.content))
+            host_health.record_response(url, time.perf_counter() - t0, r.status_code)
+            if r.status_code == 200:
+                return r.content
+    except Exception as e:
+        metrics.record_fetch(url, time.perf_counter() - t0, error=True)
+        host_health.record_error(url, time.perf_counter() - t0, e)
+        return None
+    return None
+
+
+def ocr_pdf_pages(data: bytes, dpi: int = 200, lang: str = "ita") -> List[str]:
+    """
+    Converte le pagine PDF in immagini (pdf2image) e esegue pytesseract OCR.
+    Restituisce il testo per pagina. Richiede poppler e tesseract installati a livello di sistema.
+    """
+    convert_from_bytes, pytesseract = _convert_from_bytes(), _pytesseract()
+    if convert_from_bytes is None or pytesseract is None:
+        return []
+    texts = []
+    try:
+        with metrics.timer("ocr_rasterize_seconds"):
+            images = convert_from_bytes(data, dpi=dpi)
+    except Exception:
+        return []
+    for img in images:
+        try:
+            with metrics.timer("ocr_page_seconds"):
+                text = pytesseract.image_to_string(img, lang=lang)
+            texts.append(text or "")
+        except Exception:
+            texts.append("")
+    return texts
+
+
+def ocr_pdf_bytes(data: bytes, dpi: int = 200, lang: str = "ita") -> str:
+    """Come ocr_pdf_pages, ma restituisce il testo concatenato."""
+    return "\n".join(ocr_pdf_pages(data, dpi=dpi, lang=lang))
+
+
+# --------------------------------------------
+# OCR adattivo a due passate
+# 1) passata veloce in scala di grigi a bassa risoluzione su tutte le pagine (image_to_data: righe,
+#    bounding box, confidenza) per trovare le righe con le keyword;
+# 2) solo le fasce attorno a quelle righe vengono ri-OCR ad alta risoluzione, a meno che i numeri
+#    letti nella prima passata abbiano già confidenza alta.
+# --------------------------------------------
+_NORM_RE = re.compile(r"[^0-9a-zàèéìòù]+")
+
+def _norm(s: str) -> str:
+    return " " + _NORM_RE.sub(" ", (s or "").lower()).strip() + " "
+
+
+def _ocr_lines(img, lang: str) -> List[Dict[str, Any]]:
+    """Righe OCR (pytesseract.image_to_data) con testo, bounding box e confidenza delle parole."""
+    pytesseract = _pytesseract()
+    d = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+    lines: Dict[tuple, Dict[str, Any]] = {}
+    for i, word in enumerate(d["text"]):
+        try:
+            conf = float(d["conf"][i])
+        except (TypeError, ValueError):
+            conf = -1.0
+        if conf < 0 or not (word or "").strip():
+            continue
+        key = (d["block_num"][i], d["par_num"][i], d["line_num"][i])
+        top, bottom = d["top"][i], d["top"][i] + d["height"][i]
+        ln = lines.get(key)
+        if ln is None:
+            lines[key] = {"words": [word], "confs": [conf], "top": top, "bottom": bottom, "left": d["left"][i]}
+        else:
+            ln["words"].append(word)
+            ln["confs"].append(conf)
+            ln["top"], ln["bottom"] = min(ln["top"], top), max(ln["bottom"], bottom)
+    out = []
+    for ln in lines.values():
+        ln["text"] = " ".join(ln["words"])
+        # confidenza minima delle parole che contengono cifre (i valori da leggere)
+        num_confs = [c for w, c in zip(ln["words"], ln["confs"]) if any(ch.isdigit() for ch in w)]
+        ln["num_conf"] = min(num_confs) if num_confs else None
+        out.append(ln)
+    out.sort(key=lambda l: (l["top"], l["left"]))
+    return out
+
+
+def _keyword_bands(lines: List[Dict[str, Any]], keywords: List[str], height: int,
+                   above: float, below: float) -> List[List[int]]:
+    """Fasce verticali [top, bottom] attorno alle righe che contengono una keyword (unite se sovrapposte)."""
+    kws = [_norm(k) for k in keywords if k and k.strip()]
+    bands: List[List[int]] = []
+    for ln in lines:
+        text = _norm(ln["text"])
+        if not any(k in text for k in kws):
+            continue
+        lh = max(1, ln["bottom"] - ln["top"])
+        bands.append([max(0, int(ln["top"] - above * lh)), min(height, int(ln["bottom"] + below * lh))])
+    bands.sort()
+    merged: List[List[int]] = []
+    for b in bands:
+        if merged and b[0] <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b[1])
+        else:
+            merged.append(b)
+    return merged
+
+
+def ocr_pdf_pages_adaptive(data: bytes, keywords: List[str], lang: str = "ita", low_dpi: int = 100,
+                           high_dpi: int = 300, confident: float = 90.0, above: float = 1.5,
+                           below: float = 6.0, full_fallback: bool = True) -> List[str]:
+    """
+    OCR a due passate: bassa risoluzione in grigio su tutto il documento, alta risoluzione solo
+    sulle fasce attorno alle keyword. Restituisce il testo per pagina (fasce ad alta risoluzione
+    al posto delle righe a bassa). Se nessuna keyword viene trovata e full_fallback è attivo,
+    ripiega sull'OCR completo (ocr_pdf_pages a high_dpi).
+    """
+    convert_from_bytes, pytesseract = _convert_from_bytes(), _pytesseract()
+    if convert_from_bytes is None or pytesseract is None:
+        return []
+    if not keywords:
+        return ocr_pdf_pages(data, dpi=high_dpi, lang=lang)
+    try:
+        with metrics.timer("ocr_rasterize_seconds", stage="low"):
+            images = convert_from_bytes(data, dpi=low_dpi, grayscale=True)
+    except Exception:
+        return []
+
+    pages_lines: List[List[Dict[str, Any]]] = []
+    pages_bands: List[List[List[int]]] = []
+    found = False
+    for img in images:
+        try:
+            with metrics.timer("ocr_page_seconds", stage="low"):
+                lines = _ocr_lines(img, lang)
+        except Exception:
+            lines = []
+        bands = _keyword_bands(lines, keywords, img.height, above, below)
+        found = found or bool(bands)
+        # fasce i cui numeri sono già letti con confidenza alta: niente seconda passata
+        todo = []
+        for b in bands:
+            confs = [ln["num_conf"] for ln in lines
+                     if b[0] <= (ln["top"] + ln["bottom"]) / 2 <= b[1] and ln["num_conf"] is not None]
+            if not confs or min(confs) < confident:
+                todo.append(b)
+        pages_lines.append(lines)
+        pages_bands.append(todo)
+        metrics.inc("ocr_regions_total", len(bands), stage="low")
+
+    if not found:
+        if full_fallback:
+            return ocr_pdf_pages(data, dpi=high_dpi, lang=lang)
+        return ["\n".join(ln["text"] for ln in lines) for lines in pages_lines]
+
+    scale = high_dpi / float(low_dpi)
+    texts = []
+    for i, (lines, bands) in enumerate(zip(pages_lines, pages_bands)):
+        high: List[str] = []
+        if bands:
+            try:
+                with metrics.timer("ocr_rasterize_seconds", stage="high"):
+                    page_img = convert_from_bytes(data, dpi=high_dpi, first_page=i + 1, last_page=i + 1,
+                                                  grayscale=True)[0]
+                for top, bottom in bands:
+                    crop = page_img.crop((0, int(top * scale), page_img.width, min(page_img.height, int(bottom * scale))))
+                    with metrics.timer("ocr_page_seconds", stage="high"):
+                        high.append(pytesseract.image_to_string(crop, lang=lang, config="--psm 6") or "")
+                    metrics.inc("ocr_regions_total", stage="high")
+            except Exception:
+                bands, high = [], []
+        # testo pagina: righe a bassa risoluzione fuori dalle fasce, testo ad alta risoluzione dentro
+        out, emitted = [], set()
+        for ln in lines:
+            mid = (ln["top"] + ln["bottom"]) / 2
+            j = next((j for j, (t, b) in enumerate(bands) if t <= mid <= b), None)
+            if j is None:
+                out.append(ln["text"])
+            elif j not in emitted:
+                emitted.add(j)
+                out.append(high[j].strip())
+        texts.append("\n".join(out))
+    return texts
+
+
+# backend di estrazione testo: "auto" = pdfplumber poi PyPDF2 (ordine storico), "pypdf2" = fast path
+PDF_BACKENDS = ("pdfplumber", "pypdf2")
+_BACKEND_ORDER = {
+    "auto": ("pdfplumber", "pypdf2"),
+    "pdfplumber": ("pdfplumber", "pypdf2"),
+    "pypdf2": ("pypdf2", "pdfplumber"),
+}
+
+def extract_pages_with(data: bytes, backend: str) -> Optional[List[str]]:
+    """Testo per pagina con un solo backend; None se il backend manca o fallisce sul documento."""
+    if backend == "pdfplumber":
+        pdfplumber = _pdfplumber()
+        if pdfplumber is None:
+            return None
+        try:
+            with pdfplumber.open(io.BytesIO(data)) as pdf:
+                pages = []
+                for p in pdf.pages:
+                    try:
+                        with metrics.timer("pdf_extract_page_seconds", backend="pdfplumber"):
+                            pages.append(p.extract_text() or "")
+                    except Exception:
+                        pages.append("")
+                return pages
+        except Exception:
+            return None
+    if backend == "pypdf2":
+        PdfReader = _pdf_reader()
+        if PdfReader is None:
+            return None
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            pages = []
+            for p in reader.pages:
+                try:
+                    with metrics.timer("pdf_extract_page_seconds", backend="pypdf2"):
+                        pages.append(p.extract_text() or "")
+                except Exception:
+                    pages.append("")
+            return pages
+        except Exception:
+            return None
+    raise ValueError(f"backend PDF sconosciuto: {backend}")
+
+
+def extract_pages_from_pdf_bytes(data: bytes, backend: str = "auto") -> Tuple[List[str], bool]:
+    """
+    Ritorna (testo per pagina, needs_ocr_bool).
+    Usa pdfplumber se disponibile, altrimenti PyPDF2 come fallback (backend="pypdf2": ordine inverso).
+    Se non riesce a estrarre testo restituisce ([], True).
+    """
+    if not data:
+        return [], False
+    for name in _BACKEND_ORDER[backend]:
+        pages = extract_pages_with(data, name)
+        if pages and any(p.strip() for p in pages):
+            return pages, False
+    # Fall back: no text extracted -> needs OCR
+    return [], True
+
+
+def extract_text_from_pdf_bytes(data: bytes) -> Tuple[str, bool]:
+    """
+    Ritorna (text, needs_ocr_bool): pagine di extract_pages_from_pdf_bytes concatenate.
+    Se non riesce a estrarre testo restituisce ('', True).
+    """
+    pages, needs_ocr = extract_pages_from_pdf_bytes(data)
+    return "\n".join(pages), needs_ocr
+
+
+# --------------------------------------------
+# Utilità per trovare valori vicino alla keyword
+# --------------------------------------------
+NUMBER_RE = re.compile(r"[-+]?\d[\d\.\,\s]*\d(?:\s*(?:€|EUR|eur)?)?")
+
+def normalize_number_str(s: str) -> str:
+    s = s.strip()
+    s = s.replace("\u00a0", " ")
+    s = s.replace(" ", "")
+    if "," in s and "." in s:
+        if s.rfind(",") > s.rfind("."):
+            s = s.replace(".", "")
+            s = s.replace(",", ".")
+        else:
+            s = s.replace(",", "")
+    else:
+        s = s.replace(",", ".")
+    s = re.sub(r"[^\d\.\-+]", "", s)
+    return s
+
+def find_value_near_keywords(text: str, keywords: List[str]) -> (Optional[str], Optional[str]):
+    """
+    Semantica storica: per la prima keyword (in ordine) che ha un numero entro 300 caratteri dalla
+    sua prima occorrenza (poi 800), il primo numero della finestra → (keyword, valore normalizzato).
+    Il numero più vicino, anche da occorrenze successive, è DocumentIndex.lookup.
+    """
+    index = DocumentIndex.from_text(text)
+    for kw in keywords:
+        hits = index.keyword_hits(kw)
+        if not hits:
+            continue
+        for within in (300, 800):
+            near = index.numbers_near(hits[0], len(kw), within)
+            if near:
+                return kw, min(near, key=lambda n: n["offset"])["value"]
+    return None, None
+
+
+class DocumentIndex:
+    """
+    Indice per documento, costruito una volta: offset delle keyword (lazy, memorizzati) e di tutti
+    i token numerici con valore normalizzato. Risponde a "numeri più vicini a ogni keyword entro N
+    caratteri" con ricerche binarie, per qualsiasi numero di keyword, senza riscansionare il testo.
+    Le pagine sono 1-based; gli offset si riferiscono al testo delle pagine unite da "\n". I numeri
+    sono cercati pagina per pagina: un token non attraversa mai un cambio pagina.
+    """
+
+    def __init__(self, pages: List[str]):
+        self.pages = pages
+        self.text = "\n".join(pages)
+        self._lower = self.text.lower()
+        self._page_starts: List[int] = []
+        self.numbers: List[Tuple[int, int, str, str]] = []  # (start, end, raw, normalizzato)
+        pos = 0
+        for p in pages:
+            self._page_starts.append(pos)
+            for m in NUMBER_RE.finditer(p):
+                self.numbers.append((pos + m.start(), pos + m.end(), m.group(0), normalize_number_str(m.group(0))))
+            pos += len(p) + 1
+        self._num_starts = [n[0] for n in self.numbers]
+        self._kw_hits: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_text(cls, text: str) -> "DocumentIndex":
+        return cls([text or ""])
+
+    def page_of(self, offset: int) -> int:
+        return max(1, bisect_right(self._page_starts, offset))
+
+    def keyword_hits(self, keyword: str) -> List[int]:
+        kw = keyword.lower()
+        hits = self._kw_hits.get(kw)
+        if hits is None:
+            hits = []
+            if kw:
+                i = self._lower.find(kw)
+                while i >= 0:
+                    hits.append(i)
+                    i = self._lower.find(kw, i + 1)
+            self._kw_hits[kw] = hits
+        return hits
+
+    def numbers_near(self, offset: int, length: int, within: int) -> List[Dict[str, Any]]:
+        """Token numerici che iniziano entro `within` caratteri dalla keyword, dal più vicino."""
+        lo = bisect_left(self._num_starts, offset - within)
+        hi = bisect_right(self._num_starts, offset + length + within)
+        out = []
+        for start, end, raw, norm in self.numbers[lo:hi]:
+            if end <= offset:
+                dist = offset - end
+            elif start >= offset + length:
+                dist = start - (offset + length)
+            else:
+                dist = 0
+            out.append({"value": norm, "raw": raw.strip(), "offset": start, "page": self.page_of(start), "distance": dist})
+        out.sort(key=lambda n: (n["distance"], n["offset"]))
+        return out
+
+    def lookup(self, keyword: str, within: int = 300, fallback_within: int = 800) -> Optional[Dict[str, Any]]:
+        """Numero più vicino alla prima occorrenza della keyword che ne ha uno entro `within` (poi `fallback_within`)."""
+        hits = self.keyword_hits(keyword)
+        for w in (within, fallback_within):
+            for idx in hits:
+                near = self.numbers_near(idx, len(keyword), w)
+                if near:
+                    hit = dict(near[0])
+                    hit.update({"keyword": keyword, "keyword_offset": idx, "keyword_page": self.page_of(idx)})
+                    return hit
+        return None
+
+    def find_values(self, keywords: List[str], within: int = 300, fallback_within: int = 800) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Un valore (con pagina e posizione) per ciascuna keyword."""
+        return {kw: self.lookup(kw, within, fallback_within) for kw in keywords}
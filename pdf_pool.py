@@ -0,0 +1,312 @@
+"""
+Estrazione testo PDF in un pool di processi worker (sandbox): un PDF patologico (xref rotta,
+disegni vettoriali enormi) non blocca più il batch né fa esplodere la memoria dell'app.
+
+- timeout wall-clock per documento: il worker bloccato viene ucciso e sostituito;
+- limite di memoria per worker (RLIMIT_AS, solo POSIX): MemoryError → esito "memory";
+- worker morto (OOM killer, segfault) → esito "crashed" e worker sostituito;
+- backend configurabile: "auto" (pdfplumber poi PyPDF2), "pdfplumber", "pypdf2" (fast path) oppure
+  "bench": per ogni classe di documento i primi documenti vengono estratti con entrambi i backend
+  e poi si usa il più veloce che estrae testo (scelte salvabili in JSON).
+
+Uso da riga di comando (benchmark su PDF locali):
+  python pdf_pool.py bench cartella/*.pdf --save pdf_backends.json
+"""
+from __future__ import annotations
+import argparse, json, multiprocessing as mp, os, re, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+MODES = ("auto", "pdfplumber", "pypdf2", "bench")
+
+_PRODUCER_RE = re.compile(rb"/Producer\s*\(([^)]{1,80})\)")
+
+
+def doc_class(data: bytes) -> str:
+    """Classe di documento per il benchmark: produttore PDF (prima parola) + fascia di dimensione."""
+    m = _PRODUCER_RE.search(data[:65536]) or _PRODUCER_RE.search(data[-65536:])
+    producer = "unknown"
+    if m:
+        word = re.split(rb"[\s/;,(]+", m.group(1).strip())[0]
+        producer = re.sub(r"[^a-z0-9]+", "", word.decode("latin-1").lower())[:20] or "unknown"
+    mb = len(data) / 1e6
+    size = "s" if mb < 1 else "m" if mb < 10 else "l"
+    return f"{producer}:{size}"
+
+
+# --------------------------------------------
+# Worker (processo separato)
+# --------------------------------------------
+def _limit_memory(memory_mb: int) -> None:
+    if not memory_mb:
+        return
+    try:
+        import resource
+        limit = int(memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except Exception:
+        pass  # Windows / limite non modificabile: si conta solo sul timeout
+
+
+def _worker_main(conn, memory_mb: int) -> None:
+    _limit_memory(memory_mb)
+    from pdf_extract import extract_pages_from_pdf_bytes, extract_pages_with, PDF_BACKENDS
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        data, mode = job
+        try:
+            if mode == "both":
+                # benchmark: entrambi i backend, testo dal primo (ordine storico) che ne estrae
+                timings, pages, needs_ocr = {}, [], True
+                for name in PDF_BACKENDS:
+                    t0 = time.perf_counter()
+                    got = extract_pages_with(data, name)
+                    ok = bool(got) and any(p.strip() for p in got)
+                    timings[name] = {"seconds": time.perf_counter() - t0, "pages": len(got or []), "ok": ok}
+                    if ok and needs_ocr:
+                        pages, needs_ocr = got, False
+                conn.send({"pages": pages, "needs_ocr": needs_ocr, "timings": timings})
+            else:
+                pages, needs_ocr = extract_pages_from_pdf_bytes(data, backend=mode)
+                conn.send({"pages": pages, "needs_ocr": needs_ocr})
+        except MemoryError:
+            conn.send({"error": "memory"})
+        except Exception as e:
+            conn.send({"error": f"{type(e).__name__}: {e}"})
+
+
+class _Worker:
+    def __init__(self, ctx, memory_mb: int):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, memory_mb), name="bilanci-pdf-worker", daemon=True)
+        self.proc.start()
+        child.close()
+
+    def kill(self) -> None:
+        try:
+            self.proc.kill()
+            self.proc.join(timeout=5)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+            self.proc.join(timeout=2)
+        except Exception:
+            pass
+        if self.proc.is_alive():
+            self.kill()
+
+
+# --------------------------------------------
+# Scelta del backend per classe di documento
+# --------------------------------------------
+class BackendChooser:
+    """Statistiche per (classe, backend): secondi per pagina e quota di documenti con testo."""
+
+    def __init__(self, trials: int = 3, path: Optional[str] = None):
+        self.trials = trials
+        self.path = path
+        self.stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.stats = json.load(f).get("stats", {})
+
+    def record(self, cls: str, timings: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            per = self.stats.setdefault(cls, {})
+            for name, t in timings.items():
+                s = per.setdefault(name, {"docs": 0, "ok": 0, "seconds": 0.0, "pages": 0})
+                s["docs"] += 1
+                s["ok"] += 1 if t["ok"] else 0
+                s["seconds"] += t["seconds"]
+                s["pages"] += t["pages"]
+
+    def choose(self, cls: str) -> Optional[str]:
+        """Backend da usare per la classe; None finché servono altri documenti di prova."""
+        per = self.stats.get(cls, {})
+        if not per or min(s["docs"] for s in per.values()) < self.trials:
+            return None
+        # prima chi estrae testo più spesso, poi il più veloce per pagina
+        def key(name):
+            s = per[name]
+            return (-s["ok"] / s["docs"], s["seconds"] / max(1, s["pages"]))
+        return min(per, key=key)
+
+    def table(self) -> List[Dict[str, Any]]:
+        rows = []
+        for cls, per in sorted(self.stats.items()):
+            for name, s in sorted(per.items()):
+                rows.append({"class": cls, "backend": name, "docs": s["docs"], "ok": s["ok"],
+                             "ms_per_page": round(1000 * s["seconds"] / max(1, s["pages"]), 2),
+                             "chosen": self.choose(cls) == name})
+        return rows
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            doc = {"trials": self.trials, "stats": self.stats,
+                   "choices": {c: self.choose(c) for c in self.stats}}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+
+
+# --------------------------------------------
+# Pool
+# --------------------------------------------
+class ExtractionPool:
+    def __init__(self, workers: int = 2, timeout: float = 60.0, memory_mb: int = 1536,
+                 backend: str = "auto", chooser: Optional[BackendChooser] = None, start_method: str = "spawn"):
+        if backend not in MODES:
+            raise ValueError(f"backend PDF sconosciuto: {backend}")
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.backend = backend
+        self.chooser = chooser or BackendChooser()
+        self._ctx = mp.get_context(start_method)
+        self._idle: Queue = Queue()
+        self.workers = max(1, int(workers))
+        for _ in range(self.workers):
+            self._idle.put(None)  # worker avviati al primo uso
+        self.stats = {"docs": 0, "timeouts": 0, "crashes": 0, "memory": 0, "replaced": 0}
+        self._lock = threading.Lock()
+
+    def _event(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+        metrics.inc("pdf_pool_events_total", event=name)
+
+    def extract(self, data: bytes, backend: Optional[str] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Estrae il testo in un worker. Ritorna {"pages", "needs_ocr", "backend", "seconds", "error"}:
+        error è None oppure "timeout" / "memory" / "crashed" / messaggio dell'eccezione.
+        backend="both" estrae con entrambi i backend e registra i tempi nel chooser.
+        """
+        mode = backend or self.backend
+        cls = doc_class(data) if mode in ("bench", "both") else None
+        if mode == "bench":
+            mode = self.chooser.choose(cls) or "both"
+        timeout = self.timeout if timeout is None else timeout
+        out: Dict[str, Any] = {"pages": [], "needs_ocr": False, "backend": mode, "seconds": 0.0, "error": None}
+        if not data:
+            return out
+
+        w = self._idle.get()
+        t0 = time.perf_counter()
+        try:
+            if w is None:
+                w = _Worker(self._ctx, self.memory_mb)
+            w.conn.send((data, mode))
+            if not w.conn.poll(timeout):
+                raise TimeoutError
+            res = w.conn.recv()
+        except TimeoutError:
+            out["error"] = "timeout"
+        except Exception:
+            # pipe chiusa, risposta illeggibile, avvio fallito: il worker non torna tra gli idle
+            out["error"] = "crashed"
+        finally:
+            out["seconds"] = time.perf_counter() - t0
+            if out["error"] is not None:
+                # worker bloccato o morto: ucciso e sostituito al prossimo uso
+                if w is not None:
+                    w.kill()
+                    self._event("replaced")
+                self._event("timeouts" if out["error"] == "timeout" else "crashes")
+                w = None
+            self._idle.put(w)
+
+        with self._lock:
+            self.stats["docs"] += 1
+        if out["error"] is None:
+            if res.get("error"):
+                out["error"] = res["error"]
+                if res["error"] == "memory":
+                    self._event("memory")
+            else:
+                out["pages"], out["needs_ocr"] = res["pages"], res["needs_ocr"]
+                if "timings" in res:
+                    self.chooser.record(cls, res["timings"])
+        metrics.observe("pdf_extract_doc_seconds", out["seconds"], backend=mode)
+        return out
+
+    def map(self, docs: List[bytes], backend: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Estrae più documenti in parallelo (uno per worker); l'ordine dei risultati è quello di `docs`."""
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            return list(ex.map(lambda d: self.extract(d, backend=backend), docs))
+
+    def close(self) -> None:
+        for _ in range(self.workers):
+            w = self._idle.get()
+            if w is not None:
+                w.close()
+
+    def __enter__(self) -> "ExtractionPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def pool_from_env() -> ExtractionPool:
+    """Pool configurato da BILANCI_PDF_WORKERS / _TIMEOUT / _MEMORY_MB / _BACKEND / _BACKENDS_FILE."""
+    env = os.environ.get
+    chooser = BackendChooser(path=env("BILANCI_PDF_BACKENDS_FILE")) if env("BILANCI_PDF_BACKENDS_FILE") else None
+    return ExtractionPool(workers=int(env("BILANCI_PDF_WORKERS", "2")),
+                          timeout=float(env("BILANCI_PDF_TIMEOUT", "60")),
+                          memory_mb=int(env("BILANCI_PDF_MEMORY_MB", "1536")),
+                          backend=env("BILANCI_PDF_BACKEND", "auto"),
+                          chooser=chooser)
+
+
+# --------------------------------------------
+# Benchmark da riga di comando
+# --------------------------------------------
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark backend di estrazione PDF per classe di documento")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("bench", help="estrae i PDF con entrambi i backend e sceglie il più veloce per classe")
+    b.add_argument("files", nargs="+")
+    b.add_argument("--workers", type=int, default=2)
+    b.add_argument("--timeout", type=float, default=60.0)
+    b.add_argument("--memory-mb", type=int, default=1536)
+    b.add_argument("--save", metavar="JSON", help="salva statistiche e scelte (BILANCI_PDF_BACKENDS_FILE)")
+    args = ap.parse_args(argv)
+
+    docs = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            docs.append(f.read())
+    chooser = BackendChooser(trials=1)
+    with ExtractionPool(workers=args.workers, timeout=args.timeout, memory_mb=args.memory_mb,
+                        backend="bench", chooser=chooser) as pool:
+        # "both": ogni file con entrambi i backend (in "bench" si smetterebbe dopo i trial)
+        for path, data, res in zip(args.files, docs, pool.map(docs, backend="both")):
+            print(f"{doc_class(data):<24} {res['seconds']:8.3f}s  {res['error'] or 'ok':<10} {os.path.basename(path)}")
+        stats = pool.stats
+    for row in chooser.table():
+        print("\t".join(str(row[k]) for k in ("class", "backend", "docs", "ok", "ms_per_page", "chosen")))
+    print(json.dumps(stats))
+    if args.save:
+        chooser.save(args.save)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Sonda economica dei PDF candidati prima del download completo.
+
+Con richieste Range si leggono solo l'inizio del file (header, prima pagina nei PDF linearizzati,
+spesso XMP) e la coda (trailer, dizionario /Info, aggiornamenti incrementali): poche centinaia di
+KB invece di decine di MB. Da lì: titolo/soggetto/keyword, anni citati, numero di pagine, testo
+della prima pagina (stream Flate decompressi dove possibile) e tipo di documento.
+
+Se il server ignora Range (200 invece di 206) si legge in streaming solo l'inizio e si chiude la
+connessione; se la sonda fallisce il candidato resta con il solo score di URL/ancora.
+"""
+from __future__ import annotations
+import codecs, os, re, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import metrics
+import singleflight
+
+HEAD_BYTES = 192 * 1024
+TAIL_BYTES = 64 * 1024
+PROBE_TTL = 3600
+NOT_PDF = "non è un PDF"
+PROBE_TOP_K = int(os.environ.get("BILANCI_PROBE_TOP_K", "5"))   # candidati sondati per azienda (0 = off)
+
+# tipo di documento → espressioni (testo normalizzato minuscolo)
+DOC_TYPES = {
+    "consolidato": ["bilancio consolidato", "consolidated financial statements", "consolidato"],
+    "bilancio": ["bilancio d'esercizio", "bilancio di esercizio", "relazione finanziaria annuale",
+                 "financial statements", "annual report", "nota integrativa", "stato patrimoniale",
+                 "relazione sulla gestione", "bilancio"],
+    "sostenibilita": ["dichiarazione non finanziaria", "dichiarazione consolidata di carattere non finanziario",
+                      "bilancio di sostenibilita", "sustainability report", "dnf"],
+    "semestrale": ["relazione finanziaria semestrale", "relazione semestrale", "half-year", "half year",
+                   "interim report", "trimestrale", "quarterly"],
+    "governance": ["relazione sul governo societario", "corporate governance", "remunerazione",
+                   "remuneration", "codice etico", "modello 231"],
+}
+# peso del tipo nello score (per i bilanci annuali cercati dal batch)
+TYPE_WEIGHT = {"consolidato": 2.0, "bilancio": 2.0, "sostenibilita": -1.0, "semestrale": -2.5, "governance": -2.5}
+
+_INFO_KEYS = ("Title", "Subject", "Keywords", "Author", "Producer", "Creator")
+_YEAR_RE = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+_STREAM_RE = re.compile(rb"stream\r?\n")
+_TEXT_RE = re.compile(rb"\((?:\\.|[^\\)])*\)\s*(?:Tj|')|\[(?:[^\]]*)\]\s*TJ")
+_PAREN_RE = re.compile(rb"\((?:\\.|[^\\)])*\)")
+_COUNT_RE = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b", re.S)
+_XMP_RE = {
+    "Title": re.compile(r"<dc:title>.*?<rdf:li[^>]*>(.*?)</rdf:li>", re.S),
+    "Subject": re.compile(r"<dc:description>.*?<rdf:li[^>]*>(.*?)</rdf:li>", re.S),
+    "Keywords": re.compile(r"<pdf:Keywords>(.*?)</pdf:Keywords>", re.S),
+}
+_DATE_RE = re.compile(rb"/CreationDate\s*\(D:(\d{4})|<xmp:CreateDate>(\d{4})")
+
+
+def _pdf_string(raw: bytes) -> str:
+    """Stringa letterale PDF (senza parentesi esterne): escape e UTF-16 con BOM."""
+    out, i = bytearray(), 0
+    esc = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+    while i < len(raw):
+        c = raw[i:i + 1]
+        if c == b"\\" and i + 1 < len(raw):
+            n = raw[i + 1:i + 2]
+            if n in esc:
+                out += esc[n]; i += 2; continue
+            m = re.match(rb"[0-7]{1,3}", raw[i + 1:i + 4])
+            if m:
+                out.append(int(m.group(), 8) & 0xFF); i += 1 + len(m.group()); continue
+            out += n; i += 2; continue
+        out += c; i += 1
+    b = bytes(out)
+    if b.startswith(codecs.BOM_UTF16_BE):
+        return b[2:].decode("utf-16-be", "replace")
+    return b.decode("latin-1")
+
+
+def _info_value(blob: bytes, key: str) -> Optional[str]:
+    m = re.search(rb"/" + key.encode() + rb"\s*(\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>)", blob)
+    if not m:
+        return None
+    v = m.group(1)
+    if v.startswith(b"<"):
+        try:
+            b = bytes.fromhex(v[1:-1].decode().replace(" ", "").replace("\n", ""))
+        except ValueError:
+            return None
+        return b[2:].decode("utf-16-be", "replace") if b.startswith(codecs.BOM_UTF16_BE) else b.decode("latin-1")
+    return _pdf_string(v[1:-1])
+
+
+def _inflate_streams(blob: bytes, limit: int = 12) -> List[bytes]:
+    """Stream del blocco letto, decompressi se Flate (anche troncati); al massimo `limit`."""
+    out = []
+    for m in _STREAM_RE.finditer(blob):
+        start = m.end()
+        end = blob.find(b"endstream", start)
+        raw = blob[start:end if end != -1 else len(blob)]
+        head = blob[max(0, m.start() - 300):m.start()]
+        if b"/FlateDecode" in head:
+            try:
+                raw = zlib.decompressobj().decompress(raw, 1 << 20)
+            except zlib.error:
+                continue
+        elif b"/Filter" in head:
+            continue   # immagini e altri filtri: niente testo
+        out.append(raw)
+        if len(out) >= limit:
+            break
+    return out
+
+
+def _page_text(streams: List[bytes], max_chars: int = 2000) -> str:
+    parts: List[str] = []
+    for s in streams:
+        for m in _TEXT_RE.finditer(s):
+            for p in _PAREN_RE.findall(m.group()):
+                parts.append(_pdf_string(p[1:-1]))
+        if sum(len(p) for p in parts) >= max_chars:
+            break
+    return re.sub(r"\s+", " ", " ".join(parts)).strip()[:max_chars]
+
+
+def parse_probe(head: bytes, tail: bytes = b"") -> Dict[str, Any]:
+    """Segnali da inizio e coda del file: metadati /Info e XMP, pagine, anno di creazione, testo."""
+    streams = _inflate_streams(head)
+    # dizionari /Info e XMP possono stare in coda, in testa o dentro object stream compressi
+    blobs = [tail, head] + streams
+    meta: Dict[str, str] = {}
+    for key in _INFO_KEYS:
+        for blob in blobs:
+            v = _info_value(blob, key)
+            if v and v.strip():
+                meta[key.lower()] = v.strip()
+                break
+    for key, rx in _XMP_RE.items():
+        if key.lower() in meta:
+            continue
+        for blob in blobs:
+            m = rx.search(blob.decode("utf-8", "replace"))
+            if m and m.group(1).strip():
+                meta[key.lower()] = m.group(1).strip()
+                break
+    counts = [int(a or b) for blob in blobs for a, b in _COUNT_RE.findall(blob)]
+    created = None
+    for blob in blobs:
+        m = _DATE_RE.search(blob)
+        if m:
+            created = int(m.group(1) or m.group(2))
+            break
+    text = _page_text(streams)
+    return {**meta, "pages": max(counts) if counts else None, "created_year": created, "first_page": text}
+
+
+def classify(text: str) -> Optional[str]:
+    """Tipo di documento dal testo (titolo/metadati/prima pagina); il più specifico vince."""
+    t = text.lower().replace("’", "'").replace("à", "a")
+    for kind in ("semestrale", "governance", "sostenibilita", "consolidato", "bilancio"):
+        if any(p in t for p in DOC_TYPES[kind]):
+            return kind
+    return None
+
+
+def doc_type(probe: Dict[str, Any]) -> Optional[str]:
+    """Tipo di documento della sonda: i metadati prevalgono sulla prima pagina (che può citare governance, DNF, ecc.)."""
+    meta = " ".join(str(probe.get(k) or "") for k in ("title", "subject", "keywords"))
+    return classify(meta) or classify(probe.get("first_page") or "")
+
+
+def _fetch_probe(url: str, head_bytes: int, tail_bytes: int, timeout: float) -> Dict[str, Any]:
+    import httpx
+    import replay
+    import host_health
+    res: Dict[str, Any] = {"url": url, "ok": False, "range": False, "size": None, "bytes": 0, "error": None}
+    if not host_health.allow(url):
+        res["error"] = "circuit_open"
+        return res
+    t0 = time.perf_counter()
+    try:
+        with httpx.Client(follow_redirects=True, timeout=host_health.timeout_for(url, timeout), headers={
+            "User-Agent": "Mozilla/5.0 (compatible; BilanciCrawler/1.0)"
+        }, **replay.client_kwargs()) as client:
+            head, tail = b"", b""
+            with client.stream("GET", url, headers={"Range": f"bytes=0-{head_bytes - 1}"}) as r:
+                if r.status_code >= 400:
+                    host_health.record_response(url, time.perf_counter() - t0, r.status_code)
+                    res["error"] = f"HTTP {r.status_code}"
+                    return res
+                res["range"] = r.status_code == 206
+                m = re.search(r"/(\d+)$", r.headers.get("content-range", ""))
+                if m:
+                    res["size"] = int(m.group(1))
+                elif r.headers.get("content-length", "").isdigit():
+                    res["size"] = int(r.headers["content-length"])
+                # Range ignorato: si legge solo l'inizio e si chiude la connessione
+                for chunk in r.iter_bytes():
+                    head += chunk
+                    if len(head) >= head_bytes:
+                        break
+            host_health.record_response(url, time.perf_counter() - t0, r.status_code)
+            head = head[:head_bytes]
+            if res["range"] and res["size"] and res["size"] > head_bytes:
+                r = client.get(url, headers={"Range": f"bytes=-{min(tail_bytes, res['size'] - head_bytes)}"})
+                if r.status_code == 206:
+                    tail = r.content
+            res["bytes"] = len(head) + len(tail)
+            if not head.lstrip().startswith(b"%PDF"):
+                res["error"] = NOT_PDF
+                return res
+            res.update(parse_probe(head, tail))
+            res["ok"] = True
+    except Exception as e:
+        host_health.record_error(url, time.perf_counter() - t0, e)
+        res["error"] = type(e).__name__
+    finally:
+        metrics.observe("pdf_probe_seconds", time.perf_counter() - t0, range="yes" if res["range"] else "no")
+        metrics.inc("pdf_probe_bytes_total", value=res["bytes"])
+    return res
+
+
+def probe_pdf(url: str, head_bytes: int = HEAD_BYTES, tail_bytes: int = TAIL_BYTES, timeout: float = 15.0) -> Dict[str, Any]:
+    """
+    Sonda di un PDF (memorizzata per URL canonico per PROBE_TTL secondi).
+    Ritorna {url, ok, range, size, bytes, title?, subject?, keywords?, pages, created_year, first_page, error}.
+    """
+    canon = singleflight.canonical_url(url)
+    return singleflight.group("pdf_probe", ttl=PROBE_TTL, max_results=512, keep=lambda r: r.get("ok")).do(
+        canon, lambda: _fetch_probe(url, head_bytes, tail_bytes, timeout))
+
+
+def probe_many(urls: List[str], workers: int = 4) -> List[Dict[str, Any]]:
+    """Sonde in parallelo (stesso ordine degli URL)."""
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as ex:
+        return list(ex.map(probe_pdf, urls))
+
+
+def probe_score(probe: Dict[str, Any], year: int, keywords: Optional[List[str]] = None) -> float:
+    """Bonus/malus dai segnali della sonda (0 se la sonda è fallita)."""
+    if not probe or not probe.get("ok"):
+        return 0.0
+    meta = " ".join(str(probe.get(k) or "") for k in ("title", "subject", "keywords"))
+    first = probe.get("first_page") or ""
+    text = f"{meta} {first}"
+    years = {int(y) for y in _YEAR_RE.findall(text)}
+    s = 0.0
+    if year in years:
+        s += 3.0
+    elif years and not ({year - 1, year + 1} & years):
+        s -= 2.0   # documento di un altro esercizio
+    if probe.get("created_year") in (year, year + 1):
+        s += 0.5
+    kind = doc_type(probe)
+    s += TYPE_WEIGHT.get(kind, 0.0)
+    low = text.lower()
+    s += 0.5 * sum(1 for kw in (keywords or []) if kw.lower() in low)
+    pages = probe.get("pages")
+    if pages is not None:
+        s += 0.5 if pages >= 20 else (-1.0 if pages < 4 else 0.0)
+    return s
+
+
+if __name__ == "__main__":
+    import json, sys
+    for u in sys.argv[1:]:
+        print(json.dumps(probe_pdf(u), ensure_ascii=False, indent=2))
@@ -0,0 +1,706 @@
+"""
+Pipeline per azienda del batch (ricerca → crawl → estrazione), senza UI: la usano l'app Streamlit
+e i worker della coda (job_queue.py), che la importano in processi senza interfaccia.
+
+- scoperta/CSE: `discover_many`, `search_google_cse(_many)` e le varianti memoizzate `cached_*`
+- crawl: `crawl_and_classify` (BFS interna con robots e delay in modalità gentile, altrimenti
+  semantic_crawler se installato)
+- `process_company`: SERP/entrypoint → crawl → sonda PDF → download ed estrazione del valore per anno
+"""
+import functools
+import json
+import re
+import time
+from collections import deque
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Set, Tuple, Union
+from urllib.parse import urljoin, urlparse
+from urllib import robotparser
+
+import host_health
+import html_stream
+import metrics
+import singleflight
+from corpus_index import index_document
+from pdf_probe import PROBE_TOP_K, probe_many, probe_score
+from pdf_extract import is_installed, DocumentIndex
+
+if TYPE_CHECKING:
+    import httpx
+
+# User-Agent chiaro e con riferimento di contatto (aiuta a non essere bloccati)
+DEFAULT_UA = "BilanciCrawler/1.0 (+https://github.com/lineapulita-creator) Mozilla/5.0 (compatible;)"
+
+# Crawler esterno (se lo hai come modulo): presenza verificata senza importarlo
+_CRAWLER_AVAILABLE = is_installed("semantic_crawler")
+
+@lru_cache(maxsize=None)
+def _external_crawler():
+    try:
+        from semantic_crawler.crawler_semantic import crawl_and_classify
+        return crawl_and_classify
+    except Exception:
+        return None
+
+# Import "soft" per dipendenze usate nel fallback: None se non disponibili
+@lru_cache(maxsize=None)
+def _httpx():
+    try:
+        import httpx
+        return httpx
+    except Exception:
+        return None
+
+@lru_cache(maxsize=None)
+def _beautifulsoup():
+    try:
+        from bs4 import BeautifulSoup
+        return BeautifulSoup
+    except Exception:
+        return None
+
+def _memoized(name: str, fn):
+    """st_cache.memoized(name) applicato al primo uso: importare la pipeline non carica Streamlit."""
+    cell = []
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not cell:
+            from st_cache import memoized
+            cell.append(memoized(name, cache_empty=False)(fn))
+        return cell[0](*args, **kwargs)
+    return wrapper
+
+# --------------------------------------------
+# Google CSE wrapper (usa httpx)
+# --------------------------------------------
+def search_google_cse(query: str, api_key: str, cx: str, num: int = 5, timeout: float = 15.0) -> List[Dict[str, Any]]:
+    """
+    Esegue una query su Google Custom Search API e ritorna la lista di result items.
+    Richiede: api_key e cx.
+    """
+    httpx = _httpx()
+    if httpx is None:
+        raise RuntimeError("httpx non disponibile")
+    import replay
+    url = "https://www.googleapis.com/customsearch/v1"
+    params = {"q": query, "key": api_key, "cx": cx, "num": num}
+    try:
+        with httpx.Client(timeout=timeout, **replay.client_kwargs()) as client:
+            with metrics.timer("cse_request_seconds"):
+                r = client.get(url, params=params)
+            r.raise_for_status()
+            data = r.json()
+            return data.get("items", [])
+    except Exception:
+        return []
+
+
+# risultati vuoti (anche per errore di rete) non memorizzati: il run successivo riprova
+cached_search_google_cse = _memoized("cse", search_google_cse)
+
+
+def discover_many(companies: Tuple[str, ...]) -> Dict[str, List[str]]:
+    """Entrypoint per più aziende senza CSE (domini candidati, DNS/HTTP, percorsi noti), in parallelo."""
+    from discovery import discover_many as _discover_many
+    return _discover_many(list(companies))
+
+
+# memoizzata per elenco di aziende: rilanciare lo stesso foglio non rifà la scoperta
+cached_discover_many = _memoized("discover_many", discover_many)
+
+
+def search_google_cse_many(queries: Tuple[str, ...], api_key: str, cx: str, num: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Più query in parallelo (client async di search_cse: QPS limitato, retry con backoff su 429/5xx).
+    Ritorna {query: items}; le query fallite mancano e vengono ritentate singolarmente.
+    """
+    from search_cse import search_many
+    return search_many(list(queries), api_key, cx, num=num)
+
+cached_search_google_cse_many = _memoized("cse_many", search_google_cse_many)
+
+
+# --------------------------------------------
+# Politeness + robots helpers
+# --------------------------------------------
+_robot_parsers: Dict[str, Optional[robotparser.RobotFileParser]] = {}
+_last_request_time: Dict[str, float] = {}
+
+def _get_host(url: str) -> str:
+    try:
+        return urlparse(url).netloc or ""
+    except Exception:
+        return ""
+
+def allowed_by_robots(url: str, user_agent: str = "*") -> bool:
+    host = _get_host(url)
+    if not host:
+        return False
+    rp = _robot_parsers.get(host)
+    metrics.cache_access("robots", host in _robot_parsers)
+    if rp is None:
+        robots_url = f"{urlparse(url).scheme}://{host}/robots.txt"
+        rp = robotparser.RobotFileParser()
+        try:
+            httpx = _httpx()
+            import replay
+            rp.set_url(robots_url)
+            # robots.txt via httpx (stesse regole di RobotFileParser.read), così passa anche dall'harness record/replay
+            with httpx.Client(timeout=10.0, follow_redirects=True, headers={"User-Agent": user_agent}, **replay.client_kwargs()) as client:
+                r = client.get(robots_url)
+            if r.status_code in (401, 403):
+                rp.disallow_all = True
+            elif r.status_code >= 400:
+                rp.allow_all = True
+            else:
+                rp.parse(r.text.splitlines())
+        except Exception:
+            _robot_parsers[host] = None
+            return True
+        _robot_parsers[host] = rp
+    if _robot_parsers.get(host) is None:
+        return True
+    try:
+        return _robot_parsers[host].can_fetch(user_agent, url)
+    except Exception:
+        return True
+
+def _page_flight() -> "singleflight.SingleFlight":
+    # pagine HTML condivise per 5 minuti (stesso URL canonico da seed/SERP diversi); PDF solo in-flight
+    return singleflight.group("page", ttl=300.0, max_results=256,
+                              keep=lambda r: "text/html" in r.headers.get("content-type", "").lower())
+
+def _get(client: "httpx.Client", url: str) -> "httpx.Response":
+    # timeout adattato alla latenza dell'host; esito registrato per il circuit breaker.
+    # Lettura in streaming: HTML fino a html_stream.MAX_HTML_BYTES, corpo dei PDF/binari non scaricato
+    t0 = time.perf_counter()
+    try:
+        page = html_stream.stream_html_sync(client, url, keep_html=True,
+                                            timeout=host_health.timeout_for(url, client.timeout.read or 15.0))
+    except Exception as e:
+        host_health.record_error(url, time.perf_counter() - t0, e)
+        raise
+    metrics.record_fetch(url, time.perf_counter() - t0, page["nbytes"])
+    host_health.record_response(url, time.perf_counter() - t0, page["status"])
+    return html_stream.capped_response(page)
+
+def polite_get(client: "httpx.Client", url: str, min_delay: float = 0.8) -> "httpx.Response":
+    def fetch():
+        host = _get_host(url)
+        now = time.time()
+        last = _last_request_time.get(host, 0.0)
+        wait = max(0.0, min_delay - (now - last))
+        if wait > 0:
+            time.sleep(wait)
+        resp = _get(client, url)
+        _last_request_time[host] = time.time()
+        return resp
+    return _page_flight().do(singleflight.canonical_url(url), fetch)
+
+
+# --------------------------------------------
+# Adapter / Fallback crawler
+# --------------------------------------------
+def _is_pdf_url(url: str) -> bool:
+    u = url.lower()
+    return u.endswith(".pdf") or "application/pdf" in u
+
+YEAR_TOKEN_RE = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+
+def _years_from_text(text: str, candidates: Optional[List[int]] = None) -> List[int]:
+    """Tutti gli anni citati nel testo (filtrati su `candidates` se indicati), in ordine di apparizione."""
+    try:
+        s = str(text)
+    except Exception:
+        return []
+    out: List[int] = []
+    for tok in YEAR_TOKEN_RE.findall(s):
+        y = int(tok)
+        if (candidates is None or y in candidates) and y not in out:
+            out.append(y)
+    return out
+
+def _year_from_text(text: str, candidates: Optional[List[int]] = None) -> Optional[int]:
+    ys = _years_from_text(text, candidates)
+    return ys[0] if ys else None
+
+def _score_candidate(url: str, title: Optional[str], keywords: List[str], year: Optional[int]) -> float:
+    score = 0.0
+    u = (url or "").lower()
+    t = (title or "").lower()
+    if year and str(year) in u:
+        score += 1.2
+    if year and str(year) in t:
+        score += 0.8
+    for kw in keywords:
+        kw_l = kw.lower()
+        if kw_l and kw_l in u:
+            score += 0.6
+        if kw_l and kw_l in t:
+            score += 0.4
+    boost_terms = ("bilanci", "relazioni", "investor", "financial", "sostenibilit")
+    if any(bt in u for bt in boost_terms):
+        score += 0.5
+    if _is_pdf_url(u):
+        score += 0.4
+    return round(score, 3)
+
+def _is_allowed(url: str, allowlist: List[str]) -> bool:
+    host = _get_host(url).lower()
+    if not host:
+        return False
+    for item in allowlist:
+        item = item.lower()
+        if host == item or host.endswith("." + item):
+            return True
+    return False
+
+def _registrable(host: str) -> str:
+    # Euristica come in crawler.py: ultimi due label (estra.it, gruppohera.it)
+    parts = (host or "").lower().split(".")
+    return ".".join(parts[-2:]) if len(parts) >= 2 else (host or "").lower()
+
+def _group_by_domain(seeds: List[str]) -> Dict[str, List[str]]:
+    groups: Dict[str, List[str]] = {}
+    for s in seeds:
+        groups.setdefault(_registrable(_get_host(s)), []).append(s)
+    return groups
+
+def _pdf_record(url: str, title: str, keywords: List[str], year: int, years: Optional[List[int]],
+                source: Optional[str], score: Optional[float] = None) -> Dict[str, Any]:
+    return {
+        "url": url,
+        "title": title,
+        "is_pdf": True,
+        "host": _get_host(url),
+        "score": _score_candidate(url, title, keywords, year) if score is None else score,
+        "year_detected": _year_from_text(url, years) or _year_from_text(title, years),
+        "years_detected": _years_from_text(url + " " + title, years),
+        "matched_keywords": [kw for kw in keywords if kw.lower() in url.lower()],
+        "source_page": source,
+    }
+
+
+def crawl_and_classify(
+    seed_url: Union[str, List[str]],
+    keywords: List[str],
+    year: int,
+    depth: int = 1,
+    max_pages: int = 20,
+    allowlist: Optional[List[str]] = None,
+    polite_mode: bool = True,
+    min_delay: float = 1.0,
+    years: Optional[List[int]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Crawl dalla seed (o dalle seed: tutte quelle di un'azienda in una sola crawl, con frontiera,
+    visited e budget condivisi per dominio); ritorna pagine/PDF candidati ordinati per score.
+    Con `years` (multi-anno) ogni record riporta in `years_detected` gli anni richiesti che cita.
+    Con `polite_mode` si usa sempre il crawler interno: semantic_crawler non legge robots.txt e non
+    rispetta `min_delay`.
+    """
+    seeds = [seed_url] if isinstance(seed_url, str) else [s for s in seed_url if s]
+    results: Optional[List[Dict[str, Any]]] = None
+    _external_crawl_and_classify = _external_crawler() if _CRAWLER_AVAILABLE and not polite_mode else None
+    if _external_crawl_and_classify is not None and seeds:
+        try:
+            results = _crawl_external(_external_crawl_and_classify, seeds, keywords, year, depth, max_pages,
+                                      allowlist, years)
+        except Exception:
+            results = None  # crawler esterno non utilizzabile: fallback interno
+    if results is None:
+        results = _crawl_fallback(seeds, keywords, year, depth, max_pages, allowlist, polite_mode, min_delay, years)
+
+    best_by_url: Dict[str, Dict[str, Any]] = {}
+    for rec in results:
+        u = rec["url"]
+        prev = best_by_url.get(u)
+        if prev is None or rec.get("score", 0) > prev.get("score", 0):
+            best_by_url[u] = rec
+    final = list(best_by_url.values())
+    final.sort(key=lambda r: (r.get("score", 0.0), 1 if not r.get("is_pdf") else 2), reverse=True)
+    return final
+
+
+def _crawl_external(crawl_fn, seeds: List[str], keywords: List[str], year: int, depth: int, max_pages: int,
+                    allowlist: Optional[List[str]], years: Optional[List[int]]) -> List[Dict[str, Any]]:
+    """
+    Adapter verso semantic_crawler (async, una config per sito): una config per dominio registrabile
+    con tutte le seed di quel dominio, budget diviso tra i domini, crawl in parallelo.
+    """
+    import asyncio
+    groups = _group_by_domain(seeds)
+    share = max(1, int(max_pages) // len(groups))
+    configs = []
+    for group in groups.values():
+        p = urlparse(group[0])
+        configs.append({
+            "base_url": f"{p.scheme}://{p.netloc}",
+            "seeds": group,
+            "allowlist_hosts": [h.lower() for h in (allowlist or [_get_host(s) for s in group])],
+            "max_depth": int(depth),
+            "max_pages": share,
+            # il crawler esterno si ferma a top_n link classificati: margine ampio per usare tutto il budget
+            "top_n_links": 50 * share,
+            "years_target": list(years or [year]),
+            "user_agent": DEFAULT_UA,
+        })
+
+    async def run_all():
+        return await asyncio.gather(*(crawl_fn(c) for c in configs), return_exceptions=True)
+
+    outs = asyncio.run(run_all())
+    if all(isinstance(o, Exception) for o in outs):
+        raise outs[0]
+    results: List[Dict[str, Any]] = []
+    for out in outs:
+        if isinstance(out, Exception):
+            continue
+        for it in out.get("items", []):
+            url, text = it.get("url", ""), (it.get("text") or "")
+            if it.get("is_pdf"):
+                results.append({**_pdf_record(url, text or url.split("/")[-1], keywords, year, years, it.get("from_page")),
+                                "category": it.get("category"), "confidence": it.get("confidence")})
+                continue
+            s = _score_candidate(url, text, keywords, year)
+            if s >= 1.0:
+                results.append({
+                    "url": url,
+                    "title": text,
+                    "is_pdf": False,
+                    "host": _get_host(url),
+                    "score": s,
+                    "year_detected": _year_from_text(url, years) or _year_from_text(text, years),
+                    "years_detected": _years_from_text(url + " " + text, years),
+                    "matched_keywords": [kw for kw in keywords if kw.lower() in (url + " " + text).lower()],
+                    "source_page": it.get("from_page"),
+                    "category": it.get("category"),
+                    "confidence": it.get("confidence"),
+                })
+    return results
+
+
+def _crawl_fallback(seeds: List[str], keywords: List[str], year: int, depth: int, max_pages: int,
+                    allowlist: Optional[List[str]], polite_mode: bool, min_delay: float,
+                    years: Optional[List[int]]) -> List[Dict[str, Any]]:
+    """
+    Crawl BFS interna. Una coda per dominio registrabile (visited comune); ogni dominio ha una quota
+    minima di pagine, il resto del budget va al dominio che finora ha dato i candidati migliori.
+    """
+    results: List[Dict[str, Any]] = []
+    httpx, BeautifulSoup = _httpx(), _beautifulsoup()
+    if httpx is None or BeautifulSoup is None or not seeds:
+        return results
+    import replay
+
+    headers = {"User-Agent": DEFAULT_UA, "Accept": "*/*"}
+    visited: Set[str] = set()
+    queues: Dict[str, deque] = {d: deque((s, 0, None) for s in group)  # (url, depth, source)
+                                for d, group in _group_by_domain(seeds).items()}
+    spent = {d: 0 for d in queues}
+    promise = {d: 0.0 for d in queues}
+    reserve = max(1, int(max_pages) // (2 * len(queues)))
+    pages_processed = 0
+    allow = [h.lower() for h in (allowlist or [_get_host(s) for s in seeds])]
+
+    def next_domain() -> Optional[str]:
+        live = [d for d, q in queues.items() if q]
+        if not live:
+            return None
+        floating = max_pages - pages_processed - sum(max(0, reserve - spent[d]) for d in live)
+        eligible = [d for d in live if spent[d] < reserve or floating > 0] or live
+        # dominio più promettente (miglior candidato finora), a parità quello meno visitato
+        return max(eligible, key=lambda d: (promise[d], -spent[d]))
+
+    with httpx.Client(follow_redirects=True, headers=headers, timeout=15.0, **replay.client_kwargs()) as client:
+        global _last_request_time
+        _last_request_time = {}
+        while pages_processed < max_pages:
+            dom = next_domain()
+            if dom is None:
+                break
+            url, d, source = queues[dom].popleft()
+            if url in visited:
+                continue
+            visited.add(url)
+            if not _is_allowed(url, allow):
+                continue
+            if polite_mode and not allowed_by_robots(url, DEFAULT_UA):
+                continue
+            if not host_health.allow(url):
+                continue  # host in cooldown dopo errori/timeout consecutivi
+            try:
+                if polite_mode:
+                    r = polite_get(client, url, min_delay=min_delay)
+                else:
+                    r = _page_flight().do(singleflight.canonical_url(url), lambda: _get(client, url))
+            except Exception:
+                metrics.record_fetch(url, 0.0, error=True)
+                continue
+            ctype = r.headers.get("content-type", "").lower()
+            if _is_pdf_url(url) or "application/pdf" in ctype:
+                rec = _pdf_record(url, url.split("/")[-1], keywords, year, years, source)
+                promise[dom] = max(promise[dom], rec["score"])
+                results.append(rec)
+                continue
+            if "text/html" not in ctype:
+                continue
+            pages_processed += 1
+            spent[dom] += 1
+            try:
+                with metrics.timer("html_parse_seconds"):
+                    soup = BeautifulSoup(r.text, "html.parser")
+            except Exception:
+                continue
+            page_title = None
+            t_tag = soup.find("title")
+            if t_tag and t_tag.text:
+                page_title = t_tag.text.strip()
+            ydet = _year_from_text(url, years) or _year_from_text(page_title, years)
+            s = _score_candidate(url, page_title, keywords, year)
+            promise[dom] = max(promise[dom], s)
+            if s >= 1.0:
+                matched = [kw for kw in keywords if (kw.lower() in (url.lower() + " " + (page_title or "").lower()))]
+                results.append({
+                    "url": url,
+                    "title": page_title,
+                    "is_pdf": False,
+                    "host": _get_host(url),
+                    "score": s,
+                    "year_detected": ydet,
+                    "years_detected": _years_from_text(url + " " + (page_title or ""), years),
+                    "matched_keywords": matched,
+                    "source_page": source,
+                })
+            t_score = time.perf_counter()
+            for a in soup.find_all("a", href=True):
+                href = a.get("href")
+                try:
+                    nxt = urljoin(url, href)
+                except Exception:
+                    continue
+                if not nxt:
+                    continue
+                if nxt.startswith("mailto:") or nxt.startswith("tel:"):
+                    continue
+                if not nxt.startswith("http"):
+                    continue
+                if nxt in visited:
+                    continue
+                if not _is_allowed(nxt, allow):
+                    continue
+                if d < depth:
+                    # link verso il dominio di un'altra seed: nella coda di quel dominio
+                    queues.get(_registrable(_get_host(nxt)), queues[dom]).append((nxt, d + 1, url))
+            metrics.observe("link_scoring_seconds", time.perf_counter() - t_score)
+    return results
+
+
+# crawl memoizzata per parametri (seed, keywords, anni, limiti): rerun e righe ripetute non rifanno rete
+cached_crawl_and_classify = _memoized("crawl_and_classify", crawl_and_classify)
+
+
+# --------------------------------------------
+# Batch: elaborazione di una singola azienda (uno o più anni)
+# --------------------------------------------
+def _best_docs_by_year(candidates: List[Dict[str, Any]], years: List[int], keywords: List[str]) -> Dict[int, Optional[str]]:
+    """
+    Attribuisce i PDF candidati agli anni richiesti.
+    Un solo anno: vince lo score più alto (comportamento storico). Multi-anno: un PDF vale per gli anni
+    che cita, quelli senza anno fanno da ripiego; a parità vince chi cita l'anno esplicitamente.
+    I candidati sondati (`probe`, vedi _probe_candidates) sommano allo score il bonus della sonda.
+    """
+    best: Dict[int, Tuple[Tuple[bool, float], str]] = {}
+    for r in candidates:
+        if not r.get("is_pdf"):
+            continue
+        url = r.get("url")
+        cited = r.get("years_detected") or _years_from_text(url)
+        for y in years:
+            if len(years) > 1 and cited and y not in cited:
+                continue
+            # segnali della sonda Range (titolo, anno, tipo documento, pagine), se sondato
+            bonus = probe_score(r["probe"], y, keywords) if r.get("probe") else 0.0
+            if len(years) == 1:
+                key = (True, r.get("score", 0.0) + bonus)
+            else:
+                key = (y in cited, _score_candidate(url, r.get("title"), keywords, y) + bonus)
+            if y not in best or key > best[y][0]:
+                best[y] = (key, url)
+    return {y: (best[y][1] if y in best else None) for y in years}
+
+def _probe_candidates(candidates: List[Dict[str, Any]], top_k: int = PROBE_TOP_K) -> List[Dict[str, Any]]:
+    """
+    Sonda Range (pdf_probe) dei migliori PDF candidati prima di scaricarne uno: metadati e prima
+    pagina costano pochi KB e correggono la scelta fatta solo su URL e ancora.
+    """
+    pdfs = sorted((c for c in candidates if c.get("is_pdf")), key=lambda c: c.get("score", 0.0), reverse=True)[:top_k]
+    if len(pdfs) < 2:
+        return candidates   # nessuna scelta da fare
+    probes = dict(zip((c["url"] for c in pdfs), probe_many([c["url"] for c in pdfs])))
+    return [{**c, "probe": probes[c["url"]]} if c.get("url") in probes else c for c in candidates]
+
+def match_values(index: DocumentIndex, extract_keywords: List[str]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """({keyword: {value, page, offset}} delle keyword con un valore, prima keyword in ordine con un valore)."""
+    hits = index.find_values(extract_keywords)
+    matched_values = {kw: {"value": h["value"], "page": h["page"], "offset": h["offset"]}
+                      for kw, h in hits.items() if h}
+    # colonne storiche: prima keyword (in ordine) che ha un valore
+    first = next((h for h in hits.values() if h), None)
+    return matched_values, first
+
+def match_fields(index: DocumentIndex, extract_keywords: List[str]) -> Dict[str, Any]:
+    """Campi di output dei valori (come process_company) per un documento già indicizzato."""
+    matched_values, first = match_values(index, extract_keywords)
+    return {
+        "matched_doc_keyword": first["keyword"] if first else "",
+        "matched_value": first["value"] if first else "",
+        "matched_page": first["page"] if first else "",
+        "matched_values": json.dumps(matched_values, ensure_ascii=False) if matched_values else "",
+        "notes": "" if first else "Nessuna keyword trovata nel testo",
+    }
+
+def serp_query(row_name: str, years: List[int]) -> str:
+    """Query CSE dell'azienda: una sola per tutti gli anni richiesti."""
+    years = sorted({int(y) for y in years}, reverse=True)
+    if len(years) == 1:
+        return f"{row_name} bilancio {years[0]}"
+    return f"{row_name} bilancio (" + " OR ".join(str(y) for y in years) + ")"
+
+
+def process_company(
+    row_name: str,
+    years: List[int],
+    doc_keywords: List[str],
+    extract_keywords: List[str],
+    api_key: Optional[str],
+    cx: Optional[str],
+    serp_results: int = 3,
+    polite_mode: bool = True,
+    min_delay: float = 1.0,
+    log=None,
+    serp_items: Optional[List[Dict[str, Any]]] = None,
+    entrypoints: Optional[List[str]] = None,
+) -> Tuple[Dict[int, Dict[str, Any]], int]:
+    """
+    Ricerca SERP + crawl + estrazione per un'azienda. Con più anni la query CSE e le crawl
+    sono condivise: ogni PDF trovato viene attribuito agli anni che cita.
+    `serp_items` (già cercati, es. in parallelo per tutto il batch) evita la query CSE.
+    `entrypoints` (scoperta dei domini, vedi discovery.py) sostituiscono la SERP: nessuna query CSE,
+    crawl con un livello in più perché si parte dalle pagine indice.
+    Ritorna ({anno: campi OUTPUT_FIELDS}, query CSE usate).
+    """
+    log = log or (lambda msg: None)
+    years = sorted({int(y) for y in years}, reverse=True)
+    queries_used = 0
+    base_notes = ""
+
+    # 1) Search via Google CSE (una query per tutti gli anni), se la scoperta dei domini non ha trovato il sito
+    if entrypoints:
+        serp_items = [{"link": u} for u in entrypoints]
+    elif serp_items is None:
+        serp_items = []
+        if api_key and cx:
+            serp_items = cached_search_google_cse(serp_query(row_name, years), api_key, cx, num=int(serp_results))
+            queries_used += 1
+        else:
+            base_notes = "No Google API key; nessuna ricerca SERP automatica eseguita."
+
+    candidate_urls = []
+    for it in serp_items:
+        link = it.get("link")
+        if link:
+            candidate_urls.append(link)
+
+    # 2) Crawl dei candidate url con crawl_and_classify per trovare PDF rilevanti
+    #    (una sola crawl con tutte le seed: frontiera, visited e budget condivisi per dominio)
+    candidates: List[Dict[str, Any]] = []
+    if candidate_urls:
+        log(f"  -> crawl di {len(candidate_urls)} candidate: {', '.join(candidate_urls)}")
+        try:
+            candidates = cached_crawl_and_classify(
+                seed_url=candidate_urls,
+                keywords=doc_keywords,
+                year=years[0],
+                depth=2 if entrypoints else 1,
+                max_pages=20 * len(candidate_urls),
+                allowlist=None,
+                polite_mode=polite_mode,
+                min_delay=min_delay,
+                years=years if len(years) > 1 else None,
+            )
+        except Exception:
+            pass
+    if candidates and PROBE_TOP_K > 0:
+        candidates = _probe_candidates(candidates)
+    docs = _best_docs_by_year(candidates, years, doc_keywords)
+
+    # 3) Se non trovato tramite crawl, verifica direttamente i candidate_urls se contengono pdf
+    serp_pdfs = [{"url": l, "title": l.split("/")[-1], "is_pdf": True, "score": 0.0,
+                  "years_detected": _years_from_text(l, years)} for l in candidate_urls if _is_pdf_url(l)]
+    if serp_pdfs:
+        for y, u in _best_docs_by_year(serp_pdfs[:1] if len(years) == 1 else serp_pdfs, years, doc_keywords).items():
+            if not docs.get(y):
+                docs[y] = u
+
+    # 4) Per ogni documento trovato: scarica ed estrai testo (con fallback OCR), una volta per URL
+    #    (testo per pagina memoizzato per URL: rerun e aziende con lo stesso PDF non riscaricano né rifanno OCR)
+    extracted: Dict[str, Tuple[bool, Optional[DocumentIndex], bool, Optional[str]]] = {}
+    out: Dict[int, Dict[str, Any]] = {}
+    for y in years:
+        best_doc_url = docs.get(y)
+        matched_keyword = None
+        matched_value = None
+        matched_page = None
+        matched_values: Dict[str, Any] = {}
+        needs_ocr_flag = False
+        notes = base_notes
+        if best_doc_url:
+            if best_doc_url not in extracted:
+                log(f"  -> scarico ed estraggo documento {best_doc_url}")
+                # OCR adattivo: alta risoluzione solo attorno alle keyword di estrazione
+                from st_cache import fetch_pdf_pages
+                doc = fetch_pdf_pages(best_doc_url, ocr=True, keywords=tuple(extract_keywords))
+                pages = doc["pages"]
+                if pages and not doc.get("error"):
+                    # testo per pagina nel corpus FTS: nuove keyword senza riscaricare (corpus_index.requery)
+                    index_document(best_doc_url, pages, row_name, [yy for yy in years if docs.get(yy) == best_doc_url],
+                                   ocr=bool(doc.get("ocr")), sha256=doc.get("sha256"))
+                # indice keyword/numeri costruito una volta per documento
+                extracted[best_doc_url] = (doc["downloaded"], DocumentIndex(pages) if pages else None,
+                                           doc["needs_ocr"], doc.get("error"))
+            data, index, needs_ocr_flag, error = extracted[best_doc_url]
+            if data and error:
+                # PDF patologico: il worker è stato fermato, il batch prosegue
+                notes = f"Estrazione testo interrotta ({error}): documento saltato"
+            elif data:
+                if not needs_ocr_flag and index is not None:
+                    matched_values, first = match_values(index, extract_keywords)
+                    if first:
+                        matched_keyword = first["keyword"]
+                        matched_value = first["value"]
+                        matched_page = first["page"]
+                    else:
+                        notes = "Nessuna keyword trovata nel testo"
+                else:
+                    needs_ocr_flag = True
+                    if not notes:
+                        notes = "Documento probabilmente scannerizzato o testo non estraibile (needs OCR)"
+            else:
+                notes = "Download documento fallito"
+        else:
+            notes = "Nessun documento PDF trovato dai risultati SERP"
+            down = sorted({metrics.host_label(u) for u in candidate_urls if host_health.state(u) != host_health.CLOSED})
+            if down:
+                notes += f" (host non raggiungibili, circuito aperto: {', '.join(down)})"
+        out[y] = {
+            "found_document_url": best_doc_url or "",
+            "matched_doc_keyword": matched_keyword or "",
+            "matched_value": matched_value or "",
+            "matched_page": matched_page or "",
+            "matched_values": json.dumps(matched_values, ensure_ascii=False) if matched_values else "",
+            "needs_ocr": bool(needs_ocr_flag),
+            "notes": notes or "",
+        }
+    return out, queries_used
@@ -0,0 +1,138 @@
+"""
+Profilazione di un run (batch, crawl semantico, CLI) dove la lentezza si manifesta.
+
+Durante il run girano insieme:
+- cProfile (deterministico) → file .pstats e tabella top-N funzioni per tempo cumulativo;
+- un campionatore di stack del thread chiamante → JSON speedscope (https://www.speedscope.app).
+
+Solo libreria standard. Gli stack campionati identici vengono aggregati, la memoria resta limitata
+anche su run lunghi.
+"""
+from __future__ import annotations
+import cProfile, io, json, marshal, os, pstats, sys, threading, time
+
+
+class RunProfiler:
+    def __init__(self, name: str = "run", sample_interval: float = 0.005, top_n: int = 30):
+        self.name = name
+        self.sample_interval = sample_interval
+        self.top_n = top_n
+        self._prof = cProfile.Profile()
+        self._stats: pstats.Stats | None = None
+        self._stacks: dict[tuple, float] = {}
+        self._frames: dict[tuple, int] = {}
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+        self.wall_seconds = 0.0
+
+    # --- ciclo di vita ---
+    def start(self) -> "RunProfiler":
+        self._t0 = time.perf_counter()
+        self._target = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample_loop, name="bilanci-profiler", daemon=True)
+        self._sampler.start()
+        self._prof.enable()
+        return self
+
+    def stop(self) -> "RunProfiler":
+        self._prof.disable()
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join(timeout=2)
+        self.wall_seconds = time.perf_counter() - self._t0
+        self._stats = pstats.Stats(self._prof, stream=io.StringIO())
+        return self
+
+    def __enter__(self) -> "RunProfiler":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _sample_loop(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._target)
+            now = time.perf_counter()
+            if frame is None:
+                last = now
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_name, code.co_filename, code.co_firstlineno)
+                idx = self._frames.get(key)
+                if idx is None:
+                    idx = self._frames[key] = len(self._frames)
+                stack.append(idx)
+                frame = frame.f_back
+            stack.reverse()
+            st = tuple(stack)
+            self._stacks[st] = self._stacks.get(st, 0.0) + (now - last)
+            last = now
+
+    # --- output ---
+    def pstats_bytes(self) -> bytes:
+        """Contenuto di un file .pstats (leggibile con pstats.Stats / snakeviz)."""
+        return marshal.dumps(self._stats.stats) if self._stats else b""
+
+    def top_functions(self, n: int | None = None, sort: str = "cumulative") -> list[dict]:
+        if not self._stats:
+            return []
+        rows = []
+        for (fname, line, func), (cc, nc, tt, ct, _callers) in self._stats.stats.items():
+            rows.append({
+                "function": func,
+                "location": f"{os.path.basename(fname)}:{line}",
+                "ncalls": nc,
+                "tottime_s": round(tt, 4),
+                "cumtime_s": round(ct, 4),
+            })
+        key = "cumtime_s" if sort == "cumulative" else "tottime_s"
+        rows.sort(key=lambda r: r[key], reverse=True)
+        return rows[: (n or self.top_n)]
+
+    def speedscope_json(self) -> str:
+        frames = [None] * len(self._frames)
+        for (name, file, line), idx in self._frames.items():
+            frames[idx] = {"name": name, "file": file, "line": line}
+        samples = list(self._stacks.keys())
+        weights = [round(self._stacks[s], 6) for s in samples]
+        doc = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "bilanci-profiling",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 6),
+                "samples": [list(s) for s in samples],
+                "weights": weights,
+            }],
+        }
+        return json.dumps(doc)
+
+    def write(self, out_dir: str, stem: str | None = None) -> dict:
+        """Scrive .pstats, .speedscope.json e top-N (.tsv) in out_dir; ritorna i percorsi."""
+        os.makedirs(out_dir, exist_ok=True)
+        stem = stem or self.name
+        paths = {
+            "pstats": os.path.join(out_dir, f"{stem}.pstats"),
+            "speedscope": os.path.join(out_dir, f"{stem}.speedscope.json"),
+            "top": os.path.join(out_dir, f"{stem}.top.tsv"),
+        }
+        with open(paths["pstats"], "wb") as f:
+            f.write(self.pstats_bytes())
+        with open(paths["speedscope"], "w", encoding="utf-8") as f:
+            f.write(self.speedscope_json())
+        with open(paths["top"], "w", encoding="utf-8") as f:
+            f.write(format_top(self.top_functions()))
+        return paths
+
+
+def format_top(rows: list[dict]) -> str:
+    cols = ["cumtime_s", "tottime_s", "ncalls", "function", "location"]
+    return "\t".join(cols) + "\n" + "".join("\t".join(str(r[c]) for c in cols) + "\n" for r in rows)
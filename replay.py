@@ -0,0 +1,198 @@
+"""
+Record/replay degli scambi HTTP (httpx) per benchmark offline e deterministici.
+
+Modalità (variabili d'ambiente o `activate()`):
+- BILANCI_HTTP_MODE=record  → esegue le richieste reali e salva ogni scambio (PDF inclusi)
+- BILANCI_HTTP_MODE=replay  → risponde solo dall'archivio, nessuna richiesta in rete
+- BILANCI_HTTP_ARCHIVE=percorso/archivio.jsonl.gz
+
+L'archivio è un JSONL gzip: una riga per scambio con metodo, URL, status, header e body (base64).
+Il parametro `key` delle URL (API key Google CSE) non viene mai salvato né usato per il match,
+così le risposte CSE registrate si riproducono senza consumare quota.
+"""
+from __future__ import annotations
+import os, gzip, json, base64, threading
+from collections import defaultdict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import httpx
+
+MODE_ENV = "BILANCI_HTTP_MODE"
+ARCHIVE_ENV = "BILANCI_HTTP_ARCHIVE"
+DEFAULT_ARCHIVE = "http_archive.jsonl.gz"
+
+# Parametri di query esclusi da archivio e chiave di match
+REDACTED_PARAMS = {"key"}
+# Header non riproducibili: il body salvato è già decodificato
+DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie"}
+
+_state = {"mode": None, "archive": None}
+_lock = threading.Lock()
+_archives: dict[str, "Archive"] = {}
+
+
+def canonical_url(url: str) -> str:
+    """URL senza parametri sensibili, con query ordinata (chiave di match)."""
+    p = urlsplit(str(url))
+    qs = sorted((k, v) for k, v in parse_qsl(p.query, keep_blank_values=True) if k not in REDACTED_PARAMS)
+    return urlunsplit((p.scheme, p.netloc.lower(), p.path or "/", urlencode(qs), ""))
+
+
+def _exchange_key(method: str, url: str) -> str:
+    return f"{method.upper()} {canonical_url(url)}"
+
+
+class Archive:
+    """Archivio JSONL gzip. In scrittura appende uno scambio per volta (thread-safe)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: dict[str, list[dict]] | None = None
+        self._cursor: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def append(self, request: httpx.Request, response: httpx.Response, body: bytes) -> None:
+        rec = {
+            "method": request.method,
+            "url": canonical_url(str(request.url)),
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.items() if k.lower() not in DROP_HEADERS],
+            "body_b64": base64.b64encode(body).decode("ascii"),
+        }
+        line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            # ogni append crea un membro gzip: gzip.open li legge in sequenza
+            with gzip.open(self.path, "ab") as f:
+                f.write(line)
+
+    def _load(self) -> dict[str, list[dict]]:
+        if self._entries is None:
+            entries: dict[str, list[dict]] = defaultdict(list)
+            if os.path.exists(self.path):
+                with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            rec = json.loads(line)
+                            entries[_exchange_key(rec["method"], rec["url"])].append(rec)
+            self._entries = entries
+        return self._entries
+
+    def lookup(self, method: str, url: str) -> dict | None:
+        """Ritorna lo scambio registrato; richieste ripetute scorrono le registrazioni in ordine."""
+        with self._lock:
+            recs = self._load().get(_exchange_key(method, url))
+            if not recs:
+                return None
+            key = _exchange_key(method, url)
+            i = min(self._cursor[key], len(recs) - 1)
+            self._cursor[key] += 1
+            return recs[i]
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._load().values())
+
+
+def _response_from_record(rec: dict, request: httpx.Request) -> httpx.Response:
+    return httpx.Response(
+        status_code=rec["status"],
+        headers=rec["headers"],
+        content=base64.b64decode(rec["body_b64"]),
+        request=request,
+    )
+
+
+def _missing(request: httpx.Request) -> httpx.ConnectError:
+    return httpx.ConnectError(f"replay: scambio non presente in archivio ({request.method} {canonical_url(str(request.url))})", request=request)
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, archive: Archive, inner: httpx.BaseTransport | None = None):
+        self.archive = archive
+        self.inner = inner or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = self.inner.handle_request(request)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        self.archive.append(request, response, body)
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in DROP_HEADERS]
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, archive: Archive, inner: httpx.AsyncBaseTransport | None = None):
+        self.archive = archive
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.inner.handle_async_request(request)
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        self.archive.append(request, response, body)
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in DROP_HEADERS]
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    def __init__(self, archive: Archive):
+        self.archive = archive
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        rec = self.archive.lookup(request.method, str(request.url))
+        if rec is None:
+            raise _missing(request)
+        return _response_from_record(rec, request)
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, archive: Archive):
+        self.archive = archive
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        rec = self.archive.lookup(request.method, str(request.url))
+        if rec is None:
+            raise _missing(request)
+        return _response_from_record(rec, request)
+
+
+def activate(mode: str | None, archive_path: str | None = None) -> None:
+    """Imposta la modalità per il processo corrente (None/'off' disattiva)."""
+    if mode not in (None, "off", "record", "replay"):
+        raise ValueError(f"modalità non valida: {mode}")
+    _state["mode"] = None if mode == "off" else mode
+    _state["archive"] = archive_path
+
+
+def current_mode() -> str | None:
+    mode = _state["mode"] or os.environ.get(MODE_ENV, "").strip().lower() or None
+    return None if mode == "off" else mode
+
+
+def _archive() -> Archive:
+    path = _state["archive"] or os.environ.get(ARCHIVE_ENV) or DEFAULT_ARCHIVE
+    with _lock:
+        if path not in _archives:
+            _archives[path] = Archive(path)
+        return _archives[path]
+
+
+def client_kwargs(async_client: bool = False) -> dict:
+    """
+    Kwargs da passare a httpx.Client / httpx.AsyncClient: vuoto se l'harness è spento,
+    altrimenti il transport di record o replay.
+    """
+    mode = current_mode()
+    if mode == "record":
+        return {"transport": AsyncRecordingTransport(_archive()) if async_client else RecordingTransport(_archive())}
+    if mode == "replay":
+        return {"transport": AsyncReplayTransport(_archive()) if async_client else ReplayTransport(_archive())}
+    return {}
@@ -0,0 +1,412 @@
+"""
+Archivio risultati del batch su SQLite: righe tipizzate aggiunte a blocchi durante il run, invece di
+un DataFrame tenuto in RAM e riempito cella per cella.
+
+- `inputs`:  una riga del foglio caricato per record (JSON compatto, colonne nell'ordine originale)
+- `results`: una riga per (azienda, anno) con i campi di OUTPUT_FIELDS tipizzati
+  (pagina INTEGER, needs_ocr 0/1; il valore resta testo com'è stato estratto, es. "1.234.567")
+
+Le esportazioni (XLSX write-only, CSV, JSON, Parquet) leggono a blocchi e scrivono direttamente su
+file: la memoria resta costante qualunque sia la dimensione del foglio.
+
+Uso da riga di comando:
+  python results_store.py runs
+  python results_store.py export <run_id> out.xlsx|out.csv|out.json|out.parquet
+"""
+from __future__ import annotations
+import csv, json, math, os, sqlite3, sys, threading, time, uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import metrics
+
+OUTPUT_FIELDS = ["found_document_url", "matched_doc_keyword", "matched_value", "matched_page", "matched_values", "needs_ocr", "notes"]
+
+# tipo SQLite di ciascun campo di output
+FIELD_TYPES = {
+    "found_document_url": "TEXT",
+    "matched_doc_keyword": "TEXT",
+    "matched_value": "TEXT",     # formato italiano ambiguo per float ("12.345" sono migliaia)
+    "matched_page": "INTEGER",
+    "matched_values": "TEXT",
+    "needs_ocr": "INTEGER",
+    "notes": "TEXT",
+}
+
+DEFAULT_DB = os.environ.get("BILANCI_RESULTS_DB", os.path.join("results", "bilanci_results.sqlite"))
+EXPORT_DIR = os.environ.get("BILANCI_EXPORT_DIR", os.path.join("results", "exports"))
+CHUNK_ROWS = 500
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "json": "application/json",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    years TEXT NOT NULL,
+    input_columns TEXT NOT NULL,
+    meta TEXT NOT NULL DEFAULT '{{}}'
+);
+CREATE TABLE IF NOT EXISTS inputs (
+    run_id TEXT NOT NULL,
+    row_idx INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, row_idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL,
+    row_idx INTEGER NOT NULL,
+    company TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    {", ".join(f"{f} {t}" for f, t in FIELD_TYPES.items())},
+    PRIMARY KEY (run_id, row_idx, year)
+) WITHOUT ROWID;
+"""
+
+
+def output_columns(years: List[int]) -> List[str]:
+    """Colonne Excel di output: nomi storici con un solo anno, suffisso `_<anno>` in multi-anno."""
+    if len(years) == 1:
+        return list(OUTPUT_FIELDS)
+    return [f"{f}_{y}" for y in years for f in OUTPUT_FIELDS]
+
+
+def _plain(v: Any) -> Any:
+    """Valore di input serializzabile: NaN/NaT → None, numpy → Python, date → ISO."""
+    if v is None:
+        return None
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)):
+        try:
+            v = v.item()
+        except Exception:
+            pass
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    if isinstance(v, (str, int, float, bool)):
+        return v
+    if hasattr(v, "isoformat"):
+        try:
+            return v.isoformat()
+        except Exception:
+            return None   # NaT
+    return str(v)
+
+
+def _typed(fields: Dict[str, Any]) -> Tuple:
+    """Campi di process_company → tupla tipizzata nell'ordine di OUTPUT_FIELDS ('' → NULL)."""
+    out = []
+    for f in OUTPUT_FIELDS:
+        v = fields.get(f)
+        if v is None or v == "":
+            out.append(None)
+        elif FIELD_TYPES[f] == "REAL":
+            try:
+                out.append(float(v))
+            except (TypeError, ValueError):
+                out.append(None)
+        elif FIELD_TYPES[f] == "INTEGER":
+            try:
+                out.append(int(v))
+            except (TypeError, ValueError):
+                out.append(None)
+        else:
+            out.append(str(v))
+    return tuple(out)
+
+
+def _cell(field: str, v: Any) -> Any:
+    if v is not None and field == "needs_ocr":
+        return bool(v)
+    return v
+
+
+class ResultsStore:
+    """Archivio SQLite (WAL) condivisibile tra thread; le scritture sono bufferizzate a blocchi."""
+
+    def __init__(self, path: str = DEFAULT_DB, chunk_rows: int = CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self._buffer: List[Tuple] = []
+
+    def _migrate(self) -> None:
+        """Archivi con le colonne di tipo diverso da FIELD_TYPES (es. matched_value REAL): tabella ricreata."""
+        declared = {r[1]: r[2] for r in self._conn.execute("PRAGMA table_info(results)")}
+        if all(declared.get(f) == t for f, t in FIELD_TYPES.items()):
+            return
+        cols = ", ".join(["run_id", "row_idx", "company", "year"] + OUTPUT_FIELDS)
+        with self._conn:
+            self._conn.execute("ALTER TABLE results RENAME TO results_old")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(f"INSERT INTO results ({cols}) SELECT {cols} FROM results_old")
+            self._conn.execute("DROP TABLE results_old")
+
+    # ---------------- scrittura ----------------
+    def new_run(self, input_columns: Sequence[str], years: Sequence[int], meta: Optional[dict] = None) -> str:
+        run_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                               (run_id, time.time(), json.dumps([int(y) for y in years]),
+                                json.dumps([str(c) for c in input_columns]), json.dumps(meta or {}, default=str)))
+        return run_id
+
+    def add_inputs(self, run_id: str, rows: Iterable[Sequence[Any]], start: int = 0) -> int:
+        """Righe del foglio originale (valori nell'ordine di input_columns), inserite a blocchi."""
+        n, chunk = 0, []
+        for i, row in enumerate(rows, start):
+            chunk.append((run_id, i, json.dumps([_plain(v) for v in row], ensure_ascii=False, default=str)))
+            if len(chunk) >= self.chunk_rows:
+                n += self._insert_inputs(chunk)
+                chunk = []
+        if chunk:
+            n += self._insert_inputs(chunk)
+        return n
+
+    def _insert_inputs(self, chunk: List[Tuple]) -> int:
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO inputs VALUES (?, ?, ?)", chunk)
+        return len(chunk)
+
+    def copy_inputs(self, src_run: str, dst_run: str) -> int:
+        """Righe del foglio di un run copiate in un altro (es. nuovo run dal corpus con altre keyword)."""
+        with self._lock, self._conn:
+            return self._conn.execute("INSERT OR REPLACE INTO inputs SELECT ?, row_idx, data FROM inputs "
+                                      "WHERE run_id = ?", (dst_run, src_run)).rowcount
+
+    def append(self, run_id: str, row_idx: int, company: str, by_year: Dict[int, Dict[str, Any]]) -> None:
+        """Risultati di una riga ({anno: campi}); scritti su disco ogni chunk_rows record."""
+        for y, fields in by_year.items():
+            self._buffer.append((run_id, int(row_idx), company, int(y)) + _typed(fields))
+        if len(self._buffer) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        chunk, self._buffer = self._buffer, []
+        cols = ", ".join("?" for _ in range(4 + len(OUTPUT_FIELDS)))
+        with metrics.timer("results_store_flush_seconds"), self._lock, self._conn:
+            self._conn.executemany(f"INSERT OR REPLACE INTO results VALUES ({cols})", chunk)
+        metrics.inc("results_store_rows_total", value=len(chunk))
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------- lettura ----------------
+    def run_info(self, run_id: str) -> Optional[dict]:
+        with self._lock:
+            r = self._conn.execute("SELECT run_id, created, years, input_columns, meta FROM runs WHERE run_id = ?",
+                                   (run_id,)).fetchone()
+        if r is None:
+            return None
+        return {"run_id": r[0], "created": r[1], "years": json.loads(r[2]),
+                "input_columns": json.loads(r[3]), "meta": json.loads(r[4])}
+
+    def runs(self, limit: int = 20) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.run_id, r.created, r.years, (SELECT COUNT(*) FROM inputs i WHERE i.run_id = r.run_id), "
+                "(SELECT COUNT(DISTINCT row_idx) FROM results s WHERE s.run_id = r.run_id) "
+                "FROM runs r ORDER BY r.created DESC LIMIT ?", (limit,)).fetchall()
+        return [{"run_id": r[0], "created": r[1], "years": json.loads(r[2]), "rows": r[3], "processed": r[4]}
+                for r in rows]
+
+    def columns(self, run_id: str) -> List[str]:
+        info = self.run_info(run_id) or {"input_columns": [], "years": []}
+        extra = [c for c in output_columns(info["years"]) if c not in info["input_columns"]]
+        return info["input_columns"] + extra
+
+    def iter_rows(self, run_id: str, limit: Optional[int] = None) -> Iterator[List[Any]]:
+        """Righe larghe (input + output per anno) nell'ordine del foglio, lette a blocchi."""
+        info = self.run_info(run_id)
+        if info is None:
+            return
+        years, in_cols = info["years"], info["input_columns"]
+        out_cols = output_columns(years)
+        # colonne di output già presenti nel foglio caricato vengono sovrascritte al loro posto
+        pos = {c: i for i, c in enumerate(in_cols)}
+        n_extra = sum(1 for c in out_cols if c not in pos)
+        slot, k = {}, len(in_cols)
+        for c in out_cols:
+            if c in pos:
+                slot[c] = pos[c]
+            else:
+                slot[c], k = k, k + 1
+        single = len(years) == 1
+        fields_sql = ", ".join(f"s.{f}" for f in OUTPUT_FIELDS)
+        last, emitted = 0, 0
+        while limit is None or emitted < limit:
+            n = self.chunk_rows if limit is None else min(self.chunk_rows, limit - emitted)
+            with self._lock:
+                inputs = self._conn.execute(
+                    "SELECT row_idx, data FROM inputs WHERE run_id = ? AND row_idx >= ? ORDER BY row_idx LIMIT ?",
+                    (run_id, last, n)).fetchall()
+                if not inputs:
+                    return
+                lo, hi = inputs[0][0], inputs[-1][0]
+                res = self._conn.execute(
+                    f"SELECT s.row_idx, s.year, {fields_sql} FROM results s "
+                    "WHERE s.run_id = ? AND s.row_idx BETWEEN ? AND ?", (run_id, lo, hi)).fetchall()
+            by_row: Dict[int, List[Tuple]] = {}
+            for r in res:
+                by_row.setdefault(r[0], []).append(r)
+            for row_idx, data in inputs:
+                row = json.loads(data)
+                row += [None] * (len(in_cols) + n_extra - len(row))
+                for r in by_row.get(row_idx, ()):
+                    for f, v in zip(OUTPUT_FIELDS, r[2:]):
+                        col = f if single else f"{f}_{r[1]}"
+                        if col in slot:
+                            row[slot[col]] = _cell(f, v)
+                yield row
+                emitted += 1
+            last = hi + 1
+
+    def results(self, run_id: str) -> Iterator[Tuple[int, str, int, Dict[str, Any]]]:
+        """(riga, azienda, anno, {campo: valore}) dei risultati del run, a blocchi."""
+        fields_sql = ", ".join(OUTPUT_FIELDS)
+        last = (-1, 0)
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT row_idx, year, company, {fields_sql} FROM results WHERE run_id = ? "
+                    "AND (row_idx, year) > (?, ?) ORDER BY row_idx, year LIMIT ?",
+                    (run_id, last[0], last[1], self.chunk_rows)).fetchall()
+            if not rows:
+                return
+            for r in rows:
+                yield r[0], r[2], r[1], {f: _cell(f, v) for f, v in zip(OUTPUT_FIELDS, r[3:])}
+            last = (rows[-1][0], rows[-1][1])
+
+    def preview(self, run_id: str, n: int = 200):
+        """Prime n righe come DataFrame (solo per la visualizzazione)."""
+        import pandas as pd
+        return pd.DataFrame(list(self.iter_rows(run_id, limit=n)), columns=self.columns(run_id))
+
+    # ---------------- esportazioni in streaming ----------------
+    def export(self, run_id: str, path: str) -> str:
+        """Esporta su file, formato dall'estensione (xlsx/csv/json/parquet)."""
+        fmt = os.path.splitext(path)[1].lstrip(".").lower()
+        writer = {"xlsx": self._export_xlsx, "csv": self._export_csv,
+                  "json": self._export_json, "parquet": self._export_parquet}.get(fmt)
+        if writer is None:
+            raise ValueError(f"formato di esportazione non supportato: {fmt!r}")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".part"
+        with metrics.timer("results_export_seconds", format=fmt):
+            writer(run_id, tmp)
+        os.replace(tmp, path)
+        return path
+
+    def export_path(self, run_id: str, fmt: str, directory: str = EXPORT_DIR) -> str:
+        """File di esportazione del run, generato alla prima richiesta (i run conclusi non cambiano)."""
+        path = os.path.join(directory, f"{run_id}.{fmt}")
+        if not os.path.exists(path):
+            self.flush()
+            self.export(run_id, path)
+        return path
+
+    def drop_exports(self, run_id: str, directory: str = EXPORT_DIR) -> None:
+        """Elimina i file esportati del run (dopo nuove righe, es. merge della coda di job)."""
+        for fmt in EXPORT_FORMATS:
+            path = os.path.join(directory, f"{run_id}.{fmt}")
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _export_xlsx(self, run_id: str, path: str) -> None:
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(self.columns(run_id))
+        for row in self.iter_rows(run_id):
+            ws.append(row)
+        wb.save(path)
+
+    def _export_csv(self, run_id: str, path: str) -> None:
+        with open(path, "w", newline="", encoding="utf-8") as fh:
+            w = csv.writer(fh)
+            w.writerow(self.columns(run_id))
+            for row in self.iter_rows(run_id):
+                w.writerow(["" if v is None else v for v in row])
+
+    def _export_json(self, run_id: str, path: str) -> None:
+        cols = self.columns(run_id)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write("[")
+            for i, row in enumerate(self.iter_rows(run_id)):
+                fh.write(",\n" if i else "\n")
+                fh.write(json.dumps(dict(zip(cols, row)), ensure_ascii=False, default=str))
+            fh.write("\n]\n")
+
+    def _export_parquet(self, run_id: str, path: str) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        info = self.run_info(run_id)
+        cols = self.columns(run_id)
+        types = {"REAL": pa.float64(), "INTEGER": pa.int64(), "TEXT": pa.string()}
+        fields = []
+        for c in cols:
+            base = next((f for f in OUTPUT_FIELDS if c == f or c.startswith(f + "_")), None)
+            if c in info["input_columns"] or base is None:
+                fields.append(pa.field(c, pa.string()))   # colonne di input: testo (tipi eterogenei da Excel)
+            elif base == "needs_ocr":
+                fields.append(pa.field(c, pa.bool_()))
+            else:
+                fields.append(pa.field(c, types[FIELD_TYPES[base]]))
+        schema = pa.schema(fields)
+        text_cols = [i for i, f in enumerate(fields) if f.type == pa.string()]
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            batch: List[List[Any]] = []
+            for row in self.iter_rows(run_id):
+                for i in text_cols:
+                    if row[i] is not None and not isinstance(row[i], str):
+                        row[i] = str(row[i])
+                batch.append(row)
+                if len(batch) >= self.chunk_rows:
+                    writer.write_table(pa.Table.from_pylist([dict(zip(cols, r)) for r in batch], schema=schema))
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist([dict(zip(cols, r)) for r in batch], schema=schema))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Archivio risultati batch (SQLite)")
+    ap.add_argument("--db", default=DEFAULT_DB)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("runs", help="elenco dei run")
+    ex = sub.add_parser("export", help="esporta un run (formato dall'estensione)")
+    ex.add_argument("run_id")
+    ex.add_argument("path")
+    args = ap.parse_args(argv)
+    with ResultsStore(args.db) as store:
+        if args.cmd == "runs":
+            for r in store.runs():
+                when = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["created"]))
+                print(f"{r['run_id']}  {when}  anni={r['years']}  righe={r['rows']}  elaborate={r['processed']}")
+        else:
+            print(store.export(args.run_id, args.path))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
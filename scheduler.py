@@ -0,0 +1,206 @@
+"""
+Scheduler multi-target: carica tutti i target di `config/targets/*.json` e li esegue in parallelo
+con `semantic_crawler.crawl_and_classify(config)`, sotto un limite globale e uno per host.
+
+Chiavi di pianificazione nel file del target (rimosse prima di passare la config al crawler):
+- `priority` (int, default 0): i target con priorità più alta partono prima
+- `time_budget_s` (float): tempo massimo del target; allo scadere il target viene chiuso come timeout
+- `enabled` (bool, default true)
+
+Un file può contenere un target (oggetto) o una lista di target. I risultati arrivano in un unico
+JSONL man mano che i target finiscono: una riga per item (`"type": "item"`) e una riga di esito
+per target (`"type": "target"`, con status ok|timeout|error, secondi, numero di item ed eventuali
+`stats` e `host_stats` (esiti per host, stato del circuit breaker) restituite dal crawler).
+
+Senza semantic_crawler si usa crawler.crawl_for_pdfs_async (solo PDF; blacklist e parole chiave
+del target non sono applicate), interrotta allo scadere del budget.
+
+Uso:
+  python scheduler.py                                   # tutti i target, risultati su stdout
+  python scheduler.py --out results/targets.jsonl --concurrency 16 --per-host 2 --budget 300
+  python scheduler.py --only Estra --only Hera
+"""
+from __future__ import annotations
+import argparse, asyncio, glob, json, os, sys, time
+from typing import Awaitable, Callable, Dict, IO, List, Optional
+from urllib.parse import urljoin, urlparse
+
+import metrics
+
+TARGETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "targets")
+SCHEDULE_KEYS = ("priority", "time_budget_s", "enabled")
+DEFAULT_BUDGET = 600.0
+
+CrawlFn = Callable[[dict], Awaitable[dict]]
+
+
+def load_targets(directory: str = TARGETS_DIR) -> List[dict]:
+    """Target da tutti i *.json della cartella (nome di default: nome del file), ordine stabile."""
+    targets = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        items = data if isinstance(data, list) else [data]
+        for i, t in enumerate(items):
+            if not isinstance(t, dict) or not t.get("base_url"):
+                raise ValueError(f"{path}: target senza base_url")
+            t = dict(t)
+            t.setdefault("name", stem if len(items) == 1 else f"{stem}_{i}")
+            t["_source"] = path
+            targets.append(t)
+    return targets
+
+
+def host_key(target: dict) -> str:
+    """Chiave del limite per host: dominio registrabile della base_url."""
+    from crawler import _registrable
+    return _registrable(urlparse(target["base_url"]).netloc)
+
+
+def crawler_config(target: dict) -> dict:
+    """Config per il crawler: il target senza le chiavi di pianificazione."""
+    return {k: v for k, v in target.items() if k not in SCHEDULE_KEYS and not k.startswith("_")}
+
+
+def default_crawl_fn() -> CrawlFn:
+    """semantic_crawler.crawl_and_classify se installato, altrimenti crawler.crawl_for_pdfs_async."""
+    try:
+        from semantic_crawler.crawler_semantic import crawl_and_classify
+        return crawl_and_classify
+    except ImportError:
+        return _fallback_crawl
+
+
+async def _fallback_crawl(config: dict) -> dict:
+    from crawler import crawl_for_pdfs_async
+    base = config["base_url"]
+    seeds = [urljoin(base + "/", s) for s in (config.get("seeds") or ["/"])]
+    years = config.get("years_target") or [time.localtime().tm_year - 1]
+    out = await crawl_for_pdfs_async(seeds, list(years), max_pages=int(config.get("max_pages", 50)),
+                                     max_depth=int(config.get("max_depth", 4)))
+    items = [{"url": c["pdf"], "text": c["anchor"], "is_pdf": True, "from_page": c["via"], "years": c["years"]}
+             for c in out["candidates"]]
+    return {"items": items, "visited": out["visited"], "missing_years": out["missing_years"],
+            "host_stats": out["host_stats"]}
+
+
+class Scheduler:
+    """
+    Esegue i target al massimo `concurrency` alla volta e `per_host` per dominio: parte sempre il
+    target pendente con priorità più alta il cui host ha uno slot libero (un host saturo non blocca
+    gli altri). `on_result(record)` riceve item ed esiti appena disponibili.
+    """
+
+    def __init__(self, crawl_fn: Optional[CrawlFn] = None, concurrency: int = 8, per_host: int = 2,
+                 budget: float = DEFAULT_BUDGET, on_result: Optional[Callable[[dict], None]] = None):
+        self.crawl_fn = crawl_fn or default_crawl_fn()
+        self.concurrency = max(1, int(concurrency))
+        self.per_host = max(1, int(per_host))
+        self.budget = float(budget)
+        self.on_result = on_result or (lambda rec: None)
+
+    async def _run_one(self, target: dict) -> dict:
+        name = target["name"]
+        budget = float(target.get("time_budget_s") or self.budget)
+        t0 = time.perf_counter()
+        status, error, items, stats, host_stats = "ok", None, [], None, None
+        try:
+            out = await asyncio.wait_for(self.crawl_fn(crawler_config(target)), timeout=budget) or {}
+            items, stats, host_stats = list(out.get("items", [])), out.get("stats"), out.get("host_stats")
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"budget di {budget:g}s superato"
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - t0
+        metrics.inc("scheduler_targets_total", status=status)
+        metrics.observe("scheduler_target_seconds", seconds, status=status)
+        for it in items:
+            self.on_result({"type": "item", "target": name, **it})
+        summary = {"type": "target", "target": name, "status": status, "seconds": round(seconds, 3),
+                   "items": len(items), "priority": int(target.get("priority", 0)), "error": error}
+        if stats:
+            summary["stats"] = stats
+        if host_stats:
+            summary["host_stats"] = host_stats
+        self.on_result(summary)
+        return summary
+
+    async def run(self, targets: List[dict]) -> List[dict]:
+        """Esegue tutti i target abilitati; ritorna gli esiti in ordine di completamento."""
+        pending = [t for t in targets if t.get("enabled", True)]
+        # priorità più alta prima, a parità l'ordine dei file
+        pending.sort(key=lambda t: -int(t.get("priority", 0)))
+        busy: Dict[str, int] = {}
+        running: Dict[asyncio.Task, str] = {}
+        summaries: List[dict] = []
+        try:
+            while pending or running:
+                while len(running) < self.concurrency:
+                    nxt = next((t for t in pending if busy.get(host_key(t), 0) < self.per_host), None)
+                    if nxt is None:
+                        break
+                    pending.remove(nxt)
+                    host = host_key(nxt)
+                    busy[host] = busy.get(host, 0) + 1
+                    running[asyncio.ensure_future(self._run_one(nxt))] = host
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    host = running.pop(task)
+                    busy[host] -= 1
+                    summaries.append(task.result())
+        finally:
+            for task in running:
+                task.cancel()
+        return summaries
+
+
+class JsonlSink:
+    """Scrive ogni record su una riga JSON e fa flush subito (il file è leggibile durante il run)."""
+
+    def __init__(self, fh: IO[str]):
+        self.fh = fh
+
+    def __call__(self, record: dict) -> None:
+        self.fh.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.fh.flush()
+
+
+def run_targets(targets: List[dict], out: IO[str], **kwargs) -> List[dict]:
+    """Wrapper sincrono: esegue i target e scrive i risultati in JSONL su `out`."""
+    return asyncio.run(Scheduler(on_result=JsonlSink(out), **kwargs).run(targets))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Crawl parallela di tutti i target in config/targets")
+    ap.add_argument("--targets", default=TARGETS_DIR, help="cartella con i file *.json dei target")
+    ap.add_argument("--out", default="-", help="file JSONL dei risultati (default stdout)")
+    ap.add_argument("--concurrency", type=int, default=8, help="target in parallelo (globale)")
+    ap.add_argument("--per-host", type=int, default=2, help="target in parallelo per dominio")
+    ap.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="secondi per target (se non nel file)")
+    ap.add_argument("--only", action="append", default=[], help="esegue solo i target con questo nome")
+    args = ap.parse_args(argv)
+
+    targets = load_targets(args.targets)
+    if args.only:
+        targets = [t for t in targets if t["name"] in set(args.only)]
+    if not targets:
+        print("Nessun target da eseguire.", file=sys.stderr)
+        return 1
+    kwargs = dict(concurrency=args.concurrency, per_host=args.per_host, budget=args.budget)
+    if args.out == "-":
+        summaries = run_targets(targets, sys.stdout, **kwargs)
+    else:
+        if os.path.dirname(args.out):
+            os.makedirs(os.path.dirname(args.out), exist_ok=True)
+        with open(args.out, "a", encoding="utf-8") as fh:
+            summaries = run_targets(targets, fh, **kwargs)
+    by_status: Dict[str, int] = {}
+    for s in summaries:
+        by_status[s["status"]] = by_status.get(s["status"], 0) + 1
+    print(f"Target: {len(summaries)} " + " ".join(f"{k}={v}" for k, v in sorted(by_status.items())), file=sys.stderr)
+    return 0 if by_status.get("ok") else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,17 @@
 from __future__ import annotations
-import re
+import asyncio, os, re
 from urllib.parse import urlencode
 import httpx
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+import metrics
+import replay
+from aio_util import run_sync
+
+# QPS massimo verso la CSE (condiviso da tutte le query di un run) e richieste concorrenti
+CSE_QPS = float(os.environ.get("BILANCI_CSE_QPS", "5"))
+CSE_CONCURRENCY = int(os.environ.get("BILANCI_CSE_CONCURRENCY", "8"))
+CSE_MAX_ATTEMPTS = 5
 
 def normalize_company(name: str) -> str:
     """Rimuove suffissi societari comuni e normalizza la ragione sociale."""
@@ -20,8 +30,9 @@ def _google_cse_search(q: str, api_key: str, cx: str, num=10, gl="it", hl="it",
     """Esegue una query CSE e ritorna il JSON."""
     params = {"key": api_key, "cx": cx, "q": q, "num": num, "gl": gl, "hl": hl, "lr": lr, "safe": "off"}
     url = "https://www.googleapis.com/customsearch/v1?" + urlencode(params)
-    with httpx.Client(timeout=30, follow_redirects=True) as client:
-        r = client.get(url)
+    with httpx.Client(timeout=30, follow_redirects=True, **replay.client_kwargs()) as client:
+        with metrics.timer("cse_request_seconds"):
+            r = client.get(url)
         r.raise_for_status()
         return r.json()
 
@@ -34,27 +45,134 @@ def build_entrypoint_queries(company: str, year: int) -> list[str]:
         f'"{core}" (amministrazione trasparente OR trasparenza) {year} site:.it',
     ]
 
-def pick_entrypoints(company: str, year: int, api_key: str, cx: str, max_sites=5) -> list[str]:
-    """Ritorna una lista di URL HTML (pagine indice) dal dominio ufficiale."""
-    queries = build_entrypoint_queries(company, year)
+def _entry_candidates(data: dict) -> list[str]:
+    """Link HTML dai risultati che somigliano a pagine indice (investor/relazioni/bilanci/...)."""
+    out = []
+    for it in data.get("items", []):
+        link = it.get("link", "")
+        if not link or link.lower().endswith(".pdf"):
+            continue
+        # preferisci pagine indice: investor/relazioni/bilanci/trasparenza/financial/report
+        if any(k in link.lower() for k in [
+            "investor", "investitori", "relazioni", "bilanci",
+            "financial", "report", "amministrazione-trasparente"
+        ]):
+            out.append(link)
+    return out
+
+def _add_entrypoints(entry: list[str], seen_domains: set, links: list[str], max_sites: int) -> None:
+    for link in links:
+        dom = re.sub(r"^https?://", "", link).split("/")[0]
+        if dom not in seen_domains:
+            seen_domains.add(dom)
+            entry.append(link)
+        if len(entry) >= max_sites:
+            break
+
+
+# --------------------------------------------
+# Client async: query concorrenti entro un QPS, retry con backoff (429/5xx)
+# --------------------------------------------
+class RateLimiter:
+    """Intervallo minimo tra l'avvio di due richieste (QPS condiviso tra task)."""
+
+    def __init__(self, qps: float = CSE_QPS):
+        self.interval = 1.0 / qps if qps and qps > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code == 429 or code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+def _count_retry(state) -> None:
+    exc = state.outcome.exception() if state.outcome else None
+    status = exc.response.status_code if isinstance(exc, httpx.HTTPStatusError) else type(exc).__name__
+    metrics.inc("cse_retries_total", status=status)
+
+
+async def cse_query_async(client: httpx.AsyncClient, limiter: RateLimiter, params: dict,
+                          max_attempts: int = CSE_MAX_ATTEMPTS) -> dict:
+    """Una query CSE (params completi, key inclusa); retry con backoff esponenziale jitterato su 429/5xx/rete."""
+    url = "https://www.googleapis.com/customsearch/v1?" + urlencode(params)
+    async for attempt in AsyncRetrying(retry=retry_if_exception(_retryable),
+                                       wait=wait_random_exponential(multiplier=0.5, max=20),
+                                       stop=stop_after_attempt(max_attempts),
+                                       before_sleep=_count_retry, reraise=True):
+        with attempt:
+            await limiter.wait()
+            with metrics.timer("cse_request_seconds"):
+                r = await client.get(url)
+            r.raise_for_status()
+            return r.json()
+
+def _entry_params(q: str, api_key: str, cx: str, num=10, gl="it", hl="it", lr="lang_it") -> dict:
+    return {"key": api_key, "cx": cx, "q": q, "num": num, "gl": gl, "hl": hl, "lr": lr, "safe": "off"}
+
+def _async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=30, follow_redirects=True, **replay.client_kwargs(async_client=True))
+
+
+async def pick_entrypoints_async(company: str, year: int, api_key: str, cx: str, max_sites=5,
+                                 client: httpx.AsyncClient | None = None, limiter: RateLimiter | None = None) -> list[str]:
+    """
+    Come pick_entrypoints, con le query lanciate in parallelo. I risultati si consumano nell'ordine
+    delle query (stesso esito della versione sequenziale); raggiunti max_sites le query ancora
+    in attesa (es. ferme sul limite di QPS) vengono annullate e non consumano quota.
+    """
+    if client is None:
+        async with _async_client() as own:
+            return await pick_entrypoints_async(company, year, api_key, cx, max_sites, own, limiter)
+    limiter = limiter or RateLimiter()
+    tasks = [asyncio.ensure_future(cse_query_async(client, limiter, _entry_params(q, api_key, cx)))
+             for q in build_entrypoint_queries(company, year)]
     entry, seen_domains = [], set()
-    for q in queries:
-        data = _google_cse_search(q, api_key, cx)
-        for it in data.get("items", []):
-            link = it.get("link", "")
-            if not link or link.lower().endswith(".pdf"):
-                continue
-            # preferisci pagine indice: investor/relazioni/bilanci/trasparenza/financial/report
-            if any(k in link.lower() for k in [
-                "investor", "investitori", "relazioni", "bilanci",
-                "financial", "report", "amministrazione-trasparente"
-            ]):
-                dom = re.sub(r"^https?://", "", link).split("/")[0]
-                if dom not in seen_domains:
-                    seen_domains.add(dom)
-                    entry.append(link)
+    try:
+        for t in tasks:
+            _add_entrypoints(entry, seen_domains, _entry_candidates(await t), max_sites)
             if len(entry) >= max_sites:
                 break
-        if len(entry) >= max_sites:
-            break
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
     return entry
+
+
+async def search_many_async(queries: list[str], api_key: str, cx: str, num: int = 10,
+                            qps: float = CSE_QPS, concurrency: int = CSE_CONCURRENCY, **extra) -> list[list[dict] | Exception]:
+    """Query CSE libere in parallelo; per ciascuna la lista `items` (o l'eccezione finale)."""
+    limiter, sem = RateLimiter(qps), asyncio.Semaphore(max(1, concurrency))
+
+    async def one(q):
+        async with sem:
+            data = await cse_query_async(client, limiter, {"q": q, "key": api_key, "cx": cx, "num": num, **extra})
+            return data.get("items", [])
+
+    async with _async_client() as client:
+        return await asyncio.gather(*(one(q) for q in queries), return_exceptions=True)
+
+
+def pick_entrypoints(company: str, year: int, api_key: str, cx: str, max_sites=5) -> list[str]:
+    """Ritorna una lista di URL HTML (pagine indice) dal dominio ufficiale."""
+    return run_sync(pick_entrypoints_async(company, year, api_key, cx, max_sites=max_sites))
+
+def search_many(queries: list[str], api_key: str, cx: str, num: int = 10,
+                qps: float = CSE_QPS, concurrency: int = CSE_CONCURRENCY) -> dict[str, list[dict]]:
+    """{query: items} per query distinte, in parallelo; le query fallite restano fuori dal dizionario."""
+    uniq = list(dict.fromkeys(queries))
+    res = run_sync(search_many_async(uniq, api_key, cx, num=num, qps=qps, concurrency=concurrency))
+    return {q: r for q, r in zip(uniq, res) if isinstance(r, list)}
@@ -1,11 +1,16 @@
 # semantic_crawler/crawler_semantic.py
 import asyncio
+import time
 import httpx
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 from collections import deque
 
-from .matchers import classify, is_pdf, host_of
+import boilerplate
+import host_health
+import html_stream
+import metrics
+import replay
+from .matchers import classify, is_pdf, host_of, years_in
 
 DEFAULT_TIMEOUT = 15.0
 
@@ -15,27 +20,55 @@ def normalize_base(base_url: str) -> str:
 def same_site(url: str, base: str) -> bool:
     return urlparse(url).netloc.lower().endswith(urlparse(base).netloc.lower())
 
-async def fetch_text(client: httpx.AsyncClient, url: str) -> tuple[int, str, str]:
+async def _stream(client: httpx.AsyncClient, url: str, host_stats: dict | None, **kwargs) -> dict | None:
+    # host con circuito aperto: nessuna richiesta; timeout adattato alla latenza dell'host
+    if not host_health.allow(url):
+        if host_stats is not None:
+            host_health.tally(host_stats, url, "circuit_open")
+        return None
+    t0 = time.perf_counter()
     try:
-        r = await client.get(url, timeout=DEFAULT_TIMEOUT, follow_redirects=True)
-        ctype = r.headers.get("content-type", "")
-        text = r.text if "text/html" in ctype.lower() else ""
-        return r.status_code, ctype, text
-    except Exception:
+        page = await html_stream.stream_html(client, url, timeout=host_health.timeout_for(url, DEFAULT_TIMEOUT),
+                                             follow_redirects=True, **kwargs)
+    except Exception as e:
+        metrics.record_fetch(url, time.perf_counter() - t0, error=True)
+        host_health.record_error(url, time.perf_counter() - t0, e, host_stats)
+        return None
+    metrics.record_fetch(url, time.perf_counter() - t0, page["nbytes"])
+    host_health.record_response(url, time.perf_counter() - t0, page["status"], host_stats)
+    return page
+
+async def fetch_text(client: httpx.AsyncClient, url: str, host_stats: dict | None = None) -> tuple[int, str, str]:
+    # HTML letto fino a html_stream.MAX_HTML_BYTES; corpo non HTML non scaricato
+    page = await _stream(client, url, host_stats, keep_html=True)
+    if page is None:
         return 0, "", ""
+    return page["status"], page["content_type"], page["html"] or ""
 
-def extract_links(base_url: str, html: str) -> list[tuple[str, str]]:
-    soup = BeautifulSoup(html, "html.parser")
+async def fetch_links(client: httpx.AsyncClient, url: str, on_links=None,
+                      host_stats: dict | None = None) -> tuple[int, str, list[tuple[str, str]]]:
+    # link assoluti della pagina; on_links(blocco) li riceve mentre la pagina arriva (True = basta leggere)
+    cb = (lambda links: on_links(_absolute(url, links))) if on_links else None
+    page = await _stream(client, url, host_stats, on_links=cb)
+    if page is None:
+        return 0, "", []
+    return page["status"], page["content_type"], _absolute(url, page["links"])
+
+def _absolute(base_url: str, links) -> list[tuple[str, str]]:
     out = []
-    for a in soup.select("a[href]"):
-        href = a.get("href", "").strip()
+    for href, txt in links:
         if not href or href.startswith("#") or href.lower().startswith("javascript:"):
             continue
-        full = urljoin(base_url + "/", href)
-        txt = (a.get_text() or "").strip()
-        out.append((full, txt))
+        out.append((urljoin(base_url + "/", href), txt))
     return out
 
+def extract_links(base_url: str, html: str) -> list[tuple[str, str]]:
+    parser = html_stream.LinkParser()
+    with metrics.timer("html_parse_seconds"):
+        parser.feed(html)
+        parser.close()
+    return _absolute(base_url, parser.drain())
+
 async def crawl_and_classify(config: dict) -> dict:
     base = normalize_base(config["base_url"])
     seeds = [urljoin(base + "/", s) for s in config.get("seeds", [])]
@@ -44,42 +77,66 @@ async def crawl_and_classify(config: dict) -> dict:
     max_pages = int(config.get("max_pages", 60))
     top_n = int(config.get("top_n_links", 20))
     ua = config.get("user_agent", "EstraSemanticCrawler/1.0")
+    years = [int(y) for y in config.get("years_target", [])] or None
 
     visited = set()
     q = deque([(s, 0) for s in seeds])
     results = []
+    host_stats: dict = {}
+    # header/footer/menu ripetuti: classificati e accodati solo dalla prima pagina che li mostra
+    templates = boilerplate.SiteTemplates()
+    site = urlparse(base).netloc.lower()
 
     headers = {"User-Agent": ua, "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8"}
 
-    async with httpx.AsyncClient(headers=headers) as client:
+    async with httpx.AsyncClient(headers=headers, **replay.client_kwargs(async_client=True)) as client:
         pages_count = 0
         while q and pages_count < max_pages and len(results) < top_n:
             url, depth = q.popleft()
             if url in visited or depth > max_depth:
                 continue
             visited.add(url)
-            status, ctype, html = await fetch_text(client, url)
+            scoring = [0.0]
+            template = templates.page(site, url)
+            content: list[tuple[str, str]] = []
+
+            # Classifica i link a blocchi, mentre la pagina arriva; ai top N si smette di leggere
+            def classify_links(links) -> bool:
+                t_score = time.perf_counter()
+                content.extend(links)
+                for href, txt in links:
+                    cat, conf = classify(href, txt, allow_hosts, years)
+                    results.append({
+                        "url": href,
+                        "text": txt,
+                        "category": cat,
+                        "confidence": conf,
+                        "host": host_of(href),
+                        "is_pdf": is_pdf(href),
+                        "years": years_in(href + " " + txt, years),
+                        "from_page": url
+                    })
+                    if len(results) >= top_n:
+                        break
+                scoring[0] += time.perf_counter() - t_score
+                return len(results) >= top_n
+
+            status, ctype, _ = await fetch_links(client, url, lambda links: classify_links(template.feed(links)),
+                                                 host_stats)
+            if status == 0:
+                template.discard()   # fetch fallito: il template resta da valutare su un'altra pagina
+            else:
+                rest = template.close()
+                if rest and len(results) < top_n:
+                    classify_links(rest)
+            links = content
             pages_count += 1
+            if scoring[0]:
+                metrics.observe("link_scoring_seconds", scoring[0])
 
             # Salta non-HTML
-            if status != 200 or "text/html" not in ctype.lower() or not html:
+            if status != 200 or "text/html" not in ctype.lower() or not links:
                 continue
-            links = extract_links(url, html)
-
-            # Classifica i link appena estratti
-            for href, txt in links:
-                cat, conf = classify(href, txt, allow_hosts)
-                results.append({
-                    "url": href,
-                    "text": txt,
-                    "category": cat,
-                    "confidence": conf,
-                    "host": host_of(href),
-                    "is_pdf": is_pdf(href),
-                    "from_page": url
-                })
-                if len(results) >= top_n:
-                    break
 
             # Enqueue navigazione interna (solo stesso sito)
             if depth < max_depth:
@@ -99,9 +156,17 @@ async def crawl_and_classify(config: dict) -> dict:
         -r["confidence"]
     ))
 
+    # Multi-anno: miglior PDF per ciascun anno target, da una sola crawl
+    best_by_year = {}
+    for y in years or []:
+        pdfs = [r for r in results if r["is_pdf"] and y in r["years"]]
+        best_by_year[y] = max(pdfs, key=lambda r: r["confidence"]) if pdfs else None
+
     return {
         "ok": True,
         "scanned_pages": len(visited),
         "returned": len(results),
-        "items": results[:top_n]
+        "items": results[:top_n],
+        "best_by_year": best_by_year,
+        "host_stats": host_health.summary(host_stats),
     }
@@ -1,7 +1,9 @@
 # semantic_crawler/matchers.py
 import re
+from functools import lru_cache
 from urllib.parse import urlparse
 
+# Anni di default se il target non specifica `years_target`
 YEAR_RE = re.compile(r"\b(2023|2024)\b")
 # Parole chiave principali
 KW_BIL = [
@@ -20,7 +22,21 @@ def is_pdf(url: str) -> bool:
 def host_of(url: str) -> str:
     return urlparse(url).netloc.lower()
 
-def score_link(href: str, anchor_text: str, path_hint: str = "") -> int:
+@lru_cache(maxsize=64)
+def _year_re_for(years: tuple) -> re.Pattern:
+    return re.compile(r"(?<!\d)(" + "|".join(str(int(y)) for y in years) + r")(?!\d)")
+
+def year_re(years=None) -> re.Pattern:
+    """Regex degli anni target (es. `years_target` della config); YEAR_RE se non indicati."""
+    if not years:
+        return YEAR_RE
+    return _year_re_for(tuple(sorted({int(y) for y in years})))
+
+def years_in(text: str, years=None) -> list[int]:
+    """Anni target citati nel testo (ordine decrescente)."""
+    return sorted({int(y) for y in year_re(years).findall(text or "")}, reverse=True)
+
+def score_link(href: str, anchor_text: str, path_hint: str = "", years=None) -> int:
     """
     Restituisce uno score 0-100 in base a parole chiave/anno nel link o nel testo ancora.
     """
@@ -30,7 +46,8 @@ def score_link(href: str, anchor_text: str, path_hint: str = "") -> int:
 
     score = 0
     # Anno target
-    if YEAR_RE.search(h) or YEAR_RE.search(a):
+    yre = year_re(years)
+    if yre.search(h) or yre.search(a):
         score += 25
 
     # Bilancio / RFA
@@ -56,11 +73,11 @@ def score_link(href: str, anchor_text: str, path_hint: str = "") -> int:
 
     return min(score, 100)
 
-def classify(href: str, anchor_text: str, allow_hosts: list[str]) -> tuple[str, int]:
+def classify(href: str, anchor_text: str, allow_hosts: list[str], years=None) -> tuple[str, int]:
     """
     Ritorna (categoria, confidenza)
     """
-    s = score_link(href, anchor_text)
+    s = score_link(href, anchor_text, years=years)
     host = host_of(href)
     pdf = is_pdf(href)
 
@@ -0,0 +1,127 @@
+"""
+Single-flight: richieste uguali (stessa pagina, stesso PDF, stesso contenuto) in corso nello stesso
+momento o ripetute a breve distanza condividono un'unica operazione e il suo risultato.
+
+Chiavi tipiche: URL canonico (pagine e download) e hash SHA-256 del contenuto PDF (estrazione/OCR:
+30 controllate che puntano al bilancio consolidato del gruppo → un solo download e un solo OCR).
+
+I gruppi sono per processo (`group(name)`), quindi condivisi anche tra sessioni Streamlit.
+"""
+from __future__ import annotations
+import hashlib, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import metrics
+
+# parametri di tracking che non cambiano la risorsa
+_TRACKING_PREFIXES = ("utm_",)
+_TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga"}
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+def canonical_url(url: str) -> str:
+    """URL normalizzato: schema/host minuscoli, senza porta di default, frammento e parametri di tracking."""
+    try:
+        p = urlsplit(str(url).strip())
+    except Exception:
+        return str(url)
+    scheme = (p.scheme or "http").lower()
+    host = (p.hostname or "").lower()
+    if p.port and str(p.port) != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{p.port}"
+    qs = sorted((k, v) for k, v in parse_qsl(p.query, keep_blank_values=True)
+                if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith(_TRACKING_PREFIXES))
+    return urlunsplit((scheme, host, p.path or "/", urlencode(qs), ""))
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class _Call:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    do(key, fn): il primo chiamante (leader) esegue fn, gli altri con la stessa chiave attendono e
+    ricevono lo stesso risultato (o la stessa eccezione). Con ttl > 0 il risultato resta disponibile
+    per ttl secondi (al massimo max_results voci, LRU) se `keep(value)` lo consente.
+    """
+
+    def __init__(self, name: str, ttl: float = 0.0, max_results: int = 128,
+                 keep: Optional[Callable[[Any], bool]] = None):
+        self.name = name
+        self.ttl = ttl
+        self.max_results = max_results
+        self.keep = keep or (lambda v: v is not None)
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, _Call] = {}
+        self._results: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            hit = self._results.get(key)
+            if hit is not None:
+                if time.monotonic() - hit[0] <= self.ttl:
+                    self._results.move_to_end(key)
+                    metrics.inc("singleflight_total", group=self.name, result="reused")
+                    return hit[1]
+                del self._results[key]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("singleflight_total", group=self.name, result="shared")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        metrics.inc("singleflight_total", group=self.name, result="leader")
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                if call.error is None and self.ttl > 0 and self.keep(call.value):
+                    self._results[key] = (time.monotonic(), call.value)
+                    while len(self._results) > self.max_results:
+                        self._results.popitem(last=False)
+            call.event.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def group(name: str, **kwargs) -> SingleFlight:
+    """Gruppo single-flight di processo (creato al primo uso con i parametri indicati)."""
+    with _groups_lock:
+        g = _groups.get(name)
+        if g is None:
+            g = _groups[name] = SingleFlight(name, **kwargs)
+        return g
+
+
+def clear_all() -> None:
+    with _groups_lock:
+        for g in _groups.values():
+            g.clear()
@@ -0,0 +1,206 @@
+"""
+Wrapper memoizzati (st.cache_data) condivisi tra app e pagine: un rerun di Streamlit
+(cambio di radio, download, ecc.) non deve mai rifare lavoro di rete, parsing o OCR.
+
+Le chiavi sono i parametri delle funzioni; TTL e numero massimo di voci per cache.
+Hit/miss finiscono nelle metriche (`cache_requests_total{cache=...}`), visibili in Diagnostics.
+Senza Streamlit (worker della coda, CLI) le funzioni si chiamano direttamente, senza memoizzazione:
+restano la deduplicazione single-flight e un solo pool PDF per processo.
+"""
+from __future__ import annotations
+import functools
+import inspect
+from typing import Any, Callable, Optional
+
+try:
+    import streamlit as st
+except ImportError:
+    st = None
+
+import metrics
+import singleflight
+
+CACHE_TTL = 6 * 3600          # risultati di crawl/ricerca validi per 6 ore
+PDF_CACHE_TTL = 24 * 3600     # testo estratto dai PDF (incl. OCR) per 24 ore
+
+# tutte le cache create da memoized (anche in altri moduli), per clear_all()
+_REGISTRY: list = []
+
+
+class _Uncacheable(Exception):
+    """Usata per non memorizzare risultati vuoti (es. errori di rete già inghiottiti)."""
+    def __init__(self, value):
+        self.value = value
+
+
+def memoized(name: str, ttl: int = CACHE_TTL, max_entries: int = 256, cache_empty: bool = True,
+             cache_if: Optional[Callable[[Any], bool]] = None):
+    """
+    Decoratore: st.cache_data con metriche hit/miss. Con cache_empty=False i risultati vuoti
+    (None, [], {}) non vengono memorizzati e la chiamata successiva riprova; lo stesso per i
+    risultati per cui `cache_if(risultato)` è falso (es. crawl fallite per errori di rete).
+    """
+    def deco(fn):
+        misses = [0]
+
+        def _cached(*args, **kwargs):
+            misses[0] += 1
+            out = fn(*args, **kwargs)
+            if (not cache_empty and not out) or (cache_if is not None and not cache_if(out)):
+                raise _Uncacheable(out)
+            return out
+
+        # st.cache_data distingue le funzioni per modulo+qualname+sorgente: ogni wrapper ha il suo nome;
+        # la firma originale fa sì che i parametri "_x" restino esclusi dalla chiave
+        _cached.__module__ = fn.__module__
+        _cached.__qualname__ = f"memoized_{name}_{fn.__qualname__}"
+        _cached.__signature__ = inspect.signature(fn)
+        if st is not None:
+            cached = st.cache_data(ttl=ttl, max_entries=max_entries, show_spinner=False)(_cached)
+        else:
+            cached = _direct(_cached)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            before = misses[0]
+            try:
+                out = cached(*args, **kwargs)
+            except _Uncacheable as e:
+                out = e.value
+            metrics.cache_access(name, misses[0] == before)
+            return out
+
+        wrapper.clear = cached.clear
+        _REGISTRY.append(cached)
+        return wrapper
+    return deco
+
+
+def _direct(fn):
+    def call(*args, **kwargs):
+        return fn(*args, **kwargs)
+    call.clear = lambda: None
+    return call
+
+
+# risorse condivise dalle sessioni (senza Streamlit: una per processo)
+_resource = st.cache_resource(show_spinner=False) if st is not None else functools.lru_cache(maxsize=None)
+
+
+def clear_all() -> None:
+    """Svuota ogni cache memoized (ricerche, scoperta, crawl, testo PDF) e i risultati single-flight."""
+    for cached in _REGISTRY:
+        cached.clear()
+    singleflight.clear_all()
+
+
+@_resource
+def extraction_pool():
+    """Pool di worker per l'estrazione testo PDF, uno per processo Streamlit (config da BILANCI_PDF_*)."""
+    from pdf_pool import pool_from_env
+    return pool_from_env()
+
+
+@_resource
+def results_store():
+    """Archivio SQLite dei risultati batch, condiviso dalle sessioni (percorso da BILANCI_RESULTS_DB)."""
+    from results_store import ResultsStore
+    return ResultsStore()
+
+
+@_resource
+def job_queue():
+    """Coda di job del batch per i worker (percorso da BILANCI_QUEUE_DB)."""
+    from job_queue import JobQueue
+    return JobQueue()
+
+
+# --------------------------------------------
+# Wrapper per crawler.py / search_cse.py / pdf_extract.py (import lazy dentro le funzioni)
+# --------------------------------------------
+@memoized("pick_entrypoints", cache_empty=False)
+def pick_entrypoints(company: str, year: int, api_key: str, cx: str, max_sites: int = 5) -> list:
+    from search_cse import pick_entrypoints as _pick
+    return _pick(company, year, api_key, cx, max_sites=max_sites)
+
+
+@memoized("discover_entrypoints", cache_empty=False)
+def discover_entrypoints(company: str, max_sites: int = 5) -> list:
+    from discovery import discover
+    return discover(company, max_sites=max_sites)
+
+
+def _crawl_clean(out: dict) -> bool:
+    """Nessun errore di rete, timeout o circuito aperto durante la crawl (host_stats)."""
+    return not any(d.get(k) for d in (out.get("host_stats") or {}).values()
+                   for k in ("error", "timeout", "circuit_open"))
+
+
+# crawl senza PDF o con host in errore: non memorizzate, il rerun successivo riprova
+@memoized("crawl_for_pdf", cache_if=lambda out: out.get("pdf") is not None and _crawl_clean(out))
+def crawl_for_pdf(entry_urls: tuple, year: int, max_pages: int = 50, max_depth: int = 4,
+                  mode: str = "first", top_k: int = 5, concurrency: Optional[int] = None) -> dict:
+    from crawler import CRAWL_CONCURRENCY, crawl_for_pdf as _crawl
+    return _crawl(list(entry_urls), year, max_pages=max_pages, max_depth=max_depth, mode=mode, top_k=top_k,
+                  concurrency=concurrency or CRAWL_CONCURRENCY)
+
+
+@memoized("crawl_for_pdfs", cache_if=lambda out: any((out.get("by_year") or {}).values()) and _crawl_clean(out))
+def crawl_for_pdfs(entry_urls: tuple, years: tuple, max_pages: int = 50, max_depth: int = 4) -> dict:
+    from crawler import crawl_for_pdfs as _crawl
+    return _crawl(list(entry_urls), list(years), max_pages=max_pages, max_depth=max_depth)
+
+
+def fetch_pdf_pages(url: str, ocr: bool = True, dpi: int = 200, lang: str = "ita", keywords: tuple = ()) -> dict:
+    """
+    Download + testo per pagina (OCR se serve e se richiesto), memorizzato per URL canonico;
+    richieste concorrenti dello stesso URL condividono un solo download/estrazione.
+    Con `keywords` l'OCR è adattivo: alta risoluzione solo attorno alle keyword.
+    Ritorna {"downloaded": bool, "pages": [...], "needs_ocr": bool, "ocr": bool, "bytes": int, "error": str|None}.
+    """
+    canon = singleflight.canonical_url(url)
+    args = (canon, bool(ocr), int(dpi), lang, tuple(keywords))
+    return singleflight.group("pdf_url").do(args, lambda: _pdf_pages_for_url(*args))
+
+
+def _clear_pdf_caches() -> None:
+    _pdf_pages_for_url.clear()
+    _pdf_pages_for_content.clear()
+
+fetch_pdf_pages.clear = _clear_pdf_caches
+
+
+@memoized("pdf_text", ttl=PDF_CACHE_TTL, max_entries=64)
+def _pdf_pages_for_url(url: str, ocr: bool, dpi: int, lang: str, keywords: tuple) -> dict:
+    from pdf_extract import download_binary
+    data = download_binary(url)
+    if not data:
+        # download fallito: non memorizzato, si riprova al prossimo run
+        raise _Uncacheable({"downloaded": False, "pages": [], "needs_ocr": False, "bytes": 0, "error": None})
+    # stesso contenuto da URL diversi (es. bilancio di gruppo linkato dalle controllate): estratto una volta
+    digest = singleflight.content_key(data)
+    args = (digest, ocr, dpi, lang, keywords)
+    res = singleflight.group("pdf_content").do(args, lambda: _pdf_pages_for_content(*args, _data=data))
+    return {**res, "bytes": len(data), "sha256": digest}
+
+
+@memoized("pdf_text_content", ttl=PDF_CACHE_TTL, max_entries=64)
+def _pdf_pages_for_content(digest: str, ocr: bool, dpi: int, lang: str, keywords: tuple, _data: bytes = b"") -> dict:
+    """Estrazione (pool di worker) + OCR per hash del contenuto; `_data` è escluso dalla chiave."""
+    from pdf_extract import ocr_available, ocr_pdf_pages, ocr_pdf_pages_adaptive
+    res = extraction_pool().extract(_data)
+    pages, needs_ocr, used_ocr = res["pages"], res["needs_ocr"], False
+    if res["error"] is not None:
+        # PDF patologico (timeout/memoria/crash): memorizzato anche l'esito, niente OCR né nuovi tentativi
+        return {"downloaded": True, "pages": [], "needs_ocr": False, "error": res["error"]}
+    if needs_ocr and ocr and ocr_available():
+        try:
+            if keywords:
+                ocr_pages = ocr_pdf_pages_adaptive(_data, list(keywords), lang=lang)
+            else:
+                ocr_pages = ocr_pdf_pages(_data, dpi=dpi, lang=lang)
+            if any(p.strip() for p in ocr_pages):
+                pages, needs_ocr, used_ocr = ocr_pages, False, True
+        except Exception:
+            pass
+    return {"downloaded": True, "pages": pages, "needs_ocr": needs_ocr, "error": None, "ocr": used_ocr}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# moduli top-level del repository importabili da tests/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,58 @@
+"""PDF minimi costruiti a mano per i test (una pagina per testo, xref corretta) e risposte Range."""
+import re
+import zlib
+
+import httpx
+
+
+def make_pdf(pages, info=None, compress=False, pad=0):
+    """
+    `pages`: testo di ogni pagina (Helvetica, una riga); `info`: voci del dizionario /Info, valori
+    già in sintassi PDF (es. "(Bilancio 2023)" o "<FEFF...>"); `compress`: stream FlateDecode;
+    `pad`: byte di commento dopo la prima pagina (per file più grandi della sonda).
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+    info = info if info is not None else {"Producer": "(LibreOffice 7.5)"}
+    n = len(pages)
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(n))
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode()]
+    font = 3 + 2 * n
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+        filt = b""
+        if compress:
+            stream, filt = zlib.compress(stream), b" /Filter /FlateDecode"
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R"
+                    f" /Resources << /Font << /F1 {font} 0 R >> >> >>".encode())
+        objs.append(b"<< /Length %d%s >>\nstream\n" % (len(stream), filt) + stream + b"\nendstream")
+    objs.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    objs.append(b"<< " + b" ".join(f"/{k} {v}".encode("latin-1") for k, v in info.items()) + b" >>")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+        if i == 4 and pad:
+            out += b"%" + b"x" * pad + b"\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objs) + 1, len(objs), xref)
+    return bytes(out)
+
+
+def range_response(request, data, content_type="application/pdf", ranges=True):
+    """Risposta a una GET con Range (`bytes=a-b` o `bytes=-n`); con ranges=False il Range è ignorato."""
+    headers = {"content-type": content_type}
+    m = re.match(r"bytes=(\d*)-(\d*)$", request.headers.get("range", ""))
+    if not ranges or not m:
+        return httpx.Response(200, headers=headers, content=data)
+    n = len(data)
+    if m.group(1):
+        start, end = int(m.group(1)), min(n - 1, int(m.group(2) or n - 1))
+    else:
+        start, end = max(0, n - int(m.group(2))), n - 1
+    headers["content-range"] = f"bytes {start}-{end}/{n}"
+    return httpx.Response(206, headers=headers, content=data[start:end + 1])
@@ -0,0 +1,125 @@
+import asyncio
+
+import httpx
+import pytest
+
+import boilerplate
+import crawler
+import replay
+from crawl_trace import CrawlTrace
+from semantic_crawler.crawler_semantic import crawl_and_classify
+
+MENU = [(f"https://s.it/menu/{i}", f"Voce {i}") for i in range(8)]
+FOOTER = [(f"https://s.it/legal/{i}", f"Legal {i}") for i in range(4)]
+
+
+def feed_page(templates, url, links, block=3):
+    page = templates.page("s.it", url)
+    out = []
+    for i in range(0, len(links), block):
+        out += page.feed(links[i:i + block])
+    return out + page.close()
+
+
+def test_first_page_keeps_everything_later_pages_only_content():
+    t = boilerplate.SiteTemplates(3)
+    first = MENU + [("https://s.it/a1", "Articolo")] + FOOTER
+    assert feed_page(t, "https://s.it/a", first) == first
+    content = [("https://s.it/bilanci", "Bilanci"), ("https://s.it/b2", "Altro")]
+    assert feed_page(t, "https://s.it/b", MENU + content + FOOTER) == content
+
+
+def test_isolated_repeats_and_other_sites_pass():
+    t = boilerplate.SiteTemplates(3)
+    feed_page(t, "https://s.it/a", MENU)
+    # meno di 3 link consecutivi in comune: non è un blocco di template
+    page = [MENU[0], ("https://s.it/x", "x"), MENU[1], ("https://s.it/y", "y")]
+    assert feed_page(t, "https://s.it/b", page) == page
+    other = t.page("altro.it", "https://altro.it/")
+    assert other.feed(MENU) + other.close() == MENU
+
+
+def test_links_are_held_back_until_their_shingles_are_complete():
+    t = boilerplate.SiteTemplates(3)
+    p = t.page("s.it", "https://s.it/a")
+    assert p.feed(MENU[:2]) == []
+    assert p.feed(MENU[2:3]) == MENU[:1]
+    assert p.close() == MENU[1:3]
+
+
+def test_concurrent_pages_recognise_each_other():
+    t = boilerplate.SiteTemplates(3)
+    a, b = t.page("s.it", "https://s.it/a"), t.page("s.it", "https://s.it/b")
+    kept_a = a.feed(MENU[:4])
+    kept_b = b.feed(MENU[:4])
+    kept_a += a.feed(MENU[4:]) + a.close()
+    kept_b += b.feed(MENU[4:]) + b.close()
+    assert kept_a == MENU
+    assert kept_b == []
+
+
+def test_failed_page_withdraws_its_shingles():
+    t = boilerplate.SiteTemplates(3)
+    broken = t.page("s.it", "https://s.it/broken")
+    delivered = broken.feed(MENU[:5])
+    broken.discard()
+    assert delivered == MENU[:3]
+    assert feed_page(t, "https://s.it/ok", MENU) == MENU
+
+
+def test_skipped_links_are_reported():
+    t = boilerplate.SiteTemplates(3)
+    feed_page(t, "https://s.it/a", MENU)
+    skipped = []
+    p = t.page("s.it", "https://s.it/b", on_skip=skipped.append)
+    assert p.feed(MENU) + p.close() == []
+    assert skipped == MENU
+
+
+def test_disabled_with_zero_shingle():
+    t = boilerplate.SiteTemplates(0)
+    feed_page(t, "https://s.it/a", MENU)
+    assert feed_page(t, "https://s.it/b", MENU) == MENU
+
+
+def _page(links):
+    body = "".join(f'<a href="{u}">{txt}</a>' for u, txt in links)
+    return httpx.Response(200, html=f"<html><body>{body}</body></html>")
+
+
+@pytest.fixture
+def site(monkeypatch):
+    menu = [(f"/menu/{i}.html", f"Voce {i}") for i in range(30)]
+    pages = {
+        "/": menu + [("/investor.html", "Investor relations")],
+        "/investor.html": menu + [("/bilanci.html", "Bilanci e relazioni")],
+        "/bilanci.html": menu + [("/bilancio_2023.pdf", "Bilancio 2023")],
+    }
+
+    def handler(request):
+        path = request.url.path
+        if path.endswith(".pdf"):
+            return httpx.Response(200, headers={"content-type": "application/pdf"}, content=b"%PDF-1.4")
+        return _page(pages.get(path, menu))
+
+    monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(handler)})
+    return menu
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_crawl_pushes_template_links_once(site, concurrency):
+    trace = CrawlTrace()
+    out = crawler.crawl_for_pdf(["https://estra.test/"], 2023, max_pages=10, concurrency=concurrency, trace=trace)
+    assert out["pdf"] == "https://estra.test/bilancio_2023.pdf"
+    pushes = [e["url"] for e in trace.events if e["event"] == "push"]
+    menu_pushes = [u for u in pushes if "/menu/" in u]
+    assert len(menu_pushes) == len(site)
+    assert trace.summary()["skip_reasons"]["boilerplate"] >= len(site)
+
+
+def test_semantic_crawler_classifies_template_links_once(site):
+    out = asyncio.run(crawl_and_classify({"base_url": "https://estra.test", "seeds": ["/"], "max_depth": 3,
+                                       "max_pages": 40, "top_n_links": 500, "years_target": [2023]}))
+    urls = [it["url"] for it in out["items"]]
+    assert len([u for u in urls if "/menu/" in u]) == len(site)
+    assert "https://estra.test/bilancio_2023.pdf" in urls
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+import corpus_index
+import metrics
+from corpus_index import CorpusIndex, keyword_query
+from pdf_extract import DocumentIndex
+from results_store import ResultsStore
+
+ESTRA = "https://estra.it/bilancio_2023.pdf"
+HERA = "https://gruppohera.it/bilancio_2023.pdf"
+
+
+@pytest.fixture
+def index(tmp_path):
+    with CorpusIndex(str(tmp_path / "corpus.sqlite")) as idx:
+        idx.add_document(ESTRA, ["Relazione sulla gestione e attività del gruppo",
+                                 "Costo del personale 456.789 euro",
+                                 "Lavoratori somministrati 42"], "Estra S.p.A.", [2023])
+        idx.add_document(HERA, ["Costo del personale 1.234.567 euro", "Nessun somministrato"], "Hera", [2023, 2022])
+        yield idx
+
+
+def counter(name):
+    return sum(c["value"] for c in metrics.snapshot()["counters"] if c["name"] == name)
+
+
+def test_keyword_query():
+    assert keyword_query(["costo del personale", "", "somministrati"]) == \
+        '"costo" + "del" + "personale"* OR "somministrati"*'
+
+
+def test_add_document_writes_once_and_replaces_on_ocr(index):
+    assert not index.add_document(ESTRA, ["Relazione", "x", "y"], "Estra S.p.A.", [2023])   # stesso numero di pagine
+    assert index.add_document(ESTRA, ["Testo OCR nuovo", "x", "y"], "Estra S.p.A.", [2023], ocr=True)
+    assert [h["page"] for h in index.search("ocr")] == [1]
+    assert index.search("relazione") == []
+    assert index.stats() == {"documents": 2, "pages": 5, "ocr_documents": 1, "companies": 2}
+
+
+def test_pages_without_text_are_not_indexed(index):
+    assert not index.add_document("https://x.it/scan.pdf", ["", "  "], "X", [2023])
+    assert index.document_pages("https://x.it/scan.pdf") is None
+
+
+def test_search_ranks_filters_and_folds_diacritics(index):
+    hits = index.search('"costo del personale"')
+    assert {h["url"] for h in hits} == {ESTRA, HERA}
+    assert "«costo del personale»" in hits[0]["snippet"].lower()
+    assert [h["page"] for h in index.search("attivita")] == [1]          # "attività"
+    only = index.search('"costo del personale"', company="estra s.p.a.", year=2023)
+    assert [(h["url"], h["companies"], h["years"]) for h in only] == [(ESTRA, ["Estra S.p.A."], [2023])]
+    assert index.search("personale", year=2021) == []
+
+
+def test_find_values_per_document(index):
+    found = {r["url"]: r for r in index.find_values(["costo del personale", "somministrati"])}
+    estra = found[ESTRA]["values"]
+    assert (estra["costo del personale"]["value"], estra["costo del personale"]["page"]) == ("456.789", 2)
+    assert (estra["somministrati"]["value"], estra["somministrati"]["page"]) == ("42", 3)
+    assert found[HERA]["values"]["costo del personale"]["value"] == "1.234.567"
+    assert found[HERA]["years"] == [2023, 2022]
+    assert [r["url"] for r in index.find_values(["somministrati"], company="Hera")] == []
+
+
+def test_sparse_lookup_matches_full_document(tmp_path):
+    filler = "testo " * 400
+    pages = [filler, filler + "Organico medio", "1.250 unità " + filler, filler, "Dividendi " + filler]
+    with CorpusIndex(str(tmp_path / "c.sqlite")) as idx:
+        idx.add_document("https://a.it/r.pdf", pages, "A", [2023])
+        sparse = idx.find_values(["organico medio", "dividendi"])[0]["values"]
+    full = DocumentIndex(pages).find_values(["organico medio", "dividendi"])
+    assert sparse["organico medio"]["value"] == full["organico medio"]["value"] == "1.250"
+    assert sparse["organico medio"]["page"] == full["organico medio"]["page"] == 3
+    assert sparse["dividendi"] is None and full["dividendi"] is None
+
+
+def test_document_index_is_refreshed_after_reindexing(index):
+    first = index.document_index(HERA)
+    assert index.document_index(HERA) is first
+    index.add_document(HERA, ["Costo del personale 97", "b"], "Hera", [2023], sha256="nuovo")
+    assert index.document_index(HERA).lookup("costo del personale")["value"] == "97"
+    assert index.document_index("https://assente.it/x.pdf") is None
+
+
+def test_requery_recomputes_values_without_network(index, tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    run_id = store.new_run(["name"], [2023])
+    store.add_inputs(run_id, [["Estra"], ["Hera"], ["Ignota"]])
+    store.append(run_id, 0, "Estra", {2023: {"found_document_url": ESTRA, "matched_value": "42"}})
+    store.append(run_id, 1, "Hera", {2023: {"found_document_url": HERA}})
+    store.append(run_id, 2, "Ignota", {2023: {"found_document_url": "https://ignota.it/b.pdf"}})
+    store.flush()
+    new_id = corpus_index.requery(index, store, run_id, ["costo del personale"])
+    rows = {name: f for _, name, _, f in store.results(new_id)}
+    assert (rows["Estra"]["matched_value"], rows["Estra"]["matched_page"]) == ("456.789", 2)
+    assert rows["Hera"]["matched_value"] == "1.234.567"
+    assert json.loads(rows["Hera"]["matched_values"])["costo del personale"]["page"] == 1
+    assert rows["Ignota"]["notes"].startswith("Documento non presente nel corpus")
+    assert store.run_info(new_id)["meta"]["requery_of"] == run_id
+    store.close()
+
+
+def test_index_document_never_raises(monkeypatch):
+    def broken():
+        raise RuntimeError("disco pieno")
+
+    monkeypatch.setattr(corpus_index, "default_index", broken)
+    before = counter("corpus_index_errors_total")
+    corpus_index.index_document(ESTRA, ["testo"], "Estra", [2023])
+    assert counter("corpus_index_errors_total") == before + 1
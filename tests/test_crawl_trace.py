@@ -0,0 +1,57 @@
+import json
+
+import httpx
+
+import crawler
+import replay
+from crawl_trace import CrawlTrace
+
+PAGES = {
+    "/ir": "<a href='/a'>Bilanci</a> <a href='/b'>Investor</a> <a href='/missing'>Vecchia</a>"
+           "<a href='/logo.png'>Logo</a> <a href='/down'>Documenti</a>"
+           "<a href='https://altro.com/x'>Partner</a> <a href='ftp://s.it/f'>FTP</a>",
+    "/a": "<a href='/a/b'>Dettaglio</a>",
+    "/b": "<a href='/a'>Bilanci</a>",
+}
+
+
+def site(request):
+    path = request.url.path
+    if path == "/down":
+        raise httpx.ConnectError("rifiutata", request=request)
+    if path == "/logo.png":
+        return httpx.Response(200, headers={"content-type": "image/png"}, content=b"\x89PNG")
+    if path not in PAGES:
+        return httpx.Response(404, headers={"content-type": "text/html"}, text="non trovata")
+    return httpx.Response(200, headers={"content-type": "text/html"}, text=PAGES[path])
+
+
+def test_crawl_counts_every_skip_reason(monkeypatch):
+    monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(site)})
+    trace = CrawlTrace()
+    out = crawler.crawl_for_pdf(["https://s.it/ir"], 2023, max_pages=20, max_depth=1, trace=trace)
+    assert out["pdf"] is None
+    summary = trace.summary()
+    assert summary["skip_reasons"] == {"domain": 1, "scheme": 1, "http_status": 1, "content_type": 1,
+                                       "error": 1, "depth": 1, "visited": 1}
+    assert summary["events"]["fetch"] == 5
+    assert summary["bytes"] == sum(e["bytes"] for e in trace.events if e["event"] == "fetch")
+    fetched = {e["url"]: e["status"] for e in trace.events if e["event"] == "fetch"}
+    assert fetched["https://s.it/missing"] == 404
+
+
+def test_summary_and_jsonl():
+    trace = CrawlTrace()
+    trace.push("https://s.it/", 5.0, 0, None, "entry")
+    trace.pop("https://s.it/", 5.0, 0, None)
+    trace.fetch("https://s.it/", 200, "text/html", 1200, 0.25)
+    trace.skip("https://x.it/", "domain", parent="https://s.it/")
+    trace.unvisited("https://s.it/z", 1.0, 2, "https://s.it/")
+    trace.found("https://s.it/b.pdf", 3.7, "https://s.it/")
+    summary = trace.summary()
+    assert summary["events"] == {"push": 1, "pop": 1, "fetch": 1, "skip": 1, "unvisited": 1, "found": 1}
+    assert summary["skip_reasons"] == {"domain": 1, "max_pages": 1}
+    assert (summary["bytes"], summary["fetch_seconds"]) == (1200, 0.25)
+    lines = [json.loads(l) for l in trace.to_jsonl().splitlines()]
+    assert [l["event"] for l in lines] == ["push", "pop", "fetch", "skip", "unvisited", "found"]
+    assert lines[1]["t_enqueue"] <= lines[1]["ts"]
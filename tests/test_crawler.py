@@ -0,0 +1,279 @@
+import httpx
+import pytest
+
+import crawler
+import replay
+from pdf_probe import probe_pdf, probe_score
+from pdfgen import make_pdf, range_response
+
+PAD = 30_000   # oltre la soglia dei PDF "troppo piccoli per un bilancio"
+DOCS = {
+    "/investor/bilanci/relazione-governance-2023.pdf":
+        make_pdf(["Relazione sul governo societario"] * 3, info={"Title": "(Relazione sul governo societario 2023)"},
+                 pad=PAD),
+    "/documenti/doc-2023.pdf":
+        make_pdf(["Bilancio d'esercizio al 31 dicembre 2023"] + ["nota"] * 24,
+                 info={"Title": "(Bilancio d'esercizio 2023)", "CreationDate": "(D:20240401)"}, pad=PAD),
+    "/investor/bilanci/nohead-2023.pdf":
+        make_pdf(["Bilancio 2019"] * 25, info={"Title": "(Bilancio d'esercizio 2019)"}, pad=PAD),
+}
+LINKS = [("/investor/bilanci/relazione-governance-2023.pdf", "Bilancio 2023 - governance"),
+         ("/investor/bilanci/login-2023.pdf", "Bilancio 2023"),
+         ("/investor/bilanci/vecchio-2023.pdf", "Bilancio 2023"),
+         ("/investor/bilanci/nohead-2023.pdf", "Bilancio 2023"),
+         ("/documenti/doc-2023.pdf", "Documento 2023")]
+
+
+def pdf_site(request):
+    path = request.url.path
+    if path in ("/ir", "/ir-rotti"):
+        links = LINKS if path == "/ir" else LINKS[1:3]
+        body = "".join(f"<a href='{h}'>{t}</a>" for h, t in links)
+        return httpx.Response(200, headers={"content-type": "text/html"}, text=body)
+    if path.endswith("login-2023.pdf"):
+        # pagina di accesso servita al posto del PDF
+        return httpx.Response(200, headers={"content-type": "text/html"}, text="<form>Accedi</form>" * 2000)
+    if path not in DOCS:
+        return httpx.Response(404, headers={"content-type": "text/html"}, text="non trovato")
+    if request.method == "HEAD":
+        if "nohead" in path:
+            return httpx.Response(405)
+        return httpx.Response(200, headers={"content-type": "application/pdf", "content-length": str(len(DOCS[path]))})
+    return range_response(request, DOCS[path])
+
+
+@pytest.fixture
+def site(monkeypatch):
+    monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(pdf_site)})
+
+
+def test_rank_mode_verifies_candidates_and_returns_the_best(site):
+    out = crawler.crawl_for_pdf(["https://rank.example.it/ir"], 2023, mode="rank", top_k=5)
+    assert out["pdf"] == "https://rank.example.it/documenti/doc-2023.pdf"
+    ranked = {c["pdf"].rsplit("/", 1)[1]: c for c in out["candidates"]}
+    assert len(ranked) == 5
+    # verificati prima, poi per score
+    flags = [c["verified"] for c in out["candidates"]]
+    assert flags == sorted(flags, reverse=True)
+    assert not ranked["login-2023.pdf"]["verified"]
+    assert ranked["login-2023.pdf"]["evidence"]["content_type"] == "text/html"
+    assert not ranked["vecchio-2023.pdf"]["verified"]
+    assert ranked["vecchio-2023.pdf"]["evidence"]["status"] == 404
+    # HEAD non supportato: decide la sonda Range
+    nohead = ranked["nohead-2023.pdf"]
+    assert nohead["verified"] and nohead["evidence"]["status"] is None and nohead["evidence"]["range"]
+    gov = ranked["relazione-governance-2023.pdf"]
+    assert gov["evidence"]["doc_type"] == "governance" and gov["score_probe"] < 0
+    best = ranked["doc-2023.pdf"]
+    assert best["evidence"]["doc_type"] == "bilancio" and best["evidence"]["pages"] == 25
+    assert best["score"] > gov["score"] > best["score_link"]
+
+
+def test_verify_candidates_checks_only_top_k(site):
+    base = "https://topk.example.it"
+    cands = [{"pdf": base + h, "anchor": t, "via": base + "/ir", "score_link": crawler._score_link(base + h, t, 2023)}
+             for h, t in LINKS]
+    ranked = crawler._verify_candidates(cands, 2023, top_k=2, timeout=5)
+    checked = [c for c in ranked if c["evidence"] is not None]
+    assert len(checked) == 2
+    top2 = sorted(cands, key=lambda c: c["score_link"], reverse=True)[:2]
+    assert {c["pdf"] for c in checked} == {c["pdf"] for c in top2}
+    assert all(c["score_probe"] is None and not c["verified"] for c in ranked[2:])
+    assert crawler._verify_candidates([], 2023, top_k=5, timeout=5) == []
+
+
+def test_rank_mode_without_verified_candidates(site):
+    out = crawler.crawl_for_pdf(["https://none.example.it/ir-rotti"], 2023, mode="rank", top_k=5)
+    assert out["pdf"] is None and out["reason"] == "no_verified_candidate"
+    assert [c["verified"] for c in out["candidates"]] == [False, False]
+
+
+def test_verify_pdf_small_file_and_failed_head(monkeypatch):
+    tiny = make_pdf(["Bilancio d'esercizio 2023"] * 25, info={"Title": "(Bilancio d'esercizio 2023)"})
+
+    def handler(request):
+        if request.method == "HEAD" and request.url.host == "nohead.example.it":
+            raise httpx.ConnectError("HEAD rifiutata")
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"content-type": "application/pdf", "content-length": str(len(tiny))})
+        return range_response(request, tiny)
+
+    monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(handler)})
+    with httpx.Client(**replay.client_kwargs()) as client:
+        url = "https://tiny.example.it/bilancio-2023.pdf"
+        small = crawler._verify_pdf(client, {"pdf": url, "score_link": 1.0}, 2023)
+        assert small["verified"] and small["evidence"]["size"] == len(tiny) < 20_000
+        # troppo piccolo per un bilancio: -1 sul bonus della sonda
+        assert small["score_probe"] == probe_score(probe_pdf(url), 2023) - 1.0
+        # HEAD fallita per rete: decide la sonda, l'errore resta nelle evidenze
+        failed = crawler._verify_pdf(client, {"pdf": "https://nohead.example.it/b-2023.pdf", "score_link": 1.0}, 2023)
+        assert failed["verified"] and failed["evidence"]["error"] == "ConnectError"
+        assert failed["evidence"]["status"] is None and failed["evidence"]["doc_type"] == "bilancio"
+
+
+# --------------------------------------------------------------------------
+# Crawl async: ordine best-first, budget, concorrenza, hook exhaustive/pages
+# --------------------------------------------------------------------------
+SITE = {
+    "/ir": [("/bilanci", "Bilanci e relazioni"), ("/news", "Notizie"), ("/investor", "Investor relations"),
+            ("/chi-siamo", "Chi siamo")],
+    "/bilanci": [("/bilanci/2023", "Anno 2023"), ("/bilanci/2022", "Anno 2022"), ("/archivio", "Archivio")],
+    "/investor": [("/investor/governance", "Governance"), ("/investor/documenti", "Documenti finanziari"),
+                  ("/ir", "Torna all'indice")],
+    "/news": [("/news/1", "Comunicato"), ("/news/2", "Evento")],
+    "/bilanci/2023": [("/bilanci/2023/allegati", "Allegati 2023"), ("/contatti", "Contatti")],
+    "/archivio": [("/archivio/vecchi", "Anni precedenti")],
+}
+
+
+def html_site(pages, delay=0.0, inflight=None):
+    """Handler async: pagine HTML da `pages` ({percorso: [(href, testo)]}), 404 altrove."""
+    import asyncio
+
+    async def handler(request):
+        if inflight is not None:
+            inflight["now"] += 1
+            inflight["peak"] = max(inflight["peak"], inflight["now"])
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            links = pages.get(request.url.path)
+            if links is None:
+                return httpx.Response(404, headers={"content-type": "text/html"}, text="")
+            body = "".join(f"<a href='{h}'>{t}</a>" for h, t in links)
+            return httpx.Response(200, headers={"content-type": "text/html"}, text=f"<html><body>{body}</body></html>")
+        finally:
+            if inflight is not None:
+                inflight["now"] -= 1
+    return handler
+
+
+def serve(monkeypatch, handler):
+    monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(handler)})
+
+
+def fetched(trace):
+    return [e["url"] for e in trace.events if e["event"] == "fetch"]
+
+
+def sequential_order(pages, seed, year, max_depth):
+    """Best-first sequenziale di riferimento (il crawler prima dell'async): ordine delle pagine scaricate."""
+    import heapq
+    from urllib.parse import urljoin, urlparse
+    heap, visited, order = [(-5.0, 0, seed, "entry", None)], set(), []
+    while heap:
+        _, depth, url, _, _ = heapq.heappop(heap)
+        if url in visited:
+            continue
+        visited.add(url)
+        if depth > max_depth:
+            continue
+        order.append(url)
+        for href, text in pages.get(urlparse(url).path, []):
+            u2 = urljoin(url, href)
+            heapq.heappush(heap, (-crawler._score_link(u2, text, year), depth + 1, u2, text, url))
+    return order
+
+
+def test_concurrency_one_matches_the_sequential_best_first_order(monkeypatch):
+    from crawl_trace import CrawlTrace
+    serve(monkeypatch, html_site(SITE))
+    trace = CrawlTrace()
+    out = crawler.crawl_for_pdf(["https://seq.example.it/ir"], 2023, max_pages=50, max_depth=2, trace=trace,
+                                concurrency=1)
+    expected = sequential_order(SITE, "https://seq.example.it/ir", 2023, max_depth=2)
+    assert fetched(trace) == expected
+    assert out["pdf"] is None and out["visited"] > len(expected)   # anche le pagine oltre max_depth contano
+
+
+def test_concurrent_crawl_visits_the_same_pages(monkeypatch):
+    from crawl_trace import CrawlTrace
+    serve(monkeypatch, html_site(SITE, delay=0.01))
+    expected = sequential_order(SITE, "https://par.example.it/ir", 2023, max_depth=2)
+    trace = CrawlTrace()
+    crawler.crawl_for_pdf(["https://par.example.it/ir"], 2023, max_pages=50, max_depth=2, trace=trace, concurrency=4)
+    assert sorted(fetched(trace)) == sorted(expected)
+    assert all(e["depth"] <= 2 for e in trace.events if e["event"] == "pop" and e["url"] in fetched(trace))
+    # giri di `concurrency` pagine: i primi dalla testa della frontiera, come nel sequenziale
+    assert fetched(trace)[0] == expected[0]
+
+
+def test_never_more_than_concurrency_requests_in_flight(monkeypatch):
+    wide = {"/ir": [(f"/p{i}", f"Bilanci {i}") for i in range(12)]}
+    for width in (1, 4):
+        inflight = {"now": 0, "peak": 0}
+        serve(monkeypatch, html_site(wide, delay=0.02, inflight=inflight))
+        out = crawler.crawl_for_pdf([f"https://w{width}.example.it/ir"], 2023, max_pages=13, concurrency=width)
+        assert out["visited"] == 13
+        assert inflight["peak"] == width
+
+
+def test_budget_is_shared_across_seeds_with_a_reserve_per_domain(monkeypatch):
+    pages = {"/ir": [(f"/bilanci/{i}", f"Bilanci e relazioni {i}") for i in range(20)],
+             "/home": [(f"/pagina/{i}", f"Pagina {i}") for i in range(20)]}
+    serve(monkeypatch, html_site(pages))
+    seeds = ["https://www.alfa.it/ir", "https://www.beta.it/home"]
+    for width in (1, 4):
+        out = crawler.crawl_for_pdf(seeds, 2023, max_pages=12, concurrency=width)
+        assert out["visited"] == 12
+        by_domain = out["pages_by_domain"]
+        assert sum(by_domain.values()) == 12
+        # beta.it ha solo link poco promettenti ma riceve la sua quota (12 // (2 * 2) = 3)
+        assert by_domain["beta.it"] == 3 and by_domain["alfa.it"] == 9
+
+
+def test_max_depth_is_respected_across_seeds(monkeypatch):
+    from crawl_trace import CrawlTrace
+    chain = {f"/l{i}": [(f"/l{i + 1}", f"Bilanci livello {i + 1}")] for i in range(6)}
+    serve(monkeypatch, html_site(chain))
+    trace = CrawlTrace()
+    crawler.crawl_for_pdf(["https://a.example.it/l0", "https://b.example.org/l0"], 2023, max_pages=50, max_depth=3,
+                          trace=trace)
+    got = fetched(trace)
+    assert sorted(got) == sorted(f"https://{h}/l{i}" for h in ("a.example.it", "b.example.org") for i in range(4))
+    assert trace.summary()["skip_reasons"]["depth"] == 2
+
+
+def test_exhaustive_visits_the_whole_budget(monkeypatch):
+    pages = {"/ir": [("/bilancio-2023.pdf", "Bilancio 2023"), ("/archivio", "Archivio bilanci")],
+             "/archivio": [("/bilancio-2022.pdf", "Bilancio 2022"), ("/altro", "Altro")],
+             "/altro": []}
+    serve(monkeypatch, html_site(pages))
+    quick = crawler.crawl_for_pdfs(["https://ex.example.it/ir"], [2023], max_pages=20)
+    assert quick["visited"] == 1 and quick["by_year"][2023]["exact"]
+    full = crawler.crawl_for_pdfs(["https://ex.example.it/ir"], [2023, 2022], max_pages=20, exhaustive=True)
+    assert full["visited"] == 3
+    assert [c["pdf"].rsplit("/", 1)[1] for c in full["candidates"]] == ["bilancio-2023.pdf", "bilancio-2022.pdf"]
+    assert full["missing_years"] == []
+
+
+class SavedPages:
+    """Aggancio `pages=` minimo: 304 per le pagine già viste, con i link salvati."""
+
+    def __init__(self, saved):
+        self.saved = saved
+        self.calls = []
+
+    def headers(self, url):
+        return {"If-None-Match": '"v1"'} if url in self.saved else {}
+
+    def links(self, url, response, html, nbytes=0):
+        self.calls.append((url, response.status_code, html is None))
+        if html is None:
+            return self.saved[url]
+        return crawler._extract_links(url, html)
+
+
+def test_pages_hook_reuses_saved_links_on_304(monkeypatch):
+    def handler(request):
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, headers={"content-type": "text/html"},
+                              text="<a href='/relazioni'>Relazioni</a>" if request.url.path == "/ir" else "")
+
+    serve(monkeypatch, handler)
+    hook = SavedPages({"https://pg.example.it/relazioni": [("https://pg.example.it/bilancio-2023.pdf", "Bilancio 2023")]})
+    out = crawler.crawl_for_pdf(["https://pg.example.it/ir"], 2023, pages=hook)
+    assert out["pdf"] == "https://pg.example.it/bilancio-2023.pdf"
+    assert out["via"] == "https://pg.example.it/relazioni"
+    assert hook.calls == [("https://pg.example.it/ir", 200, False), ("https://pg.example.it/relazioni", 304, True)]
@@ -0,0 +1,135 @@
+import types
+
+import httpx
+import pytest
+
+import crawler
+import host_health
+import replay
+from crawl_trace import CrawlTrace
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def fresh_hosts(monkeypatch):
+    host_health.reset()
+    clock = Clock()
+    monkeypatch.setattr(host_health, "time", types.SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(host_health, "FAILURES_TO_OPEN", 3)
+    monkeypatch.setattr(host_health, "COOLDOWN", 60.0)
+    yield clock
+    host_health.reset()
+
+
+URL = "https://slow.example.it/page"
+
+
+def fail(n, url=URL):
+    for _ in range(n):
+        host_health.record(url, 0.5, ok=False)
+
+
+def test_opens_after_consecutive_failures():
+    fail(2)
+    assert host_health.state(URL) == host_health.CLOSED
+    assert host_health.allow(URL)
+    fail(1)
+    assert host_health.state(URL) == host_health.OPEN
+    assert not host_health.allow(URL)
+    # stesso host, altro percorso
+    assert not host_health.allow("https://slow.example.it/altro")
+    assert host_health.allow("https://fast.example.it/")
+
+
+def test_success_resets_consecutive_failures():
+    fail(2)
+    host_health.record(URL, 0.1, ok=True)
+    fail(2)
+    assert host_health.state(URL) == host_health.CLOSED
+
+
+def test_half_open_allows_one_probe_and_closes_on_success(fresh_hosts):
+    fail(3)
+    fresh_hosts.now += 61
+    assert host_health.allow(URL)          # prova
+    assert not host_health.allow(URL)      # una sola prova alla volta
+    assert host_health.state(URL) == host_health.HALF_OPEN
+    host_health.record(URL, 0.2, ok=True)
+    assert host_health.state(URL) == host_health.CLOSED
+    assert host_health.allow(URL)
+
+
+def test_failed_probe_reopens_for_another_cooldown(fresh_hosts):
+    fail(3)
+    fresh_hosts.now += 61
+    assert host_health.allow(URL)
+    fail(1)
+    assert host_health.state(URL) == host_health.OPEN
+    fresh_hosts.now += 30
+    assert not host_health.allow(URL)
+    fresh_hosts.now += 31
+    assert host_health.allow(URL)
+
+
+def test_stuck_probe_expires_after_cooldown(fresh_hosts):
+    fail(3)
+    fresh_hosts.now += 61
+    assert host_health.allow(URL)
+    fresh_hosts.now += 61                  # la prova non ha mai risposto
+    assert host_health.allow(URL)
+
+
+def test_adaptive_timeout(monkeypatch):
+    monkeypatch.setattr(host_health, "MIN_TIMEOUT", 3.0)
+    assert host_health.timeout_for(URL, 15) == 15      # pochi campioni: timeout pieno
+    for _ in range(host_health.MIN_SAMPLES):
+        host_health.record(URL, 2.0, ok=True)
+    assert host_health.timeout_for(URL, 15) == pytest.approx(8.0)
+    assert host_health.timeout_for(URL, 5) == 5        # mai oltre il richiesto
+    fast = "https://fast.example.it/"
+    for _ in range(host_health.MIN_SAMPLES):
+        host_health.record(fast, 0.01, ok=True)
+    assert host_health.timeout_for(fast, 15) == 3.0     # minimo
+
+
+@pytest.mark.parametrize("status, failures", [(404, 0), (429, 1), (503, 1), (200, 0)])
+def test_status_classification(status, failures):
+    stats = {}
+    host_health.record_response(URL, 0.1, status, stats)
+    assert host_health.snapshot()[0]["consecutive_failures"] == failures
+    assert stats["slow.example.it"] == {"ok" if status < 400 else "http_error": 1}
+
+
+def test_timeout_exception_is_tallied_as_timeout():
+    stats = {}
+    host_health.record_error(URL, 3.0, httpx.ReadTimeout("lento"), stats)
+    host_health.record_error(URL, 0.1, httpx.ConnectError("rifiutata"), stats)
+    assert stats["slow.example.it"] == {"timeout": 1, "error": 1}
+    snap = host_health.snapshot()[0]
+    assert (snap["errors"], snap["timeouts"]) == (2, 1)
+
+
+def test_crawl_skips_host_with_open_circuit(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        return httpx.Response(503, text="down")
+
+    monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(handler)})
+    entries = [f"https://down.example.it/p{i}" for i in range(6)]
+    trace = CrawlTrace()
+    out = crawler.crawl_for_pdf(entries, 2023, max_pages=10, concurrency=1, trace=trace)
+    assert out["pdf"] is None
+    assert len(requests) == 3
+    assert out["host_stats"]["down.example.it"]["http_error"] == 3
+    assert out["host_stats"]["down.example.it"]["circuit_open"] == 3
+    assert out["host_stats"]["down.example.it"]["circuit"] == host_health.OPEN
+    assert trace.summary()["skip_reasons"]["circuit_open"] == 3
@@ -0,0 +1,122 @@
+import asyncio
+
+import httpx
+import pytest
+from bs4 import BeautifulSoup
+
+from html_stream import LinkParser, capped_response, stream_html, stream_html_sync
+
+PAGE = ("<html><head><title> Investor\n relations </title></head><body>"
+        "<a href='/bilanci'>Bilanci <b>e</b> relazioni</a>"
+        "<a href=\"/governance\">Corporate &amp; governance</a>"
+        "<p>Notizie</p><a href='/perché'>Perché investire</a>"
+        "<a href='/vuoto'></a><a name='ancora'>senza href</a>"
+        "<a href=' /archivio-2023.pdf '>Bilancio  2023</a></body></html>")
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def soup_links(html):
+    return [(a["href"].strip(), a.get_text(" ", strip=True)) for a in BeautifulSoup(html, "html.parser").find_all("a")
+            if a.get("href") is not None]
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 10_000])
+def test_chunked_parse_matches_whole_document(size):
+    whole = LinkParser()
+    whole.feed(PAGE)
+    whole.close()
+    expected = whole.drain()
+    assert expected == soup_links(PAGE)
+    parser = LinkParser()
+    got = []
+    for part in chunks(PAGE, size):
+        parser.feed(part)
+        got += parser.drain()
+    parser.close()
+    got += parser.drain()
+    assert got == expected
+    assert parser.title == "Investor relations"
+
+
+def paged(body, size=16, content_type="text/html; charset=utf-8", status=200):
+    """Handler che serve `body` a chunk di `size` byte e registra quanti ne sono stati letti."""
+    sent = {"bytes": 0}
+
+    def gen():
+        for part in chunks(body, size):
+            sent["bytes"] += len(part)
+            yield part
+
+    async def agen():
+        for part in gen():
+            yield part
+
+    def handler(request):
+        return httpx.Response(status, headers={"content-type": content_type}, content=gen())
+
+    async def ahandler(request):
+        return httpx.Response(status, headers={"content-type": content_type}, content=agen())
+
+    return handler, ahandler, sent
+
+
+def fetch(body, async_client, **kwargs):
+    handler, ahandler, sent = paged(body, **{k: kwargs.pop(k) for k in ("size", "content_type", "status")
+                                             if k in kwargs})
+    url = "https://www.estra.it/ir"
+    if async_client:
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(ahandler)) as client:
+                return await stream_html(client, url, **kwargs)
+        return asyncio.run(run()), sent
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        return stream_html_sync(client, url, **kwargs), sent
+
+
+@pytest.mark.parametrize("async_client", [False, True])
+def test_whole_page_within_the_cap(async_client):
+    body = PAGE.encode()
+    page, sent = fetch(body, async_client, keep_html=True)
+    assert not page["truncated"] and page["nbytes"] == len(body) == sent["bytes"]
+    assert page["html"] == PAGE and page["links"] == soup_links(PAGE)
+    assert page["title"] == "Investor relations"
+
+
+@pytest.mark.parametrize("async_client", [False, True])
+def test_byte_cap_truncates_and_stops_reading(async_client):
+    body = ("<a href='/bilanci'>Bilanci</a>" + "<p>" + "x" * 5000 + "</p><a href='/oltre'>Oltre</a>").encode()
+    page, sent = fetch(body, async_client, max_bytes=100, keep_html=True)
+    assert page["truncated"] and page["nbytes"] == 100
+    assert sent["bytes"] < 200              # il resto del corpo non viene scaricato
+    assert page["links"] == [("/bilanci", "Bilanci")]
+    resp = capped_response(page)
+    assert len(resp.content) == 100 and resp.headers["content-length"] == "100"
+
+
+def test_multibyte_characters_split_across_chunks():
+    html = "<a href='/perché'>Società è più</a>"
+    page, _ = fetch(html.encode("utf-8"), False, size=1)
+    assert page["links"] == [("/perché", "Società è più")]
+
+
+def test_on_links_can_stop_the_download():
+    body = "".join(f"<a href='/p{i}'>Pagina {i}</a>" for i in range(200)).encode()
+    seen = []
+
+    def on_links(links):
+        seen.extend(links)
+        return len(seen) >= 3
+
+    page, sent = fetch(body, False, on_links=on_links)
+    assert page["stopped"] and not page["truncated"]
+    assert 3 <= len(seen) < 200 and sent["bytes"] < len(body)
+
+
+@pytest.mark.parametrize("content_type, status", [("application/pdf", 200), ("text/html", 404)])
+def test_non_html_and_errors_are_not_read(content_type, status):
+    page, sent = fetch(b"%PDF-1.4 " * 1000, False, content_type=content_type, status=status)
+    assert page["status"] == status and page["nbytes"] == 0 and page["links"] == []
+    assert sent["bytes"] <= 16
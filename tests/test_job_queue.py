@@ -0,0 +1,150 @@
+import types
+
+import pytest
+
+import job_queue
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+from results_store import ResultsStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = Clock()
+    monkeypatch.setattr(job_queue, "time", types.SimpleNamespace(time=c.time, strftime=job_queue.time.strftime,
+                                                                 perf_counter=job_queue.time.perf_counter,
+                                                                 sleep=job_queue.time.sleep))
+    monkeypatch.setattr(job_queue, "MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(job_queue, "RETRY_BACKOFF", 10.0)
+    return c
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    with JobQueue(str(tmp_path / "queue.sqlite")) as q:
+        yield q
+
+
+def jobs(queue, batch_id):
+    return {r[0]: r[1:] for r in queue._conn.execute(
+        "SELECT company, status, attempts, worker FROM jobs WHERE batch_id = ?", (batch_id,))}
+
+
+def test_enqueue_one_job_per_distinct_company(queue):
+    bid = queue.enqueue("run", ["Estra", "Hera", " estra ", "ESTRA"], {"years": [2023]})
+    assert queue.status(bid)["total"] == 2
+    job = queue.claim("w1")
+    assert (job["company"], job["rows"]) == ("Estra", [0, 2, 3])
+    # stesso batch_id: nessun duplicato
+    queue.enqueue("run", ["Estra", "Hera"], {"years": [2023]}, batch_id=bid)
+    assert queue.status(bid)["total"] == 2
+
+
+def test_claim_in_order_and_leases_are_exclusive(queue):
+    bid = queue.enqueue("run", ["A", "B"], {"years": [2023]})
+    assert queue.claim("w1")["company"] == "A"
+    assert queue.claim("w2")["company"] == "B"
+    assert queue.claim("w3") is None
+    assert queue.status(bid)[RUNNING] == 2
+
+
+def test_expired_lease_is_reclaimed_and_old_worker_loses_it(queue, clock):
+    bid = queue.enqueue("run", ["A"], {"years": [2023]})
+    job = queue.claim("dead", lease=60)
+    clock.now += 30
+    assert queue.heartbeat(job, "dead", lease=60)      # lease rinnovato fino a +90
+    clock.now += 59
+    assert queue.claim("w2") is None
+    clock.now += 2
+    again = queue.claim("w2", lease=60)
+    assert (again["company"], again["attempt"]) == ("A", 2)
+    assert not queue.heartbeat(job, "dead")
+    assert queue.fail(job, "dead", "boom") is None      # lease perso: nessun effetto
+    assert jobs(queue, bid)["A"] == (RUNNING, 2, "w2")
+
+
+def test_failures_are_retried_with_backoff_then_failed(queue, clock):
+    bid = queue.enqueue("run", ["A"], {"years": [2023]})
+    job = queue.claim("w1")
+    assert queue.fail(job, "w1", "boom 1") == QUEUED
+    assert queue.claim("w1") is None                    # backoff: 10 s
+    clock.now += 10
+    job = queue.claim("w1")
+    assert queue.fail(job, "w1", "boom 2") == QUEUED
+    clock.now += 19
+    assert queue.claim("w1") is None                    # backoff: 20 s
+    clock.now += 1
+    job = queue.claim("w1")
+    assert job["attempt"] == 3
+    assert queue.fail(job, "w1", "boom 3") == FAILED
+    clock.now += 1000
+    assert queue.claim("w1") is None
+    assert queue.failures(bid) == [{"company": "A", "attempts": 3, "error": "boom 3"}]
+
+
+def test_expired_lease_on_last_attempt_fails_the_job(queue, clock):
+    bid = queue.enqueue("run", ["A"], {"years": [2023]})
+    for _ in range(3):
+        assert queue.claim("dead", lease=5) is not None
+        clock.now += 6
+    assert queue.claim("w2") is None
+    assert queue.failures(bid)[0]["error"].startswith("lease scaduto")
+
+
+def test_first_completion_wins(queue, clock):
+    bid = queue.enqueue("run", ["A"], {"years": [2023]})
+    slow = queue.claim("slow", lease=5)
+    clock.now += 6
+    fast = queue.claim("fast")
+    assert queue.complete(fast, {2023: {"notes": "fast"}}, queries_used=1)
+    assert not queue.complete(slow, {2023: {"notes": "slow"}})
+    assert queue.status(bid) == {QUEUED: 0, RUNNING: 0, DONE: 1, FAILED: 0, "total": 1, "queries_used": 1}
+    assert queue.claim("w3") is None
+
+
+def test_merge_writes_results_and_failure_notes(queue, tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    run_id = store.new_run(["name"], [2023])
+    store.add_inputs(run_id, [["Estra"], ["Hera"], ["estra"]])
+    bid = queue.enqueue(run_id, ["Estra", "Hera", "estra"], {"years": [2023]})
+    a = queue.claim("w1")
+    queue.complete(a, {2023: {"found_document_url": "https://estra.it/b.pdf", "matched_value": "1.234"}})
+    b = queue.claim("w1")
+    for _ in range(3):
+        queue.fail(b, "w1", "RuntimeError: boom")
+        queue._conn.execute("UPDATE jobs SET not_before = 0")
+        b = queue.claim("w1") or b
+    queue.merge(bid, store)
+    rows = {(r[0], r[1]): r[2:] for r in store._conn.execute(
+        "SELECT row_idx, company, found_document_url, notes FROM results WHERE run_id = ?", (run_id,))}
+    # il risultato del job vale per tutte le righe con la stessa azienda
+    assert rows[(0, "Estra")][0] == rows[(2, "Estra")][0] == "https://estra.it/b.pdf"
+    assert rows[(1, "Hera")] == (None, "Job fallito dopo 3 tentativi: RuntimeError: boom")
+    store.close()
+
+
+def test_run_worker_completes_and_retries(tmp_path, clock, monkeypatch):
+    path = str(tmp_path / "queue.sqlite")
+    with JobQueue(path) as q:
+        bid = q.enqueue("run", ["ok", "flaky", "broken"], {"years": [2023]})
+    calls = {}
+
+    def execute(job):
+        n = calls[job["company"]] = calls.get(job["company"], 0) + 1
+        if job["company"] == "broken" or (job["company"] == "flaky" and n == 1):
+            raise RuntimeError(job["company"])
+        return {2023: {"notes": job["company"]}}, 0
+
+    monkeypatch.setattr(job_queue, "execute", execute)
+    monkeypatch.setattr(job_queue, "RETRY_BACKOFF", 0.0)
+    assert job_queue.run_worker(path, worker="w1", until_empty=True) == 1 + 2 + 3
+    with JobQueue(path) as q:
+        assert q.status(bid)[DONE] == 2
+        assert q.failures(bid) == [{"company": "broken", "attempts": 3, "error": "RuntimeError: broken"}]
@@ -0,0 +1,126 @@
+import asyncio
+import itertools
+
+import httpx
+import pytest
+
+import replay
+from monitor import MonitorStore, diff_docs, fingerprint, monitor_company, monitor_crawl_fn
+from scheduler import Scheduler
+
+SEED = "https://www.estra.it/ir"
+
+
+class Site:
+    """Sito finto: /ir con ETag (304 se invariato), /archivio senza validatori ma con token che cambiano."""
+
+    def __init__(self):
+        self.ir_version = "v1"
+        self.ir_links = ["/archivio", "/bilancio-2023.pdf"]
+        self.pdf_etags = {"/bilancio-2023.pdf": '"b1"', "/relazione-2023.pdf": '"r1"', "/nota-2023.pdf": '"n1"'}
+        self.tokens = itertools.count()
+        self.log = []
+
+    def __call__(self, request):
+        path = request.url.path
+        self.log.append((request.method, path, request.headers.get("if-none-match")))
+        if path.endswith(".pdf"):
+            return httpx.Response(200, headers={"content-type": "application/pdf", "etag": self.pdf_etags[path],
+                                                "content-length": "250000"})
+        if path == "/ir":
+            etag = f'"{self.ir_version}"'
+            if request.headers.get("if-none-match") == etag:
+                return httpx.Response(304, headers={"etag": etag})
+            body = "".join(f"<a href='{l}'>Bilanci {l}</a>" for l in self.ir_links)
+            return httpx.Response(200, headers={"content-type": "text/html", "etag": etag}, text=body)
+        if path == "/archivio":
+            # script e campo nascosto cambiano a ogni richiesta: l'impronta no
+            body = (f"<script>var t={next(self.tokens)}</script><input type='hidden' name='csrf' value='{next(self.tokens)}'>"
+                    "<a href='/relazione-2023.pdf'>Relazione finanziaria 2023</a>")
+            return httpx.Response(200, headers={"content-type": "text/html"}, text=body)
+        return httpx.Response(404)
+
+    def gets(self, path):
+        return [h for m, p, h in self.log if m == "GET" and p == path]
+
+
+@pytest.fixture
+def site(monkeypatch):
+    s = Site()
+    monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(s)})
+    return s
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = MonitorStore(str(tmp_path / "monitor.sqlite"))
+    yield s
+    s.close()
+
+
+def check(store, scope="estra"):
+    return monitor_company([SEED], [2023], store, scope=scope, max_pages=10, max_depth=2)
+
+
+def test_first_run_is_a_baseline_of_new_documents(site, store):
+    res = check(store)
+    assert {d["url"]: d["change"] for d in res["diff"]} == {
+        "https://www.estra.it/bilancio-2023.pdf": "new", "https://www.estra.it/relazione-2023.pdf": "new"}
+    assert all(d["baseline"] for d in res["diff"])
+    assert {k: res["pages"][k] for k in ("new", "changed", "unchanged", "not_modified")} == \
+        {"new": 2, "changed": 0, "unchanged": 0, "not_modified": 0}
+
+
+def test_304_and_unchanged_fingerprint_reuse_saved_links(site, store):
+    check(store)
+    site.log.clear()
+    res = check(store)
+    # /ir: richiesta condizionale → 304; /archivio: 200 con impronta invariata → link salvati
+    assert site.gets("/ir") == ['"v1"']
+    assert res["pages"]["not_modified"] == 1 and res["pages"]["unchanged"] == 1
+    assert res["pages"]["new"] == res["pages"]["changed"] == 0
+    # i PDF arrivano comunque dai link salvati; nessun documento nuovo o cambiato
+    assert res["diff"] == []
+    assert ("HEAD", "/relazione-2023.pdf", '"r1"') in site.log
+
+
+def test_changed_and_new_documents(site, store):
+    check(store)
+    site.pdf_etags["/bilancio-2023.pdf"] = '"b2"'
+    site.ir_version = "v2"
+    site.ir_links.append("/nota-2023.pdf")
+    res = check(store)
+    assert res["pages"]["changed"] == 1
+    assert {d["url"]: d["change"] for d in res["diff"]} == {
+        "https://www.estra.it/bilancio-2023.pdf": "changed", "https://www.estra.it/nota-2023.pdf": "new"}
+    assert not any(d["baseline"] for d in res["diff"])
+    changed = next(d for d in res["diff"] if d["change"] == "changed")
+    assert changed["etag"] == '"b2"' and changed["length"] == 250000
+    # ambito diverso: stato dei documenti separato
+    assert all(d["change"] == "new" for d in check(store, scope="altro")["diff"])
+
+
+def test_diff_docs_without_head(site, store):
+    cands = [{"url": "https://www.estra.it/bilancio-2023.pdf", "anchor": "Bilancio", "via": SEED}] * 2
+    assert [d["change"] for d in diff_docs(store, "s", cands, check=False)] == ["new"]
+    assert diff_docs(store, "s", cands, check=False) == []
+    assert not any(m == "HEAD" for m, _, _ in site.log)
+
+
+def test_fingerprint_ignores_volatile_markup():
+    a = "<p>Bilanci</p><script>var nonce='1'</script><!-- 12:00 -->"
+    b = "<p>Bilanci</p>  <script>var nonce='2'</script><!-- 12:05 -->"
+    assert fingerprint(a) == fingerprint(b)
+    assert fingerprint(a) != fingerprint("<p>Bilanci 2024</p>")
+
+
+def test_monitor_crawl_fn_runs_under_the_scheduler(site, store):
+    target = {"name": "estra", "base_url": "https://www.estra.it", "seeds": ["/ir"], "years_target": [2023],
+              "max_pages": 10, "max_depth": 2}
+    first = asyncio.run(Scheduler(monitor_crawl_fn(store)).run([target]))[0]
+    assert first["status"] == "ok" and first["items"] == 2
+    # secondo giro: nessuna novità, /ir risponde 304
+    site.log.clear()
+    again = asyncio.run(Scheduler(monitor_crawl_fn(store)).run([target]))[0]
+    assert again["status"] == "ok" and again["items"] == 0
+    assert site.gets("/ir") == ['"v1"']
@@ -0,0 +1,57 @@
+from pdf_extract import DocumentIndex, find_value_near_keywords, normalize_number_str
+
+
+def test_nearest_number_and_page():
+    idx = DocumentIndex([
+        "Relazione sulla gestione 2023",
+        "Ricavi 1.000.000 euro\nCosto del personale 456.789 euro\nAltro 12",
+    ])
+    hit = idx.lookup("costo del personale")
+    assert hit["value"] == "456.789"
+    assert hit["page"] == 2
+    assert hit["keyword_page"] == 2
+
+
+def test_each_keyword_gets_its_own_value():
+    idx = DocumentIndex(["Lavoratori somministrati: 42. " + "x" * 400 + " Costo del personale 1.234,50"])
+    found = idx.find_values(["somministrati", "costo del personale", "dividendi"])
+    assert found["somministrati"]["value"] == "42"
+    assert found["costo del personale"]["value"] == "1234.50"
+    assert found["dividendi"] is None
+
+
+def test_fallback_window():
+    idx = DocumentIndex(["Organico " + "-" * 500 + " 77"])
+    assert idx.lookup("organico", within=300, fallback_within=300) is None
+    assert idx.lookup("organico")["value"] == "77"
+
+
+def test_later_occurrence_with_a_number_wins():
+    idx = DocumentIndex(["Indice: personale", "a" * 1000, "Personale 15 unità"])
+    hit = idx.lookup("personale")
+    assert hit["value"] == "15"
+    assert hit["page"] == 3
+
+
+def test_numbers_do_not_span_page_breaks():
+    idx = DocumentIndex(["Costo del personale 2023", "456 dipendenti"])
+    hit = idx.lookup("costo del personale")
+    assert (hit["value"], hit["page"]) == ("2023", 1)
+    assert [n[3] for n in idx.numbers] == ["2023", "456"]
+    assert idx.numbers[1][0] == len("Costo del personale 2023\n") and idx.page_of(idx.numbers[1][0]) == 2
+
+
+def test_find_value_near_keywords_keeps_the_first_number_in_the_window():
+    text = "Dipendenti 120 e costo 3.400"
+    assert find_value_near_keywords(text, ["costo", "dipendenti"]) == ("costo", "120")
+    assert DocumentIndex.from_text(text).lookup("costo")["value"] == "3.400"
+    # solo la prima occorrenza: senza numeri vicini si passa alla keyword successiva
+    late = "Personale" + " " * 900 + "Personale 15, organico 7"
+    assert find_value_near_keywords(late, ["personale", "organico"]) == ("organico", "15")
+    assert find_value_near_keywords("nessun numero", ["personale"]) == (None, None)
+
+
+def test_normalize_number_str():
+    assert normalize_number_str("1.234,56 €") == "1234.56"
+    assert normalize_number_str("1,234.56") == "1234.56"
+    assert normalize_number_str("12,5") == "12.5"
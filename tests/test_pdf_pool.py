@@ -0,0 +1,107 @@
+import pytest
+
+from pdf_extract import PDF_BACKENDS
+from pdf_pool import BackendChooser, ExtractionPool, doc_class
+from pdfgen import make_pdf
+
+
+@pytest.fixture
+def pool():
+    with ExtractionPool(workers=1, timeout=30.0) as p:
+        yield p
+
+
+def test_doc_class_uses_producer_and_size():
+    assert doc_class(make_pdf("x")) == "libreoffice:s"
+    assert doc_class(make_pdf("x", info={"Producer": "(Microsoft: Print To PDF)"})) == "microsoft:s"
+    assert doc_class(b"%PDF-1.7 " + b"0" * 2_000_000) == "unknown:m"
+
+
+def test_chooser_waits_for_trials_then_prefers_text_then_speed(tmp_path):
+    chooser = BackendChooser(trials=2, path=str(tmp_path / "backends.json"))
+    slow_ok = {"pdfplumber": {"seconds": 2.0, "pages": 10, "ok": True},
+               "pypdf2": {"seconds": 0.2, "pages": 10, "ok": True}}
+    chooser.record("acme:s", slow_ok)
+    assert chooser.choose("acme:s") is None
+    chooser.record("acme:s", slow_ok)
+    assert chooser.choose("acme:s") == "pypdf2"
+    # il più veloce che però non estrae testo perde
+    empty_fast = {"pdfplumber": {"seconds": 1.0, "pages": 5, "ok": True},
+                  "pypdf2": {"seconds": 0.1, "pages": 5, "ok": False}}
+    chooser.record("scan:m", empty_fast)
+    chooser.record("scan:m", empty_fast)
+    assert chooser.choose("scan:m") == "pdfplumber"
+    chooser.save()
+    again = BackendChooser(trials=2, path=chooser.path)
+    assert again.choose("acme:s") == "pypdf2"
+    assert [r["chosen"] for r in again.table() if r["class"] == "scan:m"] == [True, False]
+
+
+def test_extract_in_worker(pool):
+    res = pool.extract(make_pdf("Costo del personale 456.789"))
+    assert res["error"] is None
+    assert "456.789" in res["pages"][0]
+    assert res["needs_ocr"] is False
+    assert pool.extract(b"")["pages"] == []
+
+
+def test_timeout_kills_and_replaces_the_worker(pool):
+    # un worker appena avviato non risponde in 0 secondi
+    res = pool.extract(make_pdf("lento"), timeout=0)
+    assert res["error"] == "timeout"
+    assert (pool.stats["timeouts"], pool.stats["replaced"]) == (1, 1)
+    res = pool.extract(make_pdf("Ricavi 1.000"))
+    assert res["error"] is None and "1.000" in res["pages"][0]
+
+
+def test_dead_worker_is_reported_and_replaced(pool):
+    assert pool.extract(make_pdf("primo"))["error"] is None
+    w = pool._idle.get()
+    w.proc.kill()
+    w.proc.join()
+    pool._idle.put(w)
+    assert pool.extract(make_pdf("secondo"))["error"] == "crashed"
+    assert pool.stats["crashes"] == 1
+    assert "terzo" in pool.extract(make_pdf("terzo"))["pages"][0]
+
+
+class _GarbledConn:
+    def send(self, msg):
+        pass
+
+    def poll(self, timeout):
+        return True
+
+    def recv(self):
+        raise RuntimeError("risposta illeggibile")
+
+
+class _BrokenWorker:
+    conn = _GarbledConn()
+    killed = False
+
+    def kill(self):
+        self.killed = True
+
+
+def test_unexpected_error_is_a_crash_and_the_worker_is_replaced(pool):
+    broken = _BrokenWorker()
+    pool._idle.get()
+    pool._idle.put(broken)
+    res = pool.extract(make_pdf("illeggibile"))
+    assert res["error"] == "crashed" and broken.killed
+    assert (pool.stats["crashes"], pool.stats["replaced"]) == (1, 1)
+    # il worker rotto non torna tra gli idle: il prossimo documento usa un worker nuovo
+    assert "dopo" in pool.extract(make_pdf("dopo"))["pages"][0]
+
+
+def test_bench_mode_records_both_backends_then_uses_the_choice():
+    chooser = BackendChooser(trials=1)
+    with ExtractionPool(workers=1, backend="bench", chooser=chooser) as pool:
+        data = make_pdf("Bilancio 2023")
+        first = pool.extract(data)
+        assert first["backend"] == "both" and first["error"] is None
+        assert set(chooser.stats[doc_class(data)]) == set(PDF_BACKENDS)
+        second = pool.extract(data)
+        assert second["backend"] == chooser.choose(doc_class(data))
+        assert "2023" in second["pages"][0]
@@ -0,0 +1,136 @@
+import httpx
+import pytest
+
+import pdf_probe
+import pipeline
+import replay
+from pdf_probe import HEAD_BYTES, _info_value, classify, doc_type, parse_probe, probe_pdf, probe_score
+from pdfgen import make_pdf, range_response
+
+# titolo UTF-16 con BOM in esadecimale, come lo scrivono Word e LibreOffice
+TITLE_HEX = "<FEFF" + "".join(f"{ord(c):04X}" for c in "Bilancio consolidato 2023") + ">"
+INFO = {"Title": TITLE_HEX, "Subject": "(Relazione finanziaria annuale \\(esercizio 2023\\))",
+        "CreationDate": "(D:20240315120000+01'00')", "Producer": "(Microsoft Word)"}
+# /Info in coda al file, oltre la parte letta in testa
+BIG = make_pdf(["Gruppo Estra Bilancio consolidato al 31 dicembre 2023"] + ["pagina"] * 24, info=INFO,
+               compress=True, pad=HEAD_BYTES + pdf_probe.TAIL_BYTES)
+
+
+def test_info_value_literal_and_hex_strings():
+    blob = b"<< /Title (Bilancio \\(2023\\)\\n) /Author <FEFF00C80073007400720061> /Keywords <zz> >>"
+    assert _info_value(blob, "Title") == "Bilancio (2023)\n"
+    assert _info_value(blob, "Author") == "Èstra"
+    assert _info_value(blob, "Keywords") is None
+    assert _info_value(blob, "Subject") is None
+    assert _info_value(b"/Title (Bilan\\347io)", "Title") == "Bilançio"
+
+
+def test_parse_probe_reads_metadata_pages_and_first_page_text():
+    head, tail = BIG[:HEAD_BYTES], BIG[-pdf_probe.TAIL_BYTES:]
+    p = parse_probe(head, tail)
+    assert p["title"] == "Bilancio consolidato 2023"
+    assert p["subject"] == "Relazione finanziaria annuale (esercizio 2023)"
+    assert (p["pages"], p["created_year"]) == (25, 2024)
+    assert p["first_page"] == "Gruppo Estra Bilancio consolidato al 31 dicembre 2023"
+    # senza coda: niente /Info, ma pagine e testo dalla testa
+    only_head = parse_probe(head)
+    assert "title" not in only_head and only_head["pages"] == 25 and "2023" in only_head["first_page"]
+
+
+def test_parse_probe_xmp():
+    xmp = (b"<x:xmpmeta><dc:title><rdf:Alt><rdf:li xml:lang='x-default'>Relazione semestrale 2023</rdf:li>"
+           b"</rdf:Alt></dc:title><xmp:CreateDate>2023-09-01</xmp:CreateDate></x:xmpmeta>")
+    p = parse_probe(b"%PDF-1.7\n" + xmp)
+    assert p["title"] == "Relazione semestrale 2023" and p["created_year"] == 2023
+
+
+@pytest.mark.parametrize("text, kind", [
+    ("Bilancio consolidato al 31 dicembre 2023", "consolidato"),
+    ("Relazione finanziaria annuale 2023", "bilancio"),
+    ("Bilancio d’esercizio 2023", "bilancio"),
+    ("Relazione finanziaria semestrale al 30 giugno 2023", "semestrale"),
+    ("Relazione sul governo societario e gli assetti proprietari", "governance"),
+    ("Dichiarazione consolidata di carattere non finanziario", "sostenibilita"),
+    ("Comunicato stampa", None),
+])
+def test_classify(text, kind):
+    assert classify(text) == kind
+
+
+def test_probe_score_prefers_the_annual_report_of_the_year():
+    probe = {"ok": True, "title": "Relazione sul governo societario 2023", "first_page": "Sommario",
+             "pages": 40, "created_year": 2024}
+    annual = {**probe, "title": "Bilancio d'esercizio 2023"}
+    assert probe_score(annual, 2023) > probe_score(probe, 2023)
+    assert probe_score(annual, 2023) > probe_score({**annual, "title": "Bilancio d'esercizio 2019"}, 2023)
+    assert probe_score({"ok": False}, 2023) == 0.0
+
+
+class Server:
+    """Serve `data` rispondendo a Range; con ranges=False lo ignora (200 e corpo intero)."""
+
+    def __init__(self, data, ranges=True, content_type="application/pdf"):
+        self.data, self.ranges, self.content_type = data, ranges, content_type
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request.headers.get("range"))
+        return range_response(request, self.data, self.content_type, self.ranges)
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    def install(server):
+        monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(server)})
+        return server
+    return install
+
+
+def test_probe_with_range_reads_head_and_tail_only(serve):
+    server = serve(Server(BIG))
+    p = probe_pdf("https://www.estra.it/range/bilancio.pdf")
+    assert p["ok"] and p["range"] and p["size"] == len(BIG)
+    assert server.requests == [f"bytes=0-{HEAD_BYTES - 1}", f"bytes=-{pdf_probe.TAIL_BYTES}"]
+    assert p["bytes"] == HEAD_BYTES + pdf_probe.TAIL_BYTES < len(BIG)
+    assert p["title"] == "Bilancio consolidato 2023" and p["pages"] == 25
+
+
+def test_probe_when_server_ignores_range(serve):
+    server = serve(Server(BIG, ranges=False))
+    p = probe_pdf("https://www.estra.it/norange/bilancio.pdf")
+    # solo l'inizio del corpo, nessuna seconda richiesta per la coda
+    assert p["ok"] and not p["range"] and len(server.requests) == 1
+    assert p["bytes"] == HEAD_BYTES
+    assert "title" not in p and p["pages"] == 25
+    assert classify(p["first_page"]) == "consolidato"
+
+
+def test_probe_rejects_html_and_http_errors(serve):
+    serve(Server(b"<html>Accedi all'area riservata</html>", content_type="text/html"))
+    assert probe_pdf("https://www.estra.it/login/bilancio.pdf")["error"] == "non è un PDF"
+    serve(lambda request: httpx.Response(404))
+    p = probe_pdf("https://www.estra.it/404/bilancio.pdf")
+    assert not p["ok"] and p["error"] == "HTTP 404"
+
+
+def test_doc_type_prefers_metadata_over_the_first_page():
+    probe = {"title": "Relazione sul governo societario 2023", "first_page": "Bilancio consolidato al 31 dicembre 2023"}
+    assert doc_type(probe) == "governance"
+    assert doc_type({**probe, "title": None}) == "consolidato"
+    assert doc_type({"first_page": "Sommario"}) is None
+
+
+def test_pipeline_reranks_candidates_with_the_probe(serve):
+    docs = {"/governance-bilancio-2023.pdf": make_pdf(["Relazione sul governo societario"] * 30,
+                                                      info={"Title": "(Relazione sul governo societario 2023)"}),
+            "/doc-2023.pdf": make_pdf(["Bilancio d'esercizio al 31 dicembre 2023"] * 30,
+                                      info={"Title": "(Bilancio d'esercizio 2023)"})}
+    serve(lambda request: range_response(request, docs[request.url.path]))
+    cands = [{"url": "https://rerank.estra.it/governance-bilancio-2023.pdf", "is_pdf": True, "score": 3.0},
+             {"url": "https://rerank.estra.it/doc-2023.pdf", "is_pdf": True, "score": 2.0},
+             {"url": "https://rerank.estra.it/ir", "is_pdf": False, "score": 5.0}]
+    # solo URL e ancora: vince il documento di governance
+    assert pipeline._best_docs_by_year(cands, [2023], ["bilancio"]) == {2023: cands[0]["url"]}
+    probed = pipeline._probe_candidates(cands)
+    assert [("probe" in c) for c in probed] == [True, True, False]
+    assert pipeline._best_docs_by_year(probed, [2023], ["bilancio"]) == {2023: cands[1]["url"]}
@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+import pytest
+
+import replay
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = str(tmp_path / "archive.jsonl.gz")
+    yield path
+    replay.activate(None)
+    replay._archives.pop(path, None)
+
+
+def site(request):
+    if request.url.path.endswith(".pdf"):
+        return httpx.Response(200, headers={"content-type": "application/pdf"}, content=b"%PDF-1.4 bilancio")
+    n = site.calls = getattr(site, "calls", 0) + 1
+    return httpx.Response(200, headers={"content-type": "text/html", "set-cookie": "s=1"},
+                          text=f"<a href='/bilancio.pdf'>Bilancio</a> visita {n}")
+
+
+def test_record_then_replay_round_trip(archive_path):
+    archive = replay.Archive(archive_path)
+    rec = replay.RecordingTransport(archive, inner=httpx.MockTransport(site))
+    with httpx.Client(transport=rec) as client:
+        first = client.get("https://s.it/ir?key=SEGRETA&b=2&a=1").text
+        second = client.get("https://s.it/ir?key=SEGRETA&a=1&b=2").text
+        pdf = client.get("https://s.it/bilancio.pdf").content
+    assert first != second
+
+    with open(archive_path, "rb") as fh:
+        assert b"SEGRETA" not in fh.read()
+
+    # replay: nessuna rete, risposte nell'ordine di registrazione, chiave API ignorata nel match
+    replay.activate("replay", archive_path)
+    with httpx.Client(**replay.client_kwargs()) as client:
+        r1 = client.get("https://s.it/ir?a=1&b=2&key=ALTRA")
+        r2 = client.get("https://s.it/ir?b=2&a=1")
+        assert (r1.text, r2.text) == (first, second)
+        assert "set-cookie" not in r1.headers
+        assert client.get("https://s.it/bilancio.pdf").content == pdf
+        with pytest.raises(httpx.ConnectError):
+            client.get("https://s.it/mai-vista")
+
+
+def test_async_client_replays_recorded_exchanges(archive_path):
+    replay.activate("record", archive_path)
+    kw = replay.client_kwargs(async_client=True)
+    kw["transport"].inner = httpx.MockTransport(site)
+
+    async def fetch(**kwargs):
+        async with httpx.AsyncClient(**kwargs) as client:
+            return (await client.get("https://s.it/bilancio.pdf")).content
+
+    recorded = asyncio.run(fetch(**kw))
+    replay.activate("replay", archive_path)
+    replay._archives.pop(archive_path, None)
+    assert asyncio.run(fetch(**replay.client_kwargs(async_client=True))) == recorded
+    assert len(replay.Archive(archive_path)) == 1
+
+
+def test_canonical_url_drops_key_and_sorts_query():
+    assert replay.canonical_url("HTTPS://S.IT?q=b&key=x&a=1") == "https://s.it/?a=1&q=b"
+    with pytest.raises(ValueError):
+        replay.activate("boh")
@@ -0,0 +1,158 @@
+import csv
+import json
+import os
+import sqlite3
+
+import pytest
+
+from results_store import OUTPUT_FIELDS, ResultsStore
+
+COLUMNS = ["Ragione sociale", "Provincia"]
+SHEET = [("Estra S.p.A.", "PO"), ("Hera S.p.A.", "BO"), ("Iren S.p.A.", "TO")]
+
+
+def fields(url="", value="", page="", ocr=False, notes=""):
+    return {"found_document_url": url, "matched_doc_keyword": "personale" if value else "",
+            "matched_value": value, "matched_page": page, "matched_values": "", "needs_ocr": ocr, "notes": notes}
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "results.sqlite")
+
+
+def test_partial_run_resumes_after_reopen(db):
+    with ResultsStore(db, chunk_rows=2) as store:
+        run_id = store.new_run(COLUMNS, [2023])
+        store.add_inputs(run_id, SHEET)
+        store.append(run_id, 0, "Estra S.p.A.", {2023: fields("https://estra.it/b.pdf", page=12)})
+    # il processo riparte: le righe già elaborate sono su disco, si continua dalle altre
+    with ResultsStore(db, chunk_rows=2) as store:
+        run = store.runs()[0]
+        assert (run["run_id"], run["rows"], run["processed"]) == (run_id, 3, 1)
+        url = store.columns(run_id).index("found_document_url")
+        done = {i for i, r in enumerate(store.iter_rows(run_id)) if r[url] is not None}
+        for i, (name, _) in enumerate(SHEET):
+            if i not in done:
+                store.append(run_id, i, name, {2023: fields(notes=f"riga {i}")})
+        # rielaborare una riga la sostituisce, non la duplica
+        store.append(run_id, 2, "Iren S.p.A.", {2023: fields(notes="di nuovo")})
+    with ResultsStore(db) as store:
+        rows = list(store.iter_rows(run_id))
+        assert store.columns(run_id) == COLUMNS + OUTPUT_FIELDS
+        assert [r[0] for r in rows] == [name for name, _ in SHEET]
+        by_col = [dict(zip(store.columns(run_id), r)) for r in rows]
+        assert by_col[0]["matched_page"] == 12 and by_col[0]["needs_ocr"] is False
+        assert [r["notes"] for r in by_col] == [None, "riga 1", "di nuovo"]
+        assert store.runs()[0]["processed"] == 3
+
+
+def test_multi_year_columns_and_exports_round_trip(db, tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("openpyxl")
+    with ResultsStore(db) as store:
+        run_id = store.new_run(COLUMNS, [2023, 2022])
+        store.add_inputs(run_id, SHEET[:2])
+        store.append(run_id, 0, "Estra S.p.A.", {2023: fields("https://estra.it/b23.pdf", page=7),
+                                                 2022: fields(ocr=True, notes="needs OCR")})
+        store.append(run_id, 1, "Hera S.p.A.", {2023: fields(notes="Nessun documento")})
+        store.flush()
+        cols = store.columns(run_id)
+        assert cols[2:4] == ["found_document_url_2023", "matched_doc_keyword_2023"]
+        paths = {fmt: store.export(run_id, str(tmp_path / f"out.{fmt}")) for fmt in ("csv", "json", "xlsx", "parquet")}
+
+    pq = pd.read_parquet(paths["parquet"])
+    assert list(pq.columns) == cols
+    assert pq.loc[0, "matched_page_2023"] == 7
+    assert bool(pq.loc[0, "needs_ocr_2022"]) is True
+    assert pd.isna(pq.loc[1, "found_document_url_2023"])
+    xl = pd.read_excel(paths["xlsx"])
+    assert list(xl.columns) == cols
+    assert xl.loc[0, "found_document_url_2023"] == "https://estra.it/b23.pdf"
+    assert xl.loc[1, "notes_2023"] == "Nessun documento"
+    with open(paths["csv"], newline="", encoding="utf-8") as fh:
+        rows = list(csv.reader(fh))
+    assert rows[0] == cols and rows[1][0] == "Estra S.p.A." and rows[2][cols.index("matched_page_2023")] == ""
+    with open(paths["json"], encoding="utf-8") as fh:
+        assert json.load(fh)[0]["matched_page_2023"] == 7
+    assert not any(os.path.exists(p + ".part") for p in paths.values())
+
+
+def test_output_columns_already_in_the_sheet_are_overwritten_in_place(db):
+    with ResultsStore(db) as store:
+        run_id = store.new_run(["Ragione sociale", "notes"], [2023])
+        store.add_inputs(run_id, [("Estra", "vecchia nota")])
+        store.append(run_id, 0, "Estra", {2023: fields(notes="nuova")})
+        store.flush()
+        assert store.columns(run_id) == ["Ragione sociale", "notes"] + [f for f in OUTPUT_FIELDS if f != "notes"]
+        row = next(store.iter_rows(run_id))
+        assert row[1] == "nuova"
+
+
+def test_unknown_export_format(db, tmp_path):
+    with ResultsStore(db) as store:
+        run_id = store.new_run(COLUMNS, [2023])
+        with pytest.raises(ValueError):
+            store.export(run_id, str(tmp_path / "out.txt"))
+
+
+def test_matched_value_is_kept_as_extracted_in_every_export(db, tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("openpyxl")
+    values = ["1.234.567", "12.345", "1.234,50"]
+    with ResultsStore(db) as store:
+        run_id = store.new_run(COLUMNS, [2023])
+        store.add_inputs(run_id, SHEET)
+        for i, (name, _) in enumerate(SHEET):
+            store.append(run_id, i, name, {2023: fields("https://x.it/b.pdf", value=values[i], page=3)})
+        store.flush()
+        paths = {fmt: store.export(run_id, str(tmp_path / f"out.{fmt}")) for fmt in ("csv", "json", "xlsx", "parquet")}
+    with open(paths["csv"], newline="", encoding="utf-8") as fh:
+        assert [r[OUTPUT_FIELDS.index("matched_value") + 2] for r in list(csv.reader(fh))[1:]] == values
+    with open(paths["json"], encoding="utf-8") as fh:
+        assert [r["matched_value"] for r in json.load(fh)] == values
+    assert list(pd.read_parquet(paths["parquet"])["matched_value"]) == values
+    assert list(pd.read_excel(paths["xlsx"], dtype={"matched_value": str})["matched_value"]) == values
+
+
+def test_store_with_real_matched_value_is_migrated(db):
+    conn = sqlite3.connect(db)
+    conn.executescript("""
+        CREATE TABLE results (run_id TEXT NOT NULL, row_idx INTEGER NOT NULL, company TEXT NOT NULL,
+            year INTEGER NOT NULL, found_document_url TEXT, matched_doc_keyword TEXT, matched_value REAL,
+            matched_page INTEGER, matched_values TEXT, needs_ocr INTEGER, notes TEXT,
+            PRIMARY KEY (run_id, row_idx, year)) WITHOUT ROWID;
+        INSERT INTO results VALUES ('r1', 0, 'Estra', 2023, 'https://x.it/b.pdf', 'personale', 456.789, 4, NULL, 0, NULL);
+    """)
+    conn.close()
+    with ResultsStore(db) as store:
+        declared = {r[1]: r[2] for r in store._conn.execute("PRAGMA table_info(results)")}
+        assert declared["matched_value"] == "TEXT"
+        (row,) = list(store.results("r1"))
+        assert row[3]["matched_page"] == 4 and row[3]["matched_value"] == "456.789"
+        store.append("r1", 1, "Hera", {2023: fields(value="12.345")})
+        store.flush()
+        assert [r[3]["matched_value"] for r in store.results("r1")] == ["456.789", "12.345"]
+
+
+def test_merge_drops_stale_exports(db, tmp_path):
+    exports = str(tmp_path / "exports")
+    with ResultsStore(db) as store:
+        run_id = store.new_run(COLUMNS, [2023])
+        store.add_inputs(run_id, SHEET)
+        store.append(run_id, 0, "Estra S.p.A.", {2023: fields(notes="prima")})
+        first = store.export_path(run_id, "csv", exports)
+        # richieste successive: stesso file, niente nuova esportazione
+        os.utime(first, (0, 0))
+        assert store.export_path(run_id, "csv", exports) == first and os.path.getmtime(first) == 0
+        store.export_path(run_id, "json", exports)
+        # merge di righe elaborate altrove (es. job_queue): le esportazioni vecchie vanno rigenerate
+        store.append(run_id, 1, "Hera S.p.A.", {2023: fields(notes="dal worker")})
+        store.flush()
+        store.drop_exports(run_id, exports)
+        assert os.listdir(exports) == []
+        with open(store.export_path(run_id, "csv", exports), newline="", encoding="utf-8") as fh:
+            notes = [r[-1] for r in list(csv.reader(fh))[1:]]
+        assert notes == ["prima", "dal worker", ""]
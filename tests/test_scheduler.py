@@ -0,0 +1,85 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+import scheduler
+from scheduler import JsonlSink, Scheduler, load_targets
+
+
+def target(name, base, priority=0, **kw):
+    return {"name": name, "base_url": base, "priority": priority, **kw}
+
+
+class FakeCrawl:
+    """crawl_fn finta: registra ordine di partenza e concorrenza per host."""
+
+    def __init__(self, delay=0.02, fail=()):
+        self.delay = delay
+        self.fail = set(fail)
+        self.started = []
+        self.active = {}
+        self.peak = {}
+        self.configs = []
+
+    async def __call__(self, config):
+        host = scheduler.host_key(config)
+        self.started.append(config["name"])
+        self.configs.append(config)
+        self.active[host] = self.active.get(host, 0) + 1
+        self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        try:
+            await asyncio.sleep(config.get("delay", self.delay))
+            if config["name"] in self.fail:
+                raise RuntimeError("sito giù")
+            return {"items": [{"url": config["base_url"] + "/bilancio.pdf"}]}
+        finally:
+            self.active[host] -= 1
+
+
+def test_higher_priority_starts_first():
+    crawl = FakeCrawl()
+    targets = [target("bassa", "https://a.it"), target("alta", "https://b.it", priority=5),
+               target("media", "https://c.it", priority=1), target("spenta", "https://d.it", 9, enabled=False)]
+    summaries = asyncio.run(Scheduler(crawl, concurrency=1).run(targets))
+    assert crawl.started == ["alta", "media", "bassa"]
+    assert [s["target"] for s in summaries] == ["alta", "media", "bassa"]
+    # le chiavi di pianificazione non arrivano al crawler
+    assert all("priority" not in c and "enabled" not in c for c in crawl.configs)
+
+
+def test_per_host_limit_does_not_block_other_hosts():
+    crawl = FakeCrawl(delay=0.05)
+    targets = [target(f"estra{i}", f"https://www{i}.estra.it", priority=10) for i in range(4)]
+    targets.append(target("hera", "https://www.gruppohera.it"))
+    asyncio.run(Scheduler(crawl, concurrency=8, per_host=2).run(targets))
+    assert crawl.peak == {"estra.it": 2, "gruppohera.it": 1}
+    # hera parte subito, senza aspettare che l'host saturo si liberi
+    assert crawl.started.index("hera") == 2
+
+
+def test_timeout_and_error_statuses():
+    crawl = FakeCrawl(fail={"rotto"})
+    out = io.StringIO()
+    targets = [target("lento", "https://lento.it", time_budget_s=0.05, delay=5),
+               target("rotto", "https://rotto.it"), target("ok", "https://ok.it")]
+    summaries = asyncio.run(Scheduler(crawl, budget=2, on_result=JsonlSink(out)).run(targets))
+    status = {s["target"]: s["status"] for s in summaries}
+    assert status == {"lento": "timeout", "rotto": "error", "ok": "ok"}
+    by_name = {s["target"]: s for s in summaries}
+    assert by_name["lento"]["seconds"] < 1 and "0.05" in by_name["lento"]["error"]
+    assert by_name["rotto"]["error"] == "RuntimeError: sito giù"
+    records = [json.loads(l) for l in out.getvalue().splitlines()]
+    assert {"type": "item", "target": "ok", "url": "https://ok.it/bilancio.pdf"} in records
+    assert sum(1 for r in records if r["type"] == "target") == 3
+
+
+def test_load_targets(tmp_path):
+    (tmp_path / "estra.json").write_text(json.dumps({"base_url": "https://www.estra.it", "priority": 2}))
+    (tmp_path / "multi.json").write_text(json.dumps([{"base_url": "https://a.it"}, {"name": "B", "base_url": "https://b.it"}]))
+    names = [t["name"] for t in load_targets(str(tmp_path))]
+    assert names == ["estra", "multi_0", "B"]
+    (tmp_path / "rotto.json").write_text(json.dumps({"name": "senza url"}))
+    with pytest.raises(ValueError):
+        load_targets(str(tmp_path))
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+
+import search_cse
+from search_cse import RateLimiter, cse_query_async, pick_entrypoints_async
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def client_for(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_rate_limiter_spaces_request_starts():
+    async def go():
+        limiter = RateLimiter(qps=20)
+        t0 = asyncio.get_running_loop().time()
+        await asyncio.gather(*(limiter.wait() for _ in range(5)))
+        return asyncio.get_running_loop().time() - t0
+
+    assert run(go()) >= 4 * 0.05 - 0.01
+
+    async def unlimited():
+        limiter = RateLimiter(qps=0)
+        t0 = asyncio.get_running_loop().time()
+        await asyncio.gather(*(limiter.wait() for _ in range(100)))
+        return asyncio.get_running_loop().time() - t0
+
+    assert run(unlimited()) < 1.0   # con qps=20 sarebbero quasi 5 s
+
+
+@pytest.mark.parametrize("status, retry", [(429, True), (500, True), (503, True), (400, False), (404, False)])
+def test_retryable_statuses(status, retry):
+    request = httpx.Request("GET", "https://www.googleapis.com/customsearch/v1")
+    err = httpx.HTTPStatusError("x", request=request, response=httpx.Response(status, request=request))
+    assert search_cse._retryable(err) is retry
+    assert search_cse._retryable(httpx.ConnectTimeout("lenta")) is True
+    assert search_cse._retryable(ValueError()) is False
+
+
+def test_query_retries_on_429_and_5xx_then_succeeds():
+    statuses = [429, 503, 200]
+    seen = []
+
+    def handler(request):
+        seen.append(request.url)
+        code = statuses[len(seen) - 1]
+        return httpx.Response(code, json={"items": [{"link": "https://s.it/investor"}]} if code == 200 else {})
+
+    async def go():
+        async with client_for(handler) as client:
+            return await cse_query_async(client, RateLimiter(qps=0), {"q": "estra", "key": "K", "cx": "C"})
+
+    assert run(go())["items"][0]["link"] == "https://s.it/investor"
+    assert len(seen) == 3
+
+
+def test_query_gives_up_on_client_errors_and_after_max_attempts():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(403 if len(calls) == 1 else 500)
+
+    async def go(max_attempts):
+        async with client_for(handler) as client:
+            return await cse_query_async(client, RateLimiter(qps=0), {"q": "x"}, max_attempts=max_attempts)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        run(go(5))
+    assert len(calls) == 1           # 403: nessun retry
+    with pytest.raises(httpx.HTTPStatusError) as err:
+        run(go(2))
+    assert err.value.response.status_code == 500
+    assert len(calls) == 3
+
+
+def test_pending_queries_are_cancelled_once_max_sites_is_reached():
+    queries = []
+
+    def handler(request):
+        queries.append(parse_qs(urlsplit(str(request.url)).query)["q"][0])
+        return httpx.Response(200, json={"items": [
+            {"link": "https://www.estra.it/investor"},
+            {"link": "https://www.estra.it/bilanci"},            # stesso dominio: non conta
+            {"link": "https://gruppo.estra.it/relazioni"},
+            {"link": "https://www.estra.it/bilancio.pdf"},
+        ]})
+
+    async def go():
+        async with client_for(handler) as client:
+            # qps=0.2: la seconda e la terza query aspettano il limite e vengono annullate prima di partire
+            return await pick_entrypoints_async("Estra S.p.A.", 2023, "K", "C", max_sites=2, client=client,
+                                                limiter=RateLimiter(qps=0.2))
+
+    t0 = time.perf_counter()
+    entry = run(go())
+    assert entry == ["https://www.estra.it/investor", "https://gruppo.estra.it/relazioni"]
+    assert len(queries) == 1 and "investor" in queries[0]
+    assert time.perf_counter() - t0 < 4
+
+
+def test_entrypoints_keep_query_order_when_not_short_circuited():
+    def handler(request):
+        q = parse_qs(urlsplit(str(request.url)).query)["q"][0]
+        n = 1 + [i for i, b in enumerate(search_cse.build_entrypoint_queries("Hera", 2023)) if b == q][0]
+        return httpx.Response(200, json={"items": [{"link": f"https://sito{n}.it/investor"}]})
+
+    async def go():
+        async with client_for(handler) as client:
+            return await pick_entrypoints_async("Hera", 2023, "K", "C", max_sites=5, client=client,
+                                                limiter=RateLimiter(qps=0))
+
+    assert run(go()) == ["https://sito1.it/investor", "https://sito2.it/investor", "https://sito3.it/investor"]
+
+
+def test_search_many_dedups_queries_and_drops_failures(monkeypatch):
+    import replay
+    seen = []
+
+    def handler(request):
+        q = parse_qs(urlsplit(str(request.url)).query)["q"][0]
+        seen.append(q)
+        if q == "rotta":
+            return httpx.Response(403)
+        return httpx.Response(200, json={"items": [{"link": f"https://{q}.it/"}]})
+
+    monkeypatch.setattr(replay, "client_kwargs", lambda async_client=False: {"transport": httpx.MockTransport(handler)})
+    out = search_cse.search_many(["estra", "hera", "estra", "rotta"], "K", "C", qps=0)
+    assert out == {"estra": [{"link": "https://estra.it/"}], "hera": [{"link": "https://hera.it/"}]}
+    assert sorted(seen) == ["estra", "hera", "rotta"]
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight, canonical_url
+
+
+def test_concurrent_calls_run_the_function_once():
+    calls = []
+    gate = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        gate.wait(5)
+        return "pagina"
+
+    g = singleflight.group("test_concurrent")
+    results = []
+    started = threading.Barrier(9)
+
+    def call():
+        started.wait(5)
+        results.append(g.do("https://s.it/ir", fetch))
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    started.wait(5)
+    # il leader resta bloccato finché tutti gli altri sono in attesa del suo risultato
+    time.sleep(0.1)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert calls == [1]
+    assert results == ["pagina"] * 8
+
+
+def test_followers_receive_the_leaders_exception():
+    gate = threading.Event()
+    g = SingleFlight("test_error")
+    errors = []
+
+    def boom():
+        gate.wait(5)
+        raise ValueError("download fallito")
+
+    def call():
+        try:
+            g.do("k", boom)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert errors == ["download fallito"] * 3
+    # l'errore non resta in memoria: la chiamata successiva riprova
+    assert g.do("k", lambda: "ok") == "ok"
+
+
+def test_ttl_keeps_only_results_accepted_by_keep():
+    g = SingleFlight("test_ttl", ttl=60, max_results=2, keep=lambda v: v is not None)
+    calls = []
+
+    def fn(v):
+        calls.append(v)
+        return v
+
+    assert g.do("a", lambda: fn(None)) is None
+    assert g.do("a", lambda: fn("A")) == "A"          # None non memorizzato
+    assert g.do("a", lambda: fn("nuovo")) == "A"      # riuso entro ttl
+    g.do("b", lambda: fn("B"))
+    g.do("c", lambda: fn("C"))                        # oltre max_results: "a" esce (LRU)
+    assert g.do("a", lambda: fn("A2")) == "A2"
+    assert calls == [None, "A", "B", "C", "A2"]
+    g.clear()
+    assert g.do("c", lambda: fn("C2")) == "C2"
+
+
+def test_group_is_shared_per_name():
+    assert singleflight.group("test_shared") is singleflight.group("test_shared", ttl=5)
+
+
+@pytest.mark.parametrize("url, canon", [
+    ("HTTPS://WWW.S.IT:443/ir?utm_source=x&b=2&a=1#top", "https://www.s.it/ir?a=1&b=2"),
+    ("http://s.it:8080?gclid=1", "http://s.it:8080/"),
+])
+def test_canonical_url(url, canon):
+    assert canonical_url(url) == canon
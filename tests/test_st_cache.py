@@ -0,0 +1,71 @@
+import pytest
+
+import crawler
+import st_cache
+
+OK = {"pdf": "https://www.estra.it/bilancio-2023.pdf", "host_stats": {"estra.it": {"ok": 3, "circuit": "closed"}}}
+NOT_FOUND = {"pdf": None, "host_stats": {"estra.it": {"ok": 5, "circuit": "closed"}}}
+HOST_DOWN = {"pdf": OK["pdf"], "host_stats": {"estra.it": {"ok": 1, "timeout": 2, "circuit": "closed"}}}
+CIRCUIT = {"pdf": OK["pdf"], "host_stats": {"estra.it": {"circuit_open": 4, "circuit": "open"}}}
+
+
+@pytest.fixture
+def crawl(monkeypatch):
+    """crawler.crawl_for_pdf finto: restituisce state["result"] e conta le chiamate."""
+    state = {"calls": 0, "result": OK}
+
+    def fake(entry_urls, year, **kwargs):
+        state["calls"] += 1
+        return state["result"]
+
+    monkeypatch.setattr(crawler, "crawl_for_pdf", fake)
+    st_cache.crawl_for_pdf.clear()
+    yield state
+    st_cache.crawl_for_pdf.clear()
+
+
+@pytest.mark.parametrize("result, cached", [(OK, True), (NOT_FOUND, False), (HOST_DOWN, False), (CIRCUIT, False)])
+def test_only_clean_successful_crawls_are_memoized(crawl, result, cached):
+    crawl["result"] = result
+    for _ in range(2):
+        assert st_cache.crawl_for_pdf(("https://www.estra.it/ir",), 2023) == result
+    assert crawl["calls"] == (1 if cached else 2)
+
+
+def test_failed_crawl_is_retried_and_then_cached(crawl):
+    crawl["result"] = HOST_DOWN
+    st_cache.crawl_for_pdf(("https://www.estra.it/ir",), 2022)
+    crawl["result"] = OK
+    for _ in range(2):
+        assert st_cache.crawl_for_pdf(("https://www.estra.it/ir",), 2022)["pdf"] == OK["pdf"]
+    assert crawl["calls"] == 2
+
+
+def test_multi_year_crawl_without_any_year_is_not_memoized(monkeypatch):
+    calls = []
+    results = {(2023,): {"by_year": {2023: None}, "host_stats": {}},
+               (2022,): {"by_year": {2022: {"pdf": "https://www.estra.it/b.pdf"}}, "host_stats": {}}}
+
+    def fake(entry_urls, years, **kwargs):
+        calls.append(tuple(years))
+        return results[tuple(years)]
+
+    monkeypatch.setattr(crawler, "crawl_for_pdfs", fake)
+    st_cache.crawl_for_pdfs.clear()
+    for years in [(2023,), (2023,), (2022,), (2022,)]:
+        st_cache.crawl_for_pdfs(("https://www.estra.it/ir",), years)
+    assert calls == [(2023,), (2023,), (2022,)]
+    st_cache.crawl_for_pdfs.clear()
+
+
+def test_cache_if_predicate():
+    calls = []
+
+    @st_cache.memoized("test_cache_if", cache_if=lambda out: out % 2 == 0)
+    def double_or_odd(x):
+        calls.append(x)
+        return x if x % 2 else 2 * x
+
+    assert [double_or_odd(x) for x in (1, 1, 2, 2)] == [1, 1, 4, 4]
+    assert calls == [1, 1, 2]
+    double_or_odd.clear()